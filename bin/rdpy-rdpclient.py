@@ -25,7 +25,7 @@ import sys, os, getopt, socket
 
 from PyQt4 import QtGui, QtCore
 from rdpy.ui.qt4 import RDPClientQt
-from rdpy.protocol.rdp import rdp
+from rdpy.protocol.rdp import rdp, x224
 from rdpy.core.error import RDPSecurityNegoFail
 from rdpy.core import rss
 
@@ -91,7 +91,7 @@ class RDPClientQtFactory(rdp.ClientFactory):
     """
     @summary: Factory create a RDP GUI client
     """
-    def __init__(self, width, height, username, password, domain, fullscreen, keyboardLayout, optimized, security, recodedPath):
+    def __init__(self, width, height, username, password, domain, fullscreen, keyboardLayout, optimized, security, recodedPath, tlsPolicy = None):
         """
         @param width: {integer} width of client
         @param heigth: {integer} heigth of client
@@ -103,6 +103,7 @@ class RDPClientQtFactory(rdp.ClientFactory):
         @param optimized: {bool} enable optimized session orders
         @param security: {str} (ssl | rdp | nego)
         @param recodedPath: {str | None} Rss file Path
+        @param tlsPolicy: {x224.TLSPolicy | None} TLS versions and ciphers (None for default policy)
         """
         self._width = width
         self._height = height
@@ -114,6 +115,7 @@ class RDPClientQtFactory(rdp.ClientFactory):
         self._optimized = optimized
         self._nego = security == "nego"
         self._recodedPath = recodedPath
+        self._tlsPolicy = tlsPolicy
         if self._nego:
             #compute start nego nla need credentials
             if username != "" and password != "":
@@ -135,6 +137,8 @@ class RDPClientQtFactory(rdp.ClientFactory):
         #create client observer
         if self._recodedPath is None:
             self._client = RDPClientQt(controller, self._width, self._height)
+            #scroll as screen copy, can't be record in rss file
+            controller.setScrBltOrderSupport()
         else:
             self._client = RDPClientQtRecorder(controller, self._width, self._height, rss.createRecorder(self._recodedPath))
         #create qt widget
@@ -152,7 +156,9 @@ class RDPClientQtFactory(rdp.ClientFactory):
         controller.setHostname(socket.gethostname())
         if self._optimized:
             controller.setPerformanceSession()
+            controller.setBulkCompression()
         controller.setSecurityLevel(self._security)
+        controller.setTLSPolicy(self._tlsPolicy)
         
         return self._client
     
@@ -222,6 +228,7 @@ def help():
     \t-k: keyboard layout [en|fr] [default : en]
     \t-o: optimized session (disable costly effect) [default : False]
     \t-r: rss_filepath Recorded Session Scenario [default : None]
+    \t-P: TLS policy [default|modern|legacy] [default : default]
     """
         
 if __name__ == '__main__':
@@ -236,9 +243,10 @@ if __name__ == '__main__':
     optimized = False
     recodedPath = None
     keyboardLayout = autoDetectKeyboardLayout()
+    tlsPolicy = "default"
     
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hfou:p:d:w:l:k:r:")
+        opts, args = getopt.getopt(sys.argv[1:], "hfou:p:d:w:l:k:r:P:")
     except getopt.GetoptError:
         help()
     for opt, arg in opts:
@@ -263,6 +271,12 @@ if __name__ == '__main__':
             keyboardLayout = arg
         elif opt == "-r":
             recodedPath = arg
+        elif opt == "-P":
+            tlsPolicy = arg
+    
+    if not tlsPolicy in x224.TLS_POLICIES:
+        help()
+        sys.exit(1)
             
     if ':' in args[0]:
         ip, port = args[0].split(':')
@@ -283,6 +297,6 @@ if __name__ == '__main__':
     log.info("keyboard layout set to %s"%keyboardLayout)
     
     from twisted.internet import reactor
-    reactor.connectTCP(ip, int(port), RDPClientQtFactory(width, height, username, password, domain, fullscreen, keyboardLayout, optimized, "nego", recodedPath))
+    reactor.connectTCP(ip, int(port), RDPClientQtFactory(width, height, username, password, domain, fullscreen, keyboardLayout, optimized, "nego", recodedPath, x224.TLS_POLICIES[tlsPolicy]))
     reactor.runReturn()
     app.exec_()
\ No newline at end of file
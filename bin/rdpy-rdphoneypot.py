@@ -24,22 +24,26 @@ RDP Honey pot use Rss scenario file to simulate RDP server
 
 import sys, os, getopt, time, datetime
 
-from rdpy.core import log, error, rss
-from rdpy.protocol.rdp import rdp
-from twisted.internet import reactor
+from rdpy.core import log, error, rss, prefork, scheduler
+from rdpy.protocol.rdp import rdp, x224
 
 log._LOG_LEVEL = log.Level.INFO
 
 class HoneyPotServer(rdp.RDPServerObserver):
-    def __init__(self, controller, rssFileSizeList):
+    def __init__(self, controller, scenarioCache, timerWheel, speed = 1.0):
         """
         @param controller: {RDPServerController}
-        @param rssFileSizeList: {Tuple} Tuple(Tuple(width, height), rssFilePath)
+        @param scenarioCache: {rss.ScenarioCache} scenarios and their pre-rendered variants
+        @param timerWheel: {scheduler.TimerWheel} shared by all sessions
+        @param speed: {float} playback speed factor
         """
         rdp.RDPServerObserver.__init__(self, controller)
-        self._rssFileSizeList = rssFileSizeList
+        self._scenarioCache = scenarioCache
+        self._timerWheel = timerWheel
+        self._speed = speed
         self._dx, self._dy = 0, 0
         self._rssFile = None
+        self._timer = None
         
     def onReady(self):
         """
@@ -50,12 +54,11 @@ class HoneyPotServer(rdp.RDPServerObserver):
         @see: rdp.RDPServerObserver.onReady
         """
         if self._rssFile is None:
-            #compute which RSS file to keep
+            #compute which scenario to keep, session use color depth of client
             width, height = self._controller.getScreen()
-            size = width * height
-            rssFilePath = sorted(self._rssFileSizeList, key = lambda x: abs(x[0][0] * x[0][1] - size))[0][1]
-            log.info("%s --- select file (%s, %s) -> %s"%(datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'),width, height, rssFilePath))
-            self._rssFile = rss.createReader(rssFilePath)
+            colorDepth = self._controller.getColorDepth()
+            variant, self._rssFile = self._scenarioCache.select(width, height, colorDepth)
+            log.info("%s --- select scenario (%s, %s, %s) -> %s"%(datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'), width, height, colorDepth, variant))
         
         domain, username, password = self._controller.getCredentials()
         hostname = self._controller.getHostname()
@@ -63,7 +66,12 @@ class HoneyPotServer(rdp.RDPServerObserver):
         self.start()
         
     def onClose(self):
-        """ HoneyPot """
+        """
+        @summary: stop playback
+        """
+        if not self._timer is None:
+            self._timer.cancel()
+            self._timer = None
         
     def onKeyEventScancode(self, code, isPressed, isExtended):
         """ HoneyPot """
@@ -80,39 +88,63 @@ class HoneyPotServer(rdp.RDPServerObserver):
     def loopScenario(self, nextEvent):
         """
         @summary: main loop event
+                    Updates due in the same tick of timer wheel are sent in one PDU
+        @param nextEvent: {rss.Event} event to play now
         """
-        if nextEvent.type.value == rss.EventType.UPDATE:
-            self._controller.sendUpdate(nextEvent.event.destLeft.value + self._dx, nextEvent.event.destTop.value + self._dy, nextEvent.event.destRight.value + self._dx, nextEvent.event.destBottom.value + self._dy, nextEvent.event.width.value, nextEvent.event.height.value, nextEvent.event.bpp.value, nextEvent.event.format.value == rss.UpdateFormat.BMP, nextEvent.event.data.value)
+        self._timer = None
+        updates = []
+        delay = 0.0
+        while not nextEvent is None:
+            if nextEvent.type.value == rss.EventType.UPDATE:
+                updates.append((nextEvent.event.destLeft.value + self._dx, nextEvent.event.destTop.value + self._dy, nextEvent.event.destRight.value + self._dx, nextEvent.event.destBottom.value + self._dy, nextEvent.event.width.value, nextEvent.event.height.value, nextEvent.event.bpp.value, nextEvent.event.format.value == rss.UpdateFormat.BMP, nextEvent.event.data.value))
+                
+            elif nextEvent.type.value == rss.EventType.CLOSE:
+                self._controller.sendUpdates(updates)
+                self._controller.close()
+                return
+                
+            elif nextEvent.type.value == rss.EventType.SCREEN:
+                #compute centering because we cannot resize client
+                clientSize = nextEvent.event.width.value, nextEvent.event.height.value
+                serverSize = self._controller.getScreen()
+                self._dx, self._dy = (max(0, serverSize[0] - clientSize[0]) / 2), max(0, (serverSize[1] - clientSize[1]) / 2)
+                
+                if nextEvent.event.colorDepth.value != self._controller.getColorDepth():
+                    self._controller.sendUpdates(updates)
+                    self._controller.setColorDepth(nextEvent.event.colorDepth.value)
+                    #restart connection sequence
+                    return
             
-        elif nextEvent.type.value == rss.EventType.CLOSE:
-            self._controller.close()
-            return
+            nextEvent = self._rssFile.nextEvent()
+            if nextEvent is None:
+                break
+            delay += float(nextEvent.timestamp.value) / 1000.0 / self._speed
+            if delay >= self._timerWheel.getTick():
+                break
             
-        elif nextEvent.type.value == rss.EventType.SCREEN:
-            self._controller.setColorDepth(nextEvent.event.colorDepth.value)
-            #compute centering because we cannot resize client
-            clientSize = nextEvent.event.width.value, nextEvent.event.height.value
-            serverSize = self._controller.getScreen()
-            
-            self._dx, self._dy = (max(0, serverSize[0] - clientSize[0]) / 2), max(0, (serverSize[1] - clientSize[1]) / 2)
-            #restart connection sequence
-            return
-        
-        e = self._rssFile.nextEvent()
-        reactor.callLater(float(e.timestamp.value) / 1000.0, lambda:self.loopScenario(e))
+        self._controller.sendUpdates(updates)
+        if not nextEvent is None:
+            self._timer = self._timerWheel.schedule(delay, self.loopScenario, nextEvent)
         
 class HoneyPotServerFactory(rdp.ServerFactory):
     """
     @summary: Factory on listening events
     """
-    def __init__(self, rssFileSizeList, privateKeyFilePath, certificateFilePath):
+    def __init__(self, scenarioCache, privateKeyFilePath, certificateFilePath, speed = 1.0, keyPoolSize = 4, keyFileName = None):
         """
-        @param rssFileSizeList: {Tuple} Tuple(Tuple(width, height), rssFilePath)
+        @param scenarioCache: {rss.ScenarioCache} scenarios and their pre-rendered variants
         @param privateKeyFilePath: {str} file contain server private key (if none -> back to standard RDP security)
         @param certificateFilePath: {str} file contain server certificate (if none -> back to standard RDP security)
+        @param speed: {float} playback speed factor
+        @param keyPoolSize: {int} number of RSA keys of standard RDP security
+        @param keyFileName: {str} file where RSA keys are loaded from or saved to
         """
-        rdp.ServerFactory.__init__(self, 16, privateKeyFilePath, certificateFilePath)
-        self._rssFileSizeList = rssFileSizeList
+        #use color depth of client to avoid renegotiation
+        rdp.ServerFactory.__init__(self, None, privateKeyFilePath, certificateFilePath, keyPoolSize, keyFileName)
+        self._scenarioCache = scenarioCache
+        self._speed = speed
+        #one timer wheel for all playback
+        self._timerWheel = scheduler.TimerWheel()
         
     def buildObserver(self, controller, addr):
         """
@@ -121,20 +153,7 @@ class HoneyPotServerFactory(rdp.ServerFactory):
         @see: rdp.ServerFactory.buildObserver
         """
         log.info("%s --- Connection from %s:%s"%(datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'), addr.host, addr.port))
-        return HoneyPotServer(controller, self._rssFileSizeList)
-    
-def readSize(filePath):
-    """
-    @summary: read size event in rss file
-    @param filePath: path of rss file
-    """
-    r = rss.createReader(filePath)
-    while True:
-        e = r.nextEvent()
-        if e is None:
-            return None
-        elif e.type.value == rss.EventType.SCREEN:
-            return e.event.width.value, e.event.height.value
+        return HoneyPotServer(controller, self._scenarioCache, self._timerWheel, self._speed)
     
 def help():
     """
@@ -146,17 +165,27 @@ def help():
             [-l listen_port default 3389] 
             [-k private_key_file_path (mandatory for SSL)] 
             [-c certificate_file_path (mandatory for SSL)] 
-            rss_filepath(1..n)
+            [-n workers default 1 (SIGHUP : graceful restart)] 
+            [-s playback speed factor default 1.0] 
+            [-P TLS policy default|modern|legacy default default] 
+            [-K rsa_keys_file_path (standard RDP security keys, generated if missing)] 
+            [-R rsa key pool size default 4] 
+            rss_filepath(1..n) (pre-rendered variants from rdpy-rssrender.py)
     """
     
 if __name__ == '__main__':
     listen = "3389"
     privateKeyFilePath = None
     certificateFilePath = None
-    rssFileSizeList = []
+    workers = 1
+    speed = 1.0
+    tlsPolicy = "default"
+    keyFileName = None
+    keyPoolSize = 4
+    scenarioCache = rss.ScenarioCache()
     
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hl:k:c:L:")
+        opts, args = getopt.getopt(sys.argv[1:], "hl:k:c:L:n:s:P:K:R:")
     except getopt.GetoptError:
         help()
     for opt, arg in opts:
@@ -171,14 +200,37 @@ if __name__ == '__main__':
             privateKeyFilePath = arg
         elif opt == "-c":
             certificateFilePath = arg
+        elif opt == "-n":
+            workers = int(arg)
+        elif opt == "-s":
+            speed = float(arg)
+        elif opt == "-P":
+            tlsPolicy = arg
+        elif opt == "-K":
+            keyFileName = arg
+        elif opt == "-R":
+            keyPoolSize = int(arg)
+    
+    if not tlsPolicy in x224.TLS_POLICIES:
+        help()
+        sys.exit(1)
     
     #build size map
     log.info("%s --- Start rdphoneypot"%datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'))
-    log.info("%s --- Build size map"%datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'))
+    log.info("%s --- Load scenarios"%datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'))
     for arg in args:
-        size = readSize(arg)
-        rssFileSizeList.append((size, arg))
-        log.info("%s --- (%s, %s) -> %s"%(datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'), size[0], size[1], arg))
+        variant = scenarioCache.load(arg)
+        if variant is None:
+            continue
+        log.info("%s --- (%s, %s, %s) -> %s"%(datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'), variant[0], variant[1], variant[2], arg))
+    
+    if len(scenarioCache.getVariants()) == 0:
+        log.error("no scenario with screen event loaded")
+        help()
+        sys.exit(1)
     
-    reactor.listenTCP(int(listen), HoneyPotServerFactory(rssFileSizeList, privateKeyFilePath, certificateFilePath))
-    reactor.run()
+    factory = HoneyPotServerFactory(scenarioCache, privateKeyFilePath, certificateFilePath, speed, keyPoolSize, keyFileName)
+    factory.setTLSPolicy(x224.TLS_POLICIES[tlsPolicy])
+    #master write key file before workers start
+    factory.loadKeys()
+    prefork.serve(factory, int(listen), workers = workers)
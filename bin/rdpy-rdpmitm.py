@@ -34,8 +34,8 @@ import os
 import argparse
 import time
 
-from rdpy.core import log, error, rss
-from rdpy.protocol.rdp import rdp
+from rdpy.core import log, error, rss, prefork
+from rdpy.protocol.rdp import rdp, x224
 from twisted.internet import reactor
 
 log._LOG_LEVEL = log.Level.INFO
@@ -46,17 +46,19 @@ class ProxyServer(rdp.RDPServerObserver):
     @summary: Server side of proxy
     """
 
-    def __init__(self, controller, target, clientSecurityLevel, rssRecorder):
+    def __init__(self, controller, target, clientSecurityLevel, rssRecorder, tlsPolicy = None):
         """
         @param controller: {RDPServerController}
         @param target: {tuple(ip, port)}
         @param rssRecorder: {rss.FileRecorder} use to record session
+        @param tlsPolicy: {x224.TLSPolicy | None} TLS versions and ciphers of client side
         """
         rdp.RDPServerObserver.__init__(self, controller)
         self._target = target
         self._client = None
         self._rss = rssRecorder
         self._clientSecurityLevel = clientSecurityLevel
+        self._tlsPolicy = tlsPolicy
 
     def setClient(self, client):
         """
@@ -83,7 +85,7 @@ class ProxyServer(rdp.RDPServerObserver):
             self._rss.screen(width, height, self._controller.getColorDepth())
 
             reactor.connectTCP(self._target[0], int(self._target[1]), ProxyClientFactory(self, width, height,
-                                                                                         domain, username, password, self._clientSecurityLevel))
+                                                                                         domain, username, password, self._clientSecurityLevel, self._tlsPolicy))
 
     def onClose(self):
         """
@@ -92,6 +94,8 @@ class ProxyServer(rdp.RDPServerObserver):
         """
         # end scenario
         self._rss.close()
+        log.info("recording queue: {queued} queued, {written} written, {dropped} dropped, {blocked} blocked, "
+                 "{spilled} spilled, {errors} errors, depth {depth} (max {maxDepth})".format(**self._rss.getQueue().getStats()))
 
         # close network stack
         if self._client is None:
@@ -143,19 +147,25 @@ class ProxyServerFactory(rdp.ServerFactory):
     @summary: Factory on listening events
     """
 
-    def __init__(self, target, ouputDir, privateKeyFilePath, certificateFilePath, clientSecurity):
+    def __init__(self, target, ouputDir, privateKeyFilePath, certificateFilePath, clientSecurity, recordingQueue, tlsPolicy = None, keyPoolSize = 4, keyFileName = None):
         """
         @param target: {tuple(ip, prt)}
         @param privateKeyFilePath: {str} file contain server private key (if none -> back to standard RDP security)
         @param certificateFilePath: {str} file contain server certificate (if none -> back to standard RDP security)
         @param clientSecurity: {str(ssl|rdp)} security layer use in client connection side
+        @param recordingQueue: {rss.RecordingQueue} started queue which write sessions out of reactor thread
+        @param tlsPolicy: {x224.TLSPolicy | None} TLS versions and ciphers of both sides
+        @param keyPoolSize: {int} number of RSA keys of standard RDP security
+        @param keyFileName: {str} file where RSA keys are loaded from or saved to
         """
         rdp.ServerFactory.__init__(
-            self, 16, privateKeyFilePath, certificateFilePath)
+            self, 16, privateKeyFilePath, certificateFilePath, keyPoolSize, keyFileName)
+        self.setTLSPolicy(tlsPolicy)
         self._target = target
         self._ouputDir = ouputDir
         self._clientSecurity = clientSecurity
-        # use produce unique file by connection
+        self._recordingQueue = recordingQueue
+        # use produce unique file by connection (pid for prefork workers)
         self._uniqueId = 0
 
     def buildObserver(self, controller, addr):
@@ -165,7 +175,7 @@ class ProxyServerFactory(rdp.ServerFactory):
         @see: rdp.ServerFactory.buildObserver
         """
         self._uniqueId += 1
-        return ProxyServer(controller, self._target, self._clientSecurity, rss.createRecorder(os.path.join(self._ouputDir, "%s_%s_%s.rss" % (time.strftime('%Y%m%d%H%M%S'), addr.host, self._uniqueId))))
+        return ProxyServer(controller, self._target, self._clientSecurity, rss.createAsyncRecorder(os.path.join(self._ouputDir, "%s_%s_%s_%s.rss" % (time.strftime('%Y%m%d%H%M%S'), addr.host, os.getpid(), self._uniqueId)), self._recordingQueue), self._tlsPolicy)
 
 
 class ProxyClient(rdp.RDPClientObserver):
@@ -222,10 +232,11 @@ class ProxyClient(rdp.RDPClientObserver):
         @param data: {str} bitmap data
         @see: rdp.RDPClientObserver.onUpdate
         """
-        self._server._rss.update(destLeft, destTop, destRight, destBottom, width, height,
-                                 bitsPerPixel, rss.UpdateFormat.BMP if isCompress else rss.UpdateFormat.RAW, data)
         self._server._controller.sendUpdate(
             destLeft, destTop, destRight, destBottom, width, height, bitsPerPixel, isCompress, data)
+        # recorded after forwarding, written by recording queue thread
+        self._server._rss.update(destLeft, destTop, destRight, destBottom, width, height,
+                                 bitsPerPixel, rss.UpdateFormat.BMP if isCompress else rss.UpdateFormat.RAW, data)
 
 
 class ProxyClientFactory(rdp.ClientFactory):
@@ -233,7 +244,7 @@ class ProxyClientFactory(rdp.ClientFactory):
     @summary: Factory for proxy client
     """
 
-    def __init__(self, server, width, height, domain, username, password, security):
+    def __init__(self, server, width, height, domain, username, password, security, tlsPolicy = None):
         """
         @param server: {ProxyServer}
         @param width: {int} screen width
@@ -242,6 +253,7 @@ class ProxyClientFactory(rdp.ClientFactory):
         @param username: {str} username session
         @param password: {str} password session
         @param security: {str(ssl|rdp)} security level
+        @param tlsPolicy: {x224.TLSPolicy | None} TLS versions and ciphers
         """
         self._server = server
         self._width = width
@@ -250,6 +262,7 @@ class ProxyClientFactory(rdp.ClientFactory):
         self._username = username
         self._password = password
         self._security = security
+        self._tlsPolicy = tlsPolicy
 
     def buildObserver(self, controller, addr):
         """
@@ -266,6 +279,7 @@ class ProxyClientFactory(rdp.ClientFactory):
         controller.setUsername(self._username)
         controller.setPassword(self._password)
         controller.setSecurityLevel(self._security)
+        controller.setTLSPolicy(self._tlsPolicy)
         controller.setPerformanceSession()
         return ProxyClient(controller, self._server)
 
@@ -305,6 +319,18 @@ if __name__ == '__main__':
                    help="output directory", required=True)
     p.add_argument('-s', '--sec', choices=["rdp", "tls", "nla"],
                    default="rdp", help="set protocol security layer")
+    p.add_argument('-q', '--record-queue', type=int, default=4096,
+                   help="max number of recording events waiting to be written")
+    p.add_argument('-p', '--record-policy', choices=[rss.RecordPolicy.DROP, rss.RecordPolicy.BLOCK, rss.RecordPolicy.SPILL],
+                   default=rss.RecordPolicy.DROP, help="what to do with recording events when queue is full")
+    p.add_argument('-n', '--workers', type=int, default=1,
+                   help="number of worker processes listening on the same port (SIGHUP: graceful restart)")
+    p.add_argument('-P', '--tls-policy', choices=sorted(x224.TLS_POLICIES.keys()),
+                   default="default", help="TLS versions and ciphers of both sides")
+    p.add_argument('-K', '--rsa-keys',
+                   help="file of RSA keys for standard RDP security (generated if missing)")
+    p.add_argument('-R', '--rsa-pool', type=int, default=4,
+                   help="number of RSA keys for standard RDP security")
     ssl = p.add_argument_group()
     ssl.add_argument('-c', '--certificate', help="certificate for TLS connections")
     ssl.add_argument('-k', '--key', help="private key of the given certificate for TLS connections")
@@ -316,8 +342,13 @@ if __name__ == '__main__':
 
     log.info("running server on {addr}, using {sec} security layer, proxying to {target}".format(
              addr=args.listen, sec=args.sec.upper(), target=args.target))
-    reactor.listenTCP(args.listen[1], ProxyServerFactory(
-        args.target, args.output, args.key, args.certificate, mapSecurityLayer(args.sec)),
-        interface=args.listen[0])
-
-    reactor.run()
+    # sessions are written out of reactor thread, pending events are flushed on shutdown
+    recordingQueue = rss.RecordingQueue(args.record_queue, args.record_policy, args.output)
+    recordingQueue.start()
+    reactor.addSystemEventTrigger("after", "shutdown", recordingQueue.stop)
+
+    factory = ProxyServerFactory(args.target, args.output, args.key, args.certificate, mapSecurityLayer(args.sec), recordingQueue,
+                                 x224.TLS_POLICIES[args.tls_policy], args.rsa_pool, args.rsa_keys)
+    # master write key file before workers start
+    factory.loadKeys()
+    prefork.serve(factory, args.listen[1], interface=args.listen[0], workers=args.workers)
@@ -21,194 +21,104 @@
 """
 example of use rdpy
 take screenshot of login page
+Scan many hosts with bounded concurrency, without Qt
+Use many worker processes to use all cores
 """
 
 import getopt
+import itertools
 import os
 import sys
 
-from PyQt4 import QtCore, QtGui
-from rdpy.protocol.rdp import rdp
-from rdpy.ui.qt4 import RDPBitmapToQtImage
+from rdpy.core import scanner, supervisor
+from rdpy.protocol.rdp.screenshot import RDPScreenshotJobFactory
+from rdpy.protocol.rdp import x224
 import rdpy.core.log as log
-from rdpy.core.error import RDPSecurityNegoFail
-from twisted.internet import task
 
 # set log level
 log._LOG_LEVEL = log.Level.INFO
 
-
-class RDPScreenShotFactory(rdp.ClientFactory):
-    """
-    @summary: Factory for screenshot exemple
-    """
-    __INSTANCE__ = 0
-    __STATE__ = []
-
-    def __init__(self, reactor, app, width, height, path, timeout):
-        """
-        @param reactor: twisted reactor
-        @param width: {integer} width of screen
-        @param height: {integer} height of screen
-        @param path: {str} path of output screenshot
-        @param timeout: {float} close connection after timeout s without any updating
-        """
-        RDPScreenShotFactory.__INSTANCE__ += 1
-        self._reactor = reactor
-        self._app = app
-        self._width = width
-        self._height = height
-        self._path = path
-        self._timeout = timeout
-        #NLA server can't be screenshooting
-        self._security = rdp.SecurityLevel.RDP_LEVEL_SSL
-
-    def clientConnectionLost(self, connector, reason):
-        """
-        @summary: Connection lost event
-        @param connector: twisted connector use for rdp connection (use reconnect to restart connection)
-        @param reason: str use to advertise reason of lost connection
-        """
-        if reason.type == RDPSecurityNegoFail and self._security != "rdp":
-            log.info("due to RDPSecurityNegoFail try standard security layer")
-            self._security = rdp.SecurityLevel.RDP_LEVEL_RDP
-            connector.connect()
-            return
-
-        log.info("connection lost : %s" % reason)
-        RDPScreenShotFactory.__STATE__.append((connector.host, connector.port, reason))
-        RDPScreenShotFactory.__INSTANCE__ -= 1
-        if(RDPScreenShotFactory.__INSTANCE__ == 0):
-            self._reactor.stop()
-            self._app.exit()
-
-    def clientConnectionFailed(self, connector, reason):
-        """
-        @summary: Connection failed event
-        @param connector: twisted connector use for rdp connection (use reconnect to restart connection)
-        @param reason: str use to advertise reason of lost connection
-        """
-        log.info("connection failed : %s"%reason)
-        RDPScreenShotFactory.__STATE__.append((connector.host, connector.port, reason))
-        RDPScreenShotFactory.__INSTANCE__ -= 1
-        if(RDPScreenShotFactory.__INSTANCE__ == 0):
-            self._reactor.stop()
-            self._app.exit()
-
-    def buildObserver(self, controller, addr):
-        """
-        @summary: build ScreenShot observer
-        @param controller: RDPClientController
-        @param addr: address of target
-        """
-        class ScreenShotObserver(rdp.RDPClientObserver):
-            """
-            @summary: observer that connect, cache every image received and save at deconnection
-            """
-            def __init__(self, controller, width, height, path, timeout, reactor):
-                """
-                @param controller: {RDPClientController}
-                @param width: {integer} width of screen
-                @param height: {integer} height of screen
-                @param path: {str} path of output screenshot
-                @param timeout: {float} close connection after timeout s without any updating
-                @param reactor: twisted reactor
-                """
-                rdp.RDPClientObserver.__init__(self, controller)
-                self._buffer = QtGui.QImage(width, height, QtGui.QImage.Format_RGB32)
-                self._path = path
-                self._timeout = timeout
-                self._startTimeout = False
-                self._reactor = reactor
-
-            def onUpdate(self, destLeft, destTop, destRight, destBottom, width, height, bitsPerPixel, isCompress, data):
-                """
-                @summary: callback use when bitmap is received 
-                """
-                image = RDPBitmapToQtImage(width, height, bitsPerPixel, isCompress, data);
-                with QtGui.QPainter(self._buffer) as qp:
-                # draw image
-                    qp.drawImage(destLeft, destTop, image, 0, 0, destRight - destLeft + 1, destBottom - destTop + 1)
-                if not self._startTimeout:
-                    self._startTimeout = False
-                    self._reactor.callLater(self._timeout, self.checkUpdate)
-
-            def onReady(self):
-                """
-                @summary: callback use when RDP stack is connected (just before received bitmap)
-                """
-                log.info("connected %s" % addr)
-
-            def onSessionReady(self):
-                """
-                @summary: Windows session is ready
-                @see: rdp.RDPClientObserver.onSessionReady
-                """
-                pass
-
-            def onClose(self):
-                """
-                @summary: callback use when RDP stack is closed
-                """
-                log.info("save screenshot into %s" % self._path)
-                self._buffer.save(self._path)
-
-            def checkUpdate(self):
-                self._controller.close();
-
-        controller.setScreen(self._width, self._height);
-        controller.setSecurityLevel(self._security)
-        return ScreenShotObserver(controller, self._width, self._height, self._path, self._timeout, self._reactor)
-
-def main(width, height, path, timeout, hosts):
+def main(width, height, path, timeout, hosts, hostFile = None, concurrency = 64, hostTimeout = 30.0, retries = 0, resultFile = None, workers = 1, tlsPolicy = "default"):
     """
     @summary: main algorithm
     @param height: {integer} height of screenshot
     @param width: {integer} width of screenshot
-    @param timeout: {float} in sec
+    @param path: {str} output directory
+    @param timeout: {float} take screenshot after timeout s without any updating
     @param hosts: {list(str(ip[:port]))}
-    @return: {list(tuple(ip, port, Failure instance)} list of connection state
+    @param hostFile: {str} file with one ip[:port] per line ("-" for stdin)
+    @param concurrency: {integer} max number of connections in progress
+    @param hostTimeout: {float} max duration of one connection in sec
+    @param retries: {integer} new attempts after failure
+    @param resultFile: {str} JSON lines results file
+    @param workers: {integer} number of worker processes (concurrency is by worker)
+    @param tlsPolicy: {str} name of TLS policy (see x224.TLS_POLICIES)
+    @return: {dict} number of hosts by status
     """
-    #create application
-    app = QtGui.QApplication(sys.argv)
-
-    #add qt4 reactor
-    import qt4reactor
-    qt4reactor.install()
-
     from twisted.internet import reactor
-
-    for host in hosts:      
-        if ':' in host:
-            ip, port = host.split(':')
-        else:
-            ip, port = host, "3389"
-
-        reactor.connectTCP(ip, int(port), RDPScreenShotFactory(reactor, app, width, height, path + "%s.jpg" % ip, timeout))
-
-    reactor.runReturn()
-    app.exec_()
-    return RDPScreenShotFactory.__STATE__
+    
+    targets = scanner.readTargets(hosts, 3389)
+    hostInput = None
+    if not hostFile is None:
+        hostInput = sys.stdin if hostFile == "-" else open(hostFile)
+        targets = itertools.chain(targets, scanner.readTargets(hostInput, 3389))
+    
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    
+    output = scanner.LogOutput() if resultFile is None else scanner.JSONLinesOutput(resultFile)
+    if workers > 1:
+        command = [sys.executable, os.path.abspath(__file__), "-W", "-w", str(width), "-l", str(height), "-o", path, "-t", str(timeout), "-c", str(concurrency), "-T", str(hostTimeout), "-r", str(retries), "-P", tlsPolicy]
+        scan = supervisor.Supervisor(command, workers, output)
+    else:
+        scan = scanner.Scanner(RDPScreenshotJobFactory(path, width, height, timeout, tlsPolicy = x224.TLS_POLICIES[tlsPolicy]), output, concurrency, hostTimeout, retries)
+    
+    stats = {}
+    def onEnd(result):
+        stats.update(result)
+        reactor.stop()
+    
+    reactor.callWhenRunning(lambda:scan.run(targets).addCallback(onEnd))
+    reactor.run()
+    if not hostInput is None and hostInput != sys.stdin:
+        hostInput.close()
+    return stats
 
 
 def help():
-    print "Usage: rdpy-rdpscreenshot [options] ip[:port]"
+    print "Usage: rdpy-rdpscreenshot [options] ip[:port] ..."
     print "\t-w: width of screen default value is 1024"
     print "\t-l: height of screen default value is 800"
-    print "\t-o: file path of screenshot default(/tmp/rdpy-rdpscreenshot.jpg)"
+    print "\t-o: output directory of screenshots default(/tmp/)"
     print "\t-t: timeout of connection without any updating order (default is 2s)"
+    print "\t-f: file with one ip[:port] per line (- for stdin)"
+    print "\t-c: max number of simultaneous connections (default is 64)"
+    print "\t-T: max duration of one connection (default is 30s)"
+    print "\t-r: number of retries after failure (default is 0)"
+    print "\t-j: append results as JSON lines in file (- for stdout)"
+    print "\t-n: number of worker processes (default is 1)"
+    print "\t-P: TLS policy [default|modern|legacy] (default is default, legacy is tried on handshake failure)"
 
 if __name__ == '__main__':
     # default script argument
     width = 1024
     height = 800
     path = "/tmp/"
-    timeout = 5.0
+    timeout = 2.0
+    hostFile = None
+    concurrency = 64
+    hostTimeout = 30.0
+    retries = 0
+    resultFile = None
+    workers = 1
+    worker = False
+    tlsPolicy = "default"
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hw:l:o:t:")
+        opts, args = getopt.getopt(sys.argv[1:], "hw:l:o:t:f:c:T:r:j:n:WP:")
     except getopt.GetoptError:
         help()
+        sys.exit(1)
     for opt, arg in opts:
         if opt == "-h":
             help()
@@ -221,5 +131,29 @@ if __name__ == '__main__':
             path = arg
         elif opt == "-t":
             timeout = float(arg)
+        elif opt == "-f":
+            hostFile = arg
+        elif opt == "-c":
+            concurrency = int(arg)
+        elif opt == "-T":
+            hostTimeout = float(arg)
+        elif opt == "-r":
+            retries = int(arg)
+        elif opt == "-j":
+            resultFile = arg
+        elif opt == "-n":
+            workers = int(arg)
+        elif opt == "-W":
+            worker = True
+        elif opt == "-P":
+            tlsPolicy = arg
+    
+    if not tlsPolicy in x224.TLS_POLICIES:
+        help()
+        sys.exit(1)
 
-    main(width, height, path, timeout, args)
+    if worker:
+        #targets are sent by supervisor
+        supervisor.runWorker(RDPScreenshotJobFactory(path, width, height, timeout, tlsPolicy = x224.TLS_POLICIES[tlsPolicy]), concurrency, hostTimeout, retries)
+    else:
+        main(width, height, path, timeout, args, hostFile, concurrency, hostTimeout, retries, resultFile, workers, tlsPolicy)
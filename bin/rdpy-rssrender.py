@@ -0,0 +1,69 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+"""
+Pre-render rss files for honeypot
+Each scenario is rendered for common screen sizes and color depths
+"""
+
+import sys, os, getopt
+
+from rdpy.core import log
+from rdpy.ui import prerender
+log._LOG_LEVEL = log.Level.INFO
+
+def help():
+    """
+    @summary: Print help in console
+    """
+    print """
+    Usage:  rdpy-rssrender.py 
+            [-o output_directory default current directory] 
+            [-s screens default 800x600,1024x768,1280x800,1280x1024,1366x768,1920x1080] 
+            [-d color_depths default 15,16,24,32] 
+            rss_filepath(1..n)
+    """
+    
+if __name__ == '__main__':
+    outputDirectory = "."
+    screens = "800x600,1024x768,1280x800,1280x1024,1366x768,1920x1080"
+    colorDepths = "15,16,24,32"
+    
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "ho:s:d:")
+    except getopt.GetoptError:
+        help()
+        sys.exit(1)
+    for opt, arg in opts:
+        if opt == "-h":
+            help()
+            sys.exit()
+        elif opt == "-o":
+            outputDirectory = arg
+        elif opt == "-s":
+            screens = arg
+        elif opt == "-d":
+            colorDepths = arg
+            
+    screens = [tuple([int(x) for x in screen.split("x")]) for screen in screens.split(",")]
+    colorDepths = [int(x) for x in colorDepths.split(",")]
+    
+    for arg in args:
+        for path in prerender.renderVariants(arg, outputDirectory, screens, colorDepths):
+            log.info("%s -> %s"%(arg, path))
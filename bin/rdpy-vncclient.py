@@ -34,11 +34,19 @@ class RFBClientQtFactory(rfb.ClientFactory):
     """
     @summary: Factory create a VNC GUI client
     """
-    def __init__(self, password):
+    def __init__(self, password, maxFrameRate = 0, continuousUpdates = False, bitsPerPixel = 32, trueColor = True):
         """
         @param password: password for VNC authentication
+        @param maxFrameRate: max incremental update requests per second (0 for no limit)
+        @param continuousUpdates: use ContinuousUpdates extension if server support it
+        @param bitsPerPixel: pixel format requested to server (32, 16 or 8)
+        @param trueColor: False for 8 bits colour map
         """
         self._password = password
+        self._maxFrameRate = maxFrameRate
+        self._continuousUpdates = continuousUpdates
+        self._bitsPerPixel = bitsPerPixel
+        self._trueColor = trueColor
         
     def buildObserver(self, controller, addr):
         """
@@ -48,6 +56,10 @@ class RFBClientQtFactory(rfb.ClientFactory):
         """
         #set password
         controller.setPassword(self._password)
+        #update pacing
+        controller.setMaxFrameRate(self._maxFrameRate)
+        controller.setContinuousUpdates(self._continuousUpdates)
+        controller.setPixelFormat(self._bitsPerPixel, self._trueColor)
         #create client observer
         client = RFBClientQt(controller)
         #create qt widget
@@ -80,9 +92,13 @@ if __name__ == '__main__':
     
     #default script argument
     password = ""
+    maxFrameRate = 0
+    continuousUpdates = False
+    bitsPerPixel = 32
+    trueColor = True
     
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hp:")
+        opts, args = getopt.getopt(sys.argv[1:], "hp:f:cb:")
     except getopt.GetoptError:
         help()
     for opt, arg in opts:
@@ -91,6 +107,14 @@ if __name__ == '__main__':
             sys.exit()
         elif opt == "-p":
             password = arg
+        elif opt == "-f":
+            maxFrameRate = float(arg)
+        elif opt == "-c":
+            continuousUpdates = True
+        elif opt == "-b":
+            #8c for colour map
+            trueColor = not arg.endswith("c")
+            bitsPerPixel = int(arg.rstrip("c"))
             
     if ':' in args[0]:
         ip, port = args[0].split(':')
@@ -105,6 +129,6 @@ if __name__ == '__main__':
     qt4reactor.install()
 
     from twisted.internet import reactor
-    reactor.connectTCP(ip, int(port), RFBClientQtFactory(password))
+    reactor.connectTCP(ip, int(port), RFBClientQtFactory(password, maxFrameRate, continuousUpdates, bitsPerPixel, trueColor))
     reactor.runReturn()
     app.exec_()
\ No newline at end of file
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+VNC Honey pot use Rss scenario file to simulate VNC server
+Scenario is played in loop in one desktop shared by all clients,
+each frame is drawn and encoded once whatever the number of clients
+"""
+
+import sys, getopt, datetime
+
+from rdpy.core import log, rss
+from rdpy.protocol.rfb import rfb
+from rdpy.protocol.rfb.desktop import Desktop
+from twisted.internet import reactor
+
+log._LOG_LEVEL = log.Level.INFO
+
+class ScenarioPlayer(object):
+    """
+    @summary: Play scenario in loop into desktop
+    """
+    def __init__(self, scenarioCache, key, desktop, speed = 1.0):
+        """
+        @param scenarioCache: {rss.ScenarioCache} loaded scenario
+        @param key: {tuple} (width, height, colorDepth) of scenario
+        @param desktop: {Desktop} shared desktop
+        @param speed: {float} playback speed factor
+        """
+        self._scenarioCache = scenarioCache
+        self._key = key
+        self._desktop = desktop
+        self._speed = speed
+        self._rssFile = None
+        
+    def start(self):
+        """
+        @summary: Play scenario from beginning
+                    called again one second after end of scenario
+        """
+        _, self._rssFile = self._scenarioCache.select(*self._key)
+        self.loopScenario(self._rssFile.nextEvent())
+        
+    def loopScenario(self, nextEvent):
+        """
+        @summary: main loop event
+        @param nextEvent: {rss.Event} event to play now
+        """
+        while not nextEvent is None:
+            if nextEvent.type.value == rss.EventType.UPDATE:
+                e = nextEvent.event
+                self._desktop.drawRDPBitmap(e.destLeft.value, e.destTop.value, e.destRight.value, e.destBottom.value, e.width.value, e.height.value, e.bpp.value, e.format.value == rss.UpdateFormat.BMP, e.data.value)
+            
+            nextEvent = self._rssFile.nextEvent()
+            if not nextEvent is None and nextEvent.timestamp.value > 0:
+                reactor.callLater(float(nextEvent.timestamp.value) / 1000.0 / self._speed, self.loopScenario, nextEvent)
+                return
+        
+        #end of scenario restart from beginning
+        reactor.callLater(1.0, self.start)
+    
+class HoneyPotServer(rfb.RFBServerObserver):
+    def onReady(self):
+        log.info("%s --- Client is ready"%datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'))
+        
+    def onClose(self):
+        """ HoneyPot """
+        
+    def onKeyEvent(self, isDown, key):
+        """ HoneyPot """
+        
+    def onPointerEvent(self, mask, x, y):
+        """ HoneyPot """
+        
+class HoneyPotServerFactory(rfb.ServerFactory):
+    """
+    @summary: Factory on listening events
+    """
+    def buildObserver(self, controller, addr):
+        """
+        @param controller: {rfb.RFBServerController}
+        @param addr: destination address
+        @see: rfb.ServerFactory.buildObserver
+        """
+        log.info("%s --- Connection from %s:%s"%(datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'), addr.host, addr.port))
+        return HoneyPotServer(controller)
+    
+def help():
+    """
+    @summary: Print help in console
+    """
+    print """
+    Usage:  rdpy-vnchoneypot.py 
+            [-L logfile]
+            [-l listen_port default 5900] 
+            [-p password (default no authentication)] 
+            [-n desktop name default rdpy] 
+            [-s playback speed factor default 1.0] 
+            rss_filepath
+    """
+    
+if __name__ == '__main__':
+    listen = "5900"
+    password = None
+    name = "rdpy"
+    speed = 1.0
+    
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hl:p:n:s:L:")
+    except getopt.GetoptError:
+        help()
+    for opt, arg in opts:
+        if opt == "-h":
+            help()
+            sys.exit()
+        elif opt == "-L":
+            log._LOG_FILE = arg 
+        elif opt == "-l":
+            listen = arg
+        elif opt == "-p":
+            password = arg
+        elif opt == "-n":
+            name = arg
+        elif opt == "-s":
+            speed = float(arg)
+            
+    if len(args) != 1:
+        help()
+        sys.exit()
+    
+    #first screen event give desktop size
+    scenarioCache = rss.ScenarioCache()
+    key = scenarioCache.load(args[0])
+    if key is None:
+        log.error("no screen event in %s"%args[0])
+        sys.exit(1)
+    log.info("%s --- Start vnchoneypot %sx%s"%(datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ'), key[0], key[1]))
+    
+    desktop = Desktop(key[0], key[1], name)
+    ScenarioPlayer(scenarioCache, key, desktop, speed).start()
+    reactor.listenTCP(int(listen), HoneyPotServerFactory(desktop, password))
+    reactor.run()
@@ -20,131 +20,100 @@
 
 """
 example of use rdpy
-take screenshot of login page
+take screenshot of first screen
+Scan many hosts with bounded concurrency, without Qt
+Use many worker processes to use all cores
 """
 
-import sys, os, getopt
-from PyQt4 import QtCore, QtGui
-from rdpy.protocol.rfb import rfb
+import getopt
+import itertools
+import os
+import sys
+
+from rdpy.core import scanner, supervisor
+from rdpy.protocol.rfb.screenshot import RFBScreenshotJobFactory
 import rdpy.core.log as log
-from rdpy.ui.qt4 import qtImageFormatFromRFBPixelFormat
-from twisted.internet import task
 
 #set log level
 log._LOG_LEVEL = log.Level.INFO
 
-class RFBScreenShotFactory(rfb.ClientFactory):
+def main(password, path, timeout, hosts, hostFile = None, concurrency = 64, hostTimeout = 30.0, retries = 0, resultFile = None, workers = 1, bitsPerPixel = 32):
     """
-    @summary: Factory for screenshot exemple
+    @summary: main algorithm
+    @param password: {str} password for VNC authentication
+    @param path: {str} output directory
+    @param timeout: {float} take screenshot after timeout s without any updating
+    @param hosts: {list(str(ip[:port]))}
+    @param hostFile: {str} file with one ip[:port] per line ("-" for stdin)
+    @param concurrency: {integer} max number of connections in progress
+    @param hostTimeout: {float} max duration of one connection in sec
+    @param retries: {integer} new attempts after failure
+    @param resultFile: {str} JSON lines results file
+    @param workers: {integer} number of worker processes (concurrency is by worker)
+    @param bitsPerPixel: {integer} pixel format requested to servers
+    @return: {dict} number of hosts by status
     """
-    __INSTANCE__ = 0
-    def __init__(self, password, path):
-        """
-        @param password: password for VNC authentication
-        @param path: path of output screenshot
-        """
-        RFBScreenShotFactory.__INSTANCE__ += 1
-        self._path = path
-        self._password = password
-        
-    def clientConnectionLost(self, connector, reason):
-        """
-        @summary: Connection lost event
-        @param connector: twisted connector use for rfb connection (use reconnect to restart connection)
-        @param reason: str use to advertise reason of lost connection
-        """
-        log.info("connection lost : %s"%reason)
-        RFBScreenShotFactory.__INSTANCE__ -= 1
-        if(RFBScreenShotFactory.__INSTANCE__ == 0):
-            reactor.stop()
-            app.exit()
-        
-    def clientConnectionFailed(self, connector, reason):
-        """
-        @summary: Connection failed event
-        @param connector: twisted connector use for rfb connection (use reconnect to restart connection)
-        @param reason: str use to advertise reason of lost connection
-        """
-        log.info("connection failed : %s"%reason)
-        RFBScreenShotFactory.__INSTANCE__ -= 1
-        if(RFBScreenShotFactory.__INSTANCE__ == 0):
-            reactor.stop()
-            app.exit()
-        
-        
-    def buildObserver(self, controller, addr):
-        """
-        @summary: build ScreenShot observer
-        @param controller: RFBClientController
-        @param addr: address of target
-        """
-        class ScreenShotObserver(rfb.RFBClientObserver):
-            """
-            @summary: observer that connect, cache every image received and save at deconnection
-            """
-            def __init__(self, controller, path):
-                """
-                @param controller: RFBClientController
-                @param path: path of output screenshot
-                """
-                rfb.RFBClientObserver.__init__(self, controller)
-                self._path = path
-                self._buffer = None
-                
-            def onUpdate(self, width, height, x, y, pixelFormat, encoding, data):
-                """
-                Implement RFBClientObserver interface
-                @param width: width of new image
-                @param height: height of new image
-                @param x: x position of new image
-                @param y: y position of new image
-                @param pixelFormat: pixefFormat structure in rfb.message.PixelFormat
-                @param encoding: encoding type rfb.message.Encoding
-                @param data: image data in accordance with pixel format and encoding
-                """
-                imageFormat = qtImageFormatFromRFBPixelFormat(pixelFormat)
-                if imageFormat is None:
-                    log.error("Receive image in bad format")
-                    return
-                image = QtGui.QImage(data, width, height, imageFormat)
-                with QtGui.QPainter(self._buffer) as qp:
-                #draw image
-                    qp.drawImage(x, y, image, 0, 0, width, height)
-                
-                self._controller.close()
-                
-            def onReady(self):
-                """
-                @summary: callback use when RDP stack is connected (just before received bitmap)
-                """
-                log.info("connected %s"%addr)
-                width, height = self._controller.getScreen()
-                self._buffer = QtGui.QImage(width, height, QtGui.QImage.Format_RGB32)
-            
-            def onClose(self):
-                """
-                @summary: callback use when RDP stack is closed
-                """
-                log.info("save screenshot into %s"%self._path)
-                self._buffer.save(self._path)
-        
-        controller.setPassword(self._password)
-        return ScreenShotObserver(controller, self._path)
+    from twisted.internet import reactor
+    
+    targets = scanner.readTargets(hosts, 5900)
+    hostInput = None
+    if not hostFile is None:
+        hostInput = sys.stdin if hostFile == "-" else open(hostFile)
+        targets = itertools.chain(targets, scanner.readTargets(hostInput, 5900))
+    
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    
+    output = scanner.LogOutput() if resultFile is None else scanner.JSONLinesOutput(resultFile)
+    if workers > 1:
+        command = [sys.executable, os.path.abspath(__file__), "-W", "-p", password, "-o", path, "-t", str(timeout), "-c", str(concurrency), "-T", str(hostTimeout), "-r", str(retries), "-b", str(bitsPerPixel)]
+        scan = supervisor.Supervisor(command, workers, output)
+    else:
+        scan = scanner.Scanner(RFBScreenshotJobFactory(path, password, timeout, bitsPerPixel = bitsPerPixel), output, concurrency, hostTimeout, retries)
+    
+    stats = {}
+    def onEnd(result):
+        stats.update(result)
+        reactor.stop()
+    
+    reactor.callWhenRunning(lambda:scan.run(targets).addCallback(onEnd))
+    reactor.run()
+    if not hostInput is None and hostInput != sys.stdin:
+        hostInput.close()
+    return stats
         
 def help():
-    print "Usage: rdpy-vncscreenshot [options] ip[:port]"
-    print "\t-o: file path of screenshot default(/tmp/rdpy-vncscreenshot.jpg)"
+    print "Usage: rdpy-vncscreenshot [options] ip[:port] ..."
+    print "\t-o: output directory of screenshots default(/tmp/)"
     print "\t-p: password for VNC Session"
+    print "\t-t: timeout of connection without any updating order (default is 1s)"
+    print "\t-f: file with one ip[:port] per line (- for stdin)"
+    print "\t-c: max number of simultaneous connections (default is 64)"
+    print "\t-T: max duration of one connection (default is 30s)"
+    print "\t-r: number of retries after failure (default is 0)"
+    print "\t-j: append results as JSON lines in file (- for stdout)"
+    print "\t-n: number of worker processes (default is 1)"
+    print "\t-b: bits per pixel requested to server 32, 16 or 8 (default is 32, 16 halves bandwidth)"
         
 if __name__ == '__main__':
     #default script argument
     path = "/tmp/"
     password = ""
+    timeout = 1.0
+    hostFile = None
+    concurrency = 64
+    hostTimeout = 30.0
+    retries = 0
+    resultFile = None
+    workers = 1
+    worker = False
+    bitsPerPixel = 32
     
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hp:o:")
+        opts, args = getopt.getopt(sys.argv[1:], "hp:o:t:f:c:T:r:j:n:Wb:")
     except getopt.GetoptError:
         help()
+        sys.exit(1)
     for opt, arg in opts:
         if opt == "-h":
             help()
@@ -153,24 +122,27 @@ if __name__ == '__main__':
             path = arg
         elif opt == "-p":
             password = arg
-        
-    #create application
-    app = QtGui.QApplication(sys.argv)
-    
-    #add qt4 reactor
-    import qt4reactor
-    qt4reactor.install()
-    from twisted.internet import reactor
-
-    
-    for arg in args:      
-        if ':' in arg:
-            ip, port = arg.split(':')
-        else:
-            ip, port = arg, "5900"
-        
-        reactor.connectTCP(ip, int(port), RFBScreenShotFactory(password, path + "%s.jpg"%ip))
-        
+        elif opt == "-t":
+            timeout = float(arg)
+        elif opt == "-f":
+            hostFile = arg
+        elif opt == "-c":
+            concurrency = int(arg)
+        elif opt == "-T":
+            hostTimeout = float(arg)
+        elif opt == "-r":
+            retries = int(arg)
+        elif opt == "-j":
+            resultFile = arg
+        elif opt == "-n":
+            workers = int(arg)
+        elif opt == "-W":
+            worker = True
+        elif opt == "-b":
+            bitsPerPixel = int(arg)
     
-    reactor.runReturn()
-    app.exec_()
\ No newline at end of file
+    if worker:
+        #targets are sent by supervisor
+        supervisor.runWorker(RFBScreenshotJobFactory(path, password, timeout, bitsPerPixel = bitsPerPixel), concurrency, hostTimeout, retries)
+    else:
+        main(password, path, timeout, args, hostFile, concurrency, hostTimeout, retries, resultFile, workers, bitsPerPixel)
@@ -0,0 +1,415 @@
+/*
+   Copyright (c) 2014-2015 Sylvain Peyrefitte
+
+   This file is part of rdpy.
+
+   rdpy is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   This program is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with this program. If not, see <http://www.gnu.org/licenses/>.
+*/
+
+/* MPPC bulk compression used by RDP 4.0 (8K history) and RDP 5.0 (64K history)
+   http://msdn.microsoft.com/en-us/library/cc240838.aspx
+   History buffer and hash table are owned by caller to keep one per session */
+
+#include <Python.h>
+
+#define uint8	unsigned char
+#define uint32	unsigned int
+
+typedef struct
+{
+	const uint8* data;
+	Py_ssize_t len;
+	Py_ssize_t pos;
+	uint32 acc;
+	int nbits;
+} bit_reader;
+
+static void
+reader_fill(bit_reader* r)
+{
+	while (r->nbits <= 24 && r->pos < r->len)
+	{
+		r->acc |= ((uint32)r->data[r->pos++]) << (24 - r->nbits);
+		r->nbits += 8;
+	}
+}
+
+static Py_ssize_t
+reader_left(bit_reader* r)
+{
+	return r->nbits + (r->len - r->pos) * 8;
+}
+
+/* look at next n bits (n <= 16) without consume them, missing bits are zero */
+static uint32
+reader_peek(bit_reader* r, int n)
+{
+	reader_fill(r);
+	return r->acc >> (32 - n);
+}
+
+/* consume n bits (n <= 16), return 0 if stream is too short */
+static int
+reader_read(bit_reader* r, int n, uint32* value)
+{
+	reader_fill(r);
+	if (r->nbits < n)
+		return 0;
+	*value = r->acc >> (32 - n);
+	r->acc <<= n;
+	r->nbits -= n;
+	return 1;
+}
+
+/* decompress data at offset of history, return new history offset or -1 on error */
+static int
+mppc_decompress(uint8* history, int history_size, int offset, const uint8* data, Py_ssize_t len, int big)
+{
+	bit_reader r = {data, len, 0, 0, 0};
+	uint32 value, copy_offset, length_of_match;
+	int k;
+
+	/* end of stream is padded with less than 8 zero bits */
+	while (reader_left(&r) >= 8)
+	{
+		/* literal 0x00 - 0x7f : 0 + 7 bits */
+		if (reader_peek(&r, 1) == 0)
+		{
+			if (!reader_read(&r, 8, &value) || offset >= history_size)
+				return -1;
+			history[offset++] = (uint8)value;
+			continue;
+		}
+
+		/* literal 0x80 - 0xff : 10 + 7 bits */
+		if (reader_peek(&r, 2) == 2)
+		{
+			if (!reader_read(&r, 9, &value) || offset >= history_size)
+				return -1;
+			history[offset++] = (uint8)(0x80 | (value & 0x7f));
+			continue;
+		}
+
+		/* copy offset */
+		if (big)
+		{
+			if (reader_peek(&r, 5) == 0x1f)
+			{
+				if (!reader_read(&r, 11, &value))
+					return -1;
+				copy_offset = value & 0x3f;
+			}
+			else if (reader_peek(&r, 5) == 0x1e)
+			{
+				if (!reader_read(&r, 13, &value))
+					return -1;
+				copy_offset = (value & 0xff) + 64;
+			}
+			else if (reader_peek(&r, 4) == 0xe)
+			{
+				if (!reader_read(&r, 15, &value))
+					return -1;
+				copy_offset = (value & 0x7ff) + 320;
+			}
+			else
+			{
+				if (!reader_read(&r, 3, &value) || !reader_read(&r, 16, &value))
+					return -1;
+				copy_offset = value + 2368;
+			}
+		}
+		else
+		{
+			if (reader_peek(&r, 4) == 0xf)
+			{
+				if (!reader_read(&r, 10, &value))
+					return -1;
+				copy_offset = value & 0x3f;
+			}
+			else if (reader_peek(&r, 4) == 0xe)
+			{
+				if (!reader_read(&r, 12, &value))
+					return -1;
+				copy_offset = (value & 0xff) + 64;
+			}
+			else
+			{
+				if (!reader_read(&r, 16, &value))
+					return -1;
+				copy_offset = (value & 0x1fff) + 320;
+			}
+		}
+
+		/* length of match : k ones, one zero, k + 1 bits */
+		k = 0;
+		while (1)
+		{
+			if (!reader_read(&r, 1, &value))
+				return -1;
+			if (value == 0)
+				break;
+			if (++k > (big ? 14 : 11))
+				return -1;
+		}
+
+		if (k == 0)
+			length_of_match = 3;
+		else
+		{
+			if (!reader_read(&r, k + 1, &value))
+				return -1;
+			length_of_match = (1 << (k + 1)) + value;
+		}
+
+		if (copy_offset == 0 || copy_offset > (uint32)offset || offset + length_of_match > (uint32)history_size)
+			return -1;
+
+		/* byte per byte because source and destination may overlap */
+		while (length_of_match--)
+		{
+			history[offset] = history[offset - copy_offset];
+			offset++;
+		}
+	}
+
+	return offset;
+}
+
+typedef struct
+{
+	uint8* data;
+	Py_ssize_t pos;
+	uint32 acc;
+	int nbits;
+} bit_writer;
+
+/* write n bits (n <= 16) */
+static void
+writer_write(bit_writer* w, uint32 value, int n)
+{
+	w->acc |= (value & ((1 << n) - 1)) << (32 - w->nbits - n);
+	w->nbits += n;
+	while (w->nbits >= 8)
+	{
+		w->data[w->pos++] = (uint8)(w->acc >> 24);
+		w->acc <<= 8;
+		w->nbits -= 8;
+	}
+}
+
+/* pad last byte with zero bits */
+static void
+writer_flush(bit_writer* w)
+{
+	if (w->nbits > 0)
+		w->data[w->pos++] = (uint8)(w->acc >> 24);
+	w->acc = 0;
+	w->nbits = 0;
+}
+
+#define HASH_BITS	15
+#define MIN_MATCH	3
+
+static uint32
+mppc_hash(const uint8* p)
+{
+	return ((((uint32)p[0] << 16) | ((uint32)p[1] << 8) | p[2]) * 2654435761U) >> (32 - HASH_BITS);
+}
+
+static void
+mppc_write_literal(bit_writer* w, uint8 c)
+{
+	if (c < 0x80)
+		writer_write(w, c, 8);
+	else
+		writer_write(w, 0x100 | (c & 0x7f), 9);
+}
+
+static void
+mppc_write_copy(bit_writer* w, uint32 copy_offset, uint32 length_of_match, int big)
+{
+	int k;
+
+	if (big)
+	{
+		if (copy_offset < 64)
+			writer_write(w, (0x1f << 6) | copy_offset, 11);
+		else if (copy_offset < 320)
+			writer_write(w, (0x1e << 8) | (copy_offset - 64), 13);
+		else if (copy_offset < 2368)
+			writer_write(w, (0xe << 11) | (copy_offset - 320), 15);
+		else
+		{
+			writer_write(w, 0x6, 3);
+			writer_write(w, copy_offset - 2368, 16);
+		}
+	}
+	else
+	{
+		if (copy_offset < 64)
+			writer_write(w, (0xf << 6) | copy_offset, 10);
+		else if (copy_offset < 320)
+			writer_write(w, (0xe << 8) | (copy_offset - 64), 12);
+		else
+			writer_write(w, (0x6 << 13) | (copy_offset - 320), 16);
+	}
+
+	if (length_of_match == 3)
+	{
+		writer_write(w, 0, 1);
+		return;
+	}
+
+	/* k ones, one zero, k + 1 bits */
+	for (k = 1; (uint32)(1 << (k + 2)) <= length_of_match; k++);
+	writer_write(w, ((1 << k) - 1) << 1, k + 1);
+	writer_write(w, length_of_match - (1 << (k + 1)), k + 1);
+}
+
+/* copy data at offset of history and compress it against history
+   hash table keep last position of each 3 bytes sequence, stale entries are checked
+   return size of compressed data in output */
+static Py_ssize_t
+mppc_compress(uint8* history, int history_size, int offset, int* table, const uint8* data, Py_ssize_t len, uint8* output, int big)
+{
+	bit_writer w = {output, 0, 0, 0};
+	int pos = offset, end = offset + (int)len;
+	int max_offset = big ? 65535 : 8191;
+	int max_match = big ? 65535 : 8191;
+
+	memcpy(history + offset, data, len);
+
+	while (pos < end)
+	{
+		int candidate, match = 0;
+		uint32 h;
+
+		if (end - pos >= MIN_MATCH)
+		{
+			h = mppc_hash(history + pos);
+			candidate = table[h];
+			table[h] = pos;
+
+			if (candidate >= 0 && candidate < pos && pos - candidate <= max_offset)
+			{
+				while (pos + match < end && match < max_match && history[candidate + match] == history[pos + match])
+					match++;
+			}
+		}
+
+		if (match < MIN_MATCH)
+		{
+			mppc_write_literal(&w, history[pos++]);
+			continue;
+		}
+
+		mppc_write_copy(&w, pos - candidate, match, big);
+
+		/* index skipped positions */
+		for (pos++, match--; match > 0; pos++, match--)
+		{
+			if (end - pos >= MIN_MATCH)
+				table[mppc_hash(history + pos)] = pos;
+		}
+	}
+
+	writer_flush(&w);
+	return w.pos;
+}
+
+static PyObject*
+mppc_compress_wrapper(PyObject* self, PyObject* args)
+{
+	Py_buffer history, table, input;
+	int history_size = 0, offset = 0, big = 0;
+	Py_ssize_t size;
+	PyObject* output;
+
+	if (!PyArg_ParseTuple(args, "w*iiw*s*i", &history, &history_size, &offset, &table, &input, &big))
+		return NULL;
+
+	if (history_size > history.len || offset < 0 || offset + input.len > history_size || table.len < (Py_ssize_t)((1 << HASH_BITS) * sizeof(int)))
+	{
+		PyBuffer_Release(&history);
+		PyBuffer_Release(&table);
+		PyBuffer_Release(&input);
+		PyErr_SetString(PyExc_ValueError, "invalid mppc history");
+		return NULL;
+	}
+
+	/* worst case is 9 bits per literal */
+	output = PyString_FromStringAndSize(NULL, input.len + input.len / 8 + 2);
+	if (output == NULL)
+	{
+		PyBuffer_Release(&history);
+		PyBuffer_Release(&table);
+		PyBuffer_Release(&input);
+		return NULL;
+	}
+
+	size = mppc_compress((uint8*)history.buf, history_size, offset, (int*)table.buf, (const uint8*)input.buf, input.len, (uint8*)PyString_AS_STRING(output), big);
+
+	PyBuffer_Release(&history);
+	PyBuffer_Release(&table);
+	PyBuffer_Release(&input);
+
+	if (_PyString_Resize(&output, size) < 0)
+		return NULL;
+
+	return output;
+}
+
+static PyObject*
+mppc_decompress_wrapper(PyObject* self, PyObject* args)
+{
+	Py_buffer history, input;
+	int history_size = 0, offset = 0, big = 0;
+
+	if (!PyArg_ParseTuple(args, "w*iis*i", &history, &history_size, &offset, &input, &big))
+		return NULL;
+
+	if (history_size > history.len || offset < 0 || offset > history_size)
+	{
+		PyBuffer_Release(&history);
+		PyBuffer_Release(&input);
+		PyErr_SetString(PyExc_ValueError, "invalid mppc history");
+		return NULL;
+	}
+
+	offset = mppc_decompress((uint8*)history.buf, history_size, offset, (const uint8*)input.buf, input.len, big);
+
+	PyBuffer_Release(&history);
+	PyBuffer_Release(&input);
+
+	if (offset < 0)
+	{
+		PyErr_SetString(PyExc_ValueError, "invalid mppc compressed data");
+		return NULL;
+	}
+
+	return Py_BuildValue("i", offset);
+}
+
+static PyMethodDef mppc_methods[] =
+{
+	{"decompress", mppc_decompress_wrapper, METH_VARARGS, "decompress mppc data into history, return new history offset."},
+	{"compress", mppc_compress_wrapper, METH_VARARGS, "copy data into history and return mppc compressed data."},
+	{NULL, NULL, 0, NULL}
+};
+
+PyMODINIT_FUNC
+initmppc(void)
+{
+	(void) Py_InitModule("mppc", mppc_methods);
+}
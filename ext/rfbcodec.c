@@ -0,0 +1,842 @@
+/*
+   Copyright (c) 2014-2015 Sylvain Peyrefitte
+
+   This file is part of rdpy.
+
+   rdpy is free software: you can redistribute it and/or modify
+   it under the terms of the GNU General Public License as published by
+   the Free Software Foundation, either version 3 of the License, or
+   (at your option) any later version.
+
+   This program is distributed in the hope that it will be useful,
+   but WITHOUT ANY WARRANTY; without even the implied warranty of
+   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+   GNU General Public License for more details.
+
+   You should have received a copy of the GNU General Public License
+   along with this program. If not, see <http://www.gnu.org/licenses/>.
+*/
+
+/* RFB rectangle decoding loops of ZRLE and Tight encodings, and ZRLE tile encoding of server side
+   http://www.realvnc.com/docs/rfbproto.pdf
+   zlib streams are owned by caller (one per connection), these functions
+   only work on inflated data and raw pixels in client pixel format */
+
+#include <Python.h>
+
+#define uint8	unsigned char
+#define uint32	unsigned int
+
+#define ZRLE_TILE_SIZE	64
+
+typedef struct
+{
+	int bytes_per_pixel;
+	int big_endian;
+	uint32 max[3];
+	int shift[3];
+} pixel_format;
+
+typedef struct
+{
+	const uint8* data;
+	Py_ssize_t len;
+	Py_ssize_t pos;
+} byte_reader;
+
+static const uint8*
+reader_take(byte_reader* r, Py_ssize_t n)
+{
+	const uint8* p;
+	if (n < 0 || r->len - r->pos < n)
+		return NULL;
+	p = r->data + r->pos;
+	r->pos += n;
+	return p;
+}
+
+/* expand a compressed pixel into a client pixel */
+static void
+cpixel_copy(uint8* dst, const uint8* cpixel, int cpixel_size, int bytes_per_pixel, int cpixel_offset)
+{
+	if (cpixel_size != bytes_per_pixel)
+		memset(dst, 0, bytes_per_pixel);
+	memcpy(dst + cpixel_offset, cpixel, cpixel_size);
+}
+
+static void
+fill_run(uint8* out, Py_ssize_t stride, int x, int y, int count, const uint8* pixel, int bytes_per_pixel)
+{
+	uint8* p = out + (Py_ssize_t)y * stride + (Py_ssize_t)x * bytes_per_pixel;
+	while (count--)
+	{
+		memcpy(p, pixel, bytes_per_pixel);
+		p += bytes_per_pixel;
+	}
+}
+
+/* expand packed palette indices (rows are padded to byte), return 0 on out of range index */
+static int
+palette_expand(uint8* out, Py_ssize_t stride, const uint8* indices, int width, int height, int bits, const uint8* palette, int palette_size, int bytes_per_pixel)
+{
+	int x, y, shift, index;
+	int mask = (1 << bits) - 1;
+	for (y = 0; y < height; y++)
+	{
+		uint8* p = out + (Py_ssize_t)y * stride;
+		shift = 8 - bits;
+		for (x = 0; x < width; x++)
+		{
+			index = ((*indices) >> shift) & mask;
+			if (index >= palette_size)
+				return 0;
+			memcpy(p, palette + index * bytes_per_pixel, bytes_per_pixel);
+			p += bytes_per_pixel;
+			shift -= bits;
+			if (shift < 0)
+			{
+				shift = 8 - bits;
+				indices++;
+			}
+		}
+		if (shift != 8 - bits)
+			indices++;
+	}
+	return 1;
+}
+
+static Py_ssize_t
+packed_size(int width, int height, int bits)
+{
+	return (((Py_ssize_t)width * bits + 7) / 8) * height;
+}
+
+/* decode ZRLE tiles of one rectangle, return 0 on malformed data */
+static int
+zrle_decode(byte_reader* r, uint8* out, int width, int height, int cpixel_size, int bytes_per_pixel, int cpixel_offset)
+{
+	uint8 palette[128 * 4];
+	uint8 pixel[4];
+	Py_ssize_t stride = (Py_ssize_t)width * bytes_per_pixel;
+	int tx, ty, tw, th, i, x, y;
+
+	for (ty = 0; ty < height; ty += ZRLE_TILE_SIZE)
+	{
+		th = height - ty < ZRLE_TILE_SIZE ? height - ty : ZRLE_TILE_SIZE;
+		for (tx = 0; tx < width; tx += ZRLE_TILE_SIZE)
+		{
+			const uint8* p;
+			const uint8* sub;
+			uint8* tile = out + (Py_ssize_t)ty * stride + (Py_ssize_t)tx * bytes_per_pixel;
+			int subencoding, palette_size;
+			tw = width - tx < ZRLE_TILE_SIZE ? width - tx : ZRLE_TILE_SIZE;
+
+			if ((sub = reader_take(r, 1)) == NULL)
+				return 0;
+			subencoding = *sub;
+
+			/* raw */
+			if (subencoding == 0)
+			{
+				if ((p = reader_take(r, (Py_ssize_t)tw * th * cpixel_size)) == NULL)
+					return 0;
+				for (y = 0; y < th; y++)
+					for (x = 0; x < tw; x++, p += cpixel_size)
+						cpixel_copy(tile + (Py_ssize_t)y * stride + x * bytes_per_pixel, p, cpixel_size, bytes_per_pixel, cpixel_offset);
+				continue;
+			}
+
+			/* unused subencodings */
+			if ((subencoding > 16 && subencoding < 128) || subencoding == 129)
+				return 0;
+
+			palette_size = subencoding == 128 ? 0 : subencoding & 0x7f;
+			for (i = 0; i < palette_size; i++)
+			{
+				if ((p = reader_take(r, cpixel_size)) == NULL)
+					return 0;
+				cpixel_copy(palette + i * bytes_per_pixel, p, cpixel_size, bytes_per_pixel, cpixel_offset);
+			}
+
+			/* solid */
+			if (subencoding == 1)
+			{
+				for (y = 0; y < th; y++)
+					fill_run(tile, stride, 0, y, tw, palette, bytes_per_pixel);
+				continue;
+			}
+
+			/* packed palette */
+			if (subencoding <= 16)
+			{
+				int bits = palette_size == 2 ? 1 : (palette_size <= 4 ? 2 : 4);
+				if ((p = reader_take(r, packed_size(tw, th, bits))) == NULL)
+					return 0;
+				if (!palette_expand(tile, stride, p, tw, th, bits, palette, palette_size, bytes_per_pixel))
+					return 0;
+				continue;
+			}
+
+			/* plain RLE (128) and palette RLE (130 - 255) */
+			x = 0;
+			y = 0;
+			while (y < th)
+			{
+				const uint8* color;
+				int count = 1, run;
+
+				if (palette_size == 0)
+				{
+					if ((p = reader_take(r, cpixel_size)) == NULL)
+						return 0;
+					cpixel_copy(pixel, p, cpixel_size, bytes_per_pixel, cpixel_offset);
+					color = pixel;
+				}
+				else
+				{
+					int index;
+					if ((p = reader_take(r, 1)) == NULL)
+						return 0;
+					index = *p & 0x7f;
+					if (index >= palette_size)
+						return 0;
+					color = palette + index * bytes_per_pixel;
+				}
+
+				/* run can't be longer than rest of tile, checked at each byte to not overflow count */
+				if (palette_size == 0 || *p & 0x80)
+				{
+					do
+					{
+						if ((sub = reader_take(r, 1)) == NULL)
+							return 0;
+						count += *sub;
+						if (count > (th - y) * tw - x)
+							return 0;
+					} while (*sub == 255);
+				}
+				else if (count > (th - y) * tw - x)
+					return 0;
+
+				while (count > 0)
+				{
+					run = tw - x < count ? tw - x : count;
+					fill_run(tile, stride, x, y, run, color, bytes_per_pixel);
+					count -= run;
+					x += run;
+					if (x == tw)
+					{
+						x = 0;
+						y++;
+					}
+				}
+			}
+		}
+	}
+	return 1;
+}
+
+static uint32
+pixel_key(const uint8* p, int bytes_per_pixel)
+{
+	uint32 key = 0;
+	memcpy(&key, p, bytes_per_pixel);
+	return key;
+}
+
+static int
+palette_find(const uint32* palette, int palette_size, uint32 key)
+{
+	int i;
+	for (i = 0; i < palette_size; i++)
+		if (palette[i] == key)
+			return i;
+	return -1;
+}
+
+static uint8*
+write_run_length(uint8* out, int count)
+{
+	count--;
+	while (count >= 255)
+	{
+		*out++ = 255;
+		count -= 255;
+	}
+	*out++ = (uint8)count;
+	return out;
+}
+
+/* write one run of plain RLE (index < 0) or palette RLE */
+static uint8*
+write_run(uint8* out, uint32 key, int index, long run, int cpixel_size, int cpixel_offset)
+{
+	if (index < 0)
+	{
+		memcpy(out, (const uint8*)&key + cpixel_offset, cpixel_size);
+		return write_run_length(out + cpixel_size, (int)run);
+	}
+	if (run == 1)
+	{
+		*out++ = (uint8)index;
+		return out;
+	}
+	*out++ = (uint8)(index | 0x80);
+	return write_run_length(out, (int)run);
+}
+
+/* encode one rectangle of client pixels as ZRLE tiles (before zlib)
+   each tile use the smallest of raw, solid, packed palette, plain RLE and palette RLE
+   return end of written data */
+static uint8*
+zrle_encode(const uint8* pixels, uint8* out, int width, int height, int bytes_per_pixel, int cpixel_size, int cpixel_offset)
+{
+	uint32 palette[127];
+	const uint8* palette_pixel[127];
+	Py_ssize_t stride = (Py_ssize_t)width * bytes_per_pixel;
+	int tx, ty, tw, th, x, y, i;
+
+	for (ty = 0; ty < height; ty += ZRLE_TILE_SIZE)
+	{
+		th = height - ty < ZRLE_TILE_SIZE ? height - ty : ZRLE_TILE_SIZE;
+		for (tx = 0; tx < width; tx += ZRLE_TILE_SIZE)
+		{
+			const uint8* tile = pixels + (Py_ssize_t)ty * stride + (Py_ssize_t)tx * bytes_per_pixel;
+			int palette_size = 0, bits = 0, best;
+			long best_cost, packed_cost = -1, plain_rle_cost = 0, palette_rle_cost = 0;
+			long run = 0;
+			uint32 prev = 0;
+			tw = width - tx < ZRLE_TILE_SIZE ? width - tx : ZRLE_TILE_SIZE;
+
+			/* first pass : palette and cost of runs */
+			for (y = 0; y < th; y++)
+			{
+				for (x = 0; x < tw; x++)
+				{
+					const uint8* p = tile + y * stride + x * bytes_per_pixel;
+					uint32 key = pixel_key(p, bytes_per_pixel);
+					if (run > 0 && key == prev)
+					{
+						run++;
+						continue;
+					}
+					if (run > 0)
+					{
+						plain_rle_cost += cpixel_size + (run - 1) / 255 + 1;
+						palette_rle_cost += 1 + (run > 1 ? (run - 1) / 255 + 1 : 0);
+					}
+					prev = key;
+					run = 1;
+					if (palette_size <= 127 && palette_find(palette, palette_size, key) < 0)
+					{
+						if (palette_size < 127)
+						{
+							palette[palette_size] = key;
+							palette_pixel[palette_size] = p;
+						}
+						palette_size++;
+					}
+				}
+			}
+			plain_rle_cost += cpixel_size + (run - 1) / 255 + 1;
+			palette_rle_cost += 1 + (run > 1 ? (run - 1) / 255 + 1 : 0);
+
+			/* solid */
+			if (palette_size == 1)
+			{
+				*out++ = 1;
+				memcpy(out, palette_pixel[0] + cpixel_offset, cpixel_size);
+				out += cpixel_size;
+				continue;
+			}
+
+			if (palette_size <= 127)
+			{
+				palette_rle_cost += palette_size * cpixel_size;
+				if (palette_size <= 16)
+				{
+					bits = palette_size == 2 ? 1 : (palette_size <= 4 ? 2 : 4);
+					packed_cost = palette_size * cpixel_size + packed_size(tw, th, bits);
+				}
+			}
+			else
+				palette_rle_cost = -1;
+
+			/* 0 raw, 1 packed palette, 2 plain RLE, 3 palette RLE */
+			best = 0;
+			best_cost = (long)tw * th * cpixel_size;
+			if (packed_cost >= 0 && packed_cost < best_cost)
+			{
+				best = 1;
+				best_cost = packed_cost;
+			}
+			if (plain_rle_cost < best_cost)
+			{
+				best = 2;
+				best_cost = plain_rle_cost;
+			}
+			if (palette_rle_cost >= 0 && palette_rle_cost < best_cost)
+				best = 3;
+
+			if (best == 0)
+			{
+				*out++ = 0;
+				for (y = 0; y < th; y++)
+					for (x = 0; x < tw; x++)
+					{
+						memcpy(out, tile + y * stride + x * bytes_per_pixel + cpixel_offset, cpixel_size);
+						out += cpixel_size;
+					}
+				continue;
+			}
+
+			if (best == 1 || best == 3)
+			{
+				*out++ = (uint8)(best == 1 ? palette_size : 128 + palette_size);
+				for (i = 0; i < palette_size; i++)
+				{
+					memcpy(out, palette_pixel[i] + cpixel_offset, cpixel_size);
+					out += cpixel_size;
+				}
+			}
+			else
+				*out++ = 128;
+
+			if (best == 1)
+			{
+				for (y = 0; y < th; y++)
+				{
+					int shift = 8 - bits;
+					uint8 value = 0;
+					for (x = 0; x < tw; x++)
+					{
+						value |= palette_find(palette, palette_size, pixel_key(tile + y * stride + x * bytes_per_pixel, bytes_per_pixel)) << shift;
+						shift -= bits;
+						if (shift < 0)
+						{
+							*out++ = value;
+							value = 0;
+							shift = 8 - bits;
+						}
+					}
+					if (shift != 8 - bits)
+						*out++ = value;
+				}
+				continue;
+			}
+
+			/* second pass : write runs */
+			run = 0;
+			for (y = 0; y < th; y++)
+			{
+				for (x = 0; x < tw; x++)
+				{
+					uint32 key = pixel_key(tile + y * stride + x * bytes_per_pixel, bytes_per_pixel);
+					if (run > 0 && key == prev)
+					{
+						run++;
+						continue;
+					}
+					if (run > 0)
+						out = write_run(out, prev, best == 2 ? -1 : palette_find(palette, palette_size, prev), run, cpixel_size, cpixel_offset);
+					prev = key;
+					run = 1;
+				}
+			}
+			out = write_run(out, prev, best == 2 ? -1 : palette_find(palette, palette_size, prev), run, cpixel_size, cpixel_offset);
+		}
+	}
+	return out;
+}
+
+static void
+pixel_write(uint8* dst, uint32 value, const pixel_format* format)
+{
+	int i;
+	for (i = 0; i < format->bytes_per_pixel; i++)
+	{
+		int shift = format->big_endian ? (format->bytes_per_pixel - 1 - i) * 8 : i * 8;
+		dst[i] = (uint8)(value >> shift);
+	}
+}
+
+static uint32
+pixel_read(const uint8* src, const pixel_format* format)
+{
+	uint32 value = 0;
+	int i;
+	for (i = 0; i < format->bytes_per_pixel; i++)
+	{
+		int shift = format->big_endian ? (format->bytes_per_pixel - 1 - i) * 8 : i * 8;
+		value |= ((uint32)src[i]) << shift;
+	}
+	return value;
+}
+
+/* 3 bytes per pixel means RGB tight pixel with 8 bits components */
+static void
+components_read(const uint8* src, const pixel_format* format, int* c)
+{
+	int i;
+	uint32 value;
+	if (format->bytes_per_pixel == 3)
+	{
+		for (i = 0; i < 3; i++)
+			c[i] = src[i];
+		return;
+	}
+	value = pixel_read(src, format);
+	for (i = 0; i < 3; i++)
+		c[i] = (value >> format->shift[i]) & format->max[i];
+}
+
+static void
+components_write(uint8* dst, const pixel_format* format, const int* c)
+{
+	int i;
+	uint32 value = 0;
+	if (format->bytes_per_pixel == 3)
+	{
+		for (i = 0; i < 3; i++)
+			dst[i] = (uint8)c[i];
+		return;
+	}
+	for (i = 0; i < 3; i++)
+		value |= ((uint32)c[i] & format->max[i]) << format->shift[i];
+	pixel_write(dst, value, format);
+}
+
+/* tight gradient filter : each component is predicted from left, up and up left neighbours */
+static void
+tight_gradient(const uint8* src, uint8* dst, int width, int height, const pixel_format* format)
+{
+	int x, y, i, bpp = format->bytes_per_pixel;
+	int c[3], left[3], up[3], upleft[3], prediction;
+	int max[3];
+
+	for (i = 0; i < 3; i++)
+		max[i] = bpp == 3 ? 255 : (int)format->max[i];
+
+	for (y = 0; y < height; y++)
+	{
+		for (x = 0; x < width; x++)
+		{
+			const uint8* s = src + ((Py_ssize_t)y * width + x) * bpp;
+			uint8* d = dst + ((Py_ssize_t)y * width + x) * bpp;
+
+			components_read(s, format, c);
+			for (i = 0; i < 3; i++)
+				left[i] = up[i] = upleft[i] = 0;
+			if (x > 0)
+				components_read(d - bpp, format, left);
+			if (y > 0)
+			{
+				components_read(d - (Py_ssize_t)width * bpp, format, up);
+				if (x > 0)
+					components_read(d - (Py_ssize_t)width * bpp - bpp, format, upleft);
+			}
+
+			for (i = 0; i < 3; i++)
+			{
+				prediction = left[i] + up[i] - upleft[i];
+				if (prediction < 0)
+					prediction = 0;
+				else if (prediction > max[i])
+					prediction = max[i];
+				c[i] = (c[i] + prediction) & max[i];
+			}
+			components_write(d, format, c);
+		}
+	}
+}
+
+static int
+parse_format(PyObject* args, pixel_format* format)
+{
+	return PyArg_ParseTuple(args, "iiIIIiii", &format->bytes_per_pixel, &format->big_endian, &format->max[0], &format->max[1], &format->max[2], &format->shift[0], &format->shift[1], &format->shift[2]);
+}
+
+static int
+check_format(const pixel_format* format)
+{
+	if (format->bytes_per_pixel != 1 && format->bytes_per_pixel != 2 && format->bytes_per_pixel != 3 && format->bytes_per_pixel != 4)
+	{
+		PyErr_SetString(PyExc_ValueError, "invalid pixel format");
+		return 0;
+	}
+	return 1;
+}
+
+static PyObject*
+zrle_decode_wrapper(PyObject* self, PyObject* args)
+{
+	Py_buffer input;
+	int width, height, cpixel_size, bytes_per_pixel, cpixel_offset;
+	PyObject* output;
+	byte_reader r;
+
+	if (!PyArg_ParseTuple(args, "s*iiiii", &input, &width, &height, &cpixel_size, &bytes_per_pixel, &cpixel_offset))
+		return NULL;
+
+	if (width < 0 || height < 0 || bytes_per_pixel < 1 || bytes_per_pixel > 4 || cpixel_size < 1 || cpixel_offset < 0 || cpixel_size + cpixel_offset > bytes_per_pixel)
+	{
+		PyBuffer_Release(&input);
+		PyErr_SetString(PyExc_ValueError, "invalid zrle parameters");
+		return NULL;
+	}
+
+	output = PyString_FromStringAndSize(NULL, (Py_ssize_t)width * height * bytes_per_pixel);
+	if (output == NULL)
+	{
+		PyBuffer_Release(&input);
+		return NULL;
+	}
+
+	r.data = (const uint8*)input.buf;
+	r.len = input.len;
+	r.pos = 0;
+
+	if (!zrle_decode(&r, (uint8*)PyString_AS_STRING(output), width, height, cpixel_size, bytes_per_pixel, cpixel_offset))
+	{
+		PyBuffer_Release(&input);
+		Py_DECREF(output);
+		PyErr_SetString(PyExc_ValueError, "invalid zrle data");
+		return NULL;
+	}
+
+	PyBuffer_Release(&input);
+	return output;
+}
+
+static PyObject*
+palette_expand_wrapper(PyObject* self, PyObject* args)
+{
+	Py_buffer indices, palette;
+	int width, height, bits, bytes_per_pixel, ok;
+	PyObject* output;
+
+	if (!PyArg_ParseTuple(args, "s*iiis*i", &indices, &width, &height, &bits, &palette, &bytes_per_pixel))
+		return NULL;
+
+	if (width < 0 || height < 0 || (bits != 1 && bits != 2 && bits != 4 && bits != 8) || bytes_per_pixel < 1 || bytes_per_pixel > 4
+		|| indices.len < packed_size(width, height, bits) || palette.len % bytes_per_pixel != 0)
+	{
+		PyBuffer_Release(&indices);
+		PyBuffer_Release(&palette);
+		PyErr_SetString(PyExc_ValueError, "invalid palette parameters");
+		return NULL;
+	}
+
+	output = PyString_FromStringAndSize(NULL, (Py_ssize_t)width * height * bytes_per_pixel);
+	if (output == NULL)
+	{
+		PyBuffer_Release(&indices);
+		PyBuffer_Release(&palette);
+		return NULL;
+	}
+
+	ok = palette_expand((uint8*)PyString_AS_STRING(output), (Py_ssize_t)width * bytes_per_pixel, (const uint8*)indices.buf, width, height, bits, (const uint8*)palette.buf, (int)(palette.len / bytes_per_pixel), bytes_per_pixel);
+
+	PyBuffer_Release(&indices);
+	PyBuffer_Release(&palette);
+
+	if (!ok)
+	{
+		Py_DECREF(output);
+		PyErr_SetString(PyExc_ValueError, "palette index out of range");
+		return NULL;
+	}
+	return output;
+}
+
+static PyObject*
+tight_gradient_wrapper(PyObject* self, PyObject* args)
+{
+	Py_buffer input;
+	int width, height;
+	pixel_format format;
+	PyObject* output;
+	PyObject* formatArgs;
+
+	if (!PyArg_ParseTuple(args, "s*iiO!", &input, &width, &height, &PyTuple_Type, &formatArgs))
+		return NULL;
+
+	if (!parse_format(formatArgs, &format) || !check_format(&format))
+	{
+		PyBuffer_Release(&input);
+		return NULL;
+	}
+
+	if (width < 0 || height < 0 || input.len != (Py_ssize_t)width * height * format.bytes_per_pixel)
+	{
+		PyBuffer_Release(&input);
+		PyErr_SetString(PyExc_ValueError, "invalid gradient data length");
+		return NULL;
+	}
+
+	output = PyString_FromStringAndSize(NULL, input.len);
+	if (output == NULL)
+	{
+		PyBuffer_Release(&input);
+		return NULL;
+	}
+
+	tight_gradient((const uint8*)input.buf, (uint8*)PyString_AS_STRING(output), width, height, &format);
+
+	PyBuffer_Release(&input);
+	return output;
+}
+
+static PyObject*
+rgb_to_pixels_wrapper(PyObject* self, PyObject* args)
+{
+	Py_buffer input;
+	pixel_format format;
+	PyObject* output;
+	PyObject* formatArgs;
+	Py_ssize_t i, count;
+	uint8* dst;
+	const uint8* src;
+
+	if (!PyArg_ParseTuple(args, "s*O!", &input, &PyTuple_Type, &formatArgs))
+		return NULL;
+
+	if (!parse_format(formatArgs, &format) || !check_format(&format) || format.bytes_per_pixel == 3 || input.len % 3 != 0)
+	{
+		PyBuffer_Release(&input);
+		if (!PyErr_Occurred())
+			PyErr_SetString(PyExc_ValueError, "invalid rgb parameters");
+		return NULL;
+	}
+
+	count = input.len / 3;
+	output = PyString_FromStringAndSize(NULL, count * format.bytes_per_pixel);
+	if (output == NULL)
+	{
+		PyBuffer_Release(&input);
+		return NULL;
+	}
+
+	src = (const uint8*)input.buf;
+	dst = (uint8*)PyString_AS_STRING(output);
+	for (i = 0; i < count; i++, src += 3, dst += format.bytes_per_pixel)
+	{
+		uint32 value = 0;
+		int c;
+		for (c = 0; c < 3; c++)
+			value |= ((src[c] * format.max[c] + 127) / 255) << format.shift[c];
+		pixel_write(dst, value, &format);
+	}
+
+	PyBuffer_Release(&input);
+	return output;
+}
+
+/* scale a true colour component to 8 bits */
+static uint8
+component_scale(uint32 value, int shift, uint32 max)
+{
+	if (max == 0 || shift < 0 || shift > 31)
+		return 0;
+	return (uint8)((((unsigned long long)(value >> shift) & max) * 255) / max);
+}
+
+static PyObject*
+pixels_to_bgrx_wrapper(PyObject* self, PyObject* args)
+{
+	Py_buffer input;
+	pixel_format format;
+	PyObject* output;
+	PyObject* formatArgs;
+	Py_ssize_t i, count;
+	uint8* dst;
+	const uint8* src;
+
+	if (!PyArg_ParseTuple(args, "s*O!", &input, &PyTuple_Type, &formatArgs))
+		return NULL;
+
+	if (!parse_format(formatArgs, &format) || !check_format(&format) || format.bytes_per_pixel == 3 || input.len % format.bytes_per_pixel != 0)
+	{
+		PyBuffer_Release(&input);
+		if (!PyErr_Occurred())
+			PyErr_SetString(PyExc_ValueError, "invalid pixels parameters");
+		return NULL;
+	}
+
+	count = input.len / format.bytes_per_pixel;
+	output = PyString_FromStringAndSize(NULL, count * 4);
+	if (output == NULL)
+	{
+		PyBuffer_Release(&input);
+		return NULL;
+	}
+
+	src = (const uint8*)input.buf;
+	dst = (uint8*)PyString_AS_STRING(output);
+	for (i = 0; i < count; i++, src += format.bytes_per_pixel, dst += 4)
+	{
+		uint32 value = pixel_read(src, &format);
+		dst[0] = component_scale(value, format.shift[2], format.max[2]);
+		dst[1] = component_scale(value, format.shift[1], format.max[1]);
+		dst[2] = component_scale(value, format.shift[0], format.max[0]);
+		dst[3] = 0xff;
+	}
+
+	PyBuffer_Release(&input);
+	return output;
+}
+
+static PyObject*
+zrle_encode_wrapper(PyObject* self, PyObject* args)
+{
+	Py_buffer input;
+	int width = 0, height = 0, bytes_per_pixel = 0, cpixel_size = 0, cpixel_offset = 0;
+	Py_ssize_t tiles;
+	PyObject* output;
+	uint8* end;
+
+	if (!PyArg_ParseTuple(args, "s*iiiii", &input, &width, &height, &cpixel_size, &bytes_per_pixel, &cpixel_offset))
+		return NULL;
+
+	if (width < 0 || height < 0 || bytes_per_pixel < 1 || bytes_per_pixel > 4 || cpixel_size < 1 || cpixel_offset < 0 || cpixel_size + cpixel_offset > bytes_per_pixel
+		|| input.len < (Py_ssize_t)width * height * bytes_per_pixel)
+	{
+		PyBuffer_Release(&input);
+		PyErr_SetString(PyExc_ValueError, "invalid zrle pixels");
+		return NULL;
+	}
+
+	/* worst case is a raw tile with its subencoding byte */
+	tiles = (Py_ssize_t)((width + ZRLE_TILE_SIZE - 1) / ZRLE_TILE_SIZE) * ((height + ZRLE_TILE_SIZE - 1) / ZRLE_TILE_SIZE);
+	output = PyString_FromStringAndSize(NULL, (Py_ssize_t)width * height * cpixel_size + tiles);
+	if (output == NULL)
+	{
+		PyBuffer_Release(&input);
+		return NULL;
+	}
+
+	end = zrle_encode((const uint8*)input.buf, (uint8*)PyString_AS_STRING(output), width, height, bytes_per_pixel, cpixel_size, cpixel_offset);
+	PyBuffer_Release(&input);
+
+	if (_PyString_Resize(&output, end - (uint8*)PyString_AS_STRING(output)) < 0)
+		return NULL;
+
+	return output;
+}
+
+static PyMethodDef rfbcodec_methods[] =
+{
+	{"zrle_decode", zrle_decode_wrapper, METH_VARARGS, "decode inflated zrle data of one rectangle into raw pixels."},
+	{"zrle_encode", zrle_encode_wrapper, METH_VARARGS, "encode raw pixels of one rectangle into zrle data before deflate."},
+	{"palette_expand", palette_expand_wrapper, METH_VARARGS, "expand packed palette indices into raw pixels."},
+	{"tight_gradient", tight_gradient_wrapper, METH_VARARGS, "reverse tight gradient filter."},
+	{"rgb_to_pixels", rgb_to_pixels_wrapper, METH_VARARGS, "convert 24 bits rgb data into client pixel format."},
+	{"pixels_to_bgrx", pixels_to_bgrx_wrapper, METH_VARARGS, "convert true colour client pixels into 32 bits bgrx data."},
+	{NULL, NULL, 0, NULL}
+};
+
+PyMODINIT_FUNC
+initrfbcodec(void)
+{
+	(void) Py_InitModule("rfbcodec", rfbcodec_methods);
+}
@@ -180,6 +180,8 @@ class RawLayer(protocol.Protocol, LayerAutomata, IStreamSender):
         LayerAutomata.__init__(self, presentation)
         #data buffer received from twisted network layer
         self._buffer = ""
+        #already consumed data at start of buffer
+        self._offset = 0
         #len of next packet pass to next state function
         self._expectedLen = 0
         self._factory = None
@@ -200,14 +202,19 @@ class RawLayer(protocol.Protocol, LayerAutomata, IStreamSender):
         #add in buffer
         self._buffer += data
         #while buffer have expected size call local callback
-        while self._expectedLen > 0 and len(self._buffer) >= self._expectedLen:
+        #consumed data are removed once, not after each packet
+        while self._expectedLen > 0 and len(self._buffer) - self._offset >= self._expectedLen:
             #expected data is first expected bytes
-            expectedData = Stream(self._buffer[0:self._expectedLen])
+            expectedData = Stream(self._buffer[self._offset:self._offset + self._expectedLen])
             #rest is for next event of automata
-            self._buffer = self._buffer[self._expectedLen:]
+            self._offset += self._expectedLen
             #call recv function
             self.recv(expectedData)
             
+        if self._offset > 0:
+            self._buffer = self._buffer[self._offset:]
+            self._offset = 0
+            
     def connectionMade(self):
         """
         @summary: inherit from twisted protocol
@@ -22,6 +22,8 @@ Log engine in RDPY
 Actually very basic log engine
 """
 
+import sys
+
 class Level(object):
     """
     @summary: Level log
@@ -34,6 +36,16 @@ class Level(object):
     
 _LOG_LEVEL = Level.DEBUG
 _LOG_FILE = False 
+#prepend to each message (worker index)
+_LOG_PREFIX = ""
+#console stream (None for stdout)
+_LOG_STREAM = None
+
+def getStream():
+    """
+    @return: {file} stream where console logs are written
+    """
+    return _LOG_STREAM or sys.stdout
 
 def log(message):
     """
@@ -42,9 +54,9 @@ def log(message):
     """
     if _LOG_FILE:
         f = open(_LOG_FILE, "a+")
-        f.write("%s\n"%message)
+        f.write("%s%s\n"%(_LOG_PREFIX, message))
         f.close()
-    print "[*] %s"%message
+    print >> getStream(), "[*] %s%s"%(_LOG_PREFIX, message)
 
 def error(message):
     """
@@ -0,0 +1,365 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Pre-fork launcher for servers (honeypot, mitm)
+Master process spawn worker processes running the same command line
+Each worker has its own reactor and accept connections on the same port :
+    - with SO_REUSEPORT each worker bind its own socket and kernel balance connections
+    - else master bind listening socket and workers inherit it
+Master signals :
+    - SIGHUP : graceful restart, new workers are started then old workers stop listening
+               and end when their sessions are closed (or after grace period)
+    - SIGTERM, SIGINT : graceful stop of all workers
+Crashed workers are restarted
+"""
+
+import os, sys, socket, signal
+from twisted.internet import protocol, error
+import rdpy.core.log as log
+
+#environment variable which contain worker index
+WORKER_ENV = "RDPY_PREFORK_WORKER"
+#environment variable which contain inherited listening socket
+SOCKET_ENV = "RDPY_PREFORK_FD"
+#file descriptor of inherited listening socket in worker
+LISTEN_FD = 3
+
+def hasReusePort():
+    """
+    @return: {bool} True if system support SO_REUSEPORT
+    """
+    return hasattr(socket, "SO_REUSEPORT")
+
+def getAddressFamily(interface):
+    """
+    @param interface: {str} listen address
+    @return: {int} AF_INET6 for ipv6 address else AF_INET
+    """
+    return socket.AF_INET6 if ":" in interface else socket.AF_INET
+
+def createListeningSocket(port, interface = "", reusePort = False, backlog = 50):
+    """
+    @summary: create non blocking listening socket
+    @param port: {int} listen port
+    @param interface: {str} listen address
+    @param reusePort: {bool} set SO_REUSEPORT option
+    @param backlog: {int} size of pending connections queue
+    @return: {socket.socket}
+    """
+    sock = socket.socket(getAddressFamily(interface), socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reusePort:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((interface, port))
+    sock.listen(backlog)
+    sock.setblocking(False)
+    return sock
+
+def getWorkerIndex():
+    """
+    @return: {int} index of current worker or None if process is not a worker
+    """
+    index = os.environ.get(WORKER_ENV)
+    if index is None:
+        return None
+    return int(index)
+
+class SessionCountingFactory(object):
+    """
+    @summary: Forward to server factory and keep opened sessions
+                Transport of protocols is not wrapped, layers close
+                and start TLS on the TCP transport itself
+    """
+    def __init__(self, factory):
+        """
+        @param factory: {protocol.ServerFactory} server factory
+        """
+        self._factory = factory
+        #protocols of opened sessions
+        self.sessions = set()
+        
+    def doStart(self):
+        self._factory.doStart()
+        
+    def doStop(self):
+        self._factory.doStop()
+        
+    def logPrefix(self):
+        return self._factory.__class__.__name__
+        
+    def buildProtocol(self, addr):
+        """
+        @summary: build protocol of server factory and forget it when connection is lost
+        @param addr: client address
+        """
+        session = self._factory.buildProtocol(addr)
+        if session is None:
+            return None
+        self.sessions.add(session)
+        connectionLost = session.connectionLost
+        def onConnectionLost(reason):
+            self.sessions.discard(session)
+            connectionLost(reason)
+        session.connectionLost = onConnectionLost
+        return session
+        
+class WorkerServer(object):
+    """
+    @summary: Worker side, listen and stop gracefully on SIGTERM
+    """
+    def __init__(self, factory, port, interface = "", gracePeriod = 30.0, reactor = None):
+        """
+        @param factory: {protocol.ServerFactory} server factory
+        @param port: {int} listen port
+        @param interface: {str} listen address
+        @param gracePeriod: {float} max time in seconds to wait end of sessions on stop
+        @param reactor: twisted reactor (default reactor if None)
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+        #track opened sessions
+        self._factory = SessionCountingFactory(factory)
+        self._port = port
+        self._interface = interface
+        self._gracePeriod = gracePeriod
+        self._listeningPort = None
+        self._deadline = None
+        
+    def getSessionCount(self):
+        """
+        @return: {int} number of opened sessions
+        """
+        return len(self._factory.sessions)
+        
+    def listen(self, fd = None):
+        """
+        @summary: adopt inherited listening socket or bind a new one with SO_REUSEPORT
+        @param fd: {int} inherited listening socket (None to bind)
+        """
+        family = getAddressFamily(self._interface)
+        if fd is None:
+            sock = createListeningSocket(self._port, self._interface, hasReusePort())
+            self._listeningPort = self._reactor.adoptStreamPort(sock.fileno(), family, self._factory)
+            sock.close()
+        else:
+            #twisted duplicate file descriptor
+            self._listeningPort = self._reactor.adoptStreamPort(fd, family, self._factory)
+            os.close(fd)
+        
+    def installSignalHandlers(self):
+        """
+        @summary: replace reactor SIGTERM handler by graceful stop
+        """
+        signal.signal(signal.SIGTERM, lambda signum, frame: self._reactor.callFromThread(self.stop))
+        
+    def stop(self):
+        """
+        @summary: stop listening and wait end of sessions
+        """
+        if self._deadline is not None:
+            return
+        self._deadline = self._reactor.seconds() + self._gracePeriod
+        log.info("stop listening, wait end of %d sessions"%self.getSessionCount())
+        if self._listeningPort is not None:
+            self._listeningPort.stopListening()
+        self.checkSessions()
+        
+    def checkSessions(self):
+        """
+        @summary: stop reactor when all sessions are closed or grace period expired
+        """
+        if self.getSessionCount() == 0 or self._reactor.seconds() >= self._deadline:
+            self._reactor.stop()
+        else:
+            self._reactor.callLater(1.0, self.checkSessions)
+            
+class WorkerProcess(protocol.ProcessProtocol):
+    """
+    @summary: Master side of one worker process
+    """
+    def __init__(self, master, index, generation):
+        """
+        @param master: {Master}
+        @param index: {int} worker number
+        @param generation: {int} restart count of master when worker was spawned
+        """
+        self._master = master
+        self.index = index
+        self.generation = generation
+        self.startTime = None
+        
+    def terminate(self):
+        """
+        @summary: ask graceful stop to worker
+        """
+        try:
+            self.transport.signalProcess("TERM")
+        except error.ProcessExitedAlready:
+            pass
+        
+    def processEnded(self, reason):
+        """
+        @param reason: {Failure} exit status
+        """
+        self._master.onWorkerEnded(self, reason)
+        
+class Master(object):
+    """
+    @summary: Spawn and supervise worker processes
+    """
+    def __init__(self, command, workers, port, interface = "", reusePort = None, reactor = None):
+        """
+        @param command: {list(str)} command line of workers, first item is executable
+        @param workers: {int} number of worker processes
+        @param port: {int} listen port
+        @param interface: {str} listen address
+        @param reusePort: {bool} workers bind their own socket (default if system support SO_REUSEPORT)
+        @param reactor: twisted reactor (default reactor if None)
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+        self._command = command
+        self._workers = workers
+        self._port = port
+        self._interface = interface
+        self._reusePort = hasReusePort() if reusePort is None else reusePort
+        self._socket = None
+        self._generation = 0
+        self._processes = []
+        self._stopping = False
+        
+    def getProcesses(self):
+        """
+        @return: {list(WorkerProcess)} running workers
+        """
+        return list(self._processes)
+        
+    def run(self):
+        """
+        @summary: spawn workers, reactor must be run by caller
+        """
+        if not self._reusePort:
+            self._socket = createListeningSocket(self._port, self._interface)
+        log.info("start %d workers on port %d (%s)"%(self._workers, self._port, "SO_REUSEPORT" if self._reusePort else "shared socket"))
+        for i in range(self._workers):
+            self.spawn(i)
+        self._reactor.callWhenRunning(self.installSignalHandlers)
+        
+    def installSignalHandlers(self):
+        """
+        @summary: replace reactor handlers by graceful stop and restart
+        """
+        signal.signal(signal.SIGHUP, lambda signum, frame: self._reactor.callFromThread(self.restart))
+        signal.signal(signal.SIGTERM, lambda signum, frame: self._reactor.callFromThread(self.stop))
+        signal.signal(signal.SIGINT, lambda signum, frame: self._reactor.callFromThread(self.stop))
+        
+    def spawn(self, index):
+        """
+        @summary: spawn one worker of current generation
+        @param index: {int} worker number
+        """
+        env = dict(os.environ)
+        env[WORKER_ENV] = str(index)
+        childFDs = { 0 : 0, 1 : 1, 2 : 2 }
+        if self._socket is not None:
+            env[SOCKET_ENV] = str(LISTEN_FD)
+            childFDs[LISTEN_FD] = self._socket.fileno()
+            
+        process = WorkerProcess(self, index, self._generation)
+        process.startTime = self._reactor.seconds()
+        self._processes.append(process)
+        self._reactor.spawnProcess(process, self._command[0], self._command, env = env, childFDs = childFDs)
+        
+    def restart(self):
+        """
+        @summary: start new generation of workers and stop old ones
+        """
+        if self._stopping:
+            return
+        log.info("graceful restart of workers")
+        self._generation += 1
+        old = self.getProcesses()
+        for process in old:
+            self.spawn(process.index)
+        for process in old:
+            process.terminate()
+            
+    def stop(self):
+        """
+        @summary: stop all workers then reactor
+        """
+        if self._stopping:
+            return
+        log.info("stop workers")
+        self._stopping = True
+        if len(self._processes) == 0:
+            self._reactor.stop()
+        for process in self.getProcesses():
+            process.terminate()
+            
+    def onWorkerEnded(self, process, reason):
+        """
+        @summary: restart crashed worker of current generation
+        @param process: {WorkerProcess}
+        @param reason: {Failure} exit status
+        """
+        self._processes.remove(process)
+        if self._stopping:
+            if len(self._processes) == 0:
+                self._reactor.stop()
+            return
+        
+        if process.generation != self._generation:
+            return
+        
+        log.warning("worker %d ended : %s"%(process.index, reason.getErrorMessage()))
+        #avoid fork loop on worker which fail at start
+        delay = 1.0 if self._reactor.seconds() - process.startTime < 1.0 else 0.0
+        self._reactor.callLater(delay, self.spawn, process.index)
+        
+def serve(factory, port, interface = "", workers = 1, gracePeriod = 30.0):
+    """
+    @summary: run server in one process or in pre-forked workers
+                Workers execute the same command line, so configuration is read by each worker
+                and reloaded on graceful restart
+    @param factory: {protocol.ServerFactory} server factory
+    @param port: {int} listen port
+    @param interface: {str} listen address
+    @param workers: {int} number of worker processes (1 to not fork)
+    @param gracePeriod: {float} max time in seconds to wait end of sessions on stop
+    """
+    from twisted.internet import reactor
+    index = getWorkerIndex()
+    if index is not None:
+        #per worker logs
+        log._LOG_PREFIX = "[%d] "%index
+        if log._LOG_FILE:
+            log._LOG_FILE = "%s.%d"%(log._LOG_FILE, index)
+        fd = os.environ.get(SOCKET_ENV)
+        server = WorkerServer(factory, port, interface, gracePeriod, reactor)
+        server.listen(None if fd is None else int(fd))
+        reactor.callWhenRunning(server.installSignalHandlers)
+    elif workers > 1:
+        Master([sys.executable] + sys.argv, workers, port, interface, reactor = reactor).run()
+    else:
+        reactor.listenTCP(port, factory, interface = interface)
+    reactor.run()
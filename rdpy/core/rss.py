@@ -24,7 +24,7 @@ Private protocol format to save events
 
 from rdpy.core.type import CompositeType, FactoryType, UInt8, UInt16Le, UInt32Le, String, sizeof, Stream
 from rdpy.core import log, error
-import time
+import time, struct, threading, tempfile, Queue
 
 class EventType(object):
     """
@@ -151,6 +151,19 @@ def timeMs():
     """
     return int(time.time() * 1000)
         
+def encodeEvent(event, timestamp):
+    """
+    @summary: wrap event in event message
+    @param event: {UpdateEvent | ScreenEvent | InfoEvent | CloseEvent | KeyEventUnicode | KeyEventScancode}
+    @param timestamp: {int} time since last event in milliseconds
+    @return: {str} bytes of event in rss file
+    """
+    e = Event(event)
+    e.timestamp.value = timestamp
+    s = Stream()
+    s.writeType(e)
+    return s.getvalue()
+        
 class FileRecorder(object):
     """
     @summary: RSR File recorder
@@ -163,23 +176,26 @@ class FileRecorder(object):
         #init timer
         self._lastEventTimer = timeMs()
         
-    def rec(self, event):
+    def rec(self, event, timestamp = None):
         """
         @summary: save event in file
         @param event: {UpdateEvent}
+        @param timestamp: {int} time since last event in milliseconds (None to compute from clock)
         """
         
         now = timeMs()
-        #wrap around event message
-        e = Event(event)
         #timestamp is time since last event
-        e.timestamp.value = now - self._lastEventTimer
+        if timestamp is None:
+            timestamp = now - self._lastEventTimer
         self._lastEventTimer = now
+        self.write(encodeEvent(event, timestamp))
         
-        s = Stream()
-        s.writeType(e)
-        
-        self._file.write(s.getvalue())
+    def write(self, data):
+        """
+        @summary: write encoded events in file
+        @param data: {str} encoded events (see encodeEvent)
+        """
+        self._file.write(data)
         
     def update(self, destLeft, destTop, destRight, destBottom, width, height, bpp, upateFormat, data):
         """
@@ -262,6 +278,216 @@ class FileRecorder(object):
         """
         self.rec(CloseEvent())
                 
+class RecordPolicy(object):
+    """
+    @summary: what to do with events when recording queue is full
+    """
+    #lose event (end of scenario is never lost)
+    DROP = "drop"
+    #wait writer thread
+    BLOCK = "block"
+    #encode event and write it in temporary file, replayed in order by writer thread
+    SPILL = "spill"
+    
+class RecordingQueue(object):
+    """
+    @summary: Bounded queue of events drained by a writer thread
+                Encoding and writing of events are done out of reactor thread
+                One queue can be shared by many recorders (see AsyncRecorder)
+    """
+    def __init__(self, maxSize = 4096, policy = RecordPolicy.DROP, spillDirectory = None):
+        """
+        @param maxSize: {int} max number of events in memory
+        @param policy: {RecordPolicy} behavior when queue is full
+        @param spillDirectory: {str} directory of spill file (None for system default)
+        """
+        self._queue = Queue.Queue(maxSize)
+        self._policy = policy
+        self._spillDirectory = spillDirectory
+        #protect spill file and its recorders shared with writer thread
+        self._lock = threading.Lock()
+        self._spill = None
+        self._spillRecorders = {}
+        self._thread = None
+        self._stopping = False
+        #producer side metrics
+        self._queued = 0
+        self._dropped = 0
+        self._blocked = 0
+        self._spilled = 0
+        self._maxDepth = 0
+        #writer side metrics
+        self._written = 0
+        self._errors = 0
+        
+    def getStats(self):
+        """
+        @return: {dict} metrics of queue
+        """
+        return { "queued" : self._queued, "written" : self._written, "dropped" : self._dropped, "blocked" : self._blocked,
+                "spilled" : self._spilled, "errors" : self._errors, "depth" : self._queue.qsize(), "maxDepth" : self._maxDepth }
+        
+    def start(self):
+        """
+        @summary: start writer thread
+        """
+        self._thread = threading.Thread(target = self.run, name = "rss writer")
+        self._thread.daemon = True
+        self._thread.start()
+        
+    def stop(self):
+        """
+        @summary: write pending events then stop writer thread
+        """
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+        
+    def put(self, recorder, event, timestamp):
+        """
+        @summary: queue an event, call from reactor thread
+        @param recorder: {AsyncRecorder}
+        @param event: {UpdateEvent | ...} event or None to close file of recorder
+        @param timestamp: {int} time since last event of recorder in milliseconds
+        """
+        item = (recorder, event, timestamp)
+        if self._spill is None:
+            try:
+                self._queue.put_nowait(item)
+                self._queued += 1
+                self._maxDepth = max(self._maxDepth, self._queue.qsize())
+                return
+            except Queue.Full:
+                pass
+            
+            #end of scenario is never lost
+            if self._policy == RecordPolicy.BLOCK or (self._policy == RecordPolicy.DROP and (event is None or isinstance(event, CloseEvent))):
+                self._blocked += 1
+                self._queue.put(item)
+                self._queued += 1
+                return
+            
+            if self._policy == RecordPolicy.DROP:
+                self._dropped += 1
+                return
+        
+        #keep order, all events go to spill file until writer thread read it
+        data = "" if event is None else encodeEvent(event, timestamp)
+        with self._lock:
+            if self._spill is None:
+                self._spill = tempfile.TemporaryFile(dir = self._spillDirectory)
+            self._spillRecorders[id(recorder)] = recorder
+            self._spill.write(struct.pack("<QI", id(recorder), len(data)) + data)
+        self._spilled += 1
+        
+    def run(self):
+        """
+        @summary: writer thread loop
+        """
+        while True:
+            try:
+                item = self._queue.get(timeout = 0.1)
+            except Queue.Empty:
+                if not self.drainSpill() and self._stopping:
+                    return
+                continue
+            
+            if item is None:
+                self._stopping = True
+                continue
+            
+            recorder, event, timestamp = item
+            self.write(recorder, None if event is None else encodeEvent(event, timestamp))
+            
+    def drainSpill(self):
+        """
+        @summary: write events of spill file, call from writer thread when queue is empty
+        @return: {bool} True if spill file was not empty
+        """
+        with self._lock:
+            spill, recorders = self._spill, self._spillRecorders
+            self._spill, self._spillRecorders = None, {}
+        if spill is None:
+            return False
+        
+        spill.seek(0)
+        while True:
+            header = spill.read(12)
+            if len(header) < 12:
+                break
+            recorderId, length = struct.unpack("<QI", header)
+            data = spill.read(length)
+            self.write(recorders[recorderId], data if length > 0 else None)
+        spill.close()
+        return True
+    
+    def write(self, recorder, data):
+        """
+        @summary: write encoded event in file of recorder
+        @param recorder: {AsyncRecorder}
+        @param data: {str} encoded event or None to close file
+        """
+        try:
+            if data is None:
+                recorder.closeFile()
+            else:
+                recorder.write(data)
+                self._written += 1
+        except Exception as e:
+            self._errors += 1
+            log.error("cannot write rss event : %s"%e)
+            
+class AsyncRecorder(FileRecorder):
+    """
+    @summary: Recorder which give events to a recording queue
+                Timestamps are computed when events occur, file is written by writer thread
+    """
+    def __init__(self, f, queue):
+        """
+        @param f: {file} file pointer use to write
+        @param queue: {RecordingQueue} started queue
+        """
+        FileRecorder.__init__(self, f)
+        self._queue = queue
+        self._closed = False
+        
+    def getQueue(self):
+        """
+        @return: {RecordingQueue} queue of recorder
+        """
+        return self._queue
+        
+    def rec(self, event, timestamp = None):
+        """
+        @summary: queue event
+        @see: FileRecorder.rec
+        """
+        if self._closed:
+            return
+        now = timeMs()
+        if timestamp is None:
+            timestamp = now - self._lastEventTimer
+        self._lastEventTimer = now
+        self._queue.put(self, event, timestamp)
+        
+    def close(self):
+        """
+        @summary: end of scenario, file is closed by writer thread
+        """
+        if self._closed:
+            return
+        FileRecorder.close(self)
+        self._closed = True
+        self._queue.put(self, None, None)
+        
+    def closeFile(self):
+        """
+        @summary: close file, call from writer thread
+        """
+        self._file.close()
+        
 class FileReader(object):
     """
     @summary: RSR File reader
@@ -282,6 +508,81 @@ class FileReader(object):
         self._s.readType(e)
         return e
         
+class MemoryReader(object):
+    """
+    @summary: Reader of events already parsed (shared by many readers)
+    """
+    def __init__(self, events):
+        """
+        @param events: {list(Event)} events of scenario
+        """
+        self._events = events
+        self._index = 0
+        
+    def nextEvent(self):
+        """
+        @summary: return next event or None at end of scenario
+        """
+        if self._index >= len(self._events):
+            return None
+        e = self._events[self._index]
+        self._index += 1
+        return e
+    
+class ScenarioCache(object):
+    """
+    @summary: Scenario files parsed once and indexed by screen
+                Pre-rendered variants of a scenario (see rdpy.ui.prerender)
+                can be played without color conversion or color depth renegotiation
+    """
+    def __init__(self):
+        #(width, height, colorDepth) -> list(list(Event)) scenarios with same screen
+        self._variants = {}
+        #(width, height, colorDepth) -> number of selections
+        self._selections = {}
+        
+    def load(self, path):
+        """
+        @summary: read all events of file, first screen event give its key
+                    scenarios with same key are played in turn
+        @param path: {str} path of rss file
+        @return: {tuple} (width, height, colorDepth) or None if file doesn't have screen event
+        """
+        events = readEvents(path)
+        key = None
+        for e in events:
+            if e.type.value == EventType.SCREEN:
+                key = (e.event.width.value, e.event.height.value, e.event.colorDepth.value)
+                break
+        if key is None:
+            log.warning("no screen event in %s"%path)
+            return None
+        if key in self._variants:
+            log.warning("%s has same screen %s as an already loaded scenario, they will be played in turn"%(path, key))
+        self._variants.setdefault(key, []).append(events)
+        return key
+    
+    def getVariants(self):
+        """
+        @return: {list(tuple)} (width, height, colorDepth) of loaded scenarios
+        """
+        return self._variants.keys()
+    
+    def select(self, width, height, colorDepth):
+        """
+        @summary: select scenario with same color depth and closest screen size
+                    back to closest screen size then closest color depth
+        @param width: {int} width of client screen
+        @param height: {int} height of client screen
+        @param colorDepth: {int} color depth of session
+        @return: {tuple(tuple, MemoryReader)} key and reader of selected scenario
+        """
+        key = sorted(self._variants.keys(), key = lambda k: (k[2] != colorDepth, abs(k[0] * k[1] - width * height), k[0] < width or k[1] < height, abs(k[2] - colorDepth)))[0]
+        scenarios = self._variants[key]
+        index = self._selections.get(key, 0)
+        self._selections[key] = index + 1
+        return key, MemoryReader(scenarios[index % len(scenarios)])
+        
 def createRecorder(path):
     """
     @summary: open file from path and return FileRecorder
@@ -290,6 +591,15 @@ def createRecorder(path):
     """
     return FileRecorder(open(path, "wb"))
 
+def createAsyncRecorder(path, queue):
+    """
+    @summary: open file from path and return AsyncRecorder
+    @param path: {str} path of output file
+    @param queue: {RecordingQueue} started queue
+    @return: {AsyncRecorder}
+    """
+    return AsyncRecorder(open(path, "wb"), queue)
+
 def createReader(path):
     """
     @summary: open file from path and return FileReader
@@ -297,4 +607,18 @@ def createReader(path):
     @return: {FileReader}
     """
     with open(path, "rb") as f:
-        return FileReader(f)
\ No newline at end of file
+        return FileReader(f)
+    
+def readEvents(path):
+    """
+    @summary: read all events of file
+    @param path: {str} path of input file
+    @return: {list(Event)}
+    """
+    reader = createReader(path)
+    events = []
+    while True:
+        e = reader.nextEvent()
+        if e is None:
+            return events
+        events.append(e)
\ No newline at end of file
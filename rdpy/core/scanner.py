@@ -0,0 +1,438 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Scan engine
+Run one job per host with bounded concurrency, per host timeout and retry policy
+Targets are pulled lazily so memory doesn't depend on size of host list
+"""
+
+import json, time, collections
+from twisted.internet import defer
+from rdpy.core.error import CallPureVirtualFuntion
+import rdpy.core.log as log
+
+def parseTarget(target, defaultPort):
+    """
+    @summary: parse host[:port], [ipv6][:port] or bare ipv6 address
+    @param target: {str} target without spaces
+    @param defaultPort: {int} port when not specified
+    @return: {tuple(str, int)} host and port
+    @raise ValueError: invalid target
+    """
+    if target.startswith("["):
+        end = target.find("]")
+        if end < 2:
+            raise ValueError("unterminated ipv6 address")
+        host, rest = target[1:end], target[end + 1:]
+        if rest == "":
+            return host, defaultPort
+        if not rest.startswith(":"):
+            raise ValueError("unexpected data after ipv6 address")
+        port = rest[1:]
+    elif target.count(":") == 1:
+        host, port = target.split(":")
+    else:
+        #no port or ipv6 address without brackets
+        return target, defaultPort
+    
+    port = int(port)
+    if host == "" or port < 1 or port > 65535:
+        raise ValueError("invalid host or port")
+    return host, port
+
+def readTargets(lines, defaultPort):
+    """
+    @summary: parse host list (one target per line, # for comment)
+                invalid lines are logged and skipped
+    @param lines: {iterable(str)} file or list of hosts
+    @param defaultPort: {int} port when not specified
+    @return: {generator(tuple(str, int))} host and port
+    @see: parseTarget
+    """
+    for line in lines:
+        line = line.split("#")[0].strip()
+        if line == "":
+            continue
+        try:
+            yield parseTarget(line, defaultPort)
+        except ValueError as e:
+            log.warning("skip invalid target %s : %s"%(line, e))
+
+class TargetQueue(object):
+    """
+    @summary: Targets pushed while scanner is running (worker of a supervisor)
+                Iterator return None when queue is empty but not closed
+    """
+    def __init__(self):
+        self._targets = collections.deque()
+        self._closed = False
+        #call when new targets are available
+        self._listener = None
+        
+    def __iter__(self):
+        return self
+    
+    def __len__(self):
+        return len(self._targets)
+    
+    def next(self):
+        """
+        @return: {tuple(str, int) | None} next target or None if must wait
+        @raise StopIteration: queue is closed and empty
+        """
+        if len(self._targets) > 0:
+            return self._targets.popleft()
+        if self._closed:
+            raise StopIteration()
+        return None
+    
+    def isClosed(self):
+        """
+        @return: {bool} no more target will be pushed
+        """
+        return self._closed
+    
+    def setListener(self, listener):
+        """
+        @param listener: {callable} call when targets are pushed or queue is closed
+        """
+        self._listener = listener
+    
+    def push(self, host, port):
+        """
+        @param host: {str} address of target
+        @param port: {int} port of target
+        """
+        self._targets.append((host, port))
+        if not self._listener is None:
+            self._listener()
+        
+    def close(self):
+        """
+        @summary: end of targets
+        """
+        self._closed = True
+        if not self._listener is None:
+            self._listener()
+
+class ScanStatus(object):
+    """
+    @summary: final state of a target
+    """
+    SUCCESS = "success"
+    FAILURE = "failure"
+    TIMEOUT = "timeout"
+
+class ScanResult(object):
+    """
+    @summary: Result of scan of one target
+    """
+    def __init__(self, host, port):
+        """
+        @param host: {str} address of target
+        @param port: {int} port of target
+        """
+        self.host = host
+        self.port = port
+        self.status = None
+        self.reason = None
+        self.attempts = 0
+        self.start = time.time()
+        self.duration = 0.0
+        #metadata return by job (image path, screen size...)
+        self.data = {}
+        
+    @staticmethod
+    def fromDict(result):
+        """
+        @summary: rebuild result (reported by worker process)
+        @param result: {dict} see toDict
+        @return: {ScanResult}
+        """
+        result = dict(result)
+        scanResult = ScanResult(result.pop("host"), result.pop("port"))
+        scanResult.status = result.pop("status")
+        scanResult.reason = result.pop("reason")
+        scanResult.attempts = result.pop("attempts")
+        scanResult.duration = result.pop("duration")
+        scanResult.data = result
+        return scanResult
+        
+    def toDict(self):
+        """
+        @return: {dict} JSON serializable result
+        """
+        result = { "host" : self.host, "port" : self.port, "status" : self.status, "reason" : self.reason, "attempts" : self.attempts, "duration" : round(self.duration, 3) }
+        result.update(self.data)
+        return result
+
+class ScanJob(object):
+    """
+    @summary: One attempt on one target
+    """
+    def start(self):
+        """
+        @summary: start job
+        @return: {Deferred} fire with metadata dict on success
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "start", "ScanJob"))
+    
+    def cancel(self):
+        """
+        @summary: abort job on timeout, deferred result is ignored
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "cancel", "ScanJob"))
+    
+class ScanJobFactory(object):
+    """
+    @summary: Build jobs for scanner
+    """
+    def buildJob(self, host, port):
+        """
+        @param host: {str} address of target
+        @param port: {int} port of target
+        @return: {ScanJob}
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "buildJob", "ScanJobFactory"))
+
+class ScanOutput(object):
+    """
+    @summary: Receive results as soon as targets are finished
+    """
+    def write(self, result):
+        """
+        @param result: {ScanResult}
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "write", "ScanOutput"))
+    
+    def close(self):
+        """
+        @summary: end of scan
+        """
+        pass
+    
+class LogOutput(ScanOutput):
+    """
+    @summary: Log each result
+    """
+    def write(self, result):
+        """
+        @see: ScanOutput.write
+        """
+        if result.status == ScanStatus.SUCCESS:
+            log.info("%s:%d %s"%(result.host, result.port, result.status))
+        else:
+            log.info("%s:%d %s : %s"%(result.host, result.port, result.status, result.reason))
+    
+class JSONLinesOutput(LogOutput):
+    """
+    @summary: Write one JSON object per result
+                Results are also logged, except when they are written on stdout
+    """
+    def __init__(self, fileName):
+        """
+        @param fileName: {str} output file path ("-" for stdout, logs are then written on stderr)
+        """
+        self._isStdout = fileName == "-"
+        if self._isStdout:
+            import sys
+            self._file = sys.stdout
+            #stdout only contains results
+            log._LOG_STREAM = sys.stderr
+        else:
+            self._file = open(fileName, "a")
+        
+    def write(self, result):
+        """
+        @see: ScanOutput.write
+        """
+        if not self._isStdout:
+            LogOutput.write(self, result)
+        self._file.write(json.dumps(result.toDict()) + "\n")
+        self._file.flush()
+        
+    def close(self):
+        """
+        @see: ScanOutput.close
+        """
+        if not self._isStdout:
+            self._file.close()
+        
+class Scanner(object):
+    """
+    @summary: Bounded concurrency scheduler
+                A new target is pulled only when a slot is free
+    """
+    def __init__(self, jobFactory, output, concurrency = 64, timeout = 30.0, retries = 0, retryDelay = 1.0, reactor = None):
+        """
+        @param jobFactory: {ScanJobFactory}
+        @param output: {ScanOutput}
+        @param concurrency: {int} max number of targets in progress
+        @param timeout: {float} max duration of one attempt in seconds
+        @param retries: {int} number of new attempts after failure or timeout
+        @param retryDelay: {float} wait before a new attempt in seconds
+        @param reactor: twisted reactor (default reactor if None)
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+        self._jobFactory = jobFactory
+        self._output = output
+        self._concurrency = concurrency
+        self._timeout = timeout
+        self._retries = retries
+        self._retryDelay = retryDelay
+        
+        self._targets = None
+        self._running = 0
+        self._finished = None
+        #jobs may finish synchronously, avoid recursion in fill
+        self._filling = False
+        self._stats = { "total" : 0, ScanStatus.SUCCESS : 0, ScanStatus.FAILURE : 0, ScanStatus.TIMEOUT : 0 }
+        
+    def getStats(self):
+        """
+        @return: {dict} number of targets by status
+        """
+        return dict(self._stats)
+    
+    def getRunning(self):
+        """
+        @return: {int} number of targets in progress
+        """
+        return self._running
+    
+    def run(self, targets):
+        """
+        @summary: scan all targets
+        @param targets: {iterable(tuple(str, int)) | TargetQueue} host and port (see readTargets)
+        @return: {Deferred} fire with stats at end of scan
+        """
+        if isinstance(targets, TargetQueue):
+            targets.setListener(self.fill)
+        self._targets = iter(targets)
+        self._finished = defer.Deferred()
+        self.fill()
+        return self._finished
+    
+    def fill(self):
+        """
+        @summary: start targets until concurrency limit or end of list
+        """
+        if self._filling:
+            return
+        self._filling = True
+        try:
+            while not self._targets is None and self._running < self._concurrency:
+                try:
+                    target = self._targets.next()
+                except StopIteration:
+                    self._targets = None
+                    break
+                except Exception as e:
+                    log.error("invalid target : %s"%e)
+                    continue
+                
+                #wait for more targets
+                if target is None:
+                    break
+                host, port = target
+                
+                self._running += 1
+                self._stats["total"] += 1
+                self.attempt(ScanResult(host, port))
+        finally:
+            self._filling = False
+            
+        if self._targets is None and self._running == 0 and not self._finished is None:
+            self._output.close()
+            finished, self._finished = self._finished, None
+            finished.callback(self.getStats())
+    
+    def attempt(self, result):
+        """
+        @summary: start one job on target
+        @param result: {ScanResult}
+        """
+        result.attempts += 1
+        state = { "done" : False }
+        
+        def onTimeout():
+            state["done"] = True
+            try:
+                job.cancel()
+            except Exception as e:
+                log.debug("cancel job : %s"%e)
+            self.retryOrFinish(result, ScanStatus.TIMEOUT, "no result after %ss"%self._timeout)
+            
+        def onSuccess(data):
+            if state["done"]:
+                return
+            state["done"] = True
+            timeoutCall.cancel()
+            result.data = data or {}
+            self.finish(result, ScanStatus.SUCCESS, None)
+            
+        def onFailure(failure):
+            if state["done"]:
+                return
+            state["done"] = True
+            timeoutCall.cancel()
+            self.retryOrFinish(result, ScanStatus.FAILURE, failure.getErrorMessage())
+        
+        timeoutCall = self._reactor.callLater(self._timeout, onTimeout)
+        try:
+            job = self._jobFactory.buildJob(result.host, result.port)
+            d = job.start()
+        except Exception as e:
+            d = defer.fail(e)
+        d.addCallbacks(onSuccess, onFailure)
+        
+    def retryOrFinish(self, result, status, reason):
+        """
+        @summary: schedule new attempt if retry policy allow it
+        @param result: {ScanResult}
+        @param status: {ScanStatus}
+        @param reason: {str} failure reason
+        """
+        if result.attempts <= self._retries:
+            log.debug("%s:%d %s (%s), retry"%(result.host, result.port, status, reason))
+            #slot stay reserved until last attempt
+            self._reactor.callLater(self._retryDelay, self.attempt, result)
+            return
+        self.finish(result, status, reason)
+            
+    def finish(self, result, status, reason):
+        """
+        @summary: write result and free slot
+        @param result: {ScanResult}
+        @param status: {ScanStatus}
+        @param reason: {str} failure reason
+        """
+        result.status = status
+        result.reason = reason
+        result.duration = time.time() - result.start
+        self._stats[status] += 1
+        try:
+            self._output.write(result)
+        except Exception as e:
+            log.error("cannot write result of %s:%d : %s"%(result.host, result.port, e))
+        self._running -= 1
+        self.fill()
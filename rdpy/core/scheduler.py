@@ -0,0 +1,144 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Shared scheduler for many timers (scenario playback)
+Hashed timer wheel driven by one reactor call per tick, whatever the number of timers
+Timers are rounded to tick precision
+"""
+
+import rdpy.core.log as log
+
+class Timer(object):
+    """
+    @summary: Handle of a scheduled callback
+    """
+    def __init__(self, wheel, rounds, callback, args):
+        """
+        @param wheel: {TimerWheel}
+        @param rounds: {int} number of wheel turns before fire
+        @param callback: {callable}
+        @param args: {tuple} arguments of callback
+        """
+        self._wheel = wheel
+        self.rounds = rounds
+        self.callback = callback
+        self.args = args
+        self.active = True
+        
+    def cancel(self):
+        """
+        @summary: callback will not be called, removed from wheel on its slot tick
+        """
+        if self.active:
+            self.active = False
+            self._wheel._count -= 1
+            
+class TimerWheel(object):
+    """
+    @summary: Hashed timer wheel
+                Slot of timer is (current tick + delay in tick) modulo wheel size
+                Reactor is called only when at least one timer is active
+    """
+    def __init__(self, tick = 0.01, size = 512, reactor = None):
+        """
+        @param tick: {float} precision in seconds
+        @param size: {int} number of slots (one turn is size * tick seconds)
+        @param reactor: twisted reactor (default reactor if None)
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+        self._tick = tick
+        self._slots = [[] for _ in range(size)]
+        #number of processed ticks since origin (None when idle)
+        self._current = 0
+        self._origin = None
+        #number of active timers
+        self._count = 0
+        self._call = None
+        
+    def getTick(self):
+        """
+        @return: {float} precision in seconds
+        """
+        return self._tick
+    
+    def getCount(self):
+        """
+        @return: {int} number of active timers
+        """
+        return self._count
+        
+    def schedule(self, delay, callback, *args):
+        """
+        @summary: call callback after delay (at least one tick)
+        @param delay: {float} delay in seconds
+        @param callback: {callable}
+        @param args: arguments of callback
+        @return: {Timer}
+        """
+        if self._origin is None:
+            #wheel restart from idle
+            self._origin = self._reactor.seconds()
+            self._current = 0
+            self._call = self._reactor.callLater(self._tick, self.onTick)
+            
+        ticks = max(1, int(round(delay / self._tick)))
+        #ticks elapsed but not yet processed
+        ticks += max(0, int((self._reactor.seconds() - self._origin) / self._tick) - self._current)
+        size = len(self._slots)
+        timer = Timer(self, (ticks - 1) / size, callback, args)
+        self._slots[(self._current + ticks) % size].append(timer)
+        self._count += 1
+        return timer
+    
+    def onTick(self):
+        """
+        @summary: process all slots of elapsed ticks (catch up if reactor was late)
+        """
+        self._call = None
+        now = self._reactor.seconds()
+        target = int((now - self._origin) / self._tick + 1e-6)
+        size = len(self._slots)
+        while self._current < target and self._count > 0:
+            self._current += 1
+            index = self._current % size
+            timers, self._slots[index] = self._slots[index], []
+            for timer in timers:
+                if not timer.active:
+                    continue
+                if timer.rounds > 0:
+                    timer.rounds -= 1
+                    self._slots[index].append(timer)
+                    continue
+                timer.active = False
+                self._count -= 1
+                #a failing callback must not stop other timers of wheel
+                try:
+                    timer.callback(*timer.args)
+                except Exception as e:
+                    log.error("timer callback %s failed : %s"%(timer.callback, e))
+                
+        if self._count > 0:
+            self._call = self._reactor.callLater(max(0.0, self._origin + (self._current + 1) * self._tick - now), self.onTick)
+        else:
+            #idle, drop cancelled timers
+            self._origin = None
+            self._slots = [[] for _ in range(size)]
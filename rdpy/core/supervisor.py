@@ -0,0 +1,364 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Multi process scan
+Supervisor share targets between worker processes, each one with its own reactor
+Workers ask targets when they have free slots, so fast workers receive more targets
+Targets of a crashed worker are given to other workers,
+END is sent when no more target can be given (list done and no target in progress elsewhere)
+
+Channel between supervisor and workers (one message per line) :
+    supervisor -> worker (stdin) : "host port" or "END"
+    worker -> supervisor (fd 3) : "NEED count" or "RESULT json"
+Logs of workers (stdout and stderr) are forwarded by supervisor
+"""
+
+import os, sys, json, itertools, collections
+from zope.interface import implementer
+from twisted.internet import protocol, defer, interfaces
+from twisted.protocols import basic
+from rdpy.core import scanner
+import rdpy.core.log as log
+
+#file descriptor of worker to supervisor channel
+CHANNEL_FD = 3
+
+class WorkerProcess(protocol.ProcessProtocol):
+    """
+    @summary: Supervisor side of one worker process
+    """
+    def __init__(self, supervisor, index):
+        """
+        @param supervisor: {Supervisor}
+        @param index: {int} worker number use in logs
+        """
+        self._supervisor = supervisor
+        self._index = index
+        #incomplete lines by file descriptor
+        self._buffers = {}
+        #targets sent and not reported (host, port) -> count
+        self._pending = {}
+        #targets asked and not sent
+        self._wanted = 0
+        #END message was sent
+        self._ended = False
+        
+    def hasPending(self):
+        """
+        @return: {bool} targets in progress in worker
+        """
+        return len(self._pending) > 0
+        
+    def childDataReceived(self, childFD, data):
+        """
+        @summary: split data in lines
+        @param childFD: {int} file descriptor of worker
+        @param data: {str} data written by worker
+        """
+        lines = (self._buffers.get(childFD, "") + data).split("\n")
+        self._buffers[childFD] = lines.pop()
+        for line in lines:
+            if childFD == CHANNEL_FD:
+                self.lineReceived(line)
+            else:
+                #forward worker logs
+                log.getStream().write("[%d] %s\n"%(self._index, line))
+                
+    def lineReceived(self, line):
+        """
+        @summary: message from worker
+        @param line: {str} NEED or RESULT message
+        """
+        if line.startswith("NEED "):
+            self._wanted += int(line[5:])
+            self._supervisor.dispatch()
+        elif line.startswith("RESULT "):
+            result = scanner.ScanResult.fromDict(json.loads(line[7:]))
+            key = (result.host, result.port)
+            if self._pending.get(key, 0) > 1:
+                self._pending[key] -= 1
+            else:
+                self._pending.pop(key, None)
+            self._supervisor.onResult(result)
+        else:
+            log.warning("invalid message from worker %d : %s"%(self._index, line))
+            
+    def sendTargets(self):
+        """
+        @summary: send targets asked by worker, END if no more target can be given
+        """
+        if self._ended or self._wanted == 0:
+            return
+        targets = self._supervisor.nextTargets(self._wanted)
+        self._wanted -= len(targets)
+        lines = []
+        for host, port in targets:
+            lines.append("%s %d"%(host, port))
+            self._pending[(host, port)] = self._pending.get((host, port), 0) + 1
+        if self._wanted > 0 and self._supervisor.isDone(self):
+            self._ended = True
+            lines.append("END")
+        if len(lines) > 0:
+            self.transport.write("\n".join(lines) + "\n")
+        
+    def processEnded(self, reason):
+        """
+        @summary: give back targets lost by worker and notify supervisor
+        @param reason: {Failure} exit status
+        """
+        if self.hasPending():
+            log.warning("worker %d ended with targets in progress : %s"%(self._index, reason.getErrorMessage()))
+        for target, count in self._pending.items():
+            self._supervisor.giveBack([target] * count)
+        self._pending = {}
+        self._supervisor.onWorkerEnded(self)
+        
+class Supervisor(object):
+    """
+    @summary: Run scan in many worker processes and aggregate results
+    """
+    def __init__(self, command, workers, output, progress = 100, reactor = None):
+        """
+        @param command: {list(str)} command line of worker (see runWorker), first item is executable
+        @param workers: {int} number of worker processes
+        @param output: {scanner.ScanOutput} receive results of all workers
+        @param progress: {int} log progress every progress results
+        @param reactor: twisted reactor (default reactor if None)
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+        self._command = command
+        self._workers = workers
+        self._output = output
+        self._progress = progress
+        
+        self._targets = None
+        #targets of crashed workers
+        self._lost = collections.deque()
+        #running WorkerProcess
+        self._processes = []
+        self._finished = None
+        self._stats = { "total" : 0, scanner.ScanStatus.SUCCESS : 0, scanner.ScanStatus.FAILURE : 0, scanner.ScanStatus.TIMEOUT : 0 }
+        
+    def getStats(self):
+        """
+        @return: {dict} number of targets by status
+        """
+        return dict(self._stats)
+        
+    def run(self, targets):
+        """
+        @summary: spawn workers and share targets
+        @param targets: {iterable(tuple(str, int))} host and port (see scanner.readTargets)
+        @return: {Deferred} fire with stats when all workers are ended
+        """
+        self._targets = iter(targets)
+        self._finished = defer.Deferred()
+        for i in range(self._workers):
+            process = WorkerProcess(self, i)
+            self._processes.append(process)
+            self._reactor.spawnProcess(process, self._command[0], self._command, env = os.environ, childFDs = { 0 : "w", 1 : "r", 2 : "r", CHANNEL_FD : "r" })
+        return self._finished
+    
+    def nextTargets(self, count):
+        """
+        @summary: targets of crashed workers first, then next targets of list
+        @param count: {int} max number of targets
+        @return: {list(tuple(str, int))} next targets, less than count when there is no more now
+        """
+        targets = []
+        while len(self._lost) > 0 and len(targets) < count:
+            targets.append(self._lost.popleft())
+        if self._targets is None or len(targets) == count:
+            return targets
+        targets += list(itertools.islice(self._targets, count - len(targets)))
+        if len(targets) < count:
+            self._targets = None
+        return targets
+    
+    def giveBack(self, targets):
+        """
+        @summary: targets of crashed worker, given to other workers
+        @param targets: {list(tuple(str, int))}
+        """
+        self._lost.extend(targets)
+        
+    def isDone(self, worker):
+        """
+        @param worker: {WorkerProcess} worker asking targets
+        @return: {bool} no more target for worker, even if another worker crash
+        """
+        return self._targets is None and len(self._lost) == 0 and not any([process.hasPending() for process in self._processes if not process is worker])
+    
+    def dispatch(self):
+        """
+        @summary: send targets or END to workers which wait for them
+        """
+        for process in list(self._processes):
+            process.sendTargets()
+    
+    def onResult(self, result):
+        """
+        @summary: result reported by a worker
+        @param result: {scanner.ScanResult}
+        """
+        self._stats["total"] += 1
+        self._stats[result.status] += 1
+        try:
+            self._output.write(result)
+        except Exception as e:
+            log.error("cannot write result of %s:%d : %s"%(result.host, result.port, e))
+        if self._stats["total"] % self._progress == 0:
+            log.info("%(total)d targets done : %(success)d success, %(failure)d failure, %(timeout)d timeout"%self._stats)
+        #end of targets in progress can allow END
+        self.dispatch()
+            
+    def onWorkerEnded(self, worker):
+        """
+        @summary: end of scan when all workers are ended
+                    targets not scanned are reported as failure if no worker is left
+        @param worker: {WorkerProcess}
+        """
+        if worker in self._processes:
+            self._processes.remove(worker)
+        if len(self._processes) > 0:
+            self.dispatch()
+            return
+        
+        remaining = list(self._lost)
+        self._lost.clear()
+        if not self._targets is None:
+            remaining += list(self._targets)
+            self._targets = None
+        if len(remaining) > 0:
+            log.error("all workers are ended, %d targets not scanned"%len(remaining))
+        for host, port in remaining:
+            result = scanner.ScanResult(host, port)
+            result.status = scanner.ScanStatus.FAILURE
+            result.reason = "no worker process left"
+            self.onResult(result)
+        
+        self._output.close()
+        finished, self._finished = self._finished, None
+        finished.callback(self.getStats())
+            
+@implementer(interfaces.IHalfCloseableProtocol)
+class ScanWorker(basic.LineReceiver, scanner.ScanOutput):
+    """
+    @summary: Worker side, scan targets send by supervisor and report results
+    """
+    delimiter = "\n"
+    
+    def __init__(self, jobFactory, concurrency, timeout, retries, reactor = None):
+        """
+        @param jobFactory: {scanner.ScanJobFactory}
+        @param concurrency: {int} max number of targets in progress in this worker
+        @param timeout: {float} max duration of one attempt in seconds
+        @param retries: {int} number of new attempts after failure or timeout
+        @param reactor: twisted reactor (default reactor if None)
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+        self._concurrency = concurrency
+        self._queue = scanner.TargetQueue()
+        self._scanner = scanner.Scanner(jobFactory, self, concurrency, timeout, retries, reactor = reactor)
+        #targets asked and not received
+        self._requested = 0
+        self._done = False
+        
+    def connectionMade(self):
+        """
+        @summary: start scan and ask first targets
+        """
+        self._scanner.run(self._queue).addCallback(self.onEnd)
+        self.request()
+        
+    def readConnectionLost(self):
+        """
+        @summary: supervisor will not send more targets, finish targets in progress
+        """
+        self._queue.close()
+        
+    def writeConnectionLost(self):
+        """
+        @summary: supervisor is gone, results can't be reported
+        """
+        self._queue.close()
+        
+    def connectionLost(self, reason):
+        """
+        @summary: stop worker when last results are written
+        """
+        self._queue.close()
+        if self._done:
+            self._reactor.stop()
+        
+    def lineReceived(self, line):
+        """
+        @summary: target or END message from supervisor
+        @param line: {str}
+        """
+        if line == "END":
+            self._queue.close()
+            return
+        host, port = line.split()
+        self._requested -= 1
+        self._queue.push(host, int(port))
+        
+    def request(self):
+        """
+        @summary: ask targets to keep two times concurrency targets in worker
+        """
+        if self._queue.isClosed():
+            return
+        count = 2 * self._concurrency - self._scanner.getRunning() - len(self._queue) - self._requested
+        if count > 0:
+            self._requested += count
+            self.sendLine("NEED %d"%count)
+        
+    def write(self, result):
+        """
+        @see: scanner.ScanOutput.write
+        """
+        self.sendLine("RESULT " + json.dumps(result.toDict()))
+        self.request()
+        
+    def onEnd(self, stats):
+        """
+        @summary: all targets are done
+        @param stats: {dict} stats of this worker
+        """
+        #wait results flush before stop
+        self._done = True
+        self.transport.loseConnection()
+        
+def runWorker(jobFactory, concurrency, timeout, retries):
+    """
+    @summary: run worker process until supervisor send END
+    @param jobFactory: {scanner.ScanJobFactory}
+    @param concurrency: {int} max number of targets in progress in this worker
+    @param timeout: {float} max duration of one attempt in seconds
+    @param retries: {int} number of new attempts after failure or timeout
+    """
+    from twisted.internet import reactor, stdio
+    stdio.StandardIO(ScanWorker(jobFactory, concurrency, timeout, retries, reactor), stdin = 0, stdout = CHANNEL_FD, reactor = reactor)
+    reactor.run()
@@ -673,7 +673,7 @@ class SInt32Be(SimpleType):
                             And optional is True, read type is ignored
         @param constant:   Check if object value doesn't change after read operation
         """
-        SimpleType.__init__(self, ">I", 4, True, value, conditional = conditional, optional = optional, constant = constant)
+        SimpleType.__init__(self, ">i", 4, True, value, conditional = conditional, optional = optional, constant = constant)
         
 class UInt24Be(SimpleType):
     """
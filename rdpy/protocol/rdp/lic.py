@@ -22,6 +22,7 @@
 @see: http://msdn.microsoft.com/en-us/library/cc241880.aspx
 """
 
+import os
 from rdpy.core.type import CompositeType, CallableValue, UInt8, UInt16Le, UInt32Le, String, sizeof, FactoryType, ArrayType, Stream
 from rdpy.core.error import InvalidExpectedDataException
 import rdpy.core.log as log
@@ -171,7 +172,7 @@ class ServerLicenseRequest(CompositeType):
 class ClientNewLicenseRequest(CompositeType):
     """
     @summary:  Send by client to ask new license for client.
-                RDPY doesn'support license reuse, need it in futur version
+                Client without stored license for this server
     @see: http://msdn.microsoft.com/en-us/library/cc241918.aspx
     """
     _MESSAGE_TYPE_ = MessageType.NEW_LICENSE_REQUEST
@@ -214,6 +215,61 @@ class ClientPLatformChallengeResponse(CompositeType):
         self.encryptedHWID = LicenseBinaryBlob(BinaryBlobType.BB_DATA_BLOB)
         self.MACData = String(readLen = CallableValue(16))
 
+class ClientLicenseInfo(CompositeType):
+    """
+    @summary: Send by client to present a license previously issued by server
+    @see: http://msdn.microsoft.com/en-us/library/cc241919.aspx
+    """
+    _MESSAGE_TYPE_ = MessageType.LICENSE_INFO
+    
+    def __init__(self, readLen = None):
+        CompositeType.__init__(self, readLen = readLen)
+        #RSA and must be only RSA
+        self.preferredKeyExchangeAlg = UInt32Le(0x00000001, constant = True)
+        self.platformId = UInt32Le(0x04000000 | 0x00010000)
+        self.clientRandom = String("\x00" * 32, readLen = CallableValue(32))
+        self.encryptedPreMasterSecret = LicenseBinaryBlob(BinaryBlobType.BB_RANDOM_BLOB)
+        self.licenseInfo = LicenseBinaryBlob(BinaryBlobType.BB_DATA_BLOB)
+        self.encryptedHWID = LicenseBinaryBlob(BinaryBlobType.BB_ENCRYPTED_DATA_BLOB)
+        self.MACData = String(readLen = CallableValue(16))
+        
+class ServerNewLicense(CompositeType):
+    """
+    @summary: License issued by server
+                Same format for new license and upgrade license message
+    @see: http://msdn.microsoft.com/en-us/library/cc241926.aspx
+    """
+    _MESSAGE_TYPE_ = MessageType.NEW_LICENSE
+    
+    def __init__(self, readLen = None):
+        CompositeType.__init__(self, readLen = readLen)
+        self.encryptedLicenseInfo = LicenseBinaryBlob(BinaryBlobType.BB_ENCRYPTED_DATA_BLOB)
+        self.MACData = String(readLen = CallableValue(16))
+        
+class ServerUpgradeLicense(ServerNewLicense):
+    """
+    @summary: License upgraded by server
+    @see: http://msdn.microsoft.com/en-us/library/cc241924.aspx
+    """
+    _MESSAGE_TYPE_ = MessageType.UPGRADE_LICENSE
+    
+class NewLicenseInfo(CompositeType):
+    """
+    @summary: Decrypted content of new license message
+    @see: http://msdn.microsoft.com/en-us/library/cc241927.aspx
+    """
+    def __init__(self):
+        CompositeType.__init__(self)
+        self.dwVersion = UInt32Le()
+        self.cbScope = UInt32Le(lambda:sizeof(self.pbScope))
+        self.pbScope = String(readLen = self.cbScope)
+        self.cbCompanyName = UInt32Le(lambda:sizeof(self.pbCompanyName))
+        self.pbCompanyName = String(readLen = self.cbCompanyName)
+        self.cbProductId = UInt32Le(lambda:sizeof(self.pbProductId))
+        self.pbProductId = String(readLen = self.cbProductId)
+        self.cbLicenseInfo = UInt32Le(lambda:sizeof(self.pbLicenseInfo))
+        self.pbLicenseInfo = String(readLen = self.cbLicenseInfo)
+
 class LicPacket(CompositeType):
     """
     @summary: A license packet
@@ -230,7 +286,7 @@ class LicPacket(CompositeType):
             @summary: factory for message nego
             Use in read mode
             """
-            for c in [LicensingErrorMessage, ServerLicenseRequest, ClientNewLicenseRequest, ServerPlatformChallenge, ClientPLatformChallengeResponse]:
+            for c in [LicensingErrorMessage, ServerLicenseRequest, ClientNewLicenseRequest, ServerPlatformChallenge, ClientPLatformChallengeResponse, ClientLicenseInfo, ServerNewLicense, ServerUpgradeLicense]:
                 if self.bMsgtype.value == c._MESSAGE_TYPE_:
                     return c(readLen = self.wMsgSize - 4)
             log.debug("unknown license message : %s"%self.bMsgtype.value)
@@ -252,6 +308,70 @@ def createValidClientLicensingErrorMessage():
         message.dwErrorCode.value = ErrorCode.STATUS_VALID_CLIENT
         message.dwStateTransition.value = StateTransition.ST_NO_TRANSITION
         return LicPacket(message)
+    
+class LicenseStore(object):
+    """
+    @summary: Licenses issued by servers, shared by client connections
+                Presenting a stored license skip the new license exchange
+    """
+    def __init__(self, fileName = None):
+        """
+        @param fileName: {str} file where licenses are loaded from and saved to (None for memory only)
+        """
+        self._fileName = fileName
+        self._licenses = None
+        
+    def load(self):
+        """
+        @summary: read licenses file, one license per line (hex key, hex license)
+        """
+        self._licenses = {}
+        if self._fileName is None or not os.path.exists(self._fileName):
+            return
+        with open(self._fileName, "rb") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 2:
+                    self._licenses[fields[0].decode("hex")] = fields[1].decode("hex")
+                    
+    def save(self):
+        """
+        @summary: write licenses file
+        """
+        if self._fileName is None:
+            return
+        with open(self._fileName, "wb") as f:
+            for key, license in self._licenses.iteritems():
+                f.write("%s %s\n"%(key.encode("hex"), license.encode("hex")))
+        
+    def get(self, key):
+        """
+        @param key: {str} server name and license scope
+        @return: {str | None} license blob
+        """
+        if self._licenses is None:
+            self.load()
+        return self._licenses.get(key)
+    
+    def put(self, key, license):
+        """
+        @param key: {str} server name and license scope
+        @param license: {str} license blob issued by server
+        """
+        if self._licenses is None:
+            self.load()
+        self._licenses[key] = license
+        self.save()
+        
+    def remove(self, key):
+        """
+        @summary: forget license rejected by server
+        @param key: {str} server name and license scope
+        """
+        if self._licenses is None:
+            self.load()
+        if self._licenses.pop(key, None) is not None:
+            self.save()
         
 class LicenseManager(object):
     """
@@ -265,6 +385,21 @@ class LicenseManager(object):
         self._transport = transport
         self._username = ""
         self._hostname = ""
+        #license reuse
+        self._licenseStore = None
+        self._serverName = None
+        #key of license in store for current connection
+        self._storeKey = None
+        self._licensePresented = False
+        
+    def setLicenseStore(self, licenseStore, serverName):
+        """
+        @summary: reuse licenses issued by this server
+        @param licenseStore: {LicenseStore}
+        @param serverName: {str} name or address of target server
+        """
+        self._licenseStore = licenseStore
+        self._serverName = serverName
  
     def recv(self, s):
         """
@@ -279,7 +414,11 @@ class LicenseManager(object):
             return True
         
         elif licPacket.bMsgtype.value == MessageType.LICENSE_REQUEST:
-            self.sendClientNewLicenseRequest(licPacket.licensingMessage)
+            license = self.getStoredLicense(licPacket.licensingMessage)
+            if license is None:
+                self.sendClientNewLicenseRequest(licPacket.licensingMessage)
+            else:
+                self.sendClientLicenseInfo(licPacket.licensingMessage, license)
             return False
             
         elif licPacket.bMsgtype.value == MessageType.PLATFORM_CHALLENGE:
@@ -287,19 +426,36 @@ class LicenseManager(object):
             return False
         
         #yes get a new license
-        elif licPacket.bMsgtype.value == MessageType.NEW_LICENSE:
+        elif licPacket.bMsgtype.value in [MessageType.NEW_LICENSE, MessageType.UPGRADE_LICENSE]:
+            self.recvServerNewLicense(licPacket.licensingMessage)
             return True
         
         else:
+            #stored license is not accepted anymore
+            if self._licensePresented:
+                self._licenseStore.remove(self._storeKey)
             raise InvalidExpectedDataException("Not a valid license packet")
         
+    def getStoredLicense(self, licenseRequest):
+        """
+        @summary: find license issued by this server for requested scope
+        @param licenseRequest: {ServerLicenseRequest}
+        @return: {str | None} license blob
+        """
+        if self._licenseStore is None or self._serverName is None:
+            return None
+        scope = ""
+        if licenseRequest.scopeList.scopeCount.value > 0:
+            scope = licenseRequest.scopeList.scopeArray[0].scope.blobData.value.rstrip("\x00")
+        self._storeKey = "%s/%s"%(self._serverName, scope)
+        return self._licenseStore.get(self._storeKey)
     
-    def sendClientNewLicenseRequest(self, licenseRequest):
+    def generateKeys(self, licenseRequest):
         """
-        @summary: Create new license request in response to server license request
+        @summary: generate client random and premaster secret, compute license keys
         @param licenseRequest: {ServerLicenseRequest}
+        @return: {tuple(str, str)} client random and encrypted premaster secret
         @see: http://msdn.microsoft.com/en-us/library/cc241989.aspx
-        @see: http://msdn.microsoft.com/en-us/library/cc241918.aspx
         """
         #get server information
         serverRandom = licenseRequest.serverRandom.value
@@ -318,10 +474,30 @@ class LicenseManager(object):
         self._macSalt = sessionKeyBlob[:16]
         self._licenseKey = sec.finalHash(sessionKeyBlob[16:32], clientRandom, serverRandom)
         
+        return clientRandom, rsa.encrypt(preMasterSecret[::-1], serverCertificate.certData.getPublicKey())[::-1] + "\x00" * 8
+    
+    def getHWID(self):
+        """
+        @return: {str} client hardware identification
+        """
+        s = Stream()
+        s.writeType((UInt32Le(2), String(self._hostname + self._username + "\x00" * 16)))
+        return s.getvalue()[:20]
+        
+    
+    def sendClientNewLicenseRequest(self, licenseRequest):
+        """
+        @summary: Create new license request in response to server license request
+        @param licenseRequest: {ServerLicenseRequest}
+        @see: http://msdn.microsoft.com/en-us/library/cc241989.aspx
+        @see: http://msdn.microsoft.com/en-us/library/cc241918.aspx
+        """
+        clientRandom, encryptedPreMasterSecret = self.generateKeys(licenseRequest)
+        
         #format message
         message = ClientNewLicenseRequest()
         message.clientRandom.value = clientRandom
-        message.encryptedPreMasterSecret.blobData.value = rsa.encrypt(preMasterSecret[::-1], serverCertificate.certData.getPublicKey())[::-1] + "\x00" * 8
+        message.encryptedPreMasterSecret.blobData.value = encryptedPreMasterSecret
         message.ClientMachineName.blobData.value = self._hostname + "\x00"
         message.ClientUserName.blobData.value = self._username + "\x00"
         self._transport.sendFlagged(sec.SecurityFlag.SEC_LICENSE_PKT, LicPacket(message))
@@ -338,14 +514,48 @@ class LicenseManager(object):
         if serverChallenge != "T\x00E\x00S\x00T\x00\x00\x00":
             raise InvalidExpectedDataException("bad license server challenge")
         
-        #generate hwid
-        s = Stream()
-        s.writeType((UInt32Le(2), String(self._hostname + self._username + "\x00" * 16)))
-        hwid = s.getvalue()[:20]
+        hwid = self.getHWID()
         
         message = ClientPLatformChallengeResponse()
         message.encryptedPlatformChallengeResponse.blobData.value = serverEncryptedChallenge
         message.encryptedHWID.blobData.value = rc4.crypt(rc4.RC4Key(self._licenseKey), hwid)
         message.MACData.value = sec.macData(self._macSalt, serverChallenge + hwid)
         
-        self._transport.sendFlagged(sec.SecurityFlag.SEC_LICENSE_PKT, LicPacket(message))
\ No newline at end of file
+        self._transport.sendFlagged(sec.SecurityFlag.SEC_LICENSE_PKT, LicPacket(message))
+        
+    def sendClientLicenseInfo(self, licenseRequest, license):
+        """
+        @summary: present stored license in response to server license request
+        @param licenseRequest: {ServerLicenseRequest}
+        @param license: {str} license blob issued by server on previous connection
+        @see: http://msdn.microsoft.com/en-us/library/cc241919.aspx
+        """
+        clientRandom, encryptedPreMasterSecret = self.generateKeys(licenseRequest)
+        hwid = self.getHWID()
+        
+        message = ClientLicenseInfo()
+        message.clientRandom.value = clientRandom
+        message.encryptedPreMasterSecret.blobData.value = encryptedPreMasterSecret
+        message.licenseInfo.blobData.value = license
+        message.encryptedHWID.blobData.value = rc4.crypt(rc4.RC4Key(self._licenseKey), hwid)
+        message.MACData.value = sec.macData(self._macSalt, hwid)
+        
+        self._licensePresented = True
+        self._transport.sendFlagged(sec.SecurityFlag.SEC_LICENSE_PKT, LicPacket(message))
+        
+    def recvServerNewLicense(self, newLicense):
+        """
+        @summary: decrypt license issued by server and keep it in store
+        @param newLicense: {ServerNewLicense}
+        """
+        if self._licenseStore is None or self._storeKey is None:
+            return
+        
+        licenseInfo = rc4.crypt(rc4.RC4Key(self._licenseKey), newLicense.encryptedLicenseInfo.blobData.value)
+        if sec.macData(self._macSalt, licenseInfo) != newLicense.MACData.value:
+            log.warning("invalid MAC of new license, license is not stored")
+            return
+        
+        newLicenseInfo = NewLicenseInfo()
+        Stream(licenseInfo).readType(newLicenseInfo)
+        self._licenseStore.put(self._storeKey, newLicenseInfo.pbLicenseInfo.value)
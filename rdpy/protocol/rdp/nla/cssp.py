@@ -149,19 +149,122 @@ def encodeDERTRequest(negoTypes = [], authInfo = None, pubKeyAuth = None):
         
     return der_encoder.encode(request)
 
+def readDERLength(s, offset):
+    """
+    @summary: read length of DER element
+    @param s: {str} DER data
+    @param offset: {integer} position of length
+    @return: {tuple(integer, integer) | None} length and position of value, None if data is too short
+    """
+    if offset >= len(s):
+        return None
+    length = ord(s[offset])
+    offset += 1
+    if not length & 0x80:
+        return length, offset
+    
+    size = length & 0x7f
+    if size == 0 or size > 4:
+        raise error.InvalidExpectedDataException("CSSP : Invalid DER length")
+    if offset + size > len(s):
+        return None
+    length = 0
+    for c in s[offset:offset + size]:
+        length = (length << 8) | ord(c)
+    return length, offset + size
+
+def readDERElement(s, offset, tag):
+    """
+    @summary: read header of DER element
+    @param s: {str} DER data
+    @param offset: {integer} position of element
+    @param tag: {integer} expected tag byte
+    @return: {tuple(integer, integer)} start and end of element value
+    @raise InvalidExpectedDataException: if tag is not expected or element is truncated
+    """
+    if offset >= len(s) or ord(s[offset]) != tag:
+        raise error.InvalidExpectedDataException("CSSP : Invalid DER tag, expected %s"%hex(tag))
+    header = readDERLength(s, offset + 1)
+    if header is None or header[1] + header[0] > len(s):
+        raise error.InvalidExpectedDataException("CSSP : Truncated DER element")
+    return header[1], header[1] + header[0]
+
+def readDERInteger(s, offset):
+    """
+    @summary: read DER integer
+    @param s: {str} DER data
+    @param offset: {integer} position of element
+    @return: {integer}
+    """
+    start, end = readDERElement(s, offset, 0x02)
+    value = 0
+    for c in s[start:end]:
+        value = (value << 8) | ord(c)
+    #negative number
+    if end > start and ord(s[start]) & 0x80:
+        value -= 1 << (8 * (end - start))
+    return value
+
+def readDEROctetString(s, offset):
+    """
+    @summary: read DER octet string
+    @param s: {str} DER data
+    @param offset: {integer} position of element
+    @return: {str}
+    """
+    start, end = readDERElement(s, offset, 0x04)
+    return s[start:end]
+
+def getDERTRequestLength(s):
+    """
+    @summary: compute size of TSRequest from its header
+    @param s: {str} begin of TSRequest
+    @return: {integer | None} size of TSRequest, None if header is not complete
+    """
+    if len(s) == 0:
+        return None
+    if ord(s[0]) != 0x30:
+        raise error.InvalidExpectedDataException("CSSP : Invalid TSRequest tag")
+    header = readDERLength(s, 1)
+    if header is None:
+        return None
+    return header[0] + header[1]
+
 def decodeDERTRequest(s):
     """
-    @summary: Decode the stream as 
+    @summary: Decode the stream as TSRequest
+                Hand written decoder for fields use by rdpy (faster than pyasn1)
     @param s: {str}
+    @return: {dict} version, negoTokens, authInfo, pubKeyAuth and errorCode fields
     """
-    return der_decoder.decode(s, asn1Spec=TSRequest())[0]
+    request = { "version" : None, "negoTokens" : [], "authInfo" : None, "pubKeyAuth" : None, "errorCode" : None }
+    
+    offset, end = readDERElement(s, 0, 0x30)
+    while offset < end:
+        tag = ord(s[offset])
+        start, offset = readDERElement(s, offset, tag)
+        if tag == 0xa0:
+            request["version"] = readDERInteger(s, start)
+        elif tag == 0xa1:
+            #sequence of sequence of [0] octet string
+            tokenOffset, tokensEnd = readDERElement(s, start, 0x30)
+            while tokenOffset < tokensEnd:
+                tokenStart, tokenOffset = readDERElement(s, tokenOffset, 0x30)
+                request["negoTokens"].append(readDEROctetString(s, readDERElement(s, tokenStart, 0xa0)[0]))
+        elif tag == 0xa2:
+            request["authInfo"] = readDEROctetString(s, start)
+        elif tag == 0xa3:
+            request["pubKeyAuth"] = readDEROctetString(s, start)
+        elif tag == 0xa4:
+            request["errorCode"] = readDERInteger(s, start)
+            
+    return request
 
 def getNegoTokens(tRequest):
-    negoData = tRequest.getComponentByName("negoTokens")
-    return [Stream(negoData.getComponentByPosition(i).getComponentByPosition(0).asOctets()) for i in range(len(negoData))]
+    return [Stream(negoToken) for negoToken in tRequest["negoTokens"]]
     
 def getPubKeyAuth(tRequest):
-    return tRequest.getComponentByName("pubKeyAuth").asOctets()
+    return tRequest["pubKeyAuth"]
 
 def encodeDERTCredentials(domain, username, password):
     passwordCred = TSPasswordCreds()
@@ -191,6 +294,10 @@ class CSSP(protocol.Protocol):
         self._interface = None
         #function call at the end of nego
         self._callback = None
+        #buffer of incomplete TSRequest
+        self._buffer = ""
+        #state that handle next complete TSRequest
+        self._nextState = None
         
     def setFactory(self, factory):
         """
@@ -247,12 +354,32 @@ class CSSP(protocol.Protocol):
         #send negotiate message
         self.transport.write(encodeDERTRequest( negoTypes = [ self._authenticationProtocol.getNegotiateMessage() ] ))
         #next state is receive a challenge
-        self.dataReceived = self.recvChallenge
+        self._nextState = self.recvChallenge
+        self.dataReceived = self.recvTSRequest
+        
+    def recvTSRequest(self, data):
+        """
+        @summary: accumulate data until a complete TSRequest is available
+                    TSRequest may be split in multiple TLS records
+        @param data: {str} data received from TLS layer
+        """
+        self._buffer += data
+        length = getDERTRequestLength(self._buffer)
+        if length is None or len(self._buffer) < length:
+            return
+        
+        message, self._buffer = self._buffer[:length], self._buffer[length:]
+        self._nextState(message)
+        
+        #forward remaining data to next state
+        if len(self._buffer) > 0:
+            data, self._buffer = self._buffer, ""
+            self.dataReceived(data)
         
     def recvChallenge(self, data):
         """
         @summary: second state in cssp automata
-        @param data : {str} all data available on buffer
+        @param data : {str} complete TSRequest
         """
         request = decodeDERTRequest(data)
         message, self._interface = self._authenticationProtocol.getAuthenticateMessage(getNegoTokens(request)[0])
@@ -269,12 +396,12 @@ class CSSP(protocol.Protocol):
         #send authenticate message with public key encoded
         self.transport.write(encodeDERTRequest( negoTypes = [ message ], pubKeyAuth = self._interface.GSS_WrapEx(self._pubKeyBer)))
         #next step is received public key incremented by one
-        self.dataReceived = self.recvPubKeyInc
+        self._nextState = self.recvPubKeyInc
     
     def recvPubKeyInc(self, data):
         """
         @summary: the server send the pubKeyBer + 1
-        @param data : {str} all data available on buffer
+        @param data : {str} complete TSRequest
         """
         request = decodeDERTRequest(data)
         pubKeyInc = self._interface.GSS_UnWrapEx(getPubKeyAuth(request))
@@ -22,10 +22,11 @@
 @see: https://msdn.microsoft.com/en-us/library/cc236621.aspx
 """
 
-import hashlib, hmac, struct, datetime
+import hashlib, hmac, struct, datetime, collections
 import sspi
-import rdpy.security.pyDes as pyDes
+import rdpy.security.des as des
 import rdpy.security.rc4 as rc4
+import rdpy.security.md4 as md4
 from rdpy.security.rsa_wrapper import random
 from rdpy.core.type import CompositeType, CallableValue, String, UInt8, UInt16Le, UInt24Le, UInt32Le, sizeof, Stream
 from rdpy.core import filetimes, error
@@ -337,7 +338,7 @@ def DES(key, data):
     @param key: {str}    Des key on 56 bits or 7 bytes
     @param data: {str}    data to encrypt
     """
-    return pyDes.des(expandDesKey(key)).encrypt(data)
+    return des.encrypt(expandDesKey(key), data)
 
 def DESL(key, data):
     """
@@ -354,13 +355,20 @@ def UNICODE(s):
     """
     return s.encode('utf-16le')
 
+#md4 provider of hashlib depend on OpenSSL build
+try:
+    hashlib.new('md4')
+    _md4 = lambda s:hashlib.new('md4', s).digest()
+except ValueError:
+    _md4 = md4.digest
+
 def MD4(s):
     """
     @summary: compute the md4 sum
     @param s: {str} input data
     @return: {str} MD4(s)
     """
-    return hashlib.new('md4', s).digest()
+    return _md4(s)
 
 def MD5(s):
     """
@@ -417,15 +425,57 @@ def HMAC_MD5(key, data):
     """
     return hmac.new(key, data, hashlib.md5).digest()
 
+class ResponseKeyCache(object):
+    """
+    @summary: Bounded LRU cache of NTLMv2 response keys
+                Same account is often used to log on many hosts
+    """
+    def __init__(self, maxSize = 256):
+        """
+        @param maxSize: {int} max number of keys
+        """
+        self._maxSize = maxSize
+        self._keys = collections.OrderedDict()
+        
+    def get(self, key):
+        """
+        @param key: {tuple} cache key
+        @return: {str | None} response key
+        """
+        value = self._keys.pop(key, None)
+        if not value is None:
+            #most recently used is last
+            self._keys[key] = value
+        return value
+    
+    def put(self, key, value):
+        """
+        @param key: {tuple} cache key
+        @param value: {str} response key
+        """
+        self._keys.pop(key, None)
+        self._keys[key] = value
+        if len(self._keys) > self._maxSize:
+            self._keys.popitem(last = False)
+            
+_responseKeyCache = ResponseKeyCache()
+
 def NTOWFv2(Passwd, User, UserDom):
     """
     @summary: Version 2 of NTLM hash function
+                Result is cached by (domain, user, password hash)
     @param Passwd: {str} Password
     @param User: {str} Username
     @param UserDom: {str} microsoft domain
     @see: https://msdn.microsoft.com/en-us/library/cc236700.aspx
     """
-    return HMAC_MD5(MD4(UNICODE(Passwd)), UNICODE(User.upper() + UserDom))
+    #never keep clear password in memory
+    key = (UserDom, User, hashlib.sha256(UNICODE(Passwd)).digest())
+    responseKey = _responseKeyCache.get(key)
+    if responseKey is None:
+        responseKey = HMAC_MD5(MD4(UNICODE(Passwd)), UNICODE(User.upper() + UserDom))
+        _responseKeyCache.put(key, responseKey)
+    return responseKey
 
 def LMOWFv2(Passwd, User, UserDom):
     """
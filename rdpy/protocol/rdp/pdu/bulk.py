@@ -0,0 +1,114 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Bulk compression of slow path and fast path PDU
+@see: http://msdn.microsoft.com/en-us/library/cc240837.aspx
+"""
+
+from rdpy.core.error import InvalidExpectedDataException
+from data import CompressionOrder, CompressionType
+import mppc
+
+class MPPCDecompressor(object):
+    """
+    @summary: MPPC decompressor (RDP 4.0 8K and RDP 5.0 64K)
+                One history is shared by all PDU of a session
+    @see: http://msdn.microsoft.com/en-us/library/cc241548.aspx
+    """
+    def __init__(self):
+        self._history = bytearray(65536)
+        self._offset = 0
+
+    def decompress(self, s, flags):
+        """
+        @summary: Update history in accordance to compression flags
+        @param s: {str} PDU data
+        @param flags: {integer} CompressionOrder | CompressionType
+        @return: {str} decompressed data
+        @raise InvalidExpectedDataException: on bad compression type or malformed data
+        """
+        if flags & CompressionOrder.PACKET_FLUSHED:
+            self._history = bytearray(len(self._history))
+            self._offset = 0
+
+        if flags & CompressionOrder.PACKET_AT_FRONT:
+            self._offset = 0
+
+        if not flags & CompressionOrder.PACKET_COMPRESSED:
+            return s
+
+        compressionType = flags & CompressionOrder.CompressionTypeMask
+        if compressionType == CompressionType.PACKET_COMPR_TYPE_8K:
+            historySize = 8192
+        elif compressionType == CompressionType.PACKET_COMPR_TYPE_64K:
+            historySize = 65536
+        else:
+            raise InvalidExpectedDataException("Unsupported bulk compression type %s"%hex(compressionType))
+
+        start = self._offset
+        try:
+            self._offset = mppc.decompress(self._history, historySize, self._offset, s, compressionType == CompressionType.PACKET_COMPR_TYPE_64K)
+        except ValueError as e:
+            raise InvalidExpectedDataException("Invalid MPPC data : %s"%e)
+
+        return str(self._history[start:self._offset])
+        
+class MPPCCompressor(object):
+    """
+    @summary: MPPC compressor (RDP 4.0 8K and RDP 5.0 64K)
+                One history is shared by all PDU of a session
+    @see: http://msdn.microsoft.com/en-us/library/cc241548.aspx
+    """
+    def __init__(self, compressionType = CompressionType.PACKET_COMPR_TYPE_64K):
+        """
+        @param compressionType: {CompressionType} 8K or 64K
+        """
+        if not compressionType in [CompressionType.PACKET_COMPR_TYPE_8K, CompressionType.PACKET_COMPR_TYPE_64K]:
+            raise InvalidExpectedDataException("Unsupported bulk compression type %s"%hex(compressionType))
+        self._compressionType = compressionType
+        self._historySize = 65536 if compressionType == CompressionType.PACKET_COMPR_TYPE_64K else 8192
+        self._history = bytearray(self._historySize)
+        #last position of 3 bytes sequences (32768 int)
+        self._hashTable = bytearray(4 * 32768)
+        self._offset = 0
+        
+    def compress(self, s):
+        """
+        @summary: Compress data against history
+        @param s: {str} PDU data
+        @return: {tuple(str, integer)} data to send and compression flags
+        """
+        flags = self._compressionType
+        
+        #no more place in history restart at front
+        if self._offset + len(s) > self._historySize:
+            self._offset = 0
+            flags |= CompressionOrder.PACKET_AT_FRONT
+        
+        if len(s) <= self._historySize:
+            compressed = mppc.compress(self._history, self._historySize, self._offset, self._hashTable, s, self._compressionType == CompressionType.PACKET_COMPR_TYPE_64K)
+            if len(compressed) < len(s):
+                self._offset += len(s)
+                return compressed, flags | CompressionOrder.PACKET_COMPRESSED
+            
+        #not compressible, decompressor must reset its history too
+        self._history = bytearray(self._historySize)
+        self._offset = 0
+        return s, self._compressionType | CompressionOrder.PACKET_FLUSHED
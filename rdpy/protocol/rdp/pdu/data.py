@@ -196,6 +196,25 @@ class FastPathUpdateType(object):
     FASTPATH_UPDATETYPE_CACHED = 0xA
     FASTPATH_UPDATETYPE_POINTER = 0xB
     
+class FastPathInputEventCode(object):
+    """
+    @summary: Use in Fast Path input event header
+    @see: http://msdn.microsoft.com/en-us/library/cc240591.aspx
+    """
+    FASTPATH_INPUT_EVENT_SCANCODE = 0x0
+    FASTPATH_INPUT_EVENT_MOUSE = 0x1
+    FASTPATH_INPUT_EVENT_MOUSEX = 0x2
+    FASTPATH_INPUT_EVENT_SYNC = 0x3
+    FASTPATH_INPUT_EVENT_UNICODE = 0x4
+    
+class FastPathKeyboardFlag(object):
+    """
+    @summary: Use in Fast Path scan code and unicode event header
+    @see: http://msdn.microsoft.com/en-us/library/cc240592.aspx
+    """
+    FASTPATH_INPUT_KBDFLAGS_RELEASE = 0x01
+    FASTPATH_INPUT_KBDFLAGS_EXTENDED = 0x02
+    
 class FastPathOutputCompression(object):
     """
     @summary: Flag for compression
@@ -211,6 +230,24 @@ class Display(object):
     SUPPRESS_DISPLAY_UPDATES = 0x00
     ALLOW_DISPLAY_UPDATES = 0x01
     
+class InfoType(object):
+    """
+    @summary: Type of save session info PDU
+    @see: https://msdn.microsoft.com/en-us/library/cc240636.aspx
+    """
+    INFOTYPE_LOGON = 0x00000000
+    INFOTYPE_LOGON_LONG = 0x00000001
+    INFOTYPE_LOGON_PLAINNOTIFY = 0x00000002
+    INFOTYPE_LOGON_EXTENDED_INFO = 0x00000003
+    
+class LogonExField(object):
+    """
+    @summary: Fields present in extended logon info
+    @see: https://msdn.microsoft.com/en-us/library/cc240642.aspx
+    """
+    LOGON_EX_AUTORECONNECTCOOKIE = 0x00000001
+    LOGON_EX_LOGONERRORS = 0x00000002
+    
 class ToogleFlag(object):
     """
     @summary: Use to known state of keyboard
@@ -558,12 +595,11 @@ class DataPDU(CompositeType):
         def PDUDataFactory():
             """
             @summary: Create object in accordance self.shareDataHeader.pduType2 value
+            compressed data are read as raw string and decompressed by PDU layer
             """
-            for c in [UpdateDataPDU, SynchronizeDataPDU, ControlDataPDU, ErrorInfoDataPDU, FontListDataPDU, FontMapDataPDU, PersistentListPDU, ClientInputEventPDU, ShutdownDeniedPDU, ShutdownRequestPDU, SupressOutputDataPDU, SaveSessionInfoPDU]:
-                if self.shareDataHeader.pduType2.value == c._PDUTYPE2_:
-                    return c(readLen = CallableValue(readLen.value - sizeof(self.shareDataHeader)))
-            log.debug("unknown PDU data type : %s"%hex(self.shareDataHeader.pduType2.value))
-            return String(readLen = CallableValue(readLen.value - sizeof(self.shareDataHeader)))
+            if self.shareDataHeader.compressedType.value & CompressionOrder.PACKET_COMPRESSED:
+                return String(readLen = CallableValue(readLen.value - sizeof(self.shareDataHeader)))
+            return self.createPDUData(readLen.value - sizeof(self.shareDataHeader))
             
         if pduData is None:
             pduData = FactoryType(PDUDataFactory)
@@ -572,6 +608,18 @@ class DataPDU(CompositeType):
             
         self.pduData = pduData
         
+    def createPDUData(self, length):
+        """
+        @summary: Create object in accordance self.shareDataHeader.pduType2 value
+        @param length: {integer} size of PDU data
+        @return: {Type} PDU data object ready to read
+        """
+        for c in [UpdateDataPDU, SynchronizeDataPDU, ControlDataPDU, ErrorInfoDataPDU, FontListDataPDU, FontMapDataPDU, PersistentListPDU, ClientInputEventPDU, ShutdownDeniedPDU, ShutdownRequestPDU, SupressOutputDataPDU, SaveSessionInfoPDU]:
+            if self.shareDataHeader.pduType2.value == c._PDUTYPE2_:
+                return c(readLen = CallableValue(length))
+        log.debug("unknown PDU data type : %s"%hex(self.shareDataHeader.pduType2.value))
+        return String(readLen = CallableValue(length))
+        
 class SynchronizeDataPDU(CompositeType):
     """
     @see http://msdn.microsoft.com/en-us/library/cc240490.aspx
@@ -776,7 +824,7 @@ class UpdateDataPDU(CompositeType):
             """
             @summary: Create object in accordance self.updateType value
             """
-            for c in [BitmapUpdateDataPDU]:
+            for c in [BitmapUpdateDataPDU, OrderUpdateDataPDU]:
                 if self.updateType.value == c._UPDATE_TYPE_:
                     return c(readLen = CallableValue(readLen.value - 2))
             log.debug("unknown PDU update data type : %s"%hex(self.updateType.value))
@@ -798,9 +846,33 @@ class SaveSessionInfoPDU(CompositeType):
     def __init__(self, readLen = None):
         CompositeType.__init__(self, readLen = readLen)
         self.infoType = UInt32Le()
-        #TODO parse info data
+        #only extended info is parsed (see LogonInfoExtended)
         self.infoData = String()
         
+class ServerAutoReconnectPacket(CompositeType):
+    """
+    @summary: Auto reconnect cookie send by server
+    @see: https://msdn.microsoft.com/en-us/library/cc240544.aspx
+    """
+    def __init__(self, conditional = lambda:True):
+        CompositeType.__init__(self, conditional = conditional)
+        self.cbLen = UInt32Le(0x0000001C, constant = True)
+        self.version = UInt32Le(0x00000001, constant = True)
+        self.logonId = UInt32Le()
+        self.arcRandomBits = String(readLen = CallableValue(16))
+        
+class LogonInfoExtended(CompositeType):
+    """
+    @summary: Extended logon info of save session info PDU
+    @see: https://msdn.microsoft.com/en-us/library/cc240642.aspx
+    """
+    def __init__(self):
+        CompositeType.__init__(self)
+        self.length = UInt16Le(lambda:sizeof(self))
+        self.fieldsPresent = UInt32Le()
+        self.cbAutoReconnectCookie = UInt32Le(lambda:sizeof(self.autoReconnectCookie), conditional = lambda:(self.fieldsPresent.value & LogonExField.LOGON_EX_AUTORECONNECTCOOKIE))
+        self.autoReconnectCookie = ServerAutoReconnectPacket(conditional = lambda:(self.fieldsPresent.value & LogonExField.LOGON_EX_AUTORECONNECTCOOKIE))
+        
 class FastPathUpdatePDU(CompositeType):
     """
     @summary: Fast path update PDU packet
@@ -809,18 +881,17 @@ class FastPathUpdatePDU(CompositeType):
     def __init__(self, updateData = None):
         CompositeType.__init__(self)
         self.updateHeader = UInt8(lambda:updateData.__class__._FASTPATH_UPDATE_TYPE_)
-        self.compressionFlags = UInt8(conditional = lambda:((self.updateHeader.value >> 4) & FastPathOutputCompression.FASTPATH_OUTPUT_COMPRESSION_USED))
+        self.compressionFlags = UInt8(conditional = lambda:((self.updateHeader.value >> 6) & FastPathOutputCompression.FASTPATH_OUTPUT_COMPRESSION_USED))
         self.size = UInt16Le(lambda:sizeof(self.updateData))
         
         def UpdateDataFactory():
             """
             @summary: Create correct object in accordance to self.updateHeader field
+            compressed data are read as raw string and decompressed by PDU layer
             """
-            for c in [FastPathBitmapUpdateDataPDU]:
-                if (self.updateHeader.value & 0xf) == c._FASTPATH_UPDATE_TYPE_:
-                    return c(readLen = self.size)
-            log.debug("unknown Fast Path PDU update data type : %s"%hex(self.updateHeader.value & 0xf))
-            return String(readLen = self.size)
+            if self.compressionFlags._is_readed and self.compressionFlags.value & CompressionOrder.PACKET_COMPRESSED:
+                return String(readLen = self.size)
+            return self.createUpdateData(self.size.value)
             
         if updateData is None:
             updateData = FactoryType(UpdateDataFactory)
@@ -828,6 +899,18 @@ class FastPathUpdatePDU(CompositeType):
             raise InvalidExpectedDataException("Try to send an invalid fast path data update PDU")
             
         self.updateData = updateData
+        
+    def createUpdateData(self, length):
+        """
+        @summary: Create correct object in accordance to self.updateHeader field
+        @param length: {integer} size of update data
+        @return: {Type} update data object ready to read
+        """
+        for c in [FastPathBitmapUpdateDataPDU, FastPathOrderUpdateDataPDU]:
+            if (self.updateHeader.value & 0xf) == c._FASTPATH_UPDATE_TYPE_:
+                return c(readLen = CallableValue(length))
+        log.debug("unknown Fast Path PDU update data type : %s"%hex(self.updateHeader.value & 0xf))
+        return String(readLen = CallableValue(length))
   
 class BitmapUpdateDataPDU(CompositeType):
     """
@@ -847,15 +930,22 @@ class BitmapUpdateDataPDU(CompositeType):
 class OrderUpdateDataPDU(CompositeType):
     """
     @summary: PDU type use to communicate Accelerated order (GDI)
+    Orders are delta encoded against previous orders so they are decoded by order.OrderState
     @see: http://msdn.microsoft.com/en-us/library/cc241571.aspx
-    @todo: not implemented yet but need it
     """
-    def __init__(self, readLen = None):
+    _UPDATE_TYPE_ = UpdateType.UPDATETYPE_ORDERS
+    
+    def __init__(self, numberOrders = 0, orderData = "", readLen = None):
+        """
+        @param numberOrders: {integer} number of orders in orderData
+        @param orderData: {str} encoded orders
+        @param readLen: Max size of packet
+        """
         CompositeType.__init__(self, readLen = readLen)
         self.pad2OctetsA = UInt16Le()
-        self.numberOrders = UInt16Le(lambda:len(self.orderData._array))
+        self.numberOrders = UInt16Le(numberOrders)
         self.pad2OctetsB = UInt16Le()
-        self.orderData = ArrayType(order.PrimaryDrawingOrder, readLen = self.numberOrders)
+        self.orderData = String(orderData, readLen = CallableValue(lambda:(readLen.value - 6)))
 
 class BitmapCompressedDataHeader(CompositeType):
     """
@@ -917,6 +1007,23 @@ class FastPathBitmapUpdateDataPDU(CompositeType):
         self.numberRectangles = UInt16Le(lambda:len(self.rectangles._array))
         self.rectangles = ArrayType(BitmapData, readLen = self.numberRectangles)
     
+class FastPathOrderUpdateDataPDU(CompositeType):
+    """
+    @summary: Fast path version of order update PDU
+    @see: http://msdn.microsoft.com/en-us/library/cc241573.aspx
+    """
+    _FASTPATH_UPDATE_TYPE_ = FastPathUpdateType.FASTPATH_UPDATETYPE_ORDERS
+    
+    def __init__(self, numberOrders = 0, orderData = "", readLen = None):
+        """
+        @param numberOrders: {integer} number of orders in orderData
+        @param orderData: {str} encoded orders
+        @param readLen: Max size of packet
+        """
+        CompositeType.__init__(self, readLen = readLen)
+        self.numberOrders = UInt16Le(numberOrders)
+        self.orderData = String(orderData, readLen = CallableValue(lambda:(readLen.value - 2)))
+    
 class SlowPathInputEvent(CompositeType):
     """
     @summary: PDU use in slow-path sending client inputs
@@ -958,6 +1065,7 @@ class PointerEvent(CompositeType):
     @see: http://msdn.microsoft.com/en-us/library/cc240586.aspx
     """
     _INPUT_MESSAGE_TYPE_ = InputMessageType.INPUT_EVENT_MOUSE
+    _FASTPATH_INPUT_EVENT_CODE_ = FastPathInputEventCode.FASTPATH_INPUT_EVENT_MOUSE
     
     def __init__(self):
         CompositeType.__init__(self)
@@ -971,6 +1079,7 @@ class PointerExEvent(CompositeType):
     @see: http://msdn.microsoft.com/en-us/library/cc240587.aspx
     """
     _INPUT_MESSAGE_TYPE_ = InputMessageType.INPUT_EVENT_MOUSEX
+    _FASTPATH_INPUT_EVENT_CODE_ = FastPathInputEventCode.FASTPATH_INPUT_EVENT_MOUSEX
     
     def __init__(self):
         CompositeType.__init__(self)
@@ -1002,4 +1111,79 @@ class UnicodeKeyEvent(CompositeType):
         CompositeType.__init__(self)
         self.keyboardFlags = UInt16Le()
         self.unicode = UInt16Le()
-        self.pad2Octets = UInt16Le()
\ No newline at end of file
+        self.pad2Octets = UInt16Le()
+        
+class FastPathInputPDU(CompositeType):
+    """
+    @summary: PDU use to send client inputs in fast path mode
+    number of events is not encoded in fast path header
+    @see: http://msdn.microsoft.com/en-us/library/cc240589.aspx
+    """
+    def __init__(self, readLen = None):
+        CompositeType.__init__(self, readLen = readLen)
+        self.numEvents = UInt8(lambda:len(self.fastPathInputEvents._array))
+        self.fastPathInputEvents = ArrayType(FastPathInputEvent, readLen = self.numEvents)
+        
+class FastPathInputEvent(CompositeType):
+    """
+    @summary: Fast path input event, flags are encoded in header
+    @see: http://msdn.microsoft.com/en-us/library/cc240591.aspx
+    """
+    def __init__(self, eventData = None, eventFlags = 0):
+        """
+        @param eventData: event data with _FASTPATH_INPUT_EVENT_CODE_ attribute
+        @param eventFlags: {integer} five bits flags of event
+        """
+        CompositeType.__init__(self)
+        self.eventHeader = UInt8(lambda:(eventData.__class__._FASTPATH_INPUT_EVENT_CODE_ << 5) | eventFlags)
+        
+        def FastPathInputDataFactory():
+            for c in [FastPathScancodeKeyEvent, PointerEvent, PointerExEvent, FastPathSynchronizeEvent, FastPathUnicodeKeyEvent]:
+                if (self.eventHeader.value >> 5) == c._FASTPATH_INPUT_EVENT_CODE_:
+                    return c()
+            raise InvalidExpectedDataException("unknown fast path input : %s"%hex(self.eventHeader.value >> 5))
+        
+        if eventData is None:
+            eventData = FactoryType(FastPathInputDataFactory)
+        elif not "_FASTPATH_INPUT_EVENT_CODE_" in eventData.__class__.__dict__:
+            raise InvalidExpectedDataException("try to send an invalid Fast Path Input Event")
+        
+        self.eventData = eventData
+        
+    def getEventFlags(self):
+        """
+        @return: {integer} flags of event
+        """
+        return self.eventHeader.value & 0x1f
+        
+class FastPathScancodeKeyEvent(CompositeType):
+    """
+    @summary: Fast path keyboard event, release and extended flags are in event header
+    @see: http://msdn.microsoft.com/en-us/library/cc240592.aspx
+    """
+    _FASTPATH_INPUT_EVENT_CODE_ = FastPathInputEventCode.FASTPATH_INPUT_EVENT_SCANCODE
+    
+    def __init__(self, keyCode = 0):
+        CompositeType.__init__(self)
+        self.keyCode = UInt8(keyCode)
+        
+class FastPathUnicodeKeyEvent(CompositeType):
+    """
+    @summary: Fast path unicode event, release flag is in event header
+    @see: http://msdn.microsoft.com/en-us/library/cc240593.aspx
+    """
+    _FASTPATH_INPUT_EVENT_CODE_ = FastPathInputEventCode.FASTPATH_INPUT_EVENT_UNICODE
+    
+    def __init__(self, unicode = 0):
+        CompositeType.__init__(self)
+        self.unicode = UInt16Le(unicode)
+        
+class FastPathSynchronizeEvent(CompositeType):
+    """
+    @summary: Fast path synchronize event, toggle flags are in event header
+    @see: http://msdn.microsoft.com/en-us/library/cc240597.aspx
+    """
+    _FASTPATH_INPUT_EVENT_CODE_ = FastPathInputEventCode.FASTPATH_INPUT_EVENT_SYNC
+    
+    def __init__(self):
+        CompositeType.__init__(self)
@@ -25,10 +25,11 @@ In this layer are managed all mains bitmap update orders end user inputs
 
 from rdpy.core.layer import LayerAutomata
 from rdpy.core.error import CallPureVirtualFuntion
-from rdpy.core.type import ArrayType
+from rdpy.core.type import ArrayType, Stream, String
 import rdpy.core.log as log
 import rdpy.protocol.rdp.tpkt as tpkt
-import data, caps
+import rdpy.protocol.rdp.sec as sec
+import data, caps, order, bulk
 
 class PDUClientListener(object):
     """
@@ -54,11 +55,20 @@ class PDUClientListener(object):
         """
         raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "onUpdate", "PDUClientListener"))
     
-    def recvDstBltOrder(self, order):
+    def recvDstBltOrder(self, order, bounds):
         """
-        @param order: rectangle order
+        @param order: {order.DstBltOrder} rectangle order with absolute fields
+        @param bounds: {tuple(left, top, right, bottom) | None} inclusive clipping bounds
         """
         pass
+    
+    def recvScrBltOrder(self, order, bounds):
+        """
+        @summary: call when a screen to screen blit order is received
+        @param order: {order.ScrBltOrder} blit order with absolute fields
+        @param bounds: {tuple(left, top, right, bottom) | None} inclusive clipping bounds
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "recvScrBltOrder", "PDUClientListener"))
 
 class PDUServerListener(object):
     """
@@ -70,6 +80,12 @@ class PDUServerListener(object):
         """
         raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "onReady", "PDUServerListener"))
     
+    def onConnect(self):
+        """
+        @summary: Event call before capabilities exchange, server capabilities can be updated
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "onConnect", "PDUServerListener"))
+    
     def onSlowPathInput(self, slowPathInputEvents):
         """
         @summary: Event call when slow path input are available
@@ -147,6 +163,12 @@ class Client(PDULayer):
         """
         PDULayer.__init__(self)
         self._listener = listener
+        #state of primary drawing orders
+        self._orderState = order.OrderState()
+        #bulk decompression history
+        self._bulkDecompressor = bulk.MPPCDecompressor()
+        #auto reconnect cookie tuple(logon id, arc random bits)
+        self._autoReconnectCookie = None
         
     def connect(self):
         """
@@ -156,6 +178,8 @@ class Client(PDULayer):
         self.setNextState(self.recvDemandActivePDU)
         #check if client support fast path message
         self._clientFastPathSupported = False
+        #check if server support fast path input
+        self._serverFastPathInputSupported = False
         
     def close(self):
         """
@@ -174,8 +198,7 @@ class Client(PDULayer):
         Wait Server Synchronize PDU
         @param s: Stream
         """
-        pdu = data.PDU()
-        s.readType(pdu)
+        pdu = self.readPDU(s)
         
         if pdu.shareControlHeader.pduType.value != data.PDUType.PDUTYPE_DEMANDACTIVEPDU:
             #not a blocking error because in deactive reactive sequence 
@@ -190,6 +213,8 @@ class Client(PDULayer):
             
         #secure checksum cap here maybe protocol (another) design error
         self._transport._enableSecureCheckSum = bool(self._serverCapabilities[caps.CapsType.CAPSTYPE_GENERAL].capability.extraFlags & caps.GeneralExtraFlag.ENC_SALTED_CHECKSUM)
+        #server accept input events in fast path packet
+        self._serverFastPathInputSupported = not self._fastPathSender is None and bool(self._serverCapabilities[caps.CapsType.CAPSTYPE_INPUT].capability.inputFlags.value & (caps.InputFlags.INPUT_FLAG_FASTPATH_INPUT | caps.InputFlags.INPUT_FLAG_FASTPATH_INPUT2))
         
         self.sendConfirmActivePDU()
         #send synchronize
@@ -202,8 +227,7 @@ class Client(PDULayer):
         Wait Control Cooperate PDU
         @param s: Stream from transport layer
         """
-        pdu = data.PDU()
-        s.readType(pdu)
+        pdu = self.readPDU(s)
         if pdu.shareControlHeader.pduType.value != data.PDUType.PDUTYPE_DATAPDU or pdu.pduMessage.shareDataHeader.pduType2.value != data.PDUType2.PDUTYPE2_SYNCHRONIZE:
             #not a blocking error because in deactive reactive sequence 
             #input can be send too but ignored
@@ -218,8 +242,7 @@ class Client(PDULayer):
         Wait Control Granted PDU
         @param s: Stream from transport layer
         """
-        pdu = data.PDU()
-        s.readType(pdu)
+        pdu = self.readPDU(s)
         if pdu.shareControlHeader.pduType.value != data.PDUType.PDUTYPE_DATAPDU or pdu.pduMessage.shareDataHeader.pduType2.value != data.PDUType2.PDUTYPE2_CONTROL or pdu.pduMessage.pduData.action.value != data.Action.CTRLACTION_COOPERATE:
             #not a blocking error because in deactive reactive sequence 
             #input can be send too but ignored
@@ -234,8 +257,7 @@ class Client(PDULayer):
         Wait Font map PDU
         @param s: Stream from transport layer
         """
-        pdu = data.PDU()
-        s.readType(pdu)
+        pdu = self.readPDU(s)
         if pdu.shareControlHeader.pduType.value != data.PDUType.PDUTYPE_DATAPDU or pdu.pduMessage.shareDataHeader.pduType2.value != data.PDUType2.PDUTYPE2_CONTROL or pdu.pduMessage.pduData.action.value != data.Action.CTRLACTION_GRANTED_CONTROL:
             #not a blocking error because in deactive reactive sequence 
             #input can be send too but ignored
@@ -250,8 +272,7 @@ class Client(PDULayer):
         Wait any PDU
         @param s: Stream from transport layer
         """
-        pdu = data.PDU()
-        s.readType(pdu)
+        pdu = self.readPDU(s)
         if pdu.shareControlHeader.pduType.value != data.PDUType.PDUTYPE_DATAPDU or pdu.pduMessage.shareDataHeader.pduType2.value != data.PDUType2.PDUTYPE2_FONTMAP:
             #not a blocking error because in deactive reactive sequence 
             #input can be send too but ignored
@@ -271,6 +292,7 @@ class Client(PDULayer):
         s.readType(pdus)
         for pdu in pdus:
             if pdu.shareControlHeader.pduType.value == data.PDUType.PDUTYPE_DATAPDU:
+                self.decompressDataPDU(pdu.pduMessage)
                 self.readDataPDU(pdu.pduMessage)
             elif pdu.shareControlHeader.pduType.value == data.PDUType.PDUTYPE_DEACTIVATEALLPDU:
                 #use in deactivation-reactivation sequence
@@ -288,8 +310,56 @@ class Client(PDULayer):
         updates = ArrayType(data.FastPathUpdatePDU)
         fastPathS.readType(updates)
         for update in updates:
-            if update.updateHeader.value == data.FastPathUpdateType.FASTPATH_UPDATETYPE_BITMAP:
+            if update.compressionFlags._is_readed:
+                self.decompressFastPathUpdate(update)
+            updateType = update.updateHeader.value & 0xf
+            if updateType == data.FastPathUpdateType.FASTPATH_UPDATETYPE_BITMAP:
                 self._listener.onUpdate(update.updateData.rectangles._array)
+            elif updateType == data.FastPathUpdateType.FASTPATH_UPDATETYPE_ORDERS:
+                self.readOrders(update.updateData.numberOrders.value, update.updateData.orderData.value)
+        
+    def readPDU(self, s):
+        """
+        @summary: Read one PDU during connection sequence
+        @param s: Stream from transport layer
+        @return: {data.PDU} PDU with decompressed data
+        """
+        pdu = data.PDU()
+        s.readType(pdu)
+        if pdu.shareControlHeader.pduType.value == data.PDUType.PDUTYPE_DATAPDU:
+            self.decompressDataPDU(pdu.pduMessage)
+        return pdu
+    
+    def decompressDataPDU(self, dataPDU):
+        """
+        @summary: Decompress PDU data with session history
+        History must be updated for each data PDU even if not compressed
+        @param dataPDU: {data.DataPDU}
+        """
+        flags = dataPDU.shareDataHeader.compressedType.value
+        if not flags & data.CompressionOrder.PACKET_COMPRESSED:
+            self._bulkDecompressor.decompress("", flags)
+            return
+        
+        decompressed = self._bulkDecompressor.decompress(dataPDU.pduData.value, flags)
+        pduData = dataPDU.createPDUData(len(decompressed))
+        Stream(decompressed).readType(pduData)
+        dataPDU.pduData = pduData
+        
+    def decompressFastPathUpdate(self, update):
+        """
+        @summary: Decompress fast path update data with session history
+        @param update: {data.FastPathUpdatePDU}
+        """
+        flags = update.compressionFlags.value
+        if not flags & data.CompressionOrder.PACKET_COMPRESSED:
+            self._bulkDecompressor.decompress("", flags)
+            return
+        
+        decompressed = self._bulkDecompressor.decompress(update.updateData.value, flags)
+        updateData = update.createUpdateData(len(decompressed))
+        Stream(decompressed).readType(updateData)
+        update.updateData = updateData
         
     def readDataPDU(self, dataPDU):
         """
@@ -309,11 +379,25 @@ class Client(PDULayer):
             #may be an event to ask to user
             self._transport.close()
         elif dataPDU.shareDataHeader.pduType2.value == data.PDUType2.PDUTYPE2_SAVE_SESSION_INFO:
+            self.readSaveSessionInfoPDU(dataPDU.pduData)
             #handle session event
             self._listener.onSessionReady()
         elif dataPDU.shareDataHeader.pduType2.value == data.PDUType2.PDUTYPE2_UPDATE:
             self.readUpdateDataPDU(dataPDU.pduData)
     
+    def readSaveSessionInfoPDU(self, saveSessionInfoPDU):
+        """
+        @summary: Keep auto reconnect cookie send after logon
+        @param saveSessionInfoPDU: {SaveSessionInfoPDU}
+        """
+        if saveSessionInfoPDU.infoType.value != data.InfoType.INFOTYPE_LOGON_EXTENDED_INFO:
+            return
+        
+        logonInfo = data.LogonInfoExtended()
+        Stream(saveSessionInfoPDU.infoData.value).readType(logonInfo)
+        if logonInfo.fieldsPresent.value & data.LogonExField.LOGON_EX_AUTORECONNECTCOOKIE:
+            self._autoReconnectCookie = (logonInfo.autoReconnectCookie.logonId.value, logonInfo.autoReconnectCookie.arcRandomBits.value)
+    
     def readUpdateDataPDU(self, updateDataPDU):
         """
         @summary: Read an update data PDU data
@@ -322,6 +406,29 @@ class Client(PDULayer):
         """
         if updateDataPDU.updateType.value == data.UpdateType.UPDATETYPE_BITMAP:
             self._listener.onUpdate(updateDataPDU.updateData.rectangles._array)
+        elif updateDataPDU.updateType.value == data.UpdateType.UPDATETYPE_ORDERS:
+            self.readOrders(updateDataPDU.updateData.numberOrders.value, updateDataPDU.updateData.orderData.value)
+            
+    def readOrders(self, numberOrders, orderData):
+        """
+        @summary: Decode drawing orders and dispatch them
+        Stop at first unsupported order because order length is unknown
+        @param numberOrders: {integer} number of orders
+        @param orderData: {str} encoded orders
+        """
+        s = Stream(orderData)
+        for _ in range(0, numberOrders):
+            primaryOrder = order.PrimaryDrawingOrder(lastOrderType = self._orderState.getOrderType)
+            s.readType(primaryOrder)
+            if not primaryOrder.isPrimary() or not primaryOrder.getOrderType() in [order.OrderType.TS_ENC_DSTBLT_ORDER, order.OrderType.TS_ENC_SCRBLT_ORDER]:
+                log.debug("Ignore end of order update")
+                return
+            
+            drawingOrder, bounds = self._orderState.update(primaryOrder)
+            if primaryOrder.getOrderType() == order.OrderType.TS_ENC_SCRBLT_ORDER:
+                self._listener.recvScrBltOrder(drawingOrder, bounds)
+            else:
+                self._listener.recvDstBltOrder(drawingOrder, bounds)
         
     def sendConfirmActivePDU(self):
         """
@@ -384,12 +491,54 @@ class Client(PDULayer):
     def sendInputEvents(self, pointerEvents):
         """
         @summary: send client input events
+        use fast path input if server support it
         @param pointerEvents: list of pointer events
         """
+        if self._serverFastPathInputSupported:
+            self.sendFastPathInputEvents(pointerEvents)
+            return
+        
         pdu = data.ClientInputEventPDU()
         pdu.slowPathInputEvents._array = [data.SlowPathInputEvent(x) for x in pointerEvents]
         self.sendDataPDU(pdu)
         
+    def sendFastPathInputEvents(self, inputEvents):
+        """
+        @summary: send client input events in fast path packet
+        @param inputEvents: list of slow path input events
+        """
+        #number of events is encoded in one byte
+        for i in range(0, len(inputEvents), 255):
+            pdu = data.FastPathInputPDU()
+            pdu.fastPathInputEvents._array = [self.createFastPathInputEvent(x) for x in inputEvents[i:i + 255]]
+            self._fastPathSender.sendFastPath(0, pdu)
+        
+    def createFastPathInputEvent(self, inputEvent):
+        """
+        @summary: convert slow path input event into fast path input event
+        @param inputEvent: {data.PointerEvent | data.PointerExEvent | data.ScancodeKeyEvent | data.UnicodeKeyEvent | data.SynchronizeEvent}
+        @return: {data.FastPathInputEvent}
+        """
+        if isinstance(inputEvent, data.ScancodeKeyEvent):
+            eventFlags = 0
+            if inputEvent.keyboardFlags.value & data.KeyboardFlag.KBDFLAGS_RELEASE:
+                eventFlags |= data.FastPathKeyboardFlag.FASTPATH_INPUT_KBDFLAGS_RELEASE
+            if inputEvent.keyboardFlags.value & data.KeyboardFlag.KBDFLAGS_EXTENDED:
+                eventFlags |= data.FastPathKeyboardFlag.FASTPATH_INPUT_KBDFLAGS_EXTENDED
+            return data.FastPathInputEvent(data.FastPathScancodeKeyEvent(inputEvent.keyCode.value), eventFlags)
+        
+        elif isinstance(inputEvent, data.UnicodeKeyEvent):
+            eventFlags = 0
+            if inputEvent.keyboardFlags.value & data.KeyboardFlag.KBDFLAGS_RELEASE:
+                eventFlags |= data.FastPathKeyboardFlag.FASTPATH_INPUT_KBDFLAGS_RELEASE
+            return data.FastPathInputEvent(data.FastPathUnicodeKeyEvent(inputEvent.unicode.value), eventFlags)
+        
+        elif isinstance(inputEvent, data.SynchronizeEvent):
+            return data.FastPathInputEvent(data.FastPathSynchronizeEvent(), inputEvent.toggleFlags.value & 0x1f)
+        
+        #pointer events have same layout in fast path
+        return data.FastPathInputEvent(inputEvent)
+        
 class Server(PDULayer):
     """
     @summary: Server Automata of PDU layer
@@ -402,11 +551,20 @@ class Server(PDULayer):
         self._listener = listener
         #fast path layer
         self._fastPathSender = None
+        #bulk compression history (if client support it)
+        self._bulkCompressor = None
         
     def connect(self):
         """
         @summary: Connect message for server automata
         """
+        #client advertise its higher compression type in info packet
+        infoFlag = self._transport._info.flag.value
+        if infoFlag & sec.InfoFlag.INFO_COMPRESSION:
+            compressionType = min((infoFlag >> 9) & data.CompressionOrder.CompressionTypeMask, data.CompressionType.PACKET_COMPR_TYPE_64K)
+            self._bulkCompressor = bulk.MPPCCompressor(compressionType)
+            
+        self._listener.onConnect()
         self.sendDemandActivePDU()
         self.setNextState(self.recvConfirmActivePDU)      
         
@@ -589,6 +747,46 @@ class Server(PDULayer):
             self.sendDemandActivePDU()
             self.setNextState(self.recvConfirmActivePDU)
         
+    def sendDataPDU(self, pduData):
+        """
+        @summary: Send an PDUData to transport layer
+        compress PDU data if client support it
+        @param pduData: PDU data message
+        """
+        if self._bulkCompressor is None:
+            PDULayer.sendDataPDU(self, pduData)
+            return
+        
+        s = Stream()
+        s.writeType(pduData)
+        compressed, flags = self._bulkCompressor.compress(s.getvalue())
+        
+        dataPDU = data.DataPDU(pduData, self._shareId)
+        dataPDU.shareDataHeader.pduType2.value = pduData.__class__._PDUTYPE2_
+        dataPDU.shareDataHeader.uncompressedLength.value = len(s.getvalue()) + 4
+        dataPDU.shareDataHeader.compressedType.value = flags
+        if flags & data.CompressionOrder.PACKET_COMPRESSED:
+            dataPDU.shareDataHeader.compressedLength.value = len(compressed) + 4
+            dataPDU.pduData = String(compressed)
+        self.sendPDU(dataPDU)
+        
+    def sendFastPathUpdatePDU(self, updateData):
+        """
+        @summary: Send a fast path update
+        compress update data if client support it
+        @param updateData: fast path update data (FastPathBitmapUpdateDataPDU)
+        """
+        fastPathUpdatePDU = data.FastPathUpdatePDU(updateData)
+        if not self._bulkCompressor is None:
+            s = Stream()
+            s.writeType(updateData)
+            compressed, flags = self._bulkCompressor.compress(s.getvalue())
+            fastPathUpdatePDU.updateHeader.value = updateData.__class__._FASTPATH_UPDATE_TYPE_ | (data.FastPathOutputCompression.FASTPATH_OUTPUT_COMPRESSION_USED << 6)
+            fastPathUpdatePDU.compressionFlags.value = flags
+            if flags & data.CompressionOrder.PACKET_COMPRESSED:
+                fastPathUpdatePDU.updateData = String(compressed)
+        self._fastPathSender.sendFastPath(0, fastPathUpdatePDU)
+        
     def sendBitmapUpdatePDU(self, bitmapDatas):
         """
         @summary: Send bitmap update data
@@ -604,9 +802,25 @@ class Server(PDULayer):
             #fast path case
             fastPathUpdateDataPDU = data.FastPathBitmapUpdateDataPDU()
             fastPathUpdateDataPDU.rectangles._array = bitmapDatas
-            self._fastPathSender.sendFastPath(0, data.FastPathUpdatePDU(fastPathUpdateDataPDU))
+            self.sendFastPathUpdatePDU(fastPathUpdateDataPDU)
         else:
             #slow path case
             updateDataPDU = data.BitmapUpdateDataPDU()
             updateDataPDU.rectangles._array = bitmapDatas
-            self.sendDataPDU(data.UpdateDataPDU(updateDataPDU))
\ No newline at end of file
+            self.sendDataPDU(data.UpdateDataPDU(updateDataPDU))
+            
+    def sendOrderUpdatePDU(self, orders):
+        """
+        @summary: Send primary drawing orders
+        Each order is sent with all fields in absolute mode
+        @param orders: {list(order.PrimaryDrawingOrder)}
+        """
+        s = Stream()
+        s.writeType(orders)
+        
+        if self._clientFastPathSupported and not self._fastPathSender is None:
+            #fast path case
+            self.sendFastPathUpdatePDU(data.FastPathOrderUpdateDataPDU(len(orders), s.getvalue()))
+        else:
+            #slow path case
+            self.sendDataPDU(data.UpdateDataPDU(data.OrderUpdateDataPDU(len(orders), s.getvalue())))
\ No newline at end of file
@@ -23,7 +23,7 @@ GDI order structure
 
 from rdpy.core import log
 from rdpy.core.error import InvalidExpectedDataException
-from rdpy.core.type import CompositeType, UInt8, String, FactoryType, SInt8, SInt16Le
+from rdpy.core.type import CompositeType, UInt8, String, FactoryType, SInt8, SInt16Le, ArrayType, CallableValue
 
 class ControlFlag(object):
     """
@@ -67,38 +67,109 @@ class OrderType(object):
     TS_ENC_ELLIPSE_CB_ORDER = 0x1A
     TS_ENC_INDEX_ORDER = 0x1B
     
+class BoundsFlag(object):
+    """
+    @summary: Bounds description flags
+    @see: http://msdn.microsoft.com/en-us/library/cc241567.aspx
+    """
+    TS_BOUND_LEFT = 0x01
+    TS_BOUND_TOP = 0x02
+    TS_BOUND_RIGHT = 0x04
+    TS_BOUND_BOTTOM = 0x08
+    TS_BOUND_DELTA_LEFT = 0x10
+    TS_BOUND_DELTA_TOP = 0x20
+    TS_BOUND_DELTA_RIGHT = 0x40
+    TS_BOUND_DELTA_BOTTOM = 0x80
+    
+class RasterOperation(object):
+    """
+    @summary: Ternary raster operation use by blit orders
+    @see: http://msdn.microsoft.com/en-us/library/cc241583.aspx
+    """
+    BLACKNESS = 0x00
+    DSTINVERT = 0x55
+    SRCCOPY = 0xCC
+    WHITENESS = 0xFF
+    
 class CoordField(CompositeType):
     """
     @summary: used to describe a value in the range -32768 to 32767
     @see: http://msdn.microsoft.com/en-us/library/cc241577.aspx
     """
-    def __init__(self, isDelta, conditional = lambda:True):
+    def __init__(self, isDelta, value = 0, conditional = lambda:True):
         """
         @param isDelta: callable object to know if coord field is in delta mode
+        @param value: {integer} absolute value use in write mode
         @param conditional: conditional read or write type
         """
         CompositeType.__init__(self, conditional = conditional)
         self.delta = SInt8(conditional = isDelta)
-        self.coordinate = SInt16Le(conditional = isDelta)
+        self.coordinate = SInt16Le(value, conditional = lambda:not isDelta())
+        
+    def update(self, last):
+        """
+        @summary: Compute absolute value of field
+        @param last: {integer} previous absolute value of field
+        @return: {integer} new absolute value
+        """
+        if not self._is_readed:
+            return last
+        if self.delta._is_readed:
+            return last + self.delta.value
+        return self.coordinate.value
+    
+class Bounds(CompositeType):
+    """
+    @summary: Bounding rectangle of a primary drawing order
+    @see: http://msdn.microsoft.com/en-us/library/cc241567.aspx
+    """
+    def __init__(self, conditional = lambda:True):
+        """
+        @param conditional: conditional read or write type
+        """
+        CompositeType.__init__(self, conditional = conditional)
+        self.description = UInt8()
+        self.left = CoordField(lambda:self.description.value & BoundsFlag.TS_BOUND_DELTA_LEFT, conditional = lambda:(self.description.value & (BoundsFlag.TS_BOUND_LEFT | BoundsFlag.TS_BOUND_DELTA_LEFT)))
+        self.top = CoordField(lambda:self.description.value & BoundsFlag.TS_BOUND_DELTA_TOP, conditional = lambda:(self.description.value & (BoundsFlag.TS_BOUND_TOP | BoundsFlag.TS_BOUND_DELTA_TOP)))
+        self.right = CoordField(lambda:self.description.value & BoundsFlag.TS_BOUND_DELTA_RIGHT, conditional = lambda:(self.description.value & (BoundsFlag.TS_BOUND_RIGHT | BoundsFlag.TS_BOUND_DELTA_RIGHT)))
+        self.bottom = CoordField(lambda:self.description.value & BoundsFlag.TS_BOUND_DELTA_BOTTOM, conditional = lambda:(self.description.value & (BoundsFlag.TS_BOUND_BOTTOM | BoundsFlag.TS_BOUND_DELTA_BOTTOM)))
+        
+    def update(self, bounds):
+        """
+        @summary: Compute absolute bounds
+        @param bounds: {tuple(left, top, right, bottom)} previous bounds
+        @return: {tuple(left, top, right, bottom)} new inclusive bounds
+        """
+        return (self.left.update(bounds[0]), self.top.update(bounds[1]), self.right.update(bounds[2]), self.bottom.update(bounds[3]))
     
 class PrimaryDrawingOrder(CompositeType):
     """
     @summary: GDI Primary drawing order
     @see: http://msdn.microsoft.com/en-us/library/cc241586.aspx
     """
-    def __init__(self, order = None):
+    def __init__(self, order = None, lastOrderType = lambda:OrderType.TS_ENC_PATBLT_ORDER):
+        """
+        @param order: {CompositeType} order to write (ScrBltOrder) with all fields in absolute mode
+        @param lastOrderType: {callable} type of previous order, use when order type field is not present
+        """
         CompositeType.__init__(self)
-        self.controlFlags = UInt8()
-        self.orderType = UInt8()
+        self._lastOrderType = lastOrderType
+        self.controlFlags = UInt8(ControlFlag.TS_STANDARD | ControlFlag.TS_TYPE_CHANGE)
+        self.orderType = UInt8(lambda:order.__class__._ORDER_TYPE_, conditional = lambda:(self.isPrimary() and self.controlFlags.value & ControlFlag.TS_TYPE_CHANGE))
+        self.fieldFlags = ArrayType(UInt8, readLen = CallableValue(self.getFieldBytes), conditional = self.isPrimary)
+        self.bounds = Bounds(conditional = lambda:(self.isPrimary() and self.controlFlags.value & ControlFlag.TS_BOUNDS and not self.controlFlags.value & ControlFlag.TS_ZERO_BOUNDS_DELTAS))
         
         def OrderFactory():
             """
-            Closure for capability factory
+            Closure for order factory
             """
-            for c in [DstBltOrder]:
-                if self.orderType.value == c._ORDER_TYPE_:
-                    return c(self.controlFlags)
-            log.debug("unknown Order type : %s"%hex(self.orderType.value))
+            if self.isPrimary():
+                for c in [DstBltOrder, ScrBltOrder]:
+                    if self.getOrderType() == c._ORDER_TYPE_:
+                        return c(fieldFlags = self.getFieldFlags, isDelta = lambda:(self.controlFlags.value & ControlFlag.TS_DELTA_COORDINATES))
+                log.debug("unknown Order type : %s"%hex(self.getOrderType()))
+            else:
+                log.debug("secondary drawing order are not supported")
             #read entire packet
             return String()
         
@@ -106,6 +177,50 @@ class PrimaryDrawingOrder(CompositeType):
             order = FactoryType(OrderFactory)
         elif not "_ORDER_TYPE_" in order.__class__.__dict__:
             raise InvalidExpectedDataException("Try to send an invalid order block")
+        else:
+            #write every field
+            fieldFlags = (1 << len(order._typeName)) - 1
+            self.fieldFlags._array = [UInt8((fieldFlags >> (8 * i)) & 0xff) for i in range(0, order.__class__._FIELD_BYTES_)]
+            
+        self.order = order
+        
+    def isPrimary(self):
+        """
+        @return: {bool} True if order is a primary drawing order
+        """
+        return self.controlFlags.value & (ControlFlag.TS_STANDARD | ControlFlag.TS_SECONDARY) == ControlFlag.TS_STANDARD
+    
+    def getOrderType(self):
+        """
+        @return: {integer} order type from order type field or previous order
+        """
+        if self.controlFlags.value & ControlFlag.TS_TYPE_CHANGE:
+            return self.orderType.value
+        return self._lastOrderType()
+    
+    def getFieldBytes(self):
+        """
+        @summary: Field flags are truncated when last bytes are zero
+        @return: {integer} number of bytes of field flags
+        """
+        fieldBytes = 0
+        for c in [DstBltOrder, ScrBltOrder]:
+            if self.getOrderType() == c._ORDER_TYPE_:
+                fieldBytes = c._FIELD_BYTES_
+        if self.controlFlags.value & ControlFlag.TS_ZERO_FIELD_BYTE_BIT0:
+            fieldBytes -= 1
+        if self.controlFlags.value & ControlFlag.TS_ZERO_FIELD_BYTE_BIT1:
+            fieldBytes -= 2
+        return max(fieldBytes, 0)
+    
+    def getFieldFlags(self):
+        """
+        @return: {integer} presence flags of order fields
+        """
+        fieldFlags = 0
+        for i in range(0, len(self.fieldFlags._array)):
+            fieldFlags |= self.fieldFlags._array[i].value << (8 * i)
+        return fieldFlags
 
 class DstBltOrder(CompositeType):
     """
@@ -114,16 +229,104 @@ class DstBltOrder(CompositeType):
     @see: http://msdn.microsoft.com/en-us/library/cc241587.aspx
     """
     #order type
-    _ORDER_TYPE_ = 0x00
+    _ORDER_TYPE_ = OrderType.TS_ENC_DSTBLT_ORDER
     #negotiation index
     _NEGOTIATE_ = 0x00
+    #size of field flags
+    _FIELD_BYTES_ = 1
+    
+    def __init__(self, nLeftRect = 0, nTopRect = 0, nWidth = 0, nHeight = 0, bRop = RasterOperation.BLACKNESS, fieldFlags = lambda:0x1f, isDelta = lambda:False):
+        """
+        @param fieldFlags: {callable} presence flags of fields
+        @param isDelta: {callable} True if coordinates are encoded as delta
+        """
+        CompositeType.__init__(self)
+        self.nLeftRect = CoordField(isDelta, nLeftRect, conditional = lambda:(fieldFlags() & 0x01))
+        self.nTopRect = CoordField(isDelta, nTopRect, conditional = lambda:(fieldFlags() & 0x02))
+        self.nWidth = CoordField(isDelta, nWidth, conditional = lambda:(fieldFlags() & 0x04))
+        self.nHeight = CoordField(isDelta, nHeight, conditional = lambda:(fieldFlags() & 0x08))
+        self.bRop = UInt8(bRop, conditional = lambda:(fieldFlags() & 0x10))
+        
+class ScrBltOrder(CompositeType):
+    """
+    @summary: The ScrBlt Primary Drawing Order is used to perform 
+                a bit-block transfer from a source region to a destination region.
+                Use by server to express scroll or window move
+    @see: http://msdn.microsoft.com/en-us/library/cc241605.aspx
+    """
+    #order type
+    _ORDER_TYPE_ = OrderType.TS_ENC_SCRBLT_ORDER
+    #negotiation index
+    _NEGOTIATE_ = 0x02
+    #size of field flags
+    _FIELD_BYTES_ = 1
     
-    def __init__(self, controlFlag):
+    def __init__(self, nLeftRect = 0, nTopRect = 0, nWidth = 0, nHeight = 0, nXSrc = 0, nYSrc = 0, bRop = RasterOperation.SRCCOPY, fieldFlags = lambda:0x7f, isDelta = lambda:False):
+        """
+        @param nLeftRect: {integer} left coordinate of destination rectangle
+        @param nTopRect: {integer} top coordinate of destination rectangle
+        @param nWidth: {integer} width of destination rectangle
+        @param nHeight: {integer} height of destination rectangle
+        @param nXSrc: {integer} left coordinate of source rectangle
+        @param nYSrc: {integer} top coordinate of source rectangle
+        @param bRop: {RasterOperation}
+        @param fieldFlags: {callable} presence flags of fields
+        @param isDelta: {callable} True if coordinates are encoded as delta
+        """
         CompositeType.__init__(self)
-        #only one field
-        self.fieldFlag = UInt8(conditional = lambda:(controlFlag.value & ControlFlag.TS_ZERO_FIELD_BYTE_BIT0 == 0 and controlFlag.value & ControlFlag.TS_ZERO_FIELD_BYTE_BIT1 == 0))
-        self.nLeftRect = CoordField(lambda:not controlFlag.value & ControlFlag.TS_DELTA_COORDINATES == 0)
-        self.nTopRect = CoordField(lambda:not controlFlag.value & ControlFlag.TS_DELTA_COORDINATES == 0)
-        self.nWidth = CoordField(lambda:not controlFlag.value & ControlFlag.TS_DELTA_COORDINATES == 0)
-        self.nHeight = CoordField(lambda:not controlFlag.value & ControlFlag.TS_DELTA_COORDINATES == 0)
-        self.bRop = CoordField(lambda:not controlFlag.value & ControlFlag.TS_DELTA_COORDINATES == 0)
\ No newline at end of file
+        self.nLeftRect = CoordField(isDelta, nLeftRect, conditional = lambda:(fieldFlags() & 0x01))
+        self.nTopRect = CoordField(isDelta, nTopRect, conditional = lambda:(fieldFlags() & 0x02))
+        self.nWidth = CoordField(isDelta, nWidth, conditional = lambda:(fieldFlags() & 0x04))
+        self.nHeight = CoordField(isDelta, nHeight, conditional = lambda:(fieldFlags() & 0x08))
+        self.bRop = UInt8(bRop, conditional = lambda:(fieldFlags() & 0x10))
+        self.nXSrc = CoordField(isDelta, nXSrc, conditional = lambda:(fieldFlags() & 0x20))
+        self.nYSrc = CoordField(isDelta, nYSrc, conditional = lambda:(fieldFlags() & 0x40))
+        
+class OrderState(object):
+    """
+    @summary: Primary drawing orders are encoded against previous orders,
+                keep last order type, bounds and absolute fields of each order
+    @see: http://msdn.microsoft.com/en-us/library/cc241586.aspx
+    """
+    def __init__(self):
+        #initial order type of a session
+        self._orderType = OrderType.TS_ENC_PATBLT_ORDER
+        #last inclusive bounds
+        self._bounds = (0, 0, 0, 0)
+        #last absolute fields for each order type
+        self._orders = {
+            OrderType.TS_ENC_DSTBLT_ORDER : DstBltOrder(),
+            OrderType.TS_ENC_SCRBLT_ORDER : ScrBltOrder()
+        }
+        
+    def getOrderType(self):
+        """
+        @return: {integer} type of last decoded order
+        """
+        return self._orderType
+    
+    def update(self, primaryOrder):
+        """
+        @summary: Merge a decoded order into state
+        @param primaryOrder: {PrimaryDrawingOrder} order just read
+        @return: {tuple(CompositeType, tuple | None)} order with absolute fields and inclusive bounds if any
+        """
+        self._orderType = primaryOrder.getOrderType()
+        
+        bounds = None
+        if primaryOrder.controlFlags.value & ControlFlag.TS_BOUNDS:
+            if primaryOrder.bounds._is_readed:
+                self._bounds = primaryOrder.bounds.update(self._bounds)
+            bounds = self._bounds
+        
+        last = self._orders[self._orderType]
+        for name in last._typeName:
+            field = getattr(primaryOrder.order, name)
+            if not field._is_readed:
+                continue
+            if isinstance(field, CoordField):
+                last.__dict__[name].coordinate.value = field.update(last.__dict__[name].coordinate.value)
+            else:
+                last.__dict__[name].value = field.value
+                
+        return last, bounds
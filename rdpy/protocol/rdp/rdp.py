@@ -26,6 +26,7 @@ from rdpy.core.error import CallPureVirtualFuntion, InvalidValue
 import pdu.layer
 import pdu.data
 import pdu.caps
+import pdu.order
 import rdpy.core.log as log
 import tpkt, x224, sec
 from t125 import mcs, gcc
@@ -61,6 +62,10 @@ class RDPClientController(pdu.layer.PDUClientListener):
         self._secLayer.initFastPath(self._tpktLayer)
         #is pdu layer is ready to send
         self._isReady = False
+        #input events waiting for batch send (None delay is no batching)
+        self._inputBatchDelay = None
+        self._inputEvents = []
+        self._inputFlushCall = None
         
     def getProtocol(self):
         """
@@ -87,6 +92,13 @@ class RDPClientController(pdu.layer.PDUClientListener):
         """
         self._secLayer._info.extendedInfo.performanceFlags.value = sec.PerfFlag.PERF_DISABLE_WALLPAPER | sec.PerfFlag.PERF_DISABLE_MENUANIMATIONS | sec.PerfFlag.PERF_DISABLE_CURSOR_SHADOW | sec.PerfFlag.PERF_DISABLE_THEMING | sec.PerfFlag.PERF_DISABLE_FULLWINDOWDRAG
         
+    def setBulkCompression(self):
+        """
+        @summary: Ask server to compress PDU with MPPC 64K
+                    Reduce bandwidth on slow links
+        """
+        self._secLayer._info.flag.value |= sec.InfoFlag.INFO_COMPRESSION | (pdu.data.CompressionType.PACKET_COMPR_TYPE_64K << 9)
+        
     def setScreen(self, width, height):
         """
         @summary: Set screen dim of session
@@ -151,6 +163,29 @@ class RDPClientController(pdu.layer.PDUClientListener):
         self._mcsLayer._clientSettings.CS_CORE.clientName.value = hostname[:15] + "\x00" * (15 - len(hostname))
         self._secLayer._licenceManager._hostname = hostname
         
+    def setLicenseStore(self, licenseStore, serverName):
+        """
+        @summary: present license issued on previous connection instead of asking a new one
+        @param licenseStore: {lic.LicenseStore} shared by connections
+        @param serverName: {str} name or address of target server
+        """
+        self._secLayer._licenceManager.setLicenseStore(licenseStore, serverName)
+        
+    def getAutoReconnectCookie(self):
+        """
+        @summary: Cookie send by server after logon, use it to resume session after network drop
+        @return: {tuple(int, str) | None} logon id and random bits
+        """
+        return self._pduLayer._autoReconnectCookie
+    
+    def setAutoReconnectCookie(self, cookie):
+        """
+        @summary: Resume session of a previous connection without full logon
+                    Must be set before connection
+        @param cookie: {tuple(int, str)} cookie retrieve by getAutoReconnectCookie
+        """
+        self._secLayer._autoReconnectCookie = cookie
+        
     def setSecurityLevel(self, level):
         """
         @summary: Request basic security
@@ -163,6 +198,29 @@ class RDPClientController(pdu.layer.PDUClientListener):
         elif level == SecurityLevel.RDP_LEVEL_NLA:
             self._x224Layer._requestedProtocol = x224.Protocols.PROTOCOL_SSL | x224.Protocols.PROTOCOL_HYBRID
         
+    def setTLSPolicy(self, policy):
+        """
+        @summary: TLS versions and ciphers use with this target
+        @param policy: {x224.TLSPolicy} for example x224.LEGACY_TLS_POLICY for old windows hosts
+        """
+        self._x224Layer._tlsPolicy = policy
+        
+    def setScrBltOrderSupport(self):
+        """
+        @summary: Ask server to express scroll and window move as screen to screen blit
+                    Observers must implement onScreenBlt
+        """
+        self._pduLayer._clientCapabilities[pdu.caps.CapsType.CAPSTYPE_ORDER].capability.orderSupport[pdu.order.ScrBltOrder._NEGOTIATE_].value = 1
+        
+    def setInputBatching(self, delay = 0.0):
+        """
+        @summary: Collect input events during delay and send them in one input PDU
+                    Consecutive mouse moves are merged, buttons and keys order is kept
+        @param delay: {float | None} batch window in seconds, 0 for next reactor tick, None to disable
+        """
+        self.flushInputEvents()
+        self._inputBatchDelay = delay
+        
     def addClientObserver(self, observer):
         """
         @summary: Add observer to RDP protocol
@@ -190,6 +248,35 @@ class RDPClientController(pdu.layer.PDUClientListener):
             for rectangle in rectangles:
                 observer.onUpdate(rectangle.destLeft.value, rectangle.destTop.value, rectangle.destRight.value, rectangle.destBottom.value, rectangle.width.value, rectangle.height.value, rectangle.bitsPerPixel.value, rectangle.flags.value & pdu.data.BitmapFlag.BITMAP_COMPRESSION, rectangle.bitmapDataStream.value)
                 
+    def recvScrBltOrder(self, order, bounds):
+        """
+        @summary: Call when a screen to screen blit order is received
+        @param order: {pdu.order.ScrBltOrder} order with absolute fields
+        @param bounds: {tuple(left, top, right, bottom) | None} inclusive clipping bounds
+        """
+        if order.bRop.value != pdu.order.RasterOperation.SRCCOPY:
+            log.debug("Ignore screen blit with raster operation %s"%hex(order.bRop.value))
+            return
+        
+        destLeft, destTop = order.nLeftRect.coordinate.value, order.nTopRect.coordinate.value
+        width, height = order.nWidth.coordinate.value, order.nHeight.coordinate.value
+        srcLeft, srcTop = order.nXSrc.coordinate.value, order.nYSrc.coordinate.value
+        
+        #clip destination rectangle and move source in accordance
+        if not bounds is None:
+            left, top = max(destLeft, bounds[0]), max(destTop, bounds[1])
+            width = min(destLeft + width, bounds[2] + 1) - left
+            height = min(destTop + height, bounds[3] + 1) - top
+            srcLeft += left - destLeft
+            srcTop += top - destTop
+            destLeft, destTop = left, top
+            
+        if width <= 0 or height <= 0:
+            return
+        
+        for observer in self._clientObserver:
+            observer.onScreenBlt(destLeft, destTop, width, height, srcLeft, srcTop)
+                
     def onReady(self):
         """
         @summary: Call when PDU layer is connected
@@ -213,6 +300,7 @@ class RDPClientController(pdu.layer.PDUClientListener):
         @summary: Event call when RDP stack is closed
         """
         self._isReady = False
+        self.flushInputEvents()
         for observer in self._clientObserver:
             observer.onClose()
     
@@ -257,7 +345,7 @@ class RDPClientController(pdu.layer.PDUClientListener):
             event.yPos.value = y
             
             # send proper event
-            self._pduLayer.sendInputEvents([event])
+            self.sendInputEvent(event)
             
         except InvalidValue:
             log.info("try send pointer event with incorrect position")
@@ -291,7 +379,7 @@ class RDPClientController(pdu.layer.PDUClientListener):
             event.yPos.value = y
             
             #send proper event
-            self._pduLayer.sendInputEvents([event])
+            self.sendInputEvent(event)
             
         except InvalidValue:
             log.info("try send wheel event with incorrect position")
@@ -316,7 +404,7 @@ class RDPClientController(pdu.layer.PDUClientListener):
                 event.keyboardFlags.value |= pdu.data.KeyboardFlag.KBDFLAGS_EXTENDED
                 
             #send event
-            self._pduLayer.sendInputEvents([event])
+            self.sendInputEvent(event)
             
         except InvalidValue:
             log.info("try send bad key event")
@@ -337,11 +425,49 @@ class RDPClientController(pdu.layer.PDUClientListener):
                 event.keyboardFlags.value |= pdu.data.KeyboardFlag.KBDFLAGS_RELEASE
             
             #send event
-            self._pduLayer.sendInputEvents([event])
+            self.sendInputEvent(event)
             
         except InvalidValue:
             log.info("try send bad key event")
             
+    def sendInputEvent(self, event):
+        """
+        @summary: Send input event or add it to current batch
+        @param event: {pdu.data.PointerEvent | pdu.data.PointerExEvent | pdu.data.ScancodeKeyEvent | pdu.data.UnicodeKeyEvent}
+        """
+        if self._inputBatchDelay is None:
+            self._pduLayer.sendInputEvents([event])
+            return
+        
+        #only last position of consecutive moves is useful
+        if len(self._inputEvents) > 0 and self.isPointerMove(event) and self.isPointerMove(self._inputEvents[-1]):
+            self._inputEvents[-1] = event
+        else:
+            self._inputEvents.append(event)
+            
+        if self._inputFlushCall is None:
+            from twisted.internet import reactor
+            self._inputFlushCall = reactor.callLater(self._inputBatchDelay, self.flushInputEvents)
+            
+    def isPointerMove(self, event):
+        """
+        @param event: input event
+        @return: True if event is a pointer move without button state
+        """
+        return isinstance(event, pdu.data.PointerEvent) and event.pointerFlags.value == pdu.data.PointerFlag.PTRFLAGS_MOVE
+        
+    def flushInputEvents(self):
+        """
+        @summary: Send all batched input events in one input PDU
+        """
+        if not self._inputFlushCall is None and self._inputFlushCall.active():
+            self._inputFlushCall.cancel()
+        self._inputFlushCall = None
+        
+        inputEvents, self._inputEvents = self._inputEvents, []
+        if len(inputEvents) > 0 and self._isReady:
+            self._pduLayer.sendInputEvents(inputEvents)
+            
     def sendRefreshOrder(self, left, top, right, bottom):
         """
         @summary: Force server to resend a particular zone
@@ -363,25 +489,32 @@ class RDPClientController(pdu.layer.PDUClientListener):
         """
         @summary: Close protocol stack
         """
+        self.flushInputEvents()
         self._pduLayer.close()
 
 class RDPServerController(pdu.layer.PDUServerListener):
     """
     @summary: Controller use in server side mode
-    """               
-    def __init__(self, colorDepth, privateKeyFileName = None, certificateFileName = None):
+    """
+    #max size of bitmap data sent in one update PDU (fast path PDU length is 15 bits)
+    MAX_UPDATE_SIZE = 16384
+    
+    def __init__(self, colorDepth, privateKeyFileName = None, certificateFileName = None, keyPool = None):
         """
         @param privateKeyFileName: file contain server private key
         @param certficiateFileName: file that contain public key
-        @param colorDepth: 15, 16, 24
+        @param colorDepth: 15, 16, 24, 32 (None to use color depth asked by client)
+        @param keyPool: {sec.ServerKeyPool} RSA keys use in standard RDP security
         """
         self._isReady = False
+        #color depth is read from client core data on connect
+        self._followClientColorDepth = colorDepth is None
         #list of observer
         self._serverObserver = []
         #build RDP protocol stack
         self._pduLayer = pdu.layer.Server(self)
         #secure layer
-        self._secLayer = sec.Server(self._pduLayer)
+        self._secLayer = sec.Server(self._pduLayer, keyPool)
         #multi channel service
         self._mcsLayer = mcs.Server(self._secLayer)
         #transport pdu layer
@@ -393,7 +526,7 @@ class RDPServerController(pdu.layer.PDUServerListener):
         self._pduLayer.initFastPath(self._secLayer)
         self._secLayer.initFastPath(self._tpktLayer)
         #set color depth of session
-        self.setColorDepth(colorDepth)
+        self.setColorDepth(colorDepth or 16)
         
     def close(self):
         """
@@ -408,6 +541,13 @@ class RDPServerController(pdu.layer.PDUServerListener):
         """
         return self._tpktLayer
     
+    def setTLSPolicy(self, policy):
+        """
+        @summary: TLS versions and ciphers accepted by server
+        @param policy: {x224.TLSPolicy | None} None for default policy
+        """
+        self._x224Layer._tlsPolicy = policy
+    
     def getHostname(self):
         """
         @return: name of client (information done by RDP)
@@ -448,6 +588,20 @@ class RDPServerController(pdu.layer.PDUServerListener):
         """
         return self._colorDepth
     
+    def getClientColorDepth(self):
+        """
+        @summary: Must be call after MCS connection
+        @return: {int} color depth asked by client in core data (15, 16, 24, 32)
+        """
+        clientCore = self._mcsLayer._clientSettings.CS_CORE
+        if clientCore.earlyCapabilityFlags.value & gcc.CapabilityFlags.RNS_UD_CS_WANT_32BPP_SESSION and clientCore.supportedColorDepths.value & gcc.Support.RNS_UD_32BPP_SUPPORT:
+            return 32
+        return {
+            gcc.HighColor.HIGH_COLOR_15BPP : 15,
+            gcc.HighColor.HIGH_COLOR_16BPP : 16,
+            gcc.HighColor.HIGH_COLOR_24BPP : 24
+        }.get(clientCore.highColorDepth.value, 16)
+    
     def getScreen(self):
         """
         @return: tuple(width, height) of client asked screen
@@ -476,12 +630,27 @@ class RDPServerController(pdu.layer.PDUServerListener):
             self._isReady = False
             self._pduLayer.sendPDU(pdu.data.DeactiveAllPDU())
             
+    def getScrBltOrderSupport(self):
+        """
+        @summary: Must be call after on ready event
+        @return: {bool} True if client accept screen to screen blit order
+        """
+        return bool(self._pduLayer._clientCapabilities[pdu.caps.CapsType.CAPSTYPE_ORDER].capability.orderSupport[pdu.order.ScrBltOrder._NEGOTIATE_].value)
+    
     def setKeyEventUnicodeSupport(self):
         """
         @summary: Enable key event in unicode format
         """
         self._pduLayer._serverCapabilities[pdu.caps.CapsType.CAPSTYPE_INPUT].capability.inputFlags.value |= pdu.caps.InputFlags.INPUT_FLAG_UNICODE
     
+    def onConnect(self):
+        """
+        @summary: Use color depth of client in first capabilities exchange
+                    to avoid a deactive-reactive sequence
+        """
+        if self._followClientColorDepth:
+            self.setColorDepth(self.getClientColorDepth())
+    
     def onReady(self):
         """
         @summary: RDP stack is now ready
@@ -545,13 +714,50 @@ class RDPServerController(pdu.layer.PDUServerListener):
         @param isCompress: use RLE compression
         @param data: bitmap data
         """
+        self.sendUpdates([(destLeft, destTop, destRight, destBottom, width, height, bitsPerPixel, isCompress, data)])
+        
+    def sendUpdates(self, updates):
+        """
+        @summary: send many bitmap updates in as few PDU as possible
+                    PDU are cut when bitmap data reach MAX_UPDATE_SIZE
+        @param updates: {list(tuple)} arguments of sendUpdate
+        """
         if not self._isReady:
             return
-        bitmapData = pdu.data.BitmapData(destLeft, destTop, destRight, destBottom, width, height, bitsPerPixel, data)
-        if isCompress:
-            bitmapData.flags.value = pdu.data.BitmapFlag.BITMAP_COMPRESSION
+        bitmapDatas = []
+        size = 0
+        for destLeft, destTop, destRight, destBottom, width, height, bitsPerPixel, isCompress, data in updates:
+            if len(bitmapDatas) > 0 and size + len(data) > RDPServerController.MAX_UPDATE_SIZE:
+                self._pduLayer.sendBitmapUpdatePDU(bitmapDatas)
+                bitmapDatas = []
+                size = 0
+            bitmapData = pdu.data.BitmapData(destLeft, destTop, destRight, destBottom, width, height, bitsPerPixel, data)
+            if isCompress:
+                bitmapData.flags.value = pdu.data.BitmapFlag.BITMAP_COMPRESSION
+            bitmapDatas.append(bitmapData)
+            size += len(data)
+            
+        if len(bitmapDatas) > 0:
+            self._pduLayer.sendBitmapUpdatePDU(bitmapDatas)
+        
+    def sendScreenBlt(self, destLeft, destTop, width, height, srcLeft, srcTop):
+        """
+        @summary: Copy a screen area to another place on client screen
+                    Use to express a scroll as a blit plus a bitmap update of newly exposed strip
+        @param destLeft: {int} xmin position of destination
+        @param destTop: {int} ymin position of destination
+        @param width: {int} width of copied area
+        @param height: {int} height of copied area
+        @param srcLeft: {int} xmin position of source
+        @param srcTop: {int} ymin position of source
+        @return: {bool} False if client doesn't support blit order, whole area must be sent with sendUpdate
+        """
+        if not self._isReady or not self.getScrBltOrderSupport():
+            return False
         
-        self._pduLayer.sendBitmapUpdatePDU([bitmapData])
+        scrBltOrder = pdu.order.ScrBltOrder(destLeft, destTop, width, height, srcLeft, srcTop)
+        self._pduLayer.sendOrderUpdatePDU([pdu.order.PrimaryDrawingOrder(scrBltOrder)])
+        return True
 
 class ClientFactory(layer.RawLayerClientFactory):
     """
@@ -589,15 +795,35 @@ class ServerFactory(layer.RawLayerServerFactory):
     """
     @summary: Factory of Server RDP protocol
     """
-    def __init__(self, colorDepth, privateKeyFileName = None, certificateFileName = None):
+    def __init__(self, colorDepth, privateKeyFileName = None, certificateFileName = None, keyPoolSize = 4, keyFileName = None):
         """
-        @param colorDepth: color depth of session
+        @param colorDepth: color depth of session (None to use color depth asked by client)
         @param privateKeyFileName: file contain server private key (if none -> back to standard RDP security)
         @param certficiateFileName: file that contain public key (if none -> back to standard RDP security)
+        @param keyPoolSize: {int} number of RSA keys of standard RDP security
+        @param keyFileName: {str} file where RSA keys are loaded from or saved to (None to generate them)
         """
         self._colorDepth = colorDepth
         self._privateKeyFileName = privateKeyFileName
         self._certificateFileName = certificateFileName
+        #RSA keys shared by all connections
+        self._keyPool = sec.ServerKeyPool(keyPoolSize, keyFileName)
+        #TLS versions and ciphers (None is default policy)
+        self._tlsPolicy = None
+        
+    def setTLSPolicy(self, policy):
+        """
+        @summary: TLS versions and ciphers accepted by all connections
+        @param policy: {x224.TLSPolicy | None} None for default policy
+        """
+        self._tlsPolicy = policy
+        
+    def loadKeys(self):
+        """
+        @summary: load or generate RSA keys before first connection
+                    else first standard RDP security connection wait for them
+        """
+        self._keyPool.load()
     
     def connectionLost(self, tpktLayer, reason):
         """
@@ -616,7 +842,8 @@ class ServerFactory(layer.RawLayerServerFactory):
         @summary: Function call from twisted and build rdp protocol stack
         @param addr: destination address
         """
-        controller = RDPServerController(self._colorDepth, self._privateKeyFileName, self._certificateFileName)
+        controller = RDPServerController(self._colorDepth, self._privateKeyFileName, self._certificateFileName, self._keyPool)
+        controller.setTLSPolicy(self._tlsPolicy)
         self.buildObserver(controller, addr)
         return controller.getProtocol()
     
@@ -672,6 +899,20 @@ class RDPClientObserver(object):
         """
         raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "onUpdate", "RDPClientObserver"))
     
+    def onScreenBlt(self, destLeft, destTop, width, height, srcLeft, srcTop):
+        """
+        @summary: Notify screen to screen copy (scroll, window move)
+                    Only call if RDPClientController.setScrBltOrderSupport was called
+                    Source and destination may overlap
+        @param destLeft: {int} xmin position of destination
+        @param destTop: {int} ymin position of destination
+        @param width: {int} width of copied area
+        @param height: {int} height of copied area
+        @param srcLeft: {int} xmin position of source
+        @param srcTop: {int} ymin position of source
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "onScreenBlt", "RDPClientObserver"))
+    
 class RDPServerObserver(object):
     """
     @summary: Class use to inform all RDP event handle by RDPY
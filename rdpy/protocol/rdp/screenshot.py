@@ -0,0 +1,223 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Headless RDP screenshot job for scan engine
+Capture login screen of a target without Qt
+"""
+
+import os
+from OpenSSL import SSL
+from twisted.internet import defer
+from rdpy.core import scanner
+from rdpy.core.error import RDPSecurityNegoFail
+from rdpy.ui.framebuffer import FrameBuffer
+import rdpy.core.log as log
+import rdp, x224
+
+class RDPScreenshotObserver(rdp.RDPClientObserver):
+    """
+    @summary: Draw updates in frame buffer and close connection when screen is idle
+    """
+    def __init__(self, controller, job):
+        """
+        @param controller: {RDPClientController}
+        @param job: {RDPScreenshotJob}
+        """
+        rdp.RDPClientObserver.__init__(self, controller)
+        self._job = job
+        self._idleCall = None
+        
+    def onUpdate(self, destLeft, destTop, destRight, destBottom, width, height, bitsPerPixel, isCompress, data):
+        """
+        @see: rdp.RDPClientObserver.onUpdate
+        """
+        try:
+            self._job._frameBuffer.drawRDPBitmap(destLeft, destTop, destRight, destBottom, width, height, bitsPerPixel, isCompress, data)
+        except Exception as e:
+            log.debug("invalid bitmap : %s"%e)
+        self._job._updates += 1
+        
+        #screenshot when no update since idle timeout
+        if self._idleCall is None:
+            self._idleCall = self._job._reactor.callLater(self._job._factory._idleTimeout, self._controller.close)
+        elif self._idleCall.active():
+            self._idleCall.reset(self._job._factory._idleTimeout)
+            
+    def onScreenBlt(self, destLeft, destTop, width, height, srcLeft, srcTop):
+        """
+        @see: rdp.RDPClientObserver.onScreenBlt
+        """
+        self._job._frameBuffer.screenBlt(destLeft, destTop, width, height, srcLeft, srcTop)
+        
+    def onReady(self):
+        """
+        @see: rdp.RDPClientObserver.onReady
+        """
+        log.debug("connected %s:%d"%(self._job._host, self._job._port))
+        
+    def onSessionReady(self):
+        """
+        @see: rdp.RDPClientObserver.onSessionReady
+        """
+        pass
+    
+    def onClose(self):
+        """
+        @see: rdp.RDPClientObserver.onClose
+        """
+        if not self._idleCall is None and self._idleCall.active():
+            self._idleCall.cancel()
+        
+class RDPScreenshotClientFactory(rdp.ClientFactory):
+    """
+    @summary: Twisted factory of one screenshot job
+    """
+    def __init__(self, job):
+        """
+        @param job: {RDPScreenshotJob}
+        """
+        self._job = job
+        #NLA server can't be screenshooting
+        self._security = rdp.SecurityLevel.RDP_LEVEL_SSL
+        self._tlsPolicy = job._factory._tlsPolicy
+        
+    def buildObserver(self, controller, addr):
+        """
+        @see: rdp.ClientFactory.buildObserver
+        """
+        controller.setScreen(self._job._frameBuffer.getWidth(), self._job._frameBuffer.getHeight())
+        controller.setSecurityLevel(self._security)
+        controller.setTLSPolicy(self._tlsPolicy)
+        controller.setScrBltOrderSupport()
+        controller.setBulkCompression()
+        return RDPScreenshotObserver(controller, self._job)
+    
+    def clientConnectionLost(self, connector, reason):
+        """
+        @summary: end of screenshot or fallback on standard RDP security
+                    or on legacy TLS policy
+        """
+        if reason.type == RDPSecurityNegoFail and self._security != rdp.SecurityLevel.RDP_LEVEL_RDP and not self._job._cancelled:
+            log.debug("%s:%d due to RDPSecurityNegoFail try standard security layer"%(self._job._host, self._job._port))
+            self._security = rdp.SecurityLevel.RDP_LEVEL_RDP
+            connector.connect()
+            return
+        if reason.check(SSL.Error) and self._tlsPolicy != x224.LEGACY_TLS_POLICY and self._job._updates == 0 and not self._job._cancelled:
+            log.debug("%s:%d due to TLS handshake failure try legacy TLS policy"%(self._job._host, self._job._port))
+            self._tlsPolicy = x224.LEGACY_TLS_POLICY
+            connector.connect()
+            return
+        self._job.onEnd(reason)
+        
+    def clientConnectionFailed(self, connector, reason):
+        """
+        @summary: cannot connect to target
+        """
+        self._job.onEnd(reason)
+
+class RDPScreenshotJob(scanner.ScanJob):
+    """
+    @summary: Screenshot of one target
+    """
+    def __init__(self, factory, host, port):
+        """
+        @param factory: {RDPScreenshotJobFactory}
+        @param host: {str} address of target
+        @param port: {int} port of target
+        """
+        self._factory = factory
+        self._reactor = factory._reactor
+        self._host = host
+        self._port = port
+        self._frameBuffer = FrameBuffer(factory._width, factory._height)
+        self._updates = 0
+        self._connector = None
+        self._cancelled = False
+        self._deferred = None
+        
+    def start(self):
+        """
+        @see: scanner.ScanJob.start
+        """
+        self._deferred = defer.Deferred()
+        self._connector = self._reactor.connectTCP(self._host, self._port, RDPScreenshotClientFactory(self), timeout = self._factory._connectTimeout)
+        return self._deferred
+    
+    def cancel(self):
+        """
+        @see: scanner.ScanJob.cancel
+        """
+        self._cancelled = True
+        self._deferred = None
+        if not self._connector is None:
+            self._connector.disconnect()
+            
+    def onEnd(self, reason):
+        """
+        @summary: connection is closed, save screen if received
+        @param reason: {Failure} twisted reason
+        """
+        if self._deferred is None:
+            return
+        d, self._deferred = self._deferred, None
+        
+        if self._updates == 0:
+            d.errback(reason)
+            return
+        
+        path = os.path.join(self._factory._path, "%s_%d.png"%(self._host, self._port))
+        try:
+            self._frameBuffer.save(path)
+        except Exception as e:
+            d.errback(e)
+            return
+        
+        d.callback({ "image" : path, "width" : self._frameBuffer.getWidth(), "height" : self._frameBuffer.getHeight(), "updates" : self._updates })
+        self._frameBuffer = None
+
+class RDPScreenshotJobFactory(scanner.ScanJobFactory):
+    """
+    @summary: Build screenshot jobs for scanner
+    """
+    def __init__(self, path, width = 1024, height = 800, idleTimeout = 2.0, connectTimeout = 10, reactor = None, tlsPolicy = None):
+        """
+        @param path: {str} output directory of screenshots
+        @param width: {int} width of screen
+        @param height: {int} height of screen
+        @param idleTimeout: {float} take screenshot after idleTimeout s without update
+        @param connectTimeout: {int} TCP connection timeout in seconds
+        @param reactor: twisted reactor (default reactor if None)
+        @param tlsPolicy: {x224.TLSPolicy | None} TLS versions and ciphers (None for default policy)
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+        self._path = path
+        self._width = width
+        self._height = height
+        self._idleTimeout = idleTimeout
+        self._connectTimeout = connectTimeout
+        self._tlsPolicy = tlsPolicy
+        
+    def buildJob(self, host, port):
+        """
+        @see: scanner.ScanJobFactory.buildJob
+        """
+        return RDPScreenshotJob(self, host, port)
@@ -164,6 +164,8 @@ class Client(X224Layer):
         @param presentation: upper layer, MCS layer in RDP case
         """
         X224Layer.__init__(self, presentation)
+        #TLS versions and ciphers (None is default policy)
+        self._tlsPolicy = None
         
     def connect(self):
         """
@@ -222,7 +224,7 @@ class Client(X224Layer):
             log.info("*" * 43)
             log.info("*" + " " * 10  + "SSL Security selected" + " " * 10 + "*")
             log.info("*" * 43)
-            self._transport.startTLS(ClientTLSContext())
+            self._transport.startTLS(getClientTLSContext(self._tlsPolicy))
             #connection is done send to presentation
             self._presentation.connect()
     
@@ -230,7 +232,7 @@ class Client(X224Layer):
             log.info("*" * 43)
             log.info("*" + " " * 10  + "NLA Security selected" + " " * 10 + "*")
             log.info("*" * 43)
-            self._transport.startNLA(ClientTLSContext(), lambda:self._presentation.connect())
+            self._transport.startNLA(getClientTLSContext(self._tlsPolicy), lambda:self._presentation.connect())
 
 class Server(X224Layer):
     """
@@ -248,6 +250,8 @@ class Server(X224Layer):
         self._serverPrivateKeyFileName = privateKeyFileName
         self._serverCertificateFileName = certificateFileName
         self._forceSSL = forceSSL and not self._serverPrivateKeyFileName is None and not self._serverCertificateFileName is None
+        #TLS versions and ciphers (None is default policy)
+        self._tlsPolicy = None
         
     def connect(self):
         """
@@ -303,38 +307,177 @@ class Server(X224Layer):
         if self._selectedProtocol == Protocols.PROTOCOL_SSL:
             log.debug("*" * 10 + " select SSL layer " + "*" * 10)
             #_transport is TPKT and transport is TCP layer of twisted
-            self._transport.startTLS(ServerTLSContext(self._serverPrivateKeyFileName, self._serverCertificateFileName))
+            self._transport.startTLS(getServerTLSContext(self._serverPrivateKeyFileName, self._serverCertificateFileName, self._tlsPolicy))
             
         #connection is done send to presentation
         self.setNextState(self.recvData)
         self._presentation.connect()
 
 #open ssl needed
+import collections
 from twisted.internet import ssl
+from twisted.internet.interfaces import IOpenSSLClientConnectionCreator
+from zope.interface import implementer
 from OpenSSL import SSL
 
+class TLSVersion(object):
+    """
+    @summary: TLS protocol versions
+    """
+    TLSv1_0 = 0
+    TLSv1_1 = 1
+    TLSv1_2 = 2
+    TLSv1_3 = 3
+    
+class TLSPolicy(object):
+    """
+    @summary: TLS versions and cipher suites accepted by a context
+    """
+    #AEAD suites only
+    MODERN_CIPHERS = "ECDHE+AESGCM:ECDHE+CHACHA20:DHE+AESGCM:DHE+CHACHA20:RSA+AESGCM"
+    
+    def __init__(self, minimumVersion = TLSVersion.TLSv1_2, maximumVersion = None, cipherList = MODERN_CIPHERS, legacyWorkarounds = False):
+        """
+        @param minimumVersion: {TLSVersion} lowest accepted version
+        @param maximumVersion: {TLSVersion | None} highest accepted version (None for no limit)
+        @param cipherList: {str} OpenSSL cipher list for TLS 1.2 and lower
+        @param legacyWorkarounds: {boolean} enable CBC workarounds for old peers
+        """
+        self._minimumVersion = minimumVersion
+        self._maximumVersion = maximumVersion
+        self._cipherList = cipherList
+        self._legacyWorkarounds = legacyWorkarounds
+        
+    def apply(self, context):
+        """
+        @summary: configure OpenSSL context
+        @param context: {SSL.Context} context build with SSLv23 method
+        """
+        context.set_options(SSL.OP_NO_SSLv2 | SSL.OP_NO_SSLv3 | SSL.OP_CIPHER_SERVER_PREFERENCE)
+        for version, option in enumerate([SSL.OP_NO_TLSv1, SSL.OP_NO_TLSv1_1, SSL.OP_NO_TLSv1_2, getattr(SSL, "OP_NO_TLSv1_3", 0)]):
+            if version < self._minimumVersion or (not self._maximumVersion is None and version > self._maximumVersion):
+                context.set_options(option)
+        context.set_cipher_list(self._cipherList)
+        if self._legacyWorkarounds:
+            context.set_options(SSL.OP_DONT_INSERT_EMPTY_FRAGMENTS)
+            context.set_options(SSL.OP_TLS_BLOCK_PADDING_BUG)
+
+#TLS 1.0 to 1.2 with OpenSSL default suites, old windows and mstsc still connect
+#(TLS 1.3 sessions cannot be resumed at handshake done)
+DEFAULT_TLS_POLICY = TLSPolicy(TLSVersion.TLSv1_0, TLSVersion.TLSv1_2, "DEFAULT:!aNULL:!eNULL")
+#TLS 1.2 and AEAD suites only
+MODERN_TLS_POLICY = TLSPolicy(TLSVersion.TLSv1_2, TLSVersion.TLSv1_2)
+#old windows hosts (TLS 1.0 CBC suites)
+LEGACY_TLS_POLICY = TLSPolicy(TLSVersion.TLSv1_0, None, "DEFAULT", True)
+#policies by name (command line tools)
+TLS_POLICIES = {
+    "default" : DEFAULT_TLS_POLICY,
+    "modern" : MODERN_TLS_POLICY,
+    "legacy" : LEGACY_TLS_POLICY
+}
+
+@implementer(IOpenSSLClientConnectionCreator)
 class ClientTLSContext(ssl.ClientContextFactory):
     """
     @summary: client context factory for open ssl
+                One context is shared by all connections
+                TLS sessions are kept by peer address to be resumed on reconnect
+                (bounded LRU, scanners connect to many peers)
     """
+    def __init__(self, policy = DEFAULT_TLS_POLICY, maxSessions = 1024):
+        """
+        @param policy: {TLSPolicy} TLS versions and ciphers
+        @param maxSessions: {int} max number of kept sessions
+        """
+        self._policy = policy
+        self._context = None
+        self._maxSessions = maxSessions
+        #last TLS session by peer address, most recently used is last
+        self._sessions = collections.OrderedDict()
+        
     def getContext(self):
-        context = SSL.Context(SSL.TLSv1_METHOD)
-        context.set_options(SSL.OP_DONT_INSERT_EMPTY_FRAGMENTS)
-        context.set_options(SSL.OP_TLS_BLOCK_PADDING_BUG)
-        return context
+        if self._context is None:
+            self._context = SSL.Context(SSL.SSLv23_METHOD)
+            self._policy.apply(self._context)
+            self._context.set_info_callback(self.infoCallback)
+        return self._context
+    
+    def clientConnectionForTLS(self, tlsProtocol):
+        """
+        @summary: create connection and resume last session with same peer
+        @param tlsProtocol: {twisted.protocols.tls.TLSMemoryBIOProtocol}
+        @return: {SSL.Connection}
+        @note: implement IOpenSSLClientConnectionCreator
+        """
+        connection = SSL.Connection(self.getContext(), None)
+        #TLS layer is not yet connected, ask TCP transport of wrapped protocol
+        peer = tlsProtocol.wrappedProtocol.transport.getPeer()
+        peer = (getattr(peer, "host", None), getattr(peer, "port", None))
+        connection.set_app_data(peer)
+        session = self._sessions.pop(peer, None)
+        if not session is None:
+            self._sessions[peer] = session
+            connection.set_session(session)
+        return connection
+    
+    def infoCallback(self, connection, where, ret):
+        """
+        @summary: keep session when handshake is done,
+                    forget it on fatal alert (resumption refused by peer)
+        """
+        peer = connection.get_app_data()
+        if where & SSL.SSL_CB_HANDSHAKE_DONE:
+            self._sessions.pop(peer, None)
+            self._sessions[peer] = connection.get_session()
+            if len(self._sessions) > self._maxSessions:
+                self._sessions.popitem(last = False)
+        elif where & SSL.SSL_CB_ALERT and ret >> 8 == 2:
+            self._sessions.pop(peer, None)
     
 class ServerTLSContext(ssl.DefaultOpenSSLContextFactory):
     """
     @summary: Server context factory for open ssl
+                Server keep session cache to allow client to resume session
     @param privateKeyFileName: Name of a file containing a private key
     @param certificateFileName: Name of a file containing a certificate
+    @param policy: {TLSPolicy} TLS versions and ciphers
     """
-    def __init__(self, privateKeyFileName, certificateFileName):
+    def __init__(self, privateKeyFileName, certificateFileName, policy = DEFAULT_TLS_POLICY):
         class TPDUSSLContext(SSL.Context):
             def __init__(self, method):
                 SSL.Context.__init__(self, method)
-                self.set_options(SSL.OP_DONT_INSERT_EMPTY_FRAGMENTS)
-                self.set_options(SSL.OP_TLS_BLOCK_PADDING_BUG)
+                policy.apply(self)
+                #session id and ticket resumption
+                self.set_session_id("rdpy")
+                self.set_session_cache_mode(SSL.SESS_CACHE_SERVER)
 
         ssl.DefaultOpenSSLContextFactory.__init__(self, privateKeyFileName, certificateFileName, SSL.SSLv23_METHOD, TPDUSSLContext)
-        
\ No newline at end of file
+
+#process wide TLS contexts
+_clientTLSContexts = {}
+_serverTLSContexts = {}
+
+def getClientTLSContext(policy = None):
+    """
+    @summary: context is build once for a policy
+    @param policy: {TLSPolicy | None} TLS versions and ciphers (None for DEFAULT_TLS_POLICY)
+    @return: {ClientTLSContext} context factory shared by all client connections
+    """
+    policy = policy or DEFAULT_TLS_POLICY
+    if not policy in _clientTLSContexts:
+        _clientTLSContexts[policy] = ClientTLSContext(policy)
+    return _clientTLSContexts[policy]
+
+def getServerTLSContext(privateKeyFileName, certificateFileName, policy = None):
+    """
+    @summary: context is build once for a key and certificate files pair and a policy
+    @param privateKeyFileName: Name of a file containing a private key
+    @param certificateFileName: Name of a file containing a certificate
+    @param policy: {TLSPolicy | None} TLS versions and ciphers (None for DEFAULT_TLS_POLICY)
+    @return: {ServerTLSContext} context factory shared by all server connections
+    """
+    policy = policy or DEFAULT_TLS_POLICY
+    key = (privateKeyFileName, certificateFileName, policy)
+    if not key in _serverTLSContexts:
+        _serverTLSContexts[key] = ServerTLSContext(privateKeyFileName, certificateFileName, policy)
+    return _serverTLSContexts[key]
\ No newline at end of file
@@ -0,0 +1,642 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Decoders of RFB rectangle encodings
+Each decoder is a small state machine driven by RFB layer :
+it asks for the next chunk length and is fed with exactly that many bytes,
+until the whole rectangle is decoded in a raw pixel buffer
+@see: http://www.realvnc.com/docs/rfbproto.pdf
+"""
+
+import struct, zlib
+from StringIO import StringIO
+from rdpy.core.error import CallPureVirtualFuntion, InvalidExpectedDataException
+import rfbcodec
+
+#JPEG subencoding of Tight need PIL
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+    
+def hasJpegSupport():
+    """
+    @return: {bool} True if Tight JPEG subencoding can be decoded
+    """
+    return not Image is None
+
+def getFormatArgs(pixelFormat, tpixel = False):
+    """
+    @summary: Pixel format parameters of rfbcodec functions
+    @param pixelFormat: {rfb.PixelFormat}
+    @param tpixel: {bool} data are 3 bytes RGB pixels
+    @return: {tuple}
+    """
+    return (3 if tpixel else pixelFormat.BitsPerPixel.value / 8, int(bool(pixelFormat.BigEndianFlag.value)),
+            pixelFormat.RedMax.value, pixelFormat.GreenMax.value, pixelFormat.BlueMax.value,
+            pixelFormat.RedShift.value, pixelFormat.GreenShift.value, pixelFormat.BlueShift.value)
+    
+def isTPixel(pixelFormat):
+    """
+    @summary: Tight use 3 bytes RGB pixels for 24 bits depth true color
+    @param pixelFormat: {rfb.PixelFormat}
+    @return: {bool}
+    """
+    return pixelFormat.BitsPerPixel.value == 32 and pixelFormat.Depth.value == 24 and pixelFormat.TrueColorFlag.value and pixelFormat.RedMax.value == 255 and pixelFormat.GreenMax.value == 255 and pixelFormat.BlueMax.value == 255
+
+def getCPixelLayout(pixelFormat):
+    """
+    @summary: ZRLE compressed pixel drops unused byte of 32 bits pixels
+    @param pixelFormat: {rfb.PixelFormat}
+    @return: {tuple(int, int)} size of compressed pixel and its offset in pixel
+    """
+    bytesPerPixel = pixelFormat.BitsPerPixel.value / 8
+    if bytesPerPixel != 4 or not pixelFormat.TrueColorFlag.value or pixelFormat.Depth.value > 24:
+        return bytesPerPixel, 0
+    
+    bigEndian = bool(pixelFormat.BigEndianFlag.value)
+    components = [(pixelFormat.RedMax.value, pixelFormat.RedShift.value), (pixelFormat.GreenMax.value, pixelFormat.GreenShift.value), (pixelFormat.BlueMax.value, pixelFormat.BlueShift.value)]
+    #fit in least significant bytes
+    if max([m << shift for m, shift in components]) < (1 << 24):
+        return 3, 1 if bigEndian else 0
+    #fit in most significant bytes
+    if min([shift for _, shift in components]) >= 8:
+        return 3, 0 if bigEndian else 1
+    return bytesPerPixel, 0
+
+class PixelBuffer(object):
+    """
+    @summary: Raw pixel buffer of one rectangle (same layout as RAW encoding)
+    """
+    def __init__(self, width, height, bytesPerPixel):
+        """
+        @param width: {int} width of rectangle
+        @param height: {int} height of rectangle
+        @param bytesPerPixel: {int} size of one pixel in bytes
+        """
+        self._width = width
+        self._height = height
+        self._bytesPerPixel = bytesPerPixel
+        self._data = bytearray(width * height * bytesPerPixel)
+        
+    def fill(self, x, y, width, height, pixel):
+        """
+        @summary: Fill an area with one pixel value
+        @param x: {int} left of area
+        @param y: {int} top of area
+        @param width: {int} width of area
+        @param height: {int} height of area
+        @param pixel: {str} encoded pixel
+        @raise InvalidExpectedDataException: if area is outside of rectangle
+        """
+        if x < 0 or y < 0 or x + width > self._width or y + height > self._height:
+            raise InvalidExpectedDataException("Sub rectangle outside of rectangle")
+        line = pixel * width
+        stride = self._width * self._bytesPerPixel
+        offset = (y * self._width + x) * self._bytesPerPixel
+        for _ in range(height):
+            self._data[offset:offset + len(line)] = line
+            offset += stride
+            
+    def blit(self, x, y, width, height, data):
+        """
+        @summary: Copy raw pixels in an area
+        @param x: {int} left of area
+        @param y: {int} top of area
+        @param width: {int} width of area
+        @param height: {int} height of area
+        @param data: {str} raw pixels of area
+        """
+        lineSize = width * self._bytesPerPixel
+        stride = self._width * self._bytesPerPixel
+        offset = (y * self._width + x) * self._bytesPerPixel
+        for i in range(height):
+            self._data[offset:offset + lineSize] = data[i * lineSize:(i + 1) * lineSize]
+            offset += stride
+            
+    def getvalue(self):
+        """
+        @return: {str} raw pixels
+        """
+        return str(self._data)
+
+class RectangleDecoder(object):
+    """
+    @summary: Interface of rectangle decoder
+    """
+    def nextLength(self):
+        """
+        @return: {int} number of bytes needed by next state or None when rectangle is decoded
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "nextLength", "RectangleDecoder"))
+    
+    def feed(self, data):
+        """
+        @summary: Decode a chunk of nextLength bytes
+        @param data: {str} encoded data
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "feed", "RectangleDecoder"))
+    
+    def getPixels(self):
+        """
+        @return: {str} decoded raw pixels
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "getPixels", "RectangleDecoder"))
+
+class RREDecoder(RectangleDecoder):
+    """
+    @summary: Rise and run length encoding
+                background pixel followed by solid sub rectangles
+    """
+    def __init__(self, width, height, bytesPerPixel):
+        """
+        @param width: {int} width of rectangle
+        @param height: {int} height of rectangle
+        @param bytesPerPixel: {int} size of one pixel in bytes
+        """
+        self._buffer = PixelBuffer(width, height, bytesPerPixel)
+        self._bytesPerPixel = bytesPerPixel
+        self._nbSubrects = None
+        self._done = False
+        
+    def nextLength(self):
+        """
+        @see: RectangleDecoder.nextLength
+        """
+        if self._done:
+            return None
+        if self._nbSubrects is None:
+            return 4 + self._bytesPerPixel
+        return self._nbSubrects * (self._bytesPerPixel + 8)
+    
+    def feed(self, data):
+        """
+        @see: RectangleDecoder.feed
+        """
+        if self._nbSubrects is None:
+            self._nbSubrects = struct.unpack(">I", data[:4])[0]
+            self._buffer.fill(0, 0, self._buffer._width, self._buffer._height, data[4:])
+            self._done = self._nbSubrects == 0
+            return
+        
+        size = self._bytesPerPixel + 8
+        for offset in range(0, len(data), size):
+            pixel = data[offset:offset + self._bytesPerPixel]
+            x, y, width, height = struct.unpack(">HHHH", data[offset + self._bytesPerPixel:offset + size])
+            self._buffer.fill(x, y, width, height, pixel)
+        self._done = True
+        
+    def getPixels(self):
+        """
+        @see: RectangleDecoder.getPixels
+        """
+        return self._buffer.getvalue()
+    
+class HextileSubencoding(object):
+    """
+    @summary: Flags of hextile tile header
+    """
+    RAW = 0x01
+    BACKGROUND_SPECIFIED = 0x02
+    FOREGROUND_SPECIFIED = 0x04
+    ANY_SUBRECTS = 0x08
+    SUBRECTS_COLOURED = 0x10
+    
+class HextileDecoder(RectangleDecoder):
+    """
+    @summary: Hextile encoding
+                rectangle is split in 16x16 tiles, left to right then top to bottom
+                background and foreground are kept from one tile to the next
+    """
+    TILE_SIZE = 16
+    
+    def __init__(self, width, height, bytesPerPixel):
+        """
+        @param width: {int} width of rectangle
+        @param height: {int} height of rectangle
+        @param bytesPerPixel: {int} size of one pixel in bytes
+        """
+        self._buffer = PixelBuffer(width, height, bytesPerPixel)
+        self._width = width
+        self._height = height
+        self._bytesPerPixel = bytesPerPixel
+        self._background = "\x00" * bytesPerPixel
+        self._foreground = "\x00" * bytesPerPixel
+        #current tile
+        self._tileX = 0
+        self._tileY = 0
+        self._subencoding = None
+        self._nbSubrects = None
+        self._done = width == 0 or height == 0
+        
+    def getTileSize(self):
+        """
+        @return: {tuple(int, int)} width and height of current tile
+        """
+        return min(self.TILE_SIZE, self._width - self._tileX), min(self.TILE_SIZE, self._height - self._tileY)
+        
+    def nextTile(self):
+        """
+        @summary: Move to next tile
+        """
+        self._subencoding = None
+        self._nbSubrects = None
+        self._tileX += self.TILE_SIZE
+        if self._tileX >= self._width:
+            self._tileX = 0
+            self._tileY += self.TILE_SIZE
+            self._done = self._tileY >= self._height
+            
+    def getTileHeaderLength(self):
+        """
+        @return: {int} length of data following subencoding byte
+        """
+        if self._subencoding & HextileSubencoding.RAW:
+            width, height = self.getTileSize()
+            return width * height * self._bytesPerPixel
+        length = 0
+        if self._subencoding & HextileSubencoding.BACKGROUND_SPECIFIED:
+            length += self._bytesPerPixel
+        if self._subencoding & HextileSubencoding.FOREGROUND_SPECIFIED:
+            length += self._bytesPerPixel
+        if self._subencoding & HextileSubencoding.ANY_SUBRECTS:
+            length += 1
+        return length
+        
+    def nextLength(self):
+        """
+        @see: RectangleDecoder.nextLength
+        """
+        if self._done:
+            return None
+        if self._subencoding is None:
+            return 1
+        if self._nbSubrects is None:
+            return self.getTileHeaderLength()
+        return self._nbSubrects * (2 + (self._bytesPerPixel if self._subencoding & HextileSubencoding.SUBRECTS_COLOURED else 0))
+    
+    def feed(self, data):
+        """
+        @see: RectangleDecoder.feed
+        """
+        if self._subencoding is None:
+            self._subencoding = ord(data[0])
+            #tile without any data, only background
+            if self.getTileHeaderLength() == 0:
+                self.readTileHeader("")
+        elif self._nbSubrects is None:
+            self.readTileHeader(data)
+        else:
+            self.readSubrects(data)
+            
+    def readTileHeader(self, data):
+        """
+        @summary: Read raw tile or colors and number of sub rectangles
+        @param data: {str} data following subencoding byte
+        """
+        width, height = self.getTileSize()
+        if self._subencoding & HextileSubencoding.RAW:
+            self._buffer.blit(self._tileX, self._tileY, width, height, data)
+            self.nextTile()
+            return
+        
+        offset = 0
+        if self._subencoding & HextileSubencoding.BACKGROUND_SPECIFIED:
+            self._background = data[offset:offset + self._bytesPerPixel]
+            offset += self._bytesPerPixel
+        if self._subencoding & HextileSubencoding.FOREGROUND_SPECIFIED:
+            self._foreground = data[offset:offset + self._bytesPerPixel]
+            offset += self._bytesPerPixel
+            
+        self._buffer.fill(self._tileX, self._tileY, width, height, self._background)
+        
+        if self._subencoding & HextileSubencoding.ANY_SUBRECTS:
+            self._nbSubrects = ord(data[offset])
+            
+        if not self._nbSubrects:
+            self.nextTile()
+        
+    def readSubrects(self, data):
+        """
+        @summary: Draw sub rectangles of current tile
+        @param data: {str} all sub rectangles of tile
+        """
+        coloured = self._subencoding & HextileSubencoding.SUBRECTS_COLOURED
+        offset = 0
+        for _ in range(self._nbSubrects):
+            pixel = self._foreground
+            if coloured:
+                pixel = data[offset:offset + self._bytesPerPixel]
+                offset += self._bytesPerPixel
+            xy, wh = ord(data[offset]), ord(data[offset + 1])
+            offset += 2
+            self._buffer.fill(self._tileX + (xy >> 4), self._tileY + (xy & 0xf), (wh >> 4) + 1, (wh & 0xf) + 1, pixel)
+        self.nextTile()
+        
+    def getPixels(self):
+        """
+        @see: RectangleDecoder.getPixels
+        """
+        return self._buffer.getvalue()
+
+class ZRLEDecoder(RectangleDecoder):
+    """
+    @summary: Zlib run length encoding
+                zlib stream is shared by all rectangles of connection
+                tiles are decoded by rfbcodec extension
+    """
+    def __init__(self, width, height, pixelFormat, stream):
+        """
+        @param width: {int} width of rectangle
+        @param height: {int} height of rectangle
+        @param pixelFormat: {rfb.PixelFormat} client pixel format
+        @param stream: {zlib.Decompress} zlib stream of connection
+        """
+        self._width = width
+        self._height = height
+        self._pixelFormat = pixelFormat
+        self._stream = stream
+        self._length = None
+        self._pixels = None
+        
+    def nextLength(self):
+        """
+        @see: RectangleDecoder.nextLength
+        """
+        if not self._pixels is None:
+            return None
+        if self._length is None:
+            return 4
+        return self._length
+    
+    def feed(self, data):
+        """
+        @see: RectangleDecoder.feed
+        """
+        if self._length is None:
+            self._length = struct.unpack(">I", data)[0]
+            if self._length != 0:
+                return
+        
+        cpixelSize, cpixelOffset = getCPixelLayout(self._pixelFormat)
+        try:
+            self._pixels = rfbcodec.zrle_decode(self._stream.decompress(data), self._width, self._height, cpixelSize, self._pixelFormat.BitsPerPixel.value / 8, cpixelOffset)
+        except (ValueError, zlib.error) as e:
+            raise InvalidExpectedDataException("Invalid ZRLE rectangle : %s"%e)
+        
+    def getPixels(self):
+        """
+        @see: RectangleDecoder.getPixels
+        """
+        return self._pixels
+    
+class TightCompression(object):
+    """
+    @summary: Compression type of Tight rectangle (high 4 bits of compression control)
+    """
+    FILL = 0x08
+    JPEG = 0x09
+    EXPLICIT_FILTER = 0x04
+    
+class TightFilter(object):
+    """
+    @summary: Filter of Tight basic compression
+    """
+    COPY = 0
+    PALETTE = 1
+    GRADIENT = 2
+    
+class TightDecoder(RectangleDecoder):
+    """
+    @summary: Tight encoding
+                fill, jpeg and basic compression with copy, palette or gradient filter
+                four zlib streams are shared by all rectangles of connection
+    """
+    #data smaller than this are not compressed
+    MIN_TO_COMPRESS = 12
+    
+    def __init__(self, width, height, pixelFormat, streams):
+        """
+        @param width: {int} width of rectangle
+        @param height: {int} height of rectangle
+        @param pixelFormat: {rfb.PixelFormat} client pixel format
+        @param streams: {list(zlib.Decompress)} four zlib streams of connection, reset in place
+        """
+        self._width = width
+        self._height = height
+        self._pixelFormat = pixelFormat
+        self._streams = streams
+        self._tpixel = isTPixel(pixelFormat)
+        self._tpixelSize = 3 if self._tpixel else pixelFormat.BitsPerPixel.value / 8
+        self._streamId = 0
+        self._filter = TightFilter.COPY
+        self._palette = None
+        self._dataSize = 0
+        self._compactLength = 0
+        self._compactBytes = 0
+        self._compactCallback = None
+        self._pixels = None
+        #(length, callback) of next state
+        self._expected = (1, self.readCompressionControl)
+        
+    def nextLength(self):
+        """
+        @see: RectangleDecoder.nextLength
+        """
+        if self._expected is None:
+            return None
+        return self._expected[0]
+    
+    def feed(self, data):
+        """
+        @see: RectangleDecoder.feed
+        """
+        self._expected[1](data)
+        
+    def getPixels(self):
+        """
+        @see: RectangleDecoder.getPixels
+        """
+        return self._pixels
+    
+    def done(self, pixels):
+        """
+        @summary: Rectangle is decoded
+        @param pixels: {str} raw pixels
+        """
+        self._pixels = pixels
+        self._expected = None
+        
+    def convert(self, data):
+        """
+        @summary: Convert Tight pixels into client pixels
+        @param data: {str} Tight pixels
+        @return: {str} client pixels
+        """
+        if not self._tpixel:
+            return data
+        return rfbcodec.rgb_to_pixels(data, getFormatArgs(self._pixelFormat))
+    
+    def readCompressionControl(self, data):
+        """
+        @summary: Reset zlib streams and read compression type
+        @param data: {str} compression control byte
+        """
+        control = ord(data)
+        for i in range(4):
+            if control & (1 << i):
+                self._streams[i] = zlib.decompressobj()
+                
+        compression = control >> 4
+        if compression == TightCompression.FILL:
+            self._expected = (self._tpixelSize, self.readFill)
+        elif compression == TightCompression.JPEG:
+            if not hasJpegSupport():
+                raise InvalidExpectedDataException("Tight JPEG subencoding needs PIL")
+            self.expectCompactLength(self.readJpeg)
+        elif compression < TightCompression.FILL:
+            self._streamId = compression & 0x03
+            if compression & TightCompression.EXPLICIT_FILTER:
+                self._expected = (1, self.readFilter)
+            else:
+                self.expectData(TightFilter.COPY)
+        else:
+            raise InvalidExpectedDataException("Invalid Tight compression type %d"%compression)
+        
+    def readFill(self, data):
+        """
+        @summary: Whole rectangle in one color
+        @param data: {str} Tight pixel
+        """
+        self.done(self.convert(data) * (self._width * self._height))
+        
+    def readJpeg(self, data):
+        """
+        @summary: Decode JPEG image of rectangle
+        @param data: {str} JPEG data
+        """
+        try:
+            image = Image.open(StringIO(data)).convert("RGB")
+        except Exception as e:
+            raise InvalidExpectedDataException("Invalid Tight JPEG data : %s"%e)
+        if image.size != (self._width, self._height):
+            raise InvalidExpectedDataException("Invalid Tight JPEG size")
+        self.done(rfbcodec.rgb_to_pixels(image.tobytes(), getFormatArgs(self._pixelFormat)))
+        
+    def readFilter(self, data):
+        """
+        @summary: Read filter of basic compression
+        @param data: {str} filter id byte
+        """
+        tightFilter = ord(data)
+        if tightFilter == TightFilter.PALETTE:
+            self._expected = (1, self.readPaletteSize)
+        elif tightFilter in [TightFilter.COPY, TightFilter.GRADIENT]:
+            self.expectData(tightFilter)
+        else:
+            raise InvalidExpectedDataException("Invalid Tight filter %d"%tightFilter)
+        
+    def readPaletteSize(self, data):
+        """
+        @param data: {str} number of colors minus one
+        """
+        self._expected = ((ord(data) + 1) * self._tpixelSize, self.readPalette)
+        
+    def readPalette(self, data):
+        """
+        @param data: {str} palette colors as Tight pixels
+        """
+        self._palette = self.convert(data)
+        self.expectData(TightFilter.PALETTE)
+        
+    def getPaletteBits(self):
+        """
+        @return: {int} bits per index of palette filter
+        """
+        return 1 if len(self._palette) == 2 * (self._pixelFormat.BitsPerPixel.value / 8) else 8
+        
+    def expectData(self, tightFilter):
+        """
+        @summary: Wait filtered data, compressed if not too small
+        @param tightFilter: {TightFilter}
+        """
+        self._filter = tightFilter
+        if tightFilter == TightFilter.PALETTE:
+            self._dataSize = ((self._width * self.getPaletteBits() + 7) / 8) * self._height
+        else:
+            self._dataSize = self._width * self._height * self._tpixelSize
+            
+        if self._dataSize < self.MIN_TO_COMPRESS:
+            self._expected = (self._dataSize, self.readData)
+        else:
+            self.expectCompactLength(self.readCompressedData)
+            
+    def expectCompactLength(self, callback):
+        """
+        @summary: Read length encoded on 1 to 3 bytes
+        @param callback: {callable} state waiting length bytes
+        """
+        self._compactLength = 0
+        self._compactBytes = 0
+        self._compactCallback = callback
+        self._expected = (1, self.readCompactLength)
+        
+    def readCompactLength(self, data):
+        """
+        @param data: {str} one byte of compact length
+        """
+        value = ord(data)
+        if self._compactBytes == 2:
+            self._compactLength |= value << 14
+        else:
+            self._compactLength |= (value & 0x7f) << (7 * self._compactBytes)
+        self._compactBytes += 1
+        
+        if self._compactBytes < 3 and value & 0x80:
+            return
+        self._expected = (self._compactLength, self._compactCallback)
+        
+    def readCompressedData(self, data):
+        """
+        @summary: Inflate data with selected zlib stream
+        @param data: {str} zlib data
+        """
+        try:
+            data = self._streams[self._streamId].decompress(data)
+        except zlib.error as e:
+            raise InvalidExpectedDataException("Invalid Tight zlib data : %s"%e)
+        if len(data) != self._dataSize:
+            raise InvalidExpectedDataException("Invalid Tight inflated size")
+        self.readData(data)
+        
+    def readData(self, data):
+        """
+        @summary: Apply filter on data
+        @param data: {str} filtered data
+        """
+        try:
+            if self._filter == TightFilter.PALETTE:
+                self.done(rfbcodec.palette_expand(data, self._width, self._height, self.getPaletteBits(), self._palette, self._pixelFormat.BitsPerPixel.value / 8))
+            elif self._filter == TightFilter.GRADIENT:
+                self.done(self.convert(rfbcodec.tight_gradient(data, self._width, self._height, getFormatArgs(self._pixelFormat, self._tpixel))))
+            else:
+                self.done(self.convert(data))
+        except ValueError as e:
+            raise InvalidExpectedDataException("Invalid Tight data : %s"%e)
@@ -0,0 +1,277 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Desktop served by RFB server
+One framebuffer is drawn once and shared by all clients,
+each client keep its own damage region until it request an update
+"""
+
+from rdpy.ui.framebuffer import FrameBuffer
+
+def intersect(a, b):
+    """
+    @param a: {tuple(int, int, int, int)} x, y, width, height
+    @param b: {tuple(int, int, int, int)} x, y, width, height
+    @return: {tuple(int, int, int, int) | None} intersection of a and b
+    """
+    left, top = max(a[0], b[0]), max(a[1], b[1])
+    right, bottom = min(a[0] + a[2], b[0] + b[2]), min(a[1] + a[3], b[1] + b[3])
+    if right <= left or bottom <= top:
+        return None
+    return (left, top, right - left, bottom - top)
+
+def boundingBox(a, b):
+    """
+    @return: {tuple(int, int, int, int)} smallest rectangle containing a and b
+    """
+    left, top = min(a[0], b[0]), min(a[1], b[1])
+    right, bottom = max(a[0] + a[2], b[0] + b[2]), max(a[1] + a[3], b[1] + b[3])
+    return (left, top, right - left, bottom - top)
+
+def subtract(a, b):
+    """
+    @return: {list(tuple(int, int, int, int))} parts of a outside of b
+    """
+    inner = intersect(a, b)
+    if inner is None:
+        return [a]
+    result = []
+    x, y, width, height = a
+    ix, iy, iwidth, iheight = inner
+    #top and bottom bands have full width
+    if iy > y:
+        result.append((x, y, width, iy - y))
+    if iy + iheight < y + height:
+        result.append((x, iy + iheight, width, y + height - iy - iheight))
+    #left and right bands have height of intersection
+    if ix > x:
+        result.append((x, iy, ix - x, iheight))
+    if ix + iwidth < x + width:
+        result.append((ix + iwidth, iy, x + width - ix - iwidth, iheight))
+    return result
+
+class DamageRegion(object):
+    """
+    @summary: Modified areas of screen not yet sent to a client
+                overlapping or neighbour rectangles are merged when it cost nothing,
+                all rectangles are merged in bounding box if there are too many
+    """
+    MAX_RECTANGLES = 32
+
+    def __init__(self):
+        self._rectangles = []
+
+    def isEmpty(self):
+        """
+        @return: {bool} True if nothing is damaged
+        """
+        return len(self._rectangles) == 0
+
+    def getRectangles(self):
+        """
+        @return: {list(tuple(int, int, int, int))} damaged rectangles
+        """
+        return list(self._rectangles)
+
+    def add(self, x, y, width, height):
+        """
+        @summary: Add a damaged area
+        @param x: {int} left of area
+        @param y: {int} top of area
+        @param width: {int} width of area
+        @param height: {int} height of area
+        """
+        if width <= 0 or height <= 0:
+            return
+        rectangle = (x, y, width, height)
+        merged = True
+        while merged:
+            merged = False
+            for other in self._rectangles:
+                box = boundingBox(rectangle, other)
+                if box[2] * box[3] <= rectangle[2] * rectangle[3] + other[2] * other[3]:
+                    self._rectangles.remove(other)
+                    rectangle = box
+                    merged = True
+                    break
+        self._rectangles.append(rectangle)
+
+        if len(self._rectangles) > self.MAX_RECTANGLES:
+            self._rectangles = [reduce(boundingBox, self._rectangles)]
+
+    def pop(self, x, y, width, height):
+        """
+        @summary: Remove damage inside an area
+        @param x: {int} left of area
+        @param y: {int} top of area
+        @param width: {int} width of area
+        @param height: {int} height of area
+        @return: {list(tuple(int, int, int, int))} damaged rectangles inside area
+        """
+        area = (x, y, width, height)
+        result = []
+        remaining = []
+        for rectangle in self._rectangles:
+            inner = intersect(rectangle, area)
+            if inner is None:
+                remaining.append(rectangle)
+                continue
+            result.append(inner)
+            remaining += subtract(rectangle, area)
+        self._rectangles = remaining
+        return result
+
+class Desktop(object):
+    """
+    @summary: Framebuffer shared by RFB server controllers
+                Frames are drawn once, damage is forwarded to each controller
+                and encoded rectangles are cached until pixels change
+    """
+    MAX_CACHE = 256
+
+    def __init__(self, width, height, name = "rdpy"):
+        """
+        @param width: {int} width of screen
+        @param height: {int} height of screen
+        @param name: {str} desktop name sent to clients
+        """
+        self._frameBuffer = FrameBuffer(width, height)
+        self._name = name
+        self._listeners = []
+        #(rectangle, encoder, pixel format) -> encoded data
+        self._cache = {}
+
+    def getWidth(self):
+        """
+        @return: {int} width of screen
+        """
+        return self._frameBuffer.getWidth()
+
+    def getHeight(self):
+        """
+        @return: {int} height of screen
+        """
+        return self._frameBuffer.getHeight()
+
+    def getName(self):
+        """
+        @return: {str} desktop name
+        """
+        return self._name
+
+    def getFrameBuffer(self):
+        """
+        @return: {FrameBuffer} screen image
+        """
+        return self._frameBuffer
+
+    def addListener(self, listener):
+        """
+        @summary: Forward damage to listener
+        @param listener: object with onDamage(x, y, width, height) method
+        """
+        self._listeners.append(listener)
+
+    def removeListener(self, listener):
+        """
+        @param listener: listener added with addListener
+        """
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def damage(self, x, y, width, height):
+        """
+        @summary: Inform listeners that an area of screen has changed
+                    Must be called after direct modification of framebuffer
+        @param x: {int} left of area
+        @param y: {int} top of area
+        @param width: {int} width of area
+        @param height: {int} height of area
+        """
+        area = intersect((x, y, width, height), (0, 0, self.getWidth(), self.getHeight()))
+        if area is None:
+            return
+        for key in self._cache.keys():
+            if not intersect(key[0], area) is None:
+                del self._cache[key]
+        for listener in self._listeners:
+            listener.onDamage(*area)
+
+    def drawPixels(self, x, y, width, height, pixels, stride = None):
+        """
+        @summary: Draw BGRX pixels
+        @see: FrameBuffer.drawPixels
+        """
+        self._frameBuffer.drawPixels(x, y, width, height, pixels, stride)
+        self.damage(x, y, width, height)
+
+    def drawRDPBitmap(self, destLeft, destTop, destRight, destBottom, width, height, bitsPerPixel, isCompress, data):
+        """
+        @summary: Draw RDP bitmap update (rss update events)
+        @see: FrameBuffer.drawRDPBitmap
+        """
+        self._frameBuffer.drawRDPBitmap(destLeft, destTop, destRight, destBottom, width, height, bitsPerPixel, isCompress, data)
+        self.damage(destLeft, destTop, destRight - destLeft + 1, destBottom - destTop + 1)
+
+    def screenBlt(self, destLeft, destTop, width, height, srcLeft, srcTop):
+        """
+        @summary: Copy an area of screen
+        @see: FrameBuffer.screenBlt
+        """
+        self._frameBuffer.screenBlt(destLeft, destTop, width, height, srcLeft, srcTop)
+        self.damage(destLeft, destTop, width, height)
+
+    def getArea(self, x, y, width, height):
+        """
+        @param x: {int} left of area
+        @param y: {int} top of area
+        @param width: {int} width of area
+        @param height: {int} height of area
+        @return: {bytearray} top down BGRX pixels of area (inside screen)
+        """
+        pixels = self._frameBuffer.getPixels()
+        screenWidth = self.getWidth()
+        lineSize = width * 4
+        result = bytearray(lineSize * height)
+        for i in range(height):
+            offset = ((y + i) * screenWidth + x) * 4
+            result[i * lineSize:(i + 1) * lineSize] = pixels[offset:offset + lineSize]
+        return result
+
+    def encode(self, x, y, width, height, encoder, pixelFormat, formatKey):
+        """
+        @summary: Encode an area, result is shared by clients with same encoding and pixel format
+        @param x: {int} left of area
+        @param y: {int} top of area
+        @param width: {int} width of area
+        @param height: {int} height of area
+        @param encoder: {function} encoder function (see rfb.encoder)
+        @param pixelFormat: {rfb.PixelFormat} client pixel format
+        @param formatKey: {tuple} hashable key of pixel format
+        @return: {str} encoded data
+        """
+        key = ((x, y, width, height), encoder, formatKey)
+        data = self._cache.get(key)
+        if data is None:
+            data = encoder(width, height, pixelFormat, self.getArea(x, y, width, height))
+            if len(self._cache) >= self.MAX_CACHE:
+                self._cache.clear()
+            self._cache[key] = data
+        return data
@@ -0,0 +1,185 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Encoders of RFB rectangle encodings (server side)
+Each encoder take top down BGRX pixels of framebuffer and return
+rectangle data in client pixel format. Result only depends on pixels
+and pixel format, so it can be shared by all clients of a desktop
+(ZRLE data is returned before deflate, zlib stream is owned by connection)
+@see: http://www.realvnc.com/docs/rfbproto.pdf
+"""
+
+import struct, zlib
+from decoder import HextileSubencoding, HextileDecoder, getFormatArgs, getCPixelLayout
+import rfbcodec
+
+#colour map pixel format is served as BGR 233
+COLOUR_MAP_FORMAT = (1, 0, 7, 7, 3, 0, 3, 6)
+
+def getColourMapEntries():
+    """
+    @summary: Colours sent to client which use colour map pixel format
+    @return: {list(tuple(int, int, int))} 16 bits red, green, blue of 256 entries
+    """
+    return [((i & 7) * 65535 / 7, ((i >> 3) & 7) * 65535 / 7, (i >> 6) * 65535 / 3) for i in range(256)]
+
+def getFormatKey(pixelFormat):
+    """
+    @param pixelFormat: {rfb.PixelFormat} client pixel format
+    @return: {tuple} pixel format parameters of rfbcodec (hashable)
+    """
+    if not pixelFormat.TrueColorFlag.value:
+        return COLOUR_MAP_FORMAT
+    return getFormatArgs(pixelFormat)
+
+def convertPixels(pixels, pixelFormat):
+    """
+    @summary: Convert BGRX pixels into client pixel format
+    @param pixels: {bytearray} top down BGRX pixels
+    @param pixelFormat: {rfb.PixelFormat} client pixel format
+    @return: {str} raw pixels
+    """
+    formatKey = getFormatKey(pixelFormat)
+    #same layout as framebuffer
+    if formatKey == (4, 0, 255, 255, 255, 16, 8, 0):
+        return str(pixels)
+    rgb = bytearray(len(pixels) / 4 * 3)
+    rgb[0::3] = pixels[2::4]
+    rgb[1::3] = pixels[1::4]
+    rgb[2::3] = pixels[0::4]
+    return rfbcodec.rgb_to_pixels(rgb, formatKey)
+
+def encodeRaw(width, height, pixelFormat, pixels):
+    """
+    @summary: Raw encoding
+    @param width: {int} width of rectangle
+    @param height: {int} height of rectangle
+    @param pixelFormat: {rfb.PixelFormat} client pixel format
+    @param pixels: {bytearray} top down BGRX pixels of rectangle
+    @return: {str} rectangle data
+    """
+    return convertPixels(pixels, pixelFormat)
+
+def encodeHextile(width, height, pixelFormat, pixels):
+    """
+    @summary: Hextile encoding
+                solid tiles only send background when it change,
+                other tiles use sub rectangles of horizontal runs or raw if smaller
+    @see: encodeRaw
+    """
+    data = convertPixels(pixels, pixelFormat)
+    bytesPerPixel = getFormatKey(pixelFormat)[0]
+    stride = width * bytesPerPixel
+    tileSize = HextileDecoder.TILE_SIZE
+    result = []
+    background, foreground = None, None
+
+    for tileY in range(0, height, tileSize):
+        tileHeight = min(tileSize, height - tileY)
+        for tileX in range(0, width, tileSize):
+            tileWidth = min(tileSize, width - tileX)
+            tile = "".join([data[(tileY + y) * stride + tileX * bytesPerPixel:(tileY + y) * stride + (tileX + tileWidth) * bytesPerPixel] for y in range(tileHeight)])
+
+            #fast path for solid tile
+            first = tile[:bytesPerPixel]
+            if tile == first * (tileWidth * tileHeight):
+                if first == background:
+                    result.append("\x00")
+                else:
+                    result.append(chr(HextileSubencoding.BACKGROUND_SPECIFIED) + first)
+                    background = first
+                continue
+
+            tilePixels = [tile[i:i + bytesPerPixel] for i in range(0, len(tile), bytesPerPixel)]
+            counts = {}
+            for pixel in tilePixels:
+                counts[pixel] = counts.get(pixel, 0) + 1
+            tileBackground = max(counts, key = counts.get)
+            coloured = len(counts) > 2
+
+            #runs of pixels which are not background
+            subrects = []
+            for y in range(tileHeight):
+                x = 0
+                while x < tileWidth:
+                    pixel = tilePixels[y * tileWidth + x]
+                    if pixel == tileBackground:
+                        x += 1
+                        continue
+                    start = x
+                    while x < tileWidth and tilePixels[y * tileWidth + x] == pixel:
+                        x += 1
+                    subrects.append((pixel, start, y, x - start))
+
+            tileForeground = subrects[0][0]
+            size = 2 + len(subrects) * (2 + (bytesPerPixel if coloured else 0))
+            if tileBackground != background:
+                size += bytesPerPixel
+            if not coloured and tileForeground != foreground:
+                size += bytesPerPixel
+
+            if len(subrects) > 255 or size >= 1 + len(tile):
+                result.append(chr(HextileSubencoding.RAW) + tile)
+                #background and foreground are not defined after raw tile
+                background, foreground = None, None
+                continue
+
+            subencoding = HextileSubencoding.ANY_SUBRECTS
+            header = ""
+            if tileBackground != background:
+                subencoding |= HextileSubencoding.BACKGROUND_SPECIFIED
+                header += tileBackground
+                background = tileBackground
+            if coloured:
+                subencoding |= HextileSubencoding.SUBRECTS_COLOURED
+                foreground = None
+            elif tileForeground != foreground:
+                subencoding |= HextileSubencoding.FOREGROUND_SPECIFIED
+                header += tileForeground
+                foreground = tileForeground
+
+            result.append(chr(subencoding) + header + chr(len(subrects)))
+            for pixel, x, y, runLength in subrects:
+                result.append((pixel if coloured else "") + chr((x << 4) | y) + chr((runLength - 1) << 4))
+
+    return "".join(result)
+
+def encodeZRLE(width, height, pixelFormat, pixels):
+    """
+    @summary: ZRLE encoding before deflate, tiles are encoded by rfbcodec extension
+    @see: encodeRaw
+    """
+    data = convertPixels(pixels, pixelFormat)
+    bytesPerPixel = getFormatKey(pixelFormat)[0]
+    if pixelFormat.TrueColorFlag.value:
+        cpixelSize, cpixelOffset = getCPixelLayout(pixelFormat)
+    else:
+        cpixelSize, cpixelOffset = 1, 0
+    return rfbcodec.zrle_encode(data, width, height, cpixelSize, bytesPerPixel, cpixelOffset)
+
+def deflateZRLE(data, stream):
+    """
+    @summary: Deflate ZRLE data with zlib stream of connection
+    @param data: {str} result of encodeZRLE
+    @param stream: {zlib.Compress} zlib stream of connection
+    @return: {str} rectangle data (length and zlib data)
+    """
+    compressed = stream.compress(data) + stream.flush(zlib.Z_SYNC_FLUSH)
+    return struct.pack(">I", len(compressed)) + compressed
@@ -20,15 +20,14 @@
 """
 Implement Remote FrameBuffer protocol use in VNC client and server
 @see: http://www.realvnc.com/docs/rfbproto.pdf
-
-@todo: server side of protocol
-@todo: more encoding rectangle
 """
 
-from rdpy.core.layer import RawLayer, RawLayerClientFactory
-from rdpy.core.type import UInt8, UInt16Be, UInt32Be, SInt32Be, String, CompositeType
-from rdpy.core.error import InvalidValue, CallPureVirtualFuntion
-from rdpy.security.pyDes import des
+from rdpy.core.layer import RawLayer, RawLayerClientFactory, RawLayerServerFactory
+from rdpy.core.type import UInt8, UInt16Be, UInt32Be, SInt32Be, String, CompositeType, Stream
+from rdpy.core.error import InvalidValue, CallPureVirtualFuntion, InvalidExpectedDataException
+import rdpy.security.des as des
+import decoder, encoder, zlib, os
+from desktop import DamageRegion, intersect
 import rdpy.core.log as log
 
 class ProtocolVersion(object):
@@ -63,6 +62,15 @@ class Encoding(object):
     @summary: Encoding types of FrameBuffer update
     """
     RAW = 0
+    COPY_RECT = 1
+    RRE = 2
+    HEXTILE = 5
+    TIGHT = 7
+    ZRLE = 16
+    #pseudo encoding, quality level 0 to 9 is added
+    JPEG_QUALITY_LEVEL_0 = -32
+    #pseudo encoding of ContinuousUpdates extension
+    CONTINUOUS_UPDATES = -313
 
 class ClientToServerMessages(object):
     """
@@ -74,6 +82,17 @@ class ClientToServerMessages(object):
     KEY_EVENT = 4
     POINTER_EVENT = 5
     CUT_TEXT = 6
+    ENABLE_CONTINUOUS_UPDATES = 150
+    
+class ServerToClientMessages(object):
+    """
+    @summary: Server to client messages types
+    """
+    FRAME_BUFFER_UPDATE = 0
+    SET_COLOUR_MAP_ENTRIES = 1
+    BELL = 2
+    CUT_TEXT = 3
+    END_OF_CONTINUOUS_UPDATES = 150
     
 class PixelFormat(CompositeType):
     """
@@ -93,6 +112,64 @@ class PixelFormat(CompositeType):
         self.BlueShift = UInt8(0)
         self.padding = (UInt16Be(), UInt8())
         
+def createPixelFormat(bitsPerPixel = 32, trueColor = True):
+    """
+    @summary: Build a little endian client pixel format
+                32 bits is XRGB 8888, 16 bits is RGB 565,
+                8 bits is BGR 233 or colour map if not trueColor
+    @param bitsPerPixel: {int} 32, 16 or 8
+    @param trueColor: {bool} False for colour map (only 8 bits)
+    @return: {PixelFormat}
+    @raise InvalidValue: unsupported format
+    """
+    pixelFormat = PixelFormat()
+    if not trueColor:
+        if bitsPerPixel != 8:
+            raise InvalidValue("Colour map is only supported with 8 bits per pixel")
+        layout = (8, 0, 0, 0, 0, 0, 0)
+    elif bitsPerPixel == 32:
+        layout = (24, 255, 255, 255, 16, 8, 0)
+    elif bitsPerPixel == 16:
+        layout = (16, 31, 63, 31, 11, 5, 0)
+    elif bitsPerPixel == 8:
+        layout = (8, 7, 7, 3, 0, 3, 6)
+    else:
+        raise InvalidValue("Unsupported pixel format %d bits per pixel"%bitsPerPixel)
+    
+    pixelFormat.BitsPerPixel.value = bitsPerPixel
+    pixelFormat.TrueColorFlag.value = trueColor
+    pixelFormat.Depth.value, pixelFormat.RedMax.value, pixelFormat.GreenMax.value, pixelFormat.BlueMax.value, pixelFormat.RedShift.value, pixelFormat.GreenShift.value, pixelFormat.BlueShift.value = layout
+    return pixelFormat
+
+def encryptChallenge(password, challenge):
+    """
+    @summary: VNC authentication response
+                DES key is password with bits of each byte reversed
+    @param password: {str} password (truncated to 8 bytes)
+    @param challenge: {str} 16 bytes challenge
+    @return: {str} 16 bytes response
+    """
+    key = (password + '\0' * 8)[:8]
+    newkey = []
+    for ki in range(len(key)):
+        bsrc = ord(key[ki])
+        btgt = 0
+        for i in range(8):
+            if bsrc & (1 << i):
+                btgt = btgt | (1 << 7-i)
+        newkey.append(chr(btgt))
+    return des.encrypt("".join(newkey), challenge)
+
+def copyPixelFormat(pixelFormat):
+    """
+    @param pixelFormat: {PixelFormat}
+    @return: {PixelFormat} copy of pixelFormat
+    """
+    result = PixelFormat()
+    for name in ["BitsPerPixel", "Depth", "BigEndianFlag", "TrueColorFlag", "RedMax", "GreenMax", "BlueMax", "RedShift", "GreenShift", "BlueShift"]:
+        getattr(result, name).value = getattr(pixelFormat, name).value
+    return result
+        
 class ServerInit(CompositeType):
     """
     @summary:  Server init structure
@@ -117,7 +194,19 @@ class FrameBufferUpdateRequest(CompositeType):
         self.y = UInt16Be(y)
         self.width = UInt16Be(width)
         self.height = UInt16Be(height)
-
+        
+class EnableContinuousUpdates(CompositeType):
+    """
+    @summary:  Ask server to send updates of area without update request
+                ContinuousUpdates extension
+    """
+    def __init__(self, enable = False, x = 0, y = 0, width = 0, height = 0):
+        CompositeType.__init__(self)
+        self.enable = UInt8(enable)
+        self.x = UInt16Be(x)
+        self.y = UInt16Be(y)
+        self.width = UInt16Be(width)
+        self.height = UInt16Be(height)
     
 class Rectangle(CompositeType):
     """
@@ -197,12 +286,29 @@ class RFB(RawLayer):
         self._serverInit = ServerInit()
         #client pixel format
         self._pixelFormat = PixelFormat()
+        #use server pixel format instead of client one
+        self._useServerPixelFormat = False
         #server name
         self._serverName = String()
         #nb rectangle
         self._nbRect = 0
         #current rectangle header
         self._currentRect = Rectangle()
+        #max size of raw rectangle band forwarded to listener (0 for whole rectangle)
+        self._bandSize = 65536
+        #rows of current raw rectangle already received
+        self._bandRow = 0
+        #first colour index of colour map update
+        self._firstColour = UInt16Be()
+        #decoder of current rectangle (None for RAW)
+        self._decoder = None
+        #encodings advertised to server in preference order
+        self._encodings = [Encoding.COPY_RECT, Encoding.TIGHT, Encoding.ZRLE, Encoding.HEXTILE, Encoding.RRE, Encoding.RAW]
+        #Tight JPEG quality level (only advertised if JPEG can be decoded)
+        self._jpegQuality = 6
+        #zlib streams live as long as connection
+        self._zrleStream = zlib.decompressobj()
+        self._tightStreams = [zlib.decompressobj() for _ in range(4)]
         #for vnc security type
         self._password = '\0' * 8
     
@@ -310,18 +416,7 @@ class RFB(RawLayer):
         @summary: receive challenge in VNC authentication case
         @param data: Stream that contain well formed packet 
         """
-        key = (self._password + '\0' * 8)[:8]
-        newkey = []
-        for ki in range(len(key)):
-            bsrc = ord(key[ki])
-            btgt = 0
-            for i in range(8):
-                if bsrc & (1 << i):
-                    btgt = btgt | (1 << 7-i)
-            newkey.append(chr(btgt))
-
-        algo = des(newkey)
-        self.send(String(algo.encrypt(data.getvalue())))
+        self.send(String(encryptChallenge(self._password, data.getvalue())))
         self.expect(4, self.recvSecurityResult)
       
     def recvSecurityResult(self, data):
@@ -364,6 +459,8 @@ class RFB(RawLayer):
         log.info("Server name %s"%str(self._serverName))
         #end of handshake
         #send pixel format
+        if self._useServerPixelFormat:
+            self._pixelFormat = copyPixelFormat(self._serverInit.pixelFormat)
         self.sendPixelFormat(self._pixelFormat)
         #write encoding
         self.sendSetEncoding()
@@ -381,12 +478,16 @@ class RFB(RawLayer):
         """
         packetType = UInt8()
         data.readType(packetType)
-        if packetType.value == 0:
+        if packetType.value == ServerToClientMessages.FRAME_BUFFER_UPDATE:
             self.expect(3, self.recvFrameBufferUpdateHeader)
-        elif packetType.value == 2:
+        elif packetType.value == ServerToClientMessages.SET_COLOUR_MAP_ENTRIES:
+            self.expect(5, self.recvColourMapHeader)
+        elif packetType.value == ServerToClientMessages.BELL:
             self._clientListener.onBell()
-        elif packetType.value == 3:
+        elif packetType.value == ServerToClientMessages.CUT_TEXT:
             self.expect(7, self.recvServerCutTextHeader)
+        elif packetType.value == ServerToClientMessages.END_OF_CONTINUOUS_UPDATES:
+            self._clientListener.recvEndOfContinuousUpdates()
         else:
             log.error("Unknown message type %s"%packetType.value)
         
@@ -399,33 +500,151 @@ class RFB(RawLayer):
         nbRect = UInt16Be()
         self._nbRect = data.readType((UInt8(), nbRect))
         self._nbRect = nbRect.value
-        self.expect(12, self.recvRectHeader)
+        if self._nbRect == 0:
+            self.endOfUpdate()
+        else:
+            self.expect(12, self.recvRectHeader)
         
     def recvRectHeader(self, data):
         """
         @summary: Read rectangle header
         @param data: Stream that contains well formed packet
+        @raise InvalidExpectedDataException: on encoding not advertised
         """
         data.readType(self._currentRect)
-        if self._currentRect.encoding.value == Encoding.RAW:
-            self.expect(self._currentRect.width.value * self._currentRect.height.value * (self._pixelFormat.BitsPerPixel.value / 8), self.recvRectBody)
+        encoding = self._currentRect.encoding.value
+        width, height = self._currentRect.width.value, self._currentRect.height.value
+        bytesPerPixel = self._pixelFormat.BitsPerPixel.value / 8
+        
+        if encoding == Encoding.RAW:
+            self._bandRow = 0
+            self.expectRawBand()
+        elif encoding == Encoding.COPY_RECT:
+            self.expect(4, self.recvCopyRect)
+        elif encoding == Encoding.RRE:
+            self._decoder = decoder.RREDecoder(width, height, bytesPerPixel)
+            self.expectDecoder()
+        elif encoding == Encoding.HEXTILE:
+            self._decoder = decoder.HextileDecoder(width, height, bytesPerPixel)
+            self.expectDecoder()
+        elif encoding == Encoding.ZRLE:
+            self._decoder = decoder.ZRLEDecoder(width, height, self._pixelFormat, self._zrleStream)
+            self.expectDecoder()
+        elif encoding == Encoding.TIGHT:
+            self._decoder = decoder.TightDecoder(width, height, self._pixelFormat, self._tightStreams)
+            self.expectDecoder()
+        else:
+            raise InvalidExpectedDataException("Unsupported rectangle encoding %d"%encoding)
     
-    def recvRectBody(self, data):
+    def expectRawBand(self):
         """
-        @summary: Read body of rectangle update
+        @summary: Wait next rows of raw rectangle
+                    Large rectangle is streamed in bands of at most bandSize bytes
+                    to not buffer whole rectangle before rendering
+        """
+        width, height = self._currentRect.width.value, self._currentRect.height.value
+        lineSize = width * self._pixelFormat.BitsPerPixel.value / 8
+        remaining = height - self._bandRow
+        if remaining <= 0 or lineSize == 0:
+            self.nextRect()
+            return
+        rows = remaining
+        if self._bandSize > 0:
+            rows = min(remaining, max(1, self._bandSize / lineSize))
+        self.expect(rows * lineSize, self.recvRectBand)
+        
+    def recvRectBand(self, data):
+        """
+        @summary: Read rows of raw rectangle, forwarded as a rectangle of these rows
+        @param data: Stream that contains well formed packet
+        """
+        width = self._currentRect.width.value
+        rows = data.len / (width * self._pixelFormat.BitsPerPixel.value / 8)
+        band = Rectangle()
+        band.x.value, band.y.value, band.width.value, band.height.value = self._currentRect.x.value, self._currentRect.y.value + self._bandRow, width, rows
+        band.encoding.value = Encoding.RAW
+        self._bandRow += rows
+        self._clientListener.recvRectangle(band, self._pixelFormat, data.getvalue())
+        self.expectRawBand()
+        
+    def recvCopyRect(self, data):
+        """
+        @summary: Read source position of copy rect encoding
         @param data: Stream that contains well formed packet
         """
-        self._clientListener.recvRectangle(self._currentRect, self._pixelFormat, data.getvalue())
-           
+        srcX = UInt16Be()
+        srcY = UInt16Be()
+        data.readType((srcX, srcY))
+        self._clientListener.recvCopyRect(self._currentRect, srcX.value, srcY.value)
+        self.nextRect()
+        
+    def expectDecoder(self):
+        """
+        @summary: Wait next chunk of current decoder
+                    or forward decoded pixels when rectangle is complete
+        """
+        length = self._decoder.nextLength()
+        if length is None:
+            pixels, self._decoder = self._decoder.getPixels(), None
+            self._clientListener.recvRectangle(self._currentRect, self._pixelFormat, pixels)
+            self.nextRect()
+        elif length == 0:
+            self.recvDecoderData(None)
+        else:
+            self.expect(length, self.recvDecoderData)
+            
+    def recvDecoderData(self, data):
+        """
+        @summary: Feed current decoder
+        @param data: Stream that contains well formed packet
+        """
+        self._decoder.feed("" if data is None else data.getvalue())
+        self.expectDecoder()
+        
+    def nextRect(self):
+        """
+        @summary: Read next rectangle or end of update
+        """
         self._nbRect -= 1
         #if there is another rect to read
         if self._nbRect == 0:
-            #job is finish send a request
-            self.sendFramebufferUpdateRequest(True, 0, 0, self._serverInit.width.value, self._serverInit.height.value)
-            self.expect(1, self.recvServerOrder)
+            self.endOfUpdate()
         else:
             self.expect(12, self.recvRectHeader)
             
+    def endOfUpdate(self):
+        """
+        @summary: All rectangles of frame buffer update are read
+                    Listener decide when next update is requested
+        """
+        self.expect(1, self.recvServerOrder)
+        self._clientListener.recvUpdateDone()
+            
+    def recvColourMapHeader(self, data):
+        """
+        @summary: Read first colour and number of colours of colour map update
+        @param data: Stream that contains well formed packet
+        """
+        nbColours = UInt16Be()
+        data.readType((UInt8(), self._firstColour, nbColours))
+        if nbColours.value == 0:
+            self.expect(1, self.recvServerOrder)
+        else:
+            self.expect(nbColours.value * 6, self.recvColourMapBody)
+        
+    def recvColourMapBody(self, data):
+        """
+        @summary: Read colours (16 bits red, green, blue) of colour map update
+        @param data: Stream that contains well formed packet
+        """
+        colours = []
+        while data.dataLen() > 0:
+            red, green, blue = UInt16Be(), UInt16Be(), UInt16Be()
+            data.readType((red, green, blue))
+            colours.append((red.value, green.value, blue.value))
+        self._clientListener.recvColourMap(self._firstColour.value, colours)
+        self.expect(1, self.recvServerOrder)
+        
     def recvServerCutTextHeader(self, data):
         """
         @summary:  callback when expect server cut text message
@@ -461,9 +680,13 @@ class RFB(RawLayer):
     def sendSetEncoding(self):
         """
         @summary:  Send set encoding packet
-                    Actually only RAW bitmap encoding are used
+                    Encodings are sent in preference order
         """
-        self.send((UInt8(ClientToServerMessages.ENCODING), UInt8(), UInt16Be(1), SInt32Be(Encoding.RAW)))
+        encodings = list(self._encodings)
+        if Encoding.TIGHT in encodings and decoder.hasJpegSupport():
+            encodings.append(Encoding.JPEG_QUALITY_LEVEL_0 + self._jpegQuality)
+        encodings.append(Encoding.CONTINUOUS_UPDATES)
+        self.send((UInt8(ClientToServerMessages.ENCODING), UInt8(), UInt16Be(len(encodings)), [SInt32Be(encoding) for encoding in encodings]))
         
     def sendFramebufferUpdateRequest(self, incremental, x, y, width, height):
         """
@@ -472,6 +695,13 @@ class RFB(RawLayer):
         """
         self.send((UInt8(ClientToServerMessages.FRAME_BUFFER_UPDATE_REQUEST), FrameBufferUpdateRequest(incremental, x, y, width, height)))
         
+    def sendEnableContinuousUpdates(self, enable, x, y, width, height):
+        """
+        @summary:  Enable or disable continuous updates of an area
+                    Only if server has sent EndOfContinuousUpdates
+        """
+        self.send((UInt8(ClientToServerMessages.ENABLE_CONTINUOUS_UPDATES), EnableContinuousUpdates(enable, x, y, width, height)))
+        
     def sendKeyEvent(self, keyEvent):
         """
         @summary: Write key event packet
@@ -502,10 +732,43 @@ class RFBClientListener(object):
                     Main update order type
         @param rectangle: Rectangle type header of packet
         @param pixelFormat: pixelFormat struct of current session
-        @param data: image data
+        @param data: raw pixels of rectangle (already decoded for RRE, Hextile, ZRLE and Tight)
+                        large raw rectangle is received in bands of rows
         """
         raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "recvRectangle", "RFBClientListener"))
     
+    def recvCopyRect(self, rectangle, srcX, srcY):
+        """
+        @summary: Receive copy rect order
+                    Copy an area of framebuffer already received
+        @param rectangle: Rectangle type header of packet (destination)
+        @param srcX: x position of source area
+        @param srcY: y position of source area
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "recvCopyRect", "RFBClientListener"))
+    
+    def recvUpdateDone(self):
+        """
+        @summary: All rectangles of a frame buffer update are received
+                    Listener must request next update
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "recvUpdateDone", "RFBClientListener"))
+    
+    def recvEndOfContinuousUpdates(self):
+        """
+        @summary: Server support ContinuousUpdates extension (first message)
+                    or has stopped continuous updates
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "recvEndOfContinuousUpdates", "RFBClientListener"))
+    
+    def recvColourMap(self, firstColour, colours):
+        """
+        @summary: Receive colour map entries (colour map pixel format)
+        @param firstColour: {int} index of first colour
+        @param colours: {list(tuple(int, int, int))} 16 bits red, green, blue
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "recvColourMap", "RFBClientListener"))
+    
     def onBell(self):
         """
         @summary: receive bip from server
@@ -523,12 +786,34 @@ class RFBClientListener(object):
 class RFBClientController(RFBClientListener):
     """
     @summary: Class use to manage RFB order and dispatch throw observers for client side
+                Pace incremental update requests : max frame rate, region of interest,
+                no request while no observer need updates, ContinuousUpdates if server support it
     """
-    def __init__(self):
+    def __init__(self, reactor = None):
+        """
+        @param reactor: twisted reactor use for frame rate (default reactor if None)
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
         self._clientObservers = []
         #rfb layer to send client orders
         self._rfbLayer = RFB(self)
         self._isReady = False
+        #pacing policy
+        self._maxFrameRate = 0
+        self._regionOfInterest = None
+        self._useContinuousUpdates = False
+        #pacing state
+        self._requestPending = True
+        self._requestCall = None
+        self._lastRequest = None
+        self._continuousUpdatesSupported = False
+        self._continuousUpdatesEnabled = False
+        #disable is sent, wait end of continuous updates
+        self._continuousUpdatesStopping = False
+        #BGRX colours of colour map pixel format
+        self._colourMap = bytearray(256 * 4)
         
     def getProtocol(self):
         """
@@ -569,13 +854,153 @@ class RFBClientController(RFBClientListener):
         """
         self._rfbLayer._password = password
         
+    def setPixelFormat(self, bitsPerPixel = 32, trueColor = True):
+        """
+        @summary: Pixel format requested to server
+                    Lower bits per pixel save bandwidth, must be called before session is ready
+        @param bitsPerPixel: {int | None} 32, 16 or 8, None to keep server native format
+        @param trueColor: {bool} False for 8 bits colour map
+        @raise InvalidValue: unsupported format
+        """
+        if self._isReady:
+            log.error("Pixel format can only be set before session is ready")
+            return
+        if bitsPerPixel is None:
+            self._rfbLayer._useServerPixelFormat = True
+            return
+        self._rfbLayer._pixelFormat = createPixelFormat(bitsPerPixel, trueColor)
+        self._rfbLayer._useServerPixelFormat = False
+        
+    def getPixelFormat(self):
+        """
+        @return: {PixelFormat} pixel format of session (valid once session is ready)
+        """
+        return self._rfbLayer._pixelFormat
+    
+    def getColourMap(self):
+        """
+        @return: {bytearray} BGRX colours of colour map pixel format (256 entries)
+        """
+        return self._colourMap
+        
+    def setStreamingBandSize(self, bandSize):
+        """
+        @summary: Raw rectangles are forwarded to observers in bands of rows as they arrive
+                    Limit memory of large rectangles and start rendering before end of rectangle
+        @param bandSize: {int} max size of band in bytes (0 to receive whole rectangle)
+        """
+        self._rfbLayer._bandSize = bandSize
+        
+    def setMaxFrameRate(self, frameRate):
+        """
+        @summary: Limit incremental update requests per second
+        @param frameRate: {float} max update request per second (0 for no limit)
+        """
+        self._maxFrameRate = frameRate
+        
+    def setRegionOfInterest(self, x, y, width, height):
+        """
+        @summary: Request only updates of an area of screen
+        @param x: {int} left of area
+        @param y: {int} top of area
+        @param width: {int} width of area
+        @param height: {int} height of area
+        """
+        self._regionOfInterest = (x, y, width, height)
+        self.onPolicyChange()
+        
+    def clearRegionOfInterest(self):
+        """
+        @summary: Request updates of whole screen
+        """
+        self._regionOfInterest = None
+        self.onPolicyChange()
+        
+    def setContinuousUpdates(self, enable):
+        """
+        @summary: Use ContinuousUpdates extension when server support it
+                    Server push updates without request, max frame rate is not applied
+        @param enable: {bool}
+        """
+        self._useContinuousUpdates = enable
+        self.onPolicyChange()
+        
+    def getRegion(self):
+        """
+        @return: {tuple(int, int, int, int)} area of update requests
+        """
+        if self._regionOfInterest is None:
+            return (0, 0, self.getWidth(), self.getHeight())
+        return self._regionOfInterest
+    
+    def isUpdateNeeded(self):
+        """
+        @return: {bool} True if at least one observer need updates
+        """
+        for observer in self._clientObservers:
+            if observer.isUpdateNeeded():
+                return True
+        return False
+    
+    def onPolicyChange(self):
+        """
+        @summary: Pacing policy or observer needs have changed
+                    Update continuous updates state or restart request loop
+        """
+        if not self._isReady or self._continuousUpdatesStopping:
+            return
+        
+        wantContinuous = self._useContinuousUpdates and self._continuousUpdatesSupported and self.isUpdateNeeded()
+        if wantContinuous:
+            self._continuousUpdatesEnabled = True
+            self._rfbLayer.sendEnableContinuousUpdates(True, *self.getRegion())
+            return
+        
+        if self._continuousUpdatesEnabled:
+            #server answer with end of continuous updates
+            self._continuousUpdatesEnabled = False
+            self._continuousUpdatesStopping = True
+            self._rfbLayer.sendEnableContinuousUpdates(False, *self.getRegion())
+            return
+        
+        if not self._requestPending:
+            self.scheduleUpdateRequest()
+            
+    def scheduleUpdateRequest(self):
+        """
+        @summary: Request next incremental update in respect of max frame rate
+        """
+        if self._continuousUpdatesEnabled or not self._requestCall is None or not self.isUpdateNeeded():
+            return
+        
+        if self._maxFrameRate > 0 and not self._lastRequest is None:
+            delay = self._lastRequest + 1.0 / self._maxFrameRate - self._reactor.seconds()
+            if delay > 0:
+                self._requestCall = self._reactor.callLater(delay, self.sendUpdateRequest)
+                return
+        self.sendUpdateRequest()
+        
+    def sendUpdateRequest(self):
+        """
+        @summary: Send incremental update request of region of interest
+        """
+        self._requestCall = None
+        if self._continuousUpdatesEnabled or not self.isUpdateNeeded():
+            return
+        self._requestPending = True
+        self._lastRequest = self._reactor.seconds()
+        self._rfbLayer.sendFramebufferUpdateRequest(True, *self.getRegion())
+        
     def onReady(self):
         """
         @summary: rfb stack is reday to send or receive event
         """
         self._isReady = True
+        #first full update is requested by rfb layer
+        self._lastRequest = self._reactor.seconds()
         for observer in self._clientObservers:
             observer.onReady()
+        self.onPolicyChange()
         
     def recvRectangle(self, rectangle, pixelFormat, data):
         """
@@ -583,11 +1008,53 @@ class RFBClientController(RFBClientListener):
                     Main update order type
         @param rectangle: Rectangle type header of packet
         @param pixelFormat: pixelFormat struct of current session
-        @param data: image data
+        @param data: raw pixels of rectangle
         """
         for observer in self._clientObservers:
             observer.onUpdate(rectangle.width.value, rectangle.height.value, rectangle.x.value, rectangle.y.value, pixelFormat, rectangle.encoding, data)
     
+    def recvUpdateDone(self):
+        """
+        @summary: End of frame buffer update, request next one
+        """
+        self._requestPending = False
+        for observer in self._clientObservers:
+            observer.onUpdateDone()
+        self.scheduleUpdateRequest()
+        
+    def recvColourMap(self, firstColour, colours):
+        """
+        @summary: Update colour map
+        @param firstColour: {int} index of first colour
+        @param colours: {list(tuple(int, int, int))} 16 bits red, green, blue
+        """
+        for i, (red, green, blue) in enumerate(colours[:max(0, 256 - firstColour)]):
+            offset = (firstColour + i) * 4
+            self._colourMap[offset:offset + 4] = chr(blue >> 8) + chr(green >> 8) + chr(red >> 8) + "\xff"
+    
+    def recvEndOfContinuousUpdates(self):
+        """
+        @summary: First message advertise extension, others end continuous updates
+        """
+        if not self._continuousUpdatesSupported:
+            self._continuousUpdatesSupported = True
+            self.onPolicyChange()
+            return
+        self._continuousUpdatesEnabled = False
+        self._continuousUpdatesStopping = False
+        self._requestPending = False
+        self.onPolicyChange()
+    
+    def recvCopyRect(self, rectangle, srcX, srcY):
+        """
+        @summary: Receive copy rect order
+        @param rectangle: Rectangle type header of packet (destination)
+        @param srcX: x position of source area
+        @param srcY: y position of source area
+        """
+        for observer in self._clientObservers:
+            observer.onScreenBlt(rectangle.x.value, rectangle.y.value, rectangle.width.value, rectangle.height.value, srcX, srcY)
+    
     def onBell(self):
         """
         @summary: biiiip event
@@ -610,6 +1077,9 @@ class RFBClientController(RFBClientListener):
         if not self._isReady:
             log.debug("Close on non ready layer means authentication error")
             return
+        if not self._requestCall is None and self._requestCall.active():
+            self._requestCall.cancel()
+        self._requestCall = None
         for observer in self._clientObservers:
             observer.onClose()
     
@@ -695,7 +1165,23 @@ class RFBClientObserver(object):
     """
     def __init__(self, controller):
         self._controller = controller
+        self._updateNeeded = True
         self._controller.addClientObserver(self)
+        
+    def isUpdateNeeded(self):
+        """
+        @return: {bool} True if observer want next updates
+        """
+        return self._updateNeeded
+    
+    def setUpdateNeeded(self, needed):
+        """
+        @summary: Pause or resume update requests for this observer
+                    Controller stop requesting when no observer need updates
+        @param needed: {bool}
+        """
+        self._updateNeeded = needed
+        self._controller.onPolicyChange()
     
     def getController(self):
         """
@@ -747,10 +1233,30 @@ class RFBClientObserver(object):
         @param y : y position
         @param pixelFormat : pixel format struct from rfb.types
         @param encoding : encoding struct from rfb.types
-        @param data : in respect of dataFormat and pixelFormat
+        @param data : raw pixels in respect of pixelFormat (encoded rectangles are decoded by RFB layer)
+                        large raw rectangle is received in bands of rows (see RFBClientController.setStreamingBandSize)
         """
         raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "onUpdate", "RFBClientObserver"))
     
+    def onUpdateDone(self):
+        """
+        @summary: All rectangles of a frame buffer update are received
+                    Default do nothing
+        """
+        pass
+        
+    def onScreenBlt(self, destLeft, destTop, width, height, srcLeft, srcTop):
+        """
+        @summary: Copy an area of screen already received (CopyRect encoding)
+        @param destLeft: {int} xmin position of destination
+        @param destTop: {int} ymin position of destination
+        @param width: {int} width of area
+        @param height: {int} height of area
+        @param srcLeft: {int} xmin position of source
+        @param srcTop: {int} ymin position of source
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "onScreenBlt", "RFBClientObserver"))
+    
     def onCutText(self, text):
         """
         @summary: event when server send cut text event
@@ -763,3 +1269,702 @@ class RFBClientObserver(object):
         @summary: event when server send biiip
         """
         raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "onBell", "RFBClientObserver"))
+        
+
+class RFBServer(RawLayer):
+    """
+    @summary: Implement server side of RFB protocol
+    """
+    def __init__(self, listener):
+        """
+        @param listener: {RFBServerListener} listener use to inform client orders
+        """
+        RawLayer.__init__(self)
+        self._serverListener = listener
+        #useful for RFB protocol
+        self._callbackBody = None
+        #max length of body read by expectedBody (None for no limit)
+        self._maxBodyLen = None
+        #client cut text length is client controlled, bigger text close connection
+        self._maxCutTextLen = 1024 * 1024
+        #protocol version negotiated
+        self._version = String(ProtocolVersion.RFB003008)
+        #password of VNC authentication (None for no authentication)
+        self._password = None
+        self._challenge = None
+        #FrameBuffer dim and server pixel format
+        self._serverInit = ServerInit()
+        self._serverName = "rdpy"
+        #client pixel format (server one until client set it)
+        self._pixelFormat = PixelFormat()
+        #zlib stream live as long as connection
+        self._zrleStream = zlib.compressobj()
+        
+    def expectWithHeader(self, expectedHeaderLen, callbackBody, maxBodyLen = None):
+        """
+        @see: RFB.expectWithHeader
+        @param maxBodyLen: {int | None} connection is closed on bigger body
+        """
+        self._callbackBody = callbackBody
+        self._maxBodyLen = maxBodyLen
+        self.expect(expectedHeaderLen, self.expectedBody)
+        
+    def expectedBody(self, data):
+        """
+        @summary: Read 4 bytes length header and wait body
+                    empty body is forwarded immediately
+        @param data: Stream that contains length
+        """
+        bodyLen = UInt32Be()
+        data.readType(bodyLen)
+        if not self._maxBodyLen is None and bodyLen.value > self._maxBodyLen:
+            log.warning("Body of %d bytes exceed limit of %d bytes, close connection"%(bodyLen.value, self._maxBodyLen))
+            #ignore data received until connection is closed
+            self.expect(0)
+            self.close()
+        elif bodyLen.value == 0:
+            self._callbackBody(Stream())
+        else:
+            self.expect(bodyLen.value, self._callbackBody)
+            
+    def getSecurityType(self):
+        """
+        @return: {SecurityType} security imposed by server
+        """
+        return SecurityType.NONE if self._password is None else SecurityType.VNC
+        
+    def connect(self):
+        """
+        @summary: Call when transport layer connection is made
+                    in Server mode -> send protocol version
+        """
+        self.send(self._version)
+        self.expect(12, self.recvProtocolVersion)
+        
+    def recvProtocolVersion(self, data):
+        """
+        @summary: Read protocol version of client
+                    minor version lower than 7 is handled as 3.3, greater than 8 as 3.8
+        @param data: Stream
+        """
+        version = data.getvalue()
+        try:
+            minor = int(version[8:11]) if version.startswith("RFB 003.") else None
+        except ValueError:
+            minor = None
+        if minor is None:
+            log.info("Invalid protocol version %s"%repr(version))
+            self.close()
+            return
+        
+        if minor >= 8:
+            self._version.value = ProtocolVersion.RFB003008
+        elif minor == 7:
+            self._version.value = ProtocolVersion.RFB003007
+        else:
+            self._version.value = ProtocolVersion.RFB003003
+            #server impose security type
+            self.send(UInt32Be(self.getSecurityType()))
+            self.recvSecurityType(None)
+            return
+        
+        self.send((UInt8(1), UInt8(self.getSecurityType())))
+        self.expect(1, self.recvSecurityType)
+        
+    def recvSecurityType(self, data):
+        """
+        @summary: Read security type choosen by client
+        @param data: Stream that contains well formed packet (None for 3.3 version)
+        """
+        if not data is None:
+            securityType = UInt8()
+            data.readType(securityType)
+            if securityType.value != self.getSecurityType():
+                self.sendSecurityFailed("Invalid security type")
+                return
+            
+        if self.getSecurityType() == SecurityType.VNC:
+            self._challenge = os.urandom(16)
+            self.send(String(self._challenge))
+            self.expect(16, self.recvChallengeResponse)
+            return
+        
+        #security result of none is only sent in 3.8 version
+        if self._version.value == ProtocolVersion.RFB003008:
+            self.send(UInt32Be(0))
+        self.expect(1, self.recvClientInit)
+        
+    def recvChallengeResponse(self, data):
+        """
+        @summary: Check response of VNC authentication
+        @param data: Stream that contains well formed packet
+        """
+        if data.getvalue() != encryptChallenge(self._password, self._challenge):
+            self.sendSecurityFailed("Authentication failed")
+            return
+        self.send(UInt32Be(0))
+        self.expect(1, self.recvClientInit)
+        
+    def sendSecurityFailed(self, reason):
+        """
+        @summary: Refuse client and close connection
+        @param reason: {str} reason sent to client (3.8 version)
+        """
+        log.info("Security failed cause to %s"%reason)
+        if self._version.value == ProtocolVersion.RFB003008:
+            self.send((UInt32Be(1), UInt32Be(len(reason)), String(reason)))
+        else:
+            self.send(UInt32Be(1))
+        self.close()
+        
+    def recvClientInit(self, data):
+        """
+        @summary: Read client init (shared flag is ignored, desktop is always shared)
+                    and send server init
+        @param data: Stream that contains well formed packet
+        """
+        self._pixelFormat = copyPixelFormat(self._serverInit.pixelFormat)
+        self.send((self._serverInit, UInt32Be(len(self._serverName)), String(self._serverName)))
+        self.expect(1, self.recvClientOrder)
+        self._serverListener.onReady()
+        
+    def recvClientOrder(self, data):
+        """
+        @summary: Read order receive from client
+        @param data: Stream that contains well formed packet
+        @raise InvalidExpectedDataException: on unknown message type
+        """
+        packetType = UInt8()
+        data.readType(packetType)
+        if packetType.value == ClientToServerMessages.PIXEL_FORMAT:
+            self.expect(19, self.recvPixelFormat)
+        elif packetType.value == ClientToServerMessages.ENCODING:
+            self.expect(3, self.recvSetEncodingsHeader)
+        elif packetType.value == ClientToServerMessages.FRAME_BUFFER_UPDATE_REQUEST:
+            self.expect(9, self.recvFrameBufferUpdateRequest)
+        elif packetType.value == ClientToServerMessages.KEY_EVENT:
+            self.expect(7, self.recvKeyEvent)
+        elif packetType.value == ClientToServerMessages.POINTER_EVENT:
+            self.expect(5, self.recvPointerEvent)
+        elif packetType.value == ClientToServerMessages.CUT_TEXT:
+            self.expect(3, self.recvClientCutTextHeader)
+        elif packetType.value == ClientToServerMessages.ENABLE_CONTINUOUS_UPDATES:
+            self.expect(9, self.recvEnableContinuousUpdates)
+        else:
+            raise InvalidExpectedDataException("Unknown client message type %d"%packetType.value)
+        
+    def recvPixelFormat(self, data):
+        """
+        @summary: Read pixel format of client
+        @param data: Stream that contains well formed packet
+        @raise InvalidExpectedDataException: on pixel format that can't be served
+        """
+        pixelFormat = PixelFormat()
+        data.readType((UInt16Be(), UInt8(), pixelFormat))
+        bitsPerPixel = pixelFormat.BitsPerPixel.value
+        if not bitsPerPixel in [8, 16, 32] or (not pixelFormat.TrueColorFlag.value and bitsPerPixel != 8):
+            raise InvalidExpectedDataException("Unsupported client pixel format %d bits per pixel"%bitsPerPixel)
+        self._pixelFormat = pixelFormat
+        self.expect(1, self.recvClientOrder)
+        self._serverListener.recvPixelFormat(pixelFormat)
+        
+    def recvSetEncodingsHeader(self, data):
+        """
+        @summary: Read number of encodings
+        @param data: Stream that contains well formed packet
+        """
+        nbEncodings = UInt16Be()
+        data.readType((UInt8(), nbEncodings))
+        if nbEncodings.value == 0:
+            self.expect(1, self.recvClientOrder)
+            self._serverListener.recvSetEncodings([])
+        else:
+            self.expect(nbEncodings.value * 4, self.recvSetEncodingsBody)
+        
+    def recvSetEncodingsBody(self, data):
+        """
+        @summary: Read encodings of client in preference order
+        @param data: Stream that contains well formed packet
+        """
+        encodings = []
+        while data.dataLen() > 0:
+            encoding = SInt32Be()
+            data.readType(encoding)
+            encodings.append(encoding.value)
+        self.expect(1, self.recvClientOrder)
+        self._serverListener.recvSetEncodings(encodings)
+        
+    def recvFrameBufferUpdateRequest(self, data):
+        """
+        @summary: Read frame buffer update request
+        @param data: Stream that contains well formed packet
+        """
+        request = FrameBufferUpdateRequest()
+        data.readType(request)
+        self.expect(1, self.recvClientOrder)
+        self._serverListener.recvFrameBufferUpdateRequest(bool(request.incremental.value), request.x.value, request.y.value, request.width.value, request.height.value)
+        
+    def recvEnableContinuousUpdates(self, data):
+        """
+        @summary: Read enable continuous updates message
+        @param data: Stream that contains well formed packet
+        """
+        request = EnableContinuousUpdates()
+        data.readType(request)
+        self.expect(1, self.recvClientOrder)
+        self._serverListener.recvEnableContinuousUpdates(bool(request.enable.value), request.x.value, request.y.value, request.width.value, request.height.value)
+        
+    def recvKeyEvent(self, data):
+        """
+        @summary: Read key event
+        @param data: Stream that contains well formed packet
+        """
+        event = KeyEvent()
+        data.readType(event)
+        self.expect(1, self.recvClientOrder)
+        self._serverListener.recvKeyEvent(bool(event.downFlag.value), event.key.value)
+        
+    def recvPointerEvent(self, data):
+        """
+        @summary: Read pointer event
+        @param data: Stream that contains well formed packet
+        """
+        event = PointerEvent()
+        data.readType(event)
+        self.expect(1, self.recvClientOrder)
+        self._serverListener.recvPointerEvent(event.mask.value, event.x.value, event.y.value)
+        
+    def recvClientCutTextHeader(self, data):
+        """
+        @summary: Read padding of client cut text, length header follow
+        @param data: Stream that contains well formed packet
+        """
+        self.expectWithHeader(4, self.recvClientCutTextBody, self._maxCutTextLen)
+        
+    def recvClientCutTextBody(self, data):
+        """
+        @summary: Read text of client cut text
+        @param data: Stream that contains well formed packet
+        """
+        self.expect(1, self.recvClientOrder)
+        self._serverListener.recvCutText(data.getvalue())
+        
+    def sendFrameBufferUpdate(self, rectangles):
+        """
+        @summary: Send frame buffer update
+        @param rectangles: {list(tuple(int, int, int, int, int, str))} x, y, width, height, encoding and encoded data
+                            ZRLE data are deflated here with zlib stream of connection
+        """
+        message = [UInt8(ServerToClientMessages.FRAME_BUFFER_UPDATE), UInt8(), UInt16Be(len(rectangles))]
+        for x, y, width, height, encoding, data in rectangles:
+            header = Rectangle()
+            header.x.value, header.y.value, header.width.value, header.height.value, header.encoding.value = x, y, width, height, encoding
+            if encoding == Encoding.ZRLE:
+                data = encoder.deflateZRLE(data, self._zrleStream)
+            message += [header, String(data)]
+        self.send(tuple(message))
+        
+    def sendColourMap(self, firstColour, colours):
+        """
+        @summary: Send colour map entries
+        @param firstColour: {int} index of first colour
+        @param colours: {list(tuple(int, int, int))} 16 bits red, green, blue
+        """
+        self.send((UInt8(ServerToClientMessages.SET_COLOUR_MAP_ENTRIES), UInt8(), UInt16Be(firstColour), UInt16Be(len(colours)), [(UInt16Be(red), UInt16Be(green), UInt16Be(blue)) for red, green, blue in colours]))
+        
+    def sendEndOfContinuousUpdates(self):
+        """
+        @summary: Advertise ContinuousUpdates extension or confirm end of continuous updates
+        """
+        self.send(UInt8(ServerToClientMessages.END_OF_CONTINUOUS_UPDATES))
+        
+    def sendBell(self):
+        """
+        @summary: Send bell to client
+        """
+        self.send(UInt8(ServerToClientMessages.BELL))
+        
+    def sendServerCutText(self, text):
+        """
+        @summary: Send cut text to client
+        @param text: {str} text of cut text event
+        """
+        self.send((UInt8(ServerToClientMessages.CUT_TEXT), ClientCutText(text)))
+        
+class RFBServerListener(object):
+    """
+    @summary: Interface use to expose event receive from RFB server layer
+    """
+    def onReady(self):
+        """
+        @summary: Handshake is done, client will send orders
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "onReady", "RFBServerListener"))
+    
+    def recvPixelFormat(self, pixelFormat):
+        """
+        @summary: Client set its pixel format
+        @param pixelFormat: {PixelFormat}
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "recvPixelFormat", "RFBServerListener"))
+    
+    def recvSetEncodings(self, encodings):
+        """
+        @summary: Client set encodings it can decode
+        @param encodings: {list(int)} encodings and pseudo encodings in preference order
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "recvSetEncodings", "RFBServerListener"))
+    
+    def recvFrameBufferUpdateRequest(self, incremental, x, y, width, height):
+        """
+        @summary: Client request an update of an area
+        @param incremental: {bool} only changes since last update are requested
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "recvFrameBufferUpdateRequest", "RFBServerListener"))
+    
+    def recvEnableContinuousUpdates(self, enable, x, y, width, height):
+        """
+        @summary: Client enable or disable continuous updates of an area
+        @param enable: {bool}
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "recvEnableContinuousUpdates", "RFBServerListener"))
+    
+    def recvKeyEvent(self, isDown, key):
+        """
+        @param isDown: {bool} key is pressed
+        @param key: {int} keysym of key
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "recvKeyEvent", "RFBServerListener"))
+    
+    def recvPointerEvent(self, mask, x, y):
+        """
+        @param mask: {int} pressed buttons (Pointer)
+        @param x: {int} x coordinate of mouse pointer
+        @param y: {int} y coordinate of mouse pointer
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "recvPointerEvent", "RFBServerListener"))
+    
+    def recvCutText(self, text):
+        """
+        @param text: {str} text of client cut text
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "recvCutText", "RFBServerListener"))
+    
+class RFBServerController(RFBServerListener):
+    """
+    @summary: Serve a desktop shared with others controllers
+                Damage of desktop is kept until client request an incremental update,
+                only damaged rectangles of requested area are sent
+    """
+    #encoders supported by server
+    ENCODERS = {
+        Encoding.RAW : encoder.encodeRaw,
+        Encoding.HEXTILE : encoder.encodeHextile,
+        Encoding.ZRLE : encoder.encodeZRLE,
+    }
+    
+    def __init__(self, desktop, password = None, reactor = None):
+        """
+        @param desktop: {desktop.Desktop} desktop served
+        @param password: {str} password of VNC authentication (None for no authentication)
+        @param reactor: twisted reactor use to coalesce damage (default reactor if None)
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+        self._desktop = desktop
+        self._serverObservers = []
+        self._rfbLayer = RFBServer(self)
+        self._rfbLayer._password = password
+        self._rfbLayer._serverName = desktop.getName()
+        self._rfbLayer._serverInit.width.value = desktop.getWidth()
+        self._rfbLayer._serverInit.height.value = desktop.getHeight()
+        self._rfbLayer._serverInit.pixelFormat = createPixelFormat(32)
+        self._isReady = False
+        #encoding choosen in client encodings
+        self._encoding = Encoding.RAW
+        #areas not yet sent to client
+        self._damage = DamageRegion()
+        #pending incremental update request
+        self._request = None
+        #continuous updates area
+        self._continuousUpdatesSupported = False
+        self._continuousRegion = None
+        self._updateCall = None
+        
+    def getProtocol(self):
+        """
+        @return: RFB layer build by controller
+        """
+        return self._rfbLayer
+    
+    def getDesktop(self):
+        """
+        @return: {desktop.Desktop} desktop served
+        """
+        return self._desktop
+    
+    def getEncoding(self):
+        """
+        @return: {Encoding} encoding use for update
+        """
+        return self._encoding
+    
+    def getPixelFormat(self):
+        """
+        @return: {PixelFormat} pixel format of client
+        """
+        return self._rfbLayer._pixelFormat
+        
+    def addServerObserver(self, observer):
+        """
+        @summary: Add new observer for this protocol
+        @param observer: {RFBServerObserver} new observer
+        """
+        self._serverObservers.append(observer)
+        
+    def onReady(self):
+        """
+        @summary: Handshake is done, start to follow damage of desktop
+        """
+        self._isReady = True
+        self._desktop.addListener(self)
+        for observer in self._serverObservers:
+            observer.onReady()
+        
+    def onClose(self):
+        """
+        @summary: Connection is closed
+        """
+        if not self._isReady:
+            return
+        self._isReady = False
+        self._desktop.removeListener(self)
+        if not self._updateCall is None and self._updateCall.active():
+            self._updateCall.cancel()
+        self._updateCall = None
+        for observer in self._serverObservers:
+            observer.onClose()
+            
+    def recvPixelFormat(self, pixelFormat):
+        """
+        @summary: Client set its pixel format, send colour map if needed
+        @param pixelFormat: {PixelFormat}
+        """
+        if not pixelFormat.TrueColorFlag.value:
+            self._rfbLayer.sendColourMap(0, encoder.getColourMapEntries())
+        
+    def recvSetEncodings(self, encodings):
+        """
+        @summary: Choose first encoding supported by server in client preference order
+        @param encodings: {list(int)} encodings in preference order
+        """
+        self._encoding = Encoding.RAW
+        for encoding in encodings:
+            if encoding in self.ENCODERS:
+                self._encoding = encoding
+                break
+        #first end of continuous updates advertise extension
+        if Encoding.CONTINUOUS_UPDATES in encodings and not self._continuousUpdatesSupported:
+            self._continuousUpdatesSupported = True
+            self._rfbLayer.sendEndOfContinuousUpdates()
+            
+    def clip(self, x, y, width, height):
+        """
+        @return: {tuple(int, int, int, int) | None} area inside desktop
+        """
+        return intersect((x, y, width, height), (0, 0, self._desktop.getWidth(), self._desktop.getHeight()))
+        
+    def recvFrameBufferUpdateRequest(self, incremental, x, y, width, height):
+        """
+        @summary: Non incremental request damage whole area,
+                    incremental request wait damage of area
+        """
+        area = self.clip(x, y, width, height)
+        if area is None:
+            #nothing to send, answer an empty update
+            self._rfbLayer.sendFrameBufferUpdate([])
+            return
+        if not incremental:
+            self._damage.add(*area)
+        self._request = area
+        self.scheduleUpdate()
+        
+    def recvEnableContinuousUpdates(self, enable, x, y, width, height):
+        """
+        @summary: Push damage of area without request
+        """
+        if not enable:
+            self._continuousRegion = None
+            self._rfbLayer.sendEndOfContinuousUpdates()
+            return
+        self._continuousRegion = self.clip(x, y, width, height)
+        self.scheduleUpdate()
+        
+    def onDamage(self, x, y, width, height):
+        """
+        @summary: Desktop has changed
+        """
+        self._damage.add(x, y, width, height)
+        self.scheduleUpdate()
+        
+    def scheduleUpdate(self):
+        """
+        @summary: Send update at end of current reactor iteration
+                    all damage drawn in same iteration are sent in one update
+        """
+        if not self._updateCall is None or (self._request is None and self._continuousRegion is None):
+            return
+        self._updateCall = self._reactor.callLater(0, self.sendUpdate)
+        
+    def sendUpdate(self):
+        """
+        @summary: Send damaged rectangles of requested area
+        """
+        self._updateCall = None
+        if not self._isReady:
+            return
+        rectangles = []
+        for area in [self._continuousRegion, self._request]:
+            if not area is None:
+                rectangles += self._damage.pop(*area)
+        if len(rectangles) == 0:
+            return
+        
+        self._request = None
+        pixelFormat = self.getPixelFormat()
+        formatKey = encoder.getFormatKey(pixelFormat)
+        encode = self.ENCODERS[self._encoding]
+        self._rfbLayer.sendFrameBufferUpdate([(x, y, width, height, self._encoding, self._desktop.encode(x, y, width, height, encode, pixelFormat, formatKey)) for x, y, width, height in rectangles])
+        
+    def sendBell(self):
+        """
+        @summary: Send bell to client
+        """
+        if self._isReady:
+            self._rfbLayer.sendBell()
+            
+    def sendCutText(self, text):
+        """
+        @summary: Send cut text to client
+        @param text: {str}
+        """
+        if self._isReady:
+            self._rfbLayer.sendServerCutText(text)
+        
+    def recvKeyEvent(self, isDown, key):
+        """
+        @summary: Forward key event to observers
+        """
+        for observer in self._serverObservers:
+            observer.onKeyEvent(isDown, key)
+            
+    def recvPointerEvent(self, mask, x, y):
+        """
+        @summary: Forward pointer event to observers
+        """
+        for observer in self._serverObservers:
+            observer.onPointerEvent(mask, x, y)
+            
+    def recvCutText(self, text):
+        """
+        @summary: Forward cut text to observers
+        """
+        for observer in self._serverObservers:
+            observer.onCutText(text)
+            
+    def close(self):
+        """
+        @summary: close rfb stack
+        """
+        self._rfbLayer.close()
+        
+class ServerFactory(RawLayerServerFactory):
+    """
+    @summary: Twisted Factory of RFB server, all connections share one desktop
+    """
+    def __init__(self, desktop, password = None):
+        """
+        @param desktop: {desktop.Desktop} desktop served
+        @param password: {str} password of VNC authentication (None for no authentication)
+        """
+        self._desktop = desktop
+        self._password = password
+        
+    def buildRawLayer(self, addr):
+        """
+        @summary: Function call by twisted on connection
+        @param addr: address of client
+        """
+        controller = RFBServerController(self._desktop, self._password)
+        self.buildObserver(controller, addr)
+        return controller.getProtocol()
+    
+    def connectionLost(self, rfblayer, reason):
+        """
+        @param rfblayer: rfblayer that cause connectionLost event
+        @param reason: twisted reason
+        """
+        rfblayer._serverListener.onClose()
+        
+    def buildObserver(self, controller, addr):
+        """
+        @summary: Build observer use for connection
+        @param controller: {RFBServerController}
+        @param addr: address of client
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "buildObserver", "ServerFactory"))
+    
+class RFBServerObserver(object):
+    """
+    @summary: RFB server protocol observer
+    """
+    def __init__(self, controller):
+        """
+        @param controller: {RFBServerController}
+        """
+        self._controller = controller
+        self._controller.addServerObserver(self)
+        
+    def getController(self):
+        """
+        @return: RFB controller use by observer
+        """
+        return self._controller
+    
+    def onReady(self):
+        """
+        @summary: Client is connected and authenticated
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "onReady", "RFBServerObserver"))
+    
+    def onClose(self):
+        """
+        @summary: On close event
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "onClose", "RFBServerObserver"))
+    
+    def onKeyEvent(self, isDown, key):
+        """
+        @summary: Key event of client
+        @param isDown: {bool} key is pressed
+        @param key: {int} keysym of key
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "onKeyEvent", "RFBServerObserver"))
+    
+    def onPointerEvent(self, mask, x, y):
+        """
+        @summary: Pointer event of client
+        @param mask: {int} pressed buttons (Pointer)
+        @param x: {int} x coordinate of mouse pointer
+        @param y: {int} y coordinate of mouse pointer
+        """
+        raise CallPureVirtualFuntion("%s:%s defined by interface %s"%(self.__class__, "onPointerEvent", "RFBServerObserver"))
+    
+    def onCutText(self, text):
+        """
+        @summary: Cut text of client
+                    Default do nothing
+        @param text: {str}
+        """
+        pass
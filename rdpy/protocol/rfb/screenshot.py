@@ -0,0 +1,215 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Headless VNC screenshot job for scan engine
+"""
+
+import os
+from twisted.internet import defer
+from rdpy.core import scanner
+from rdpy.ui.framebuffer import FrameBuffer
+import rdpy.core.log as log
+import rfb
+
+class RFBScreenshotObserver(rfb.RFBClientObserver):
+    """
+    @summary: Draw updates in frame buffer and close connection when screen is idle
+    """
+    def __init__(self, controller, job):
+        """
+        @param controller: {RFBClientController}
+        @param job: {RFBScreenshotJob}
+        """
+        rfb.RFBClientObserver.__init__(self, controller)
+        self._job = job
+        self._idleCall = None
+        
+    def onReady(self):
+        """
+        @see: rfb.RFBClientObserver.onReady
+        """
+        width, height = self._controller.getScreen()
+        self._job._frameBuffer = FrameBuffer(width, height)
+        
+    def onUpdate(self, width, height, x, y, pixelFormat, encoding, data):
+        """
+        @see: rfb.RFBClientObserver.onUpdate
+        """
+        try:
+            self._job._frameBuffer.drawRFBPixels(x, y, width, height, pixelFormat, data, self._controller.getColourMap())
+        except ValueError as e:
+            log.error("Receive image in bad format : %s"%e)
+            return
+        self._job._updates += 1
+        
+        #screenshot when no update since idle timeout
+        if self._idleCall is None:
+            self._idleCall = self._job._reactor.callLater(self._job._factory._idleTimeout, self._controller.close)
+        elif self._idleCall.active():
+            self._idleCall.reset(self._job._factory._idleTimeout)
+            
+    def onUpdateDone(self):
+        """
+        @summary: First update answer the full screen request, no need of more
+        @see: rfb.RFBClientObserver.onUpdateDone
+        """
+        self.setUpdateNeeded(False)
+        
+    def onScreenBlt(self, destLeft, destTop, width, height, srcLeft, srcTop):
+        """
+        @see: rfb.RFBClientObserver.onScreenBlt
+        """
+        self._job._frameBuffer.screenBlt(destLeft, destTop, width, height, srcLeft, srcTop)
+        
+    def onClose(self):
+        """
+        @see: rfb.RFBClientObserver.onClose
+        """
+        if not self._idleCall is None and self._idleCall.active():
+            self._idleCall.cancel()
+            
+    def onCutText(self, text):
+        """
+        @see: rfb.RFBClientObserver.onCutText
+        """
+        pass
+    
+    def onBell(self):
+        """
+        @see: rfb.RFBClientObserver.onBell
+        """
+        pass
+    
+class RFBScreenshotClientFactory(rfb.ClientFactory):
+    """
+    @summary: Twisted factory of one screenshot job
+    """
+    def __init__(self, job):
+        """
+        @param job: {RFBScreenshotJob}
+        """
+        self._job = job
+        
+    def buildObserver(self, controller, addr):
+        """
+        @see: rfb.ClientFactory.buildObserver
+        """
+        controller.setPassword(self._job._factory._password)
+        controller.setPixelFormat(self._job._factory._bitsPerPixel)
+        return RFBScreenshotObserver(controller, self._job)
+    
+    def clientConnectionLost(self, connector, reason):
+        """
+        @summary: end of screenshot
+        """
+        self._job.onEnd(reason)
+        
+    def clientConnectionFailed(self, connector, reason):
+        """
+        @summary: cannot connect to target
+        """
+        self._job.onEnd(reason)
+        
+class RFBScreenshotJob(scanner.ScanJob):
+    """
+    @summary: Screenshot of one target
+    """
+    def __init__(self, factory, host, port):
+        """
+        @param factory: {RFBScreenshotJobFactory}
+        @param host: {str} address of target
+        @param port: {int} port of target
+        """
+        self._factory = factory
+        self._reactor = factory._reactor
+        self._host = host
+        self._port = port
+        #screen size is known after handshake
+        self._frameBuffer = None
+        self._updates = 0
+        self._connector = None
+        self._deferred = None
+        
+    def start(self):
+        """
+        @see: scanner.ScanJob.start
+        """
+        self._deferred = defer.Deferred()
+        self._connector = self._reactor.connectTCP(self._host, self._port, RFBScreenshotClientFactory(self), timeout = self._factory._connectTimeout)
+        return self._deferred
+    
+    def cancel(self):
+        """
+        @see: scanner.ScanJob.cancel
+        """
+        self._deferred = None
+        if not self._connector is None:
+            self._connector.disconnect()
+            
+    def onEnd(self, reason):
+        """
+        @summary: connection is closed, save screen if received
+        @param reason: {Failure} twisted reason
+        """
+        if self._deferred is None:
+            return
+        d, self._deferred = self._deferred, None
+        
+        if self._updates == 0:
+            d.errback(reason)
+            return
+        
+        path = os.path.join(self._factory._path, "%s_%d.png"%(self._host, self._port))
+        try:
+            self._frameBuffer.save(path)
+        except Exception as e:
+            d.errback(e)
+            return
+        
+        d.callback({ "image" : path, "width" : self._frameBuffer.getWidth(), "height" : self._frameBuffer.getHeight(), "updates" : self._updates })
+        self._frameBuffer = None
+        
+class RFBScreenshotJobFactory(scanner.ScanJobFactory):
+    """
+    @summary: Build screenshot jobs for scanner
+    """
+    def __init__(self, path, password = "", idleTimeout = 1.0, connectTimeout = 10, bitsPerPixel = 32, reactor = None):
+        """
+        @param path: {str} output directory of screenshots
+        @param password: {str} password for VNC authentication
+        @param idleTimeout: {float} take screenshot after idleTimeout s without update
+        @param connectTimeout: {int} TCP connection timeout in seconds
+        @param bitsPerPixel: {int} pixel format requested to server (32, 16 or 8), 16 halves bandwidth
+        @param reactor: twisted reactor (default reactor if None)
+        """
+        if reactor is None:
+            from twisted.internet import reactor
+        self._reactor = reactor
+        self._path = path
+        self._password = password
+        self._idleTimeout = idleTimeout
+        self._connectTimeout = connectTimeout
+        self._bitsPerPixel = bitsPerPixel
+        
+    def buildJob(self, host, port):
+        """
+        @see: scanner.ScanJobFactory.buildJob
+        """
+        return RFBScreenshotJob(self, host, port)
@@ -0,0 +1,61 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+DES block cipher in ECB mode used by NTLMv1 and VNC authentication
+Use native implementation of cryptography (pyOpenSSL dependency) when available
+Fallback on pure python pyDes
+"""
+
+import rdpy.security.pyDes as pyDes
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    from cryptography.hazmat.backends import default_backend
+    _backend = default_backend()
+    
+    def _encrypt(key, data):
+        #triple des with 64 bits key is single des (K1 = K2 = K3)
+        encryptor = Cipher(algorithms.TripleDES(key), modes.ECB(), backend = _backend).encryptor()
+        return encryptor.update(data) + encryptor.finalize()
+    
+    BACKEND = "cryptography"
+except Exception:
+    def _encrypt(key, data):
+        return pyDes.des(key).encrypt(data)
+    
+    BACKEND = "pyDes"
+
+def encrypt(key, data):
+    """
+    @summary: encrypt data with DES in ECB mode
+    @param key: {str} key of 8 bytes (parity bits are ignored)
+    @param data: {str} data with size multiple of 8 bytes
+    @return: {str} encrypted data
+    """
+    return _encrypt(key, data)
+
+def pyEncrypt(key, data):
+    """
+    @summary: encrypt data with pure python implementation
+    @param key: {str} key of 8 bytes (parity bits are ignored)
+    @param data: {str} data with size multiple of 8 bytes
+    @return: {str} encrypted data
+    """
+    return pyDes.des(key).encrypt(data)
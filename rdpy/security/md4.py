@@ -0,0 +1,82 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Pure python MD4 message digest
+Use when hashlib is build without md4 provider (OpenSSL 3)
+@see: https://tools.ietf.org/html/rfc1320
+"""
+
+import struct
+
+def _rotl(x, n):
+    """
+    @summary: rotate left 32 bits integer
+    """
+    x &= 0xffffffff
+    return ((x << n) | (x >> (32 - n))) & 0xffffffff
+
+def _F(x, y, z):
+    return (x & y) | (~x & z)
+
+def _G(x, y, z):
+    return (x & y) | (x & z) | (y & z)
+
+def _H(x, y, z):
+    return x ^ y ^ z
+
+def digest(message):
+    """
+    @summary: compute MD4 digest
+    @param message: {str} input data
+    @return: {str} 16 bytes digest
+    """
+    length = len(message)
+    message += "\x80" + "\x00" * ((55 - length) % 64) + struct.pack("<Q", (length * 8) & 0xffffffffffffffff)
+    
+    h = [0x67452301, 0xefcdab89, 0x98badcfe, 0x10325476]
+    
+    for offset in range(0, len(message), 64):
+        X = struct.unpack("<16I", message[offset:offset + 64])
+        a, b, c, d = h
+        
+        #round 1
+        for i in range(0, 16, 4):
+            a = _rotl(a + _F(b, c, d) + X[i], 3)
+            d = _rotl(d + _F(a, b, c) + X[i + 1], 7)
+            c = _rotl(c + _F(d, a, b) + X[i + 2], 11)
+            b = _rotl(b + _F(c, d, a) + X[i + 3], 19)
+        
+        #round 2
+        for i in range(4):
+            a = _rotl(a + _G(b, c, d) + X[i] + 0x5a827999, 3)
+            d = _rotl(d + _G(a, b, c) + X[i + 4] + 0x5a827999, 5)
+            c = _rotl(c + _G(d, a, b) + X[i + 8] + 0x5a827999, 9)
+            b = _rotl(b + _G(c, d, a) + X[i + 12] + 0x5a827999, 13)
+        
+        #round 3
+        for i in [0, 2, 1, 3]:
+            a = _rotl(a + _H(b, c, d) + X[i] + 0x6ed9eba1, 3)
+            d = _rotl(d + _H(a, b, c) + X[i + 8] + 0x6ed9eba1, 9)
+            c = _rotl(c + _H(d, a, b) + X[i + 4] + 0x6ed9eba1, 11)
+            b = _rotl(b + _H(c, d, a) + X[i + 12] + 0x6ed9eba1, 15)
+        
+        h = [(x + y) & 0xffffffff for x, y in zip(h, [a, b, c, d])]
+        
+    return struct.pack("<4I", *h)
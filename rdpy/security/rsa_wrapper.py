@@ -30,6 +30,23 @@ def newkeys(size):
     """
     return rsa.newkeys(size)
 
+def exportKey(privateKey):
+    """
+    @summary: serialize private key generated by newkeys
+    @param privateKey: {rsa.PrivateKey}
+    @return: {str} PEM encoded PKCS#1 key
+    """
+    return privateKey.save_pkcs1()
+
+def importKey(data):
+    """
+    @summary: load key pair serialized by exportKey
+    @param data: {str} PEM encoded PKCS#1 key
+    @return: {tuple(rsa.PublicKey, rsa.PrivateKey)}
+    """
+    privateKey = rsa.PrivateKey.load_pkcs1(data)
+    return rsa.PublicKey(privateKey.n, privateKey.e), privateKey
+
 def PublicKey(e, n):
     """
     @param e: {long | str}public exponent
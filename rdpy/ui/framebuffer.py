@@ -0,0 +1,294 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Headless frame buffer
+Keep screen in memory without Qt and save it as PNG
+Pixels are stored as 32 bits BGRX (same as Qt RGB32 on little endian)
+"""
+
+import struct, zlib, array
+import rle, rfbcodec
+
+#bytes per pixel of RDP bitmaps
+_BYTES_PER_PIXEL_ = { 15 : 2, 16 : 2, 24 : 3, 32 : 4 }
+
+#lazy lookup tables 16 bits pixel -> BGRX
+_LOOKUP_TABLE_ = {}
+
+def lookupTable(bitsPerPixel):
+    """
+    @summary: build conversion table of 15 or 16 bits pixels
+    @param bitsPerPixel: {int} 15 (RGB555) or 16 (RGB565)
+    @return: {list(str)} BGRX pixel indexed by 16 bits pixel
+    """
+    if not bitsPerPixel in _LOOKUP_TABLE_:
+        table = []
+        for pixel in range(65536):
+            if bitsPerPixel == 15:
+                r, g, b = (pixel >> 7) & 0xf8, (pixel >> 2) & 0xf8, (pixel << 3) & 0xf8
+            else:
+                r, g, b = (pixel >> 8) & 0xf8, (pixel >> 3) & 0xfc, (pixel << 3) & 0xf8
+            table.append(chr(b) + chr(g) + chr(r) + "\xff")
+        _LOOKUP_TABLE_[bitsPerPixel] = table
+    return _LOOKUP_TABLE_[bitsPerPixel]
+
+def decodeRDPBitmap(width, height, bitsPerPixel, isCompress, data):
+    """
+    @summary: decode RDP bitmap into top down BGRX pixels
+    @param width: {int} width of bitmap
+    @param height: {int} height of bitmap
+    @param bitsPerPixel: {int} 15, 16, 24 or 32
+    @param isCompress: {bool} use RLE compression
+    @param data: {str} bitmap data
+    @return: {bytearray} width * height * 4 bytes
+    @raise ValueError: unsupported format
+    """
+    if not bitsPerPixel in _BYTES_PER_PIXEL_:
+        raise ValueError("unsupported bitmap format %d bpp"%bitsPerPixel)
+    bytesPerPixel = _BYTES_PER_PIXEL_[bitsPerPixel]
+    stride = width * bytesPerPixel
+    
+    if isCompress:
+        buf = bytearray(stride * height)
+        rle.bitmap_decompress(buf, width, height, data, bytesPerPixel)
+    else:
+        #uncompressed bitmap are bottom up
+        buf = bytearray(stride * height)
+        for y in range(height):
+            buf[y * stride:(y + 1) * stride] = data[(height - y - 1) * stride:(height - y) * stride]
+    
+    if bytesPerPixel == 4:
+        return buf
+    
+    if bytesPerPixel == 3:
+        pixels = bytearray("\xff" * (width * height * 4))
+        pixels[0::4] = buf[0::3]
+        pixels[1::4] = buf[1::3]
+        pixels[2::4] = buf[2::3]
+        return pixels
+    
+    table = lookupTable(bitsPerPixel)
+    return bytearray("".join([table[pixel] for pixel in array.array("H", str(buf))]))
+
+def encodeRDPBitmap(width, height, bitsPerPixel, pixels):
+    """
+    @summary: encode top down BGRX pixels into uncompressed RDP bitmap
+    @param width: {int} width of bitmap (line size must be multiple of 4 bytes)
+    @param height: {int} height of bitmap
+    @param bitsPerPixel: {int} 15, 16, 24 or 32
+    @param pixels: {bytearray} width * height * 4 bytes
+    @return: {str} bottom up bitmap data
+    @raise ValueError: unsupported format
+    """
+    if not bitsPerPixel in _BYTES_PER_PIXEL_:
+        raise ValueError("unsupported bitmap format %d bpp"%bitsPerPixel)
+    bytesPerPixel = _BYTES_PER_PIXEL_[bitsPerPixel]
+    
+    if bytesPerPixel == 4:
+        buf = bytearray(pixels)
+    elif bytesPerPixel == 3:
+        buf = bytearray(width * height * 3)
+        buf[0::3] = pixels[0::4]
+        buf[1::3] = pixels[1::4]
+        buf[2::3] = pixels[2::4]
+    else:
+        b = array.array("H", [x >> 3 for x in pixels[0::4]])
+        if bitsPerPixel == 15:
+            g = [(x >> 3) << 5 for x in pixels[1::4]]
+            r = [(x >> 3) << 10 for x in pixels[2::4]]
+        else:
+            g = [(x >> 2) << 5 for x in pixels[1::4]]
+            r = [(x >> 3) << 11 for x in pixels[2::4]]
+        for i in range(len(b)):
+            b[i] |= g[i] | r[i]
+        buf = bytearray(b.tostring())
+    
+    stride = width * bytesPerPixel
+    return "".join([str(buf[(height - y - 1) * stride:(height - y) * stride]) for y in range(height)])
+    
+def decodeRFBPixels(width, height, pixelFormat, data, colourMap = None):
+    """
+    @summary: convert RFB pixels into top down BGRX pixels
+                colour map pixels are translated channel by channel,
+                true colour pixels are converted by rfbcodec extension (copied if already BGRX)
+    @param width: {int} width of rectangle
+    @param height: {int} height of rectangle
+    @param pixelFormat: {rfb.PixelFormat} pixel format of session
+    @param data: {str} raw pixels
+    @param colourMap: {bytearray} BGRX colours (256 entries) for colour map pixel format
+    @return: {bytearray} width * height * 4 bytes
+    @raise ValueError: unsupported format
+    """
+    bitsPerPixel = pixelFormat.BitsPerPixel.value
+    if not bitsPerPixel in [8, 16, 32]:
+        raise ValueError("unsupported RFB pixel format %d bpp"%bitsPerPixel)
+    if len(data) != width * height * bitsPerPixel / 8:
+        raise ValueError("invalid RFB pixels length")
+    
+    if pixelFormat.TrueColorFlag.value:
+        #same layout as frame buffer
+        if bitsPerPixel == 32 and (pixelFormat.RedMax.value, pixelFormat.GreenMax.value, pixelFormat.BlueMax.value) == (255, 255, 255) and (pixelFormat.RedShift.value, pixelFormat.GreenShift.value, pixelFormat.BlueShift.value) == ((8, 16, 24) if pixelFormat.BigEndianFlag.value else (16, 8, 0)):
+            return bytearray(data)
+        return bytearray(rfbcodec.pixels_to_bgrx(data, (bitsPerPixel / 8, int(bool(pixelFormat.BigEndianFlag.value)),
+                                                        pixelFormat.RedMax.value, pixelFormat.GreenMax.value, pixelFormat.BlueMax.value,
+                                                        pixelFormat.RedShift.value, pixelFormat.GreenShift.value, pixelFormat.BlueShift.value)))
+    
+    if bitsPerPixel != 8:
+        raise ValueError("unsupported RFB colour map with %d bpp"%bitsPerPixel)
+    if colourMap is None:
+        raise ValueError("colour map pixel format without colour map")
+    colours = str(colourMap)
+    pixels = bytearray(width * height * 4)
+    for channel in range(4):
+        pixels[channel::4] = data.translate(colours[channel::4])
+    return pixels
+    
+class FrameBuffer(object):
+    """
+    @summary: Screen image in memory
+    """
+    def __init__(self, width, height):
+        """
+        @param width: {int} width of screen
+        @param height: {int} height of screen
+        """
+        self._width = width
+        self._height = height
+        self._data = bytearray(width * height * 4)
+        
+    def getWidth(self):
+        """
+        @return: {int} width of screen
+        """
+        return self._width
+    
+    def getHeight(self):
+        """
+        @return: {int} height of screen
+        """
+        return self._height
+    
+    def getPixels(self):
+        """
+        @return: {bytearray} top down BGRX pixels of screen
+        """
+        return self._data
+    
+    def getPixel(self, x, y):
+        """
+        @return: {tuple(int, int, int)} red, green and blue of pixel
+        """
+        offset = (y * self._width + x) * 4
+        return self._data[offset + 2], self._data[offset + 1], self._data[offset]
+    
+    def drawPixels(self, x, y, width, height, pixels, stride = None):
+        """
+        @summary: copy BGRX pixels into screen, clip outside area
+        @param x: {int} left position
+        @param y: {int} top position
+        @param width: {int} width of copied area
+        @param height: {int} height of copied area
+        @param pixels: {bytearray} top down BGRX pixels
+        @param stride: {int} pixels per line of source (default width)
+        """
+        stride = (stride or width) * 4
+        srcX = max(0, -x)
+        srcY = max(0, -y)
+        width = min(width, self._width - x) - srcX
+        height = min(height, self._height - y) - srcY
+        if width <= 0 or height <= 0:
+            return
+        x, y = x + srcX, y + srcY
+        lineSize = width * 4
+        for i in range(height):
+            src = (srcY + i) * stride + srcX * 4
+            dst = ((y + i) * self._width + x) * 4
+            self._data[dst:dst + lineSize] = pixels[src:src + lineSize]
+            
+    def drawRDPBitmap(self, destLeft, destTop, destRight, destBottom, width, height, bitsPerPixel, isCompress, data):
+        """
+        @summary: draw bitmap update (same parameters as RDPClientObserver.onUpdate)
+        """
+        pixels = decodeRDPBitmap(width, height, bitsPerPixel, isCompress, data)
+        self.drawPixels(destLeft, destTop, min(width, destRight - destLeft + 1), min(height, destBottom - destTop + 1), pixels, width)
+        
+    def drawRFBPixels(self, x, y, width, height, pixelFormat, data, colourMap = None):
+        """
+        @summary: draw RFB rectangle (same parameters as RFBClientObserver.onUpdate)
+        @param colourMap: {bytearray} BGRX colours for colour map pixel format
+        """
+        self.drawPixels(x, y, width, height, decodeRFBPixels(width, height, pixelFormat, data, colourMap))
+        
+    def screenBlt(self, destLeft, destTop, width, height, srcLeft, srcTop):
+        """
+        @summary: Copy an area of screen in place (source and destination may overlap)
+        @param destLeft: {int} xmin position of destination
+        @param destTop: {int} ymin position of destination
+        @param width: {int} width of copied area
+        @param height: {int} height of copied area
+        @param srcLeft: {int} xmin position of source
+        @param srcTop: {int} ymin position of source
+        """
+        #clip source and destination inside screen
+        dx = max(0, -destLeft, -srcLeft)
+        dy = max(0, -destTop, -srcTop)
+        destLeft, srcLeft, width = destLeft + dx, srcLeft + dx, width - dx
+        destTop, srcTop, height = destTop + dy, srcTop + dy, height - dy
+        width = min(width, self._width - max(destLeft, srcLeft))
+        height = min(height, self._height - max(destTop, srcTop))
+        if width <= 0 or height <= 0:
+            return
+        
+        lines = range(0, height)
+        #copy from bottom when area move down to not overwrite source
+        if destTop > srcTop:
+            lines.reverse()
+        lineSize = width * 4
+        for i in lines:
+            src = ((srcTop + i) * self._width + srcLeft) * 4
+            dst = ((destTop + i) * self._width + destLeft) * 4
+            self._data[dst:dst + lineSize] = self._data[src:src + lineSize]
+            
+    def toPNG(self):
+        """
+        @summary: encode screen as 24 bits PNG image
+        @return: {str} PNG file content
+        """
+        rgb = bytearray(self._width * self._height * 3)
+        rgb[0::3] = self._data[2::4]
+        rgb[1::3] = self._data[1::4]
+        rgb[2::3] = self._data[0::4]
+        
+        lineSize = self._width * 3
+        #filter type 0 on each line
+        raw = "".join(["\x00" + str(rgb[y * lineSize:(y + 1) * lineSize]) for y in range(self._height)])
+        
+        def chunk(tag, data):
+            return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+        
+        return "\x89PNG\r\n\x1a\n" + chunk("IHDR", struct.pack(">IIBBBBB", self._width, self._height, 8, 2, 0, 0, 0)) + chunk("IDAT", zlib.compress(raw, 6)) + chunk("IEND", "")
+    
+    def save(self, path):
+        """
+        @summary: write screen in PNG file
+        @param path: {str} file path
+        """
+        with open(path, "wb") as f:
+            f.write(self.toPNG())
@@ -0,0 +1,139 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+Pre-render scenario (rss file) for a screen size and a color depth
+Bitmaps are decoded, centered, clipped and encoded as uncompressed bitmap of target color depth
+Rendered file can be sent as is by honeypot (see rss.ScenarioCache)
+"""
+
+import os
+from rdpy.core import rss
+from rdpy.ui.framebuffer import FrameBuffer, decodeRDPBitmap, encodeRDPBitmap
+
+#max size of bitmap data of one update event
+MAX_BITMAP_SIZE = 16384
+
+#bytes per pixel of rendered bitmaps
+_BYTES_PER_PIXEL_ = { 15 : 2, 16 : 2, 24 : 3, 32 : 4 }
+
+def renderUpdate(updateEvent, dx, dy, width, height, colorDepth):
+    """
+    @summary: render one update event on target screen
+    @param updateEvent: {rss.UpdateEvent} recorded update
+    @param dx: {int} horizontal offset of recorded screen on target screen
+    @param dy: {int} vertical offset of recorded screen on target screen
+    @param width: {int} width of target screen
+    @param height: {int} height of target screen
+    @param colorDepth: {int} color depth of target
+    @return: {list(rss.UpdateEvent)} uncompressed bitmaps, empty if update is outside screen
+    """
+    bitmapWidth = updateEvent.width.value
+    pixels = decodeRDPBitmap(bitmapWidth, updateEvent.height.value, updateEvent.bpp.value, updateEvent.format.value == rss.UpdateFormat.BMP, updateEvent.data.value)
+    visibleWidth = min(bitmapWidth, updateEvent.destRight.value - updateEvent.destLeft.value + 1)
+    visibleHeight = min(updateEvent.height.value, updateEvent.destBottom.value - updateEvent.destTop.value + 1)
+    left, top = updateEvent.destLeft.value + dx, updateEvent.destTop.value + dy
+    
+    #clip on target screen
+    x0, y0 = max(0, left), max(0, top)
+    x1, y1 = min(width, left + visibleWidth), min(height, top + visibleHeight)
+    if x1 <= x0 or y1 <= y0:
+        return []
+    
+    #uncompressed bitmap width is multiple of 4 pixels, padding is outside dest rectangle
+    paddedWidth = (x1 - x0 + 3) & ~3
+    lineSize = paddedWidth * _BYTES_PER_PIXEL_[colorDepth]
+    rowsPerBitmap = max(1, MAX_BITMAP_SIZE / lineSize)
+    
+    updates = []
+    for tileTop in range(y0, y1, rowsPerBitmap):
+        rows = min(rowsPerBitmap, y1 - tileTop)
+        bitmap = FrameBuffer(paddedWidth, rows)
+        bitmap.drawPixels(left - x0, top - tileTop, visibleWidth, visibleHeight, pixels, bitmapWidth)
+        
+        update = rss.UpdateEvent()
+        update.destLeft.value = x0
+        update.destTop.value = tileTop
+        update.destRight.value = x1 - 1
+        update.destBottom.value = tileTop + rows - 1
+        update.width.value = paddedWidth
+        update.height.value = rows
+        update.bpp.value = colorDepth
+        update.format.value = rss.UpdateFormat.RAW
+        update.data.value = encodeRDPBitmap(paddedWidth, rows, colorDepth, bitmap.getPixels())
+        updates.append(update)
+    return updates
+
+def renderScenario(reader, recorder, width, height, colorDepth):
+    """
+    @summary: render all events of scenario
+                Recorded screen is centered on target screen
+                Time of dropped events is added to next event
+    @param reader: {rss.FileReader | rss.MemoryReader} source scenario
+    @param recorder: {rss.FileRecorder} rendered scenario
+    @param width: {int} width of target screen
+    @param height: {int} height of target screen
+    @param colorDepth: {int} 15, 16, 24 or 32
+    """
+    screenEvent = rss.ScreenEvent()
+    screenEvent.width.value = width
+    screenEvent.height.value = height
+    screenEvent.colorDepth.value = colorDepth
+    recorder.rec(screenEvent, 0)
+    
+    dx, dy = 0, 0
+    timestamp = 0
+    while True:
+        e = reader.nextEvent()
+        if e is None:
+            break
+        timestamp += e.timestamp.value
+        
+        if e.type.value == rss.EventType.SCREEN:
+            dx, dy = (width - e.event.width.value) / 2, (height - e.event.height.value) / 2
+            
+        elif e.type.value == rss.EventType.UPDATE:
+            for update in renderUpdate(e.event, dx, dy, width, height, colorDepth):
+                recorder.rec(update, timestamp)
+                timestamp = 0
+                
+        elif e.type.value in [rss.EventType.INFO, rss.EventType.CLOSE, rss.EventType.KEY_UNICODE, rss.EventType.KEY_SCANCODE]:
+            recorder.rec(e.event._value, timestamp)
+            timestamp = 0
+            
+def renderVariants(path, outputDirectory, screens, colorDepths):
+    """
+    @summary: render scenario for each screen size and color depth
+    @param path: {str} source rss file
+    @param outputDirectory: {str} directory of rendered files
+    @param screens: {list(tuple(int, int))} width and height
+    @param colorDepths: {list(int)} color depths
+    @return: {list(str)} path of rendered files (name_WIDTHxHEIGHT_DEPTH.rss)
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    #source is parsed once for all variants
+    events = rss.readEvents(path)
+    paths = []
+    for width, height in screens:
+        for colorDepth in colorDepths:
+            outputPath = os.path.join(outputDirectory, "%s_%dx%d_%d.rss"%(name, width, height, colorDepth))
+            with open(outputPath, "wb") as f:
+                renderScenario(rss.MemoryReader(events), rss.FileRecorder(f), width, height, colorDepth)
+            paths.append(outputPath)
+    return paths
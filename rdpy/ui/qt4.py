@@ -26,8 +26,9 @@ QRemoteDesktop is a widget use for render in rdpy
 from PyQt4 import QtGui, QtCore
 from rdpy.protocol.rfb.rfb import RFBClientObserver
 from rdpy.protocol.rdp.rdp import RDPClientObserver
+from rdpy.ui.framebuffer import decodeRFBPixels
 from rdpy.core.error import CallPureVirtualFuntion
-import sys
+import sys, ctypes
 
 import rdpy.core.log as log
 import rle
@@ -70,10 +71,14 @@ class QAdaptor(object):
 def qtImageFormatFromRFBPixelFormat(pixelFormat):
     """
     @summary: convert RFB pixel format to QtGui.QImage format
+    @return: QtGui.QImage format or None if pixels must be converted
     """
-    if pixelFormat.BitsPerPixel.value == 32:
+    if pixelFormat.BigEndianFlag.value or not pixelFormat.TrueColorFlag.value:
+        return None
+    layout = (pixelFormat.RedMax.value, pixelFormat.GreenMax.value, pixelFormat.BlueMax.value, pixelFormat.RedShift.value, pixelFormat.GreenShift.value, pixelFormat.BlueShift.value)
+    if pixelFormat.BitsPerPixel.value == 32 and layout == (255, 255, 255, 16, 8, 0):
         return QtGui.QImage.Format_RGB32
-    elif pixelFormat.BitsPerPixel.value == 16:
+    elif pixelFormat.BitsPerPixel.value == 16 and layout == (31, 63, 31, 11, 5, 0):
         return QtGui.QImage.Format_RGB16
 
 class RFBClientQt(RFBClientObserver, QAdaptor):
@@ -109,11 +114,23 @@ class RFBClientQt(RFBClientObserver, QAdaptor):
         """
         imageFormat = qtImageFormatFromRFBPixelFormat(pixelFormat)
         if imageFormat is None:
-            log.error("Receive image in bad format")
-            return
+            #other formats are converted in RGB32
+            try:
+                data = str(decodeRFBPixels(width, height, pixelFormat, data, self._controller.getColourMap()))
+            except ValueError as e:
+                log.error("Receive image in bad format : %s"%e)
+                return
+            imageFormat = QtGui.QImage.Format_RGB32
  
         image = QtGui.QImage(data, width, height, imageFormat)
         self._widget.notifyImage(x, y, image, width, height)
+    
+    def onScreenBlt(self, destLeft, destTop, width, height, srcLeft, srcTop):
+        """
+        @summary: Implement RFBClientObserver interface (CopyRect encoding)
+        @see: rfb.RFBClientObserver.onScreenBlt
+        """
+        self._widget.notifyScreenBlt(destLeft, destTop, width, height, srcLeft, srcTop)
         
     def onCutText(self, text):
         """
@@ -227,6 +244,39 @@ def RDPBitmapToQtImage(width, height, bitsPerPixel, isCompress, data):
         image = QtGui.QImage(width, height, QtGui.QImage.Format_RGB32)
     return image
   
+def screenBltQtImage(image, destLeft, destTop, width, height, srcLeft, srcTop):
+    """
+    @summary: Copy an area of image in place
+                Use memmove on each line because source and destination may overlap
+    @param image: {QtGui.QImage} image to update
+    @param destLeft: {int} xmin position of destination
+    @param destTop: {int} ymin position of destination
+    @param width: {int} width of copied area
+    @param height: {int} height of copied area
+    @param srcLeft: {int} xmin position of source
+    @param srcTop: {int} ymin position of source
+    """
+    #clip source and destination inside image
+    dx = max(0, -destLeft, -srcLeft)
+    dy = max(0, -destTop, -srcTop)
+    destLeft, srcLeft, width = destLeft + dx, srcLeft + dx, width - dx
+    destTop, srcTop, height = destTop + dy, srcTop + dy, height - dy
+    width = min(width, image.width() - max(destLeft, srcLeft))
+    height = min(height, image.height() - max(destTop, srcTop))
+    if width <= 0 or height <= 0:
+        return
+    
+    pixelSize = image.depth() / 8
+    bytesPerLine = image.bytesPerLine()
+    buf = int(image.bits())
+    
+    lines = range(0, height)
+    #copy from bottom when area move down to not overwrite source
+    if destTop > srcTop:
+        lines.reverse()
+    for i in lines:
+        ctypes.memmove(buf + (destTop + i) * bytesPerLine + destLeft * pixelSize, buf + (srcTop + i) * bytesPerLine + srcLeft * pixelSize, width * pixelSize)
+  
 class RDPClientQt(RDPClientObserver, QAdaptor):
     """
     @summary: Adaptor for RDP client
@@ -307,6 +357,19 @@ class RDPClientQt(RDPClientObserver, QAdaptor):
         #if image need to be cut
         #For bit alignement server may send more than image pixel
         self._widget.notifyImage(destLeft, destTop, image, destRight - destLeft + 1, destBottom - destTop + 1)
+        
+    def onScreenBlt(self, destLeft, destTop, width, height, srcLeft, srcTop):
+        """
+        @summary: Notify screen to screen copy
+        @param destLeft: {int} xmin position of destination
+        @param destTop: {int} ymin position of destination
+        @param width: {int} width of copied area
+        @param height: {int} height of copied area
+        @param srcLeft: {int} xmin position of source
+        @param srcTop: {int} ymin position of source
+        @see: rdp.RDPClientObserver.onScreenBlt
+        """
+        self._widget.notifyScreenBlt(destLeft, destTop, width, height, srcLeft, srcTop)
     
     def onReady(self):
         """
@@ -363,6 +426,20 @@ class QRemoteDesktop(QtGui.QWidget):
         #force update
         self.update()
         
+    def notifyScreenBlt(self, destLeft, destTop, width, height, srcLeft, srcTop):
+        """
+        @summary: Function call from QAdaptor to move an area of buffer image
+        @param destLeft: x position of destination
+        @param destTop: y position of destination
+        @param width: width of area
+        @param height: height of area
+        @param srcLeft: x position of source
+        @param srcTop: y position of source
+        """
+        screenBltQtImage(self._buffer, destLeft, destTop, width, height, srcLeft, srcTop)
+        #force update
+        self.update()
+        
     def resize(self, width, height):
         """
         @summary: override resize function
@@ -26,14 +26,16 @@ setup(name='rdpy',
 			'rdpy.protocol.rfb', 
 			'rdpy.ui'
 		],
-	ext_modules=[Extension('rle', ['ext/rle.c'])],
+	ext_modules=[Extension('rle', ['ext/rle.c']), Extension('mppc', ['ext/mppc.c']), Extension('rfbcodec', ['ext/rfbcodec.c'])],
 	scripts = [
 			'bin/rdpy-rdpclient.py',
 			'bin/rdpy-rdphoneypot.py',
 			'bin/rdpy-rdpmitm.py',
 			'bin/rdpy-rdpscreenshot.py', 
 			'bin/rdpy-rssplayer.py',
+			'bin/rdpy-rssrender.py',
 			'bin/rdpy-vncclient.py', 
+			'bin/rdpy-vnchoneypot.py',
 			'bin/rdpy-vncscreenshot.py'
 		],
 	install_requires=[
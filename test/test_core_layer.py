@@ -74,4 +74,37 @@ class LayerTest(unittest.TestCase):
             
         t = TestAutomata()
         t.expect(4, t.expectedCallBack)
-        self.assertEqual(t.dataReceived("\x00\x00\x00"), None, "Not enough dada")
\ No newline at end of file
+        self.assertEqual(t.dataReceived("\x00\x00\x00"), None, "Not enough dada")
+        
+    def test_layer_automata_many_packets(self):
+        """
+        @summary: all packets of one chunk are read in order, rest is kept for next chunk
+        """
+        class TestAutomata(rdpy.core.layer.RawLayer):
+            def expectedCallBack(self, data):
+                packets.append(data.getvalue())
+                
+        packets = []
+        t = TestAutomata()
+        t.expect(2, t.expectedCallBack)
+        t.dataReceived("aabbc")
+        self.assertEqual(packets, ["aa", "bb"], "invalid packets")
+        t.dataReceived("c")
+        self.assertEqual(packets, ["aa", "bb", "cc"], "rest of chunk must be kept")
+        self.assertEqual(t._buffer, "", "buffer must be empty")
+        
+    def test_layer_automata_reentrant(self):
+        """
+        @summary: data received from a callback are read after current data
+        """
+        class TestAutomata(rdpy.core.layer.RawLayer):
+            def expectedCallBack(self, data):
+                packets.append(data.getvalue())
+                if len(packets) == 1:
+                    self.dataReceived("cc")
+                
+        packets = []
+        t = TestAutomata()
+        t.expect(2, t.expectedCallBack)
+        t.dataReceived("aabb")
+        self.assertEqual(packets, ["aa", "bb", "cc"], "invalid packets")
@@ -0,0 +1,155 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+unit test for rdpy.core.prefork module
+"""
+
+import os, sys
+# Change path so we find rdpy
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+import unittest
+from twisted.internet import task, error
+from twisted.python import failure
+import rdpy.core.prefork as prefork
+
+class Transport(object):
+    """
+    @summary: fake process transport
+    """
+    def __init__(self):
+        self.signals = []
+    def signalProcess(self, signal):
+        self.signals.append(signal)
+        
+class Reactor(task.Clock):
+    """
+    @summary: fake reactor which record spawned process
+    """
+    def __init__(self):
+        task.Clock.__init__(self)
+        self.spawned = []
+        self.stopped = False
+    def spawnProcess(self, processProtocol, executable, args, env, childFDs):
+        processProtocol.transport = Transport()
+        self.spawned.append((processProtocol, env))
+    def callWhenRunning(self, f):
+        pass
+    def stop(self):
+        self.stopped = True
+
+class PreforkTest(unittest.TestCase):
+    """
+    @summary: test case for pre-fork master
+    """
+    def test_restart(self):
+        """
+        @summary: crashed worker is restarted, graceful restart replace all workers
+        """
+        reactor = Reactor()
+        master = prefork.Master(["python", "server.py"], 2, 3389, reusePort = True, reactor = reactor)
+        master.run()
+        self.assertEqual([env[prefork.WORKER_ENV] for _, env in reactor.spawned], ["0", "1"], "invalid workers")
+        self.assertFalse(prefork.SOCKET_ENV in reactor.spawned[0][1], "socket must not be shared with SO_REUSEPORT")
+        
+        #crash
+        reactor.advance(5)
+        worker = reactor.spawned[1][0]
+        worker.processEnded(failure.Failure(error.ProcessTerminated(1)))
+        reactor.advance(0)
+        self.assertEqual(reactor.spawned[2][0].index, 1, "crashed worker not restarted")
+        
+        #graceful restart
+        old = master.getProcesses()
+        master.restart()
+        self.assertEqual(len(reactor.spawned), 5, "new generation not spawned")
+        for process in old:
+            self.assertEqual(process.transport.signals, ["TERM"], "old worker not stopped")
+            process.processEnded(failure.Failure(error.ProcessDone(0)))
+        reactor.advance(5)
+        self.assertEqual(len(reactor.spawned), 5, "old worker must not be restarted")
+        
+    def test_stop(self):
+        """
+        @summary: reactor is stopped when all workers are ended
+        """
+        reactor = Reactor()
+        master = prefork.Master(["python", "server.py"], 2, 3389, reusePort = True, reactor = reactor)
+        master.run()
+        master.stop()
+        for process in master.getProcesses():
+            self.assertEqual(process.transport.signals, ["TERM"], "worker not stopped")
+            self.assertFalse(reactor.stopped, "workers are running")
+            process.processEnded(failure.Failure(error.ProcessDone(0)))
+        self.assertTrue(reactor.stopped, "reactor not stopped")
+        self.assertEqual(len(reactor.spawned), 2, "worker must not be restarted")
+        
+    def test_reuse_port(self):
+        """
+        @summary: many sockets listen on same port with SO_REUSEPORT
+        """
+        if not prefork.hasReusePort():
+            return
+        s1 = prefork.createListeningSocket(0, "127.0.0.1", True)
+        port = s1.getsockname()[1]
+        s2 = prefork.createListeningSocket(port, "127.0.0.1", True)
+        s1.close()
+        s2.close()
+        
+    def test_worker_close(self):
+        """
+        @summary: session of worker is counted and closed by server on TCP transport
+        """
+        import socket
+        from twisted.internet import reactor
+        from rdpy.core import layer
+        
+        class Factory(layer.RawLayerServerFactory):
+            def __init__(self):
+                self.layers = []
+                self.lost = []
+            def buildRawLayer(self, addr):
+                self.layers.append(layer.RawLayer())
+                return self.layers[-1]
+            def connectionLost(self, rawLayer, reason):
+                self.lost.append(rawLayer)
+        
+        def iterate(condition):
+            for _ in range(100):
+                if condition():
+                    return
+                reactor.iterate(0.01)
+                
+        factory = Factory()
+        server = prefork.WorkerServer(factory, 0, "127.0.0.1", reactor = reactor)
+        server.listen()
+        client = socket.create_connection(("127.0.0.1", server._listeningPort.getHost().port))
+        try:
+            iterate(lambda: server.getSessionCount() == 1)
+            self.assertEqual(server.getSessionCount(), 1, "session not counted")
+            factory.layers[0].close()
+            iterate(lambda: server.getSessionCount() == 0)
+            self.assertEqual(server.getSessionCount(), 0, "session not closed")
+            self.assertEqual(factory.lost, factory.layers, "connection lost not forwarded")
+            self.assertEqual(client.recv(1), "", "client not disconnected")
+        finally:
+            client.close()
+            server._listeningPort.stopListening()
+            reactor.iterate(0)
@@ -0,0 +1,89 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+unit test for rdpy.core.rss module
+"""
+
+import os, sys
+# Change path so we find rdpy
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+import unittest, StringIO
+from rdpy.core import rss
+
+class File(StringIO.StringIO):
+    """
+    @summary: keep content after close
+    """
+    def close(self):
+        self.isClosed = True
+        
+def readEvents(f):
+    """
+    @return: {list(tuple)} type and code of key events
+    """
+    reader = rss.FileReader(StringIO.StringIO(f.getvalue()))
+    events = []
+    while True:
+        e = reader.nextEvent()
+        if e is None:
+            return events
+        events.append((e.type.value, e.event.code.value if e.type.value == rss.EventType.KEY_UNICODE else None))
+
+class RssTest(unittest.TestCase):
+    """
+    @summary: test case for asynchronous recording
+    """
+    def test_drop(self):
+        """
+        @summary: events are dropped when queue is full, but not close of file
+        """
+        queue = rss.RecordingQueue(2, rss.RecordPolicy.DROP)
+        f = File()
+        recorder = rss.AsyncRecorder(f, queue)
+        for code in range(3):
+            recorder.keyUnicode(code, True)
+        self.assertEqual(queue.getStats()["dropped"], 1, "event not dropped")
+        queue.start()
+        recorder.close()
+        queue.stop()
+        self.assertEqual(readEvents(f), [(rss.EventType.KEY_UNICODE, 0), (rss.EventType.KEY_UNICODE, 1), (rss.EventType.CLOSE, None)], "invalid events")
+        self.assertTrue(f.isClosed, "file not closed")
+        
+    def test_spill(self):
+        """
+        @summary: events which don't fit in queue are written in order from spill file
+        """
+        queue = rss.RecordingQueue(1, rss.RecordPolicy.SPILL)
+        files = [File(), File()]
+        recorders = [rss.AsyncRecorder(f, queue) for f in files]
+        for code in range(3):
+            for recorder in recorders:
+                recorder.keyUnicode(code, True)
+        for recorder in recorders:
+            recorder.close()
+        queue.start()
+        queue.stop()
+        
+        stats = queue.getStats()
+        self.assertEqual((stats["queued"], stats["spilled"], stats["written"]), (1, 9, 8), "invalid stats")
+        for f in files:
+            self.assertEqual(readEvents(f), [(rss.EventType.KEY_UNICODE, 0), (rss.EventType.KEY_UNICODE, 1), (rss.EventType.KEY_UNICODE, 2), (rss.EventType.CLOSE, None)], "invalid order")
+            self.assertTrue(f.isClosed, "file not closed")
@@ -0,0 +1,139 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+unit test for rdpy.core.scanner module
+"""
+
+import os, sys
+# Change path so we find rdpy
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+import unittest
+from twisted.internet import task, defer
+import rdpy.core.scanner as scanner
+
+class Output(scanner.ScanOutput):
+    """
+    @summary: keep results
+    """
+    def __init__(self):
+        self._results = []
+    def write(self, result):
+        self._results.append(result)
+        
+class JobFactory(scanner.ScanJobFactory):
+    """
+    @summary: jobs are finished by test
+    """
+    def __init__(self):
+        self._jobs = []
+    def buildJob(self, host, port):
+        class Job(scanner.ScanJob):
+            def __init__(self):
+                self.deferred = defer.Deferred()
+                self.cancelled = False
+            def start(self):
+                return self.deferred
+            def cancel(self):
+                self.cancelled = True
+        job = Job()
+        self._jobs.append((host, job))
+        return job
+
+class ScannerTest(unittest.TestCase):
+    """
+    @summary: test case for scan engine
+    """
+    def test_read_targets(self):
+        """
+        @summary: host list parsing
+        """
+        self.assertEqual(list(scanner.readTargets(["10.0.0.1", " 10.0.0.2:3390 # comment", "", "# comment"], 3389)), [("10.0.0.1", 3389), ("10.0.0.2", 3390)], "invalid targets")
+        
+    def test_read_targets_ipv6(self):
+        """
+        @summary: ipv6 with brackets or bare, invalid lines are skipped
+        """
+        lines = ["[fe80::1]:3390", "[::1]", "::1", "fe80::1", "host:abc", "[::1", "[::1]x", ":3389", "host:70000", "10.0.0.3:3391"]
+        self.assertEqual(list(scanner.readTargets(lines, 3389)), [("fe80::1", 3390), ("::1", 3389), ("::1", 3389), ("fe80::1", 3389), ("10.0.0.3", 3391)], "invalid targets")
+        
+    def test_concurrency(self):
+        """
+        @summary: targets are pulled only when a slot is free
+        """
+        clock = task.Clock()
+        output = Output()
+        factory = JobFactory()
+        scan = scanner.Scanner(factory, output, concurrency = 2, timeout = 10.0, reactor = clock)
+        stats = []
+        scan.run(("host%d"%i, 3389) for i in range(5)).addCallback(stats.append)
+        self.assertEqual(len(factory._jobs), 2, "concurrency not respected")
+        
+        factory._jobs[0][1].deferred.callback({ "image" : "a.png" })
+        self.assertEqual(len(factory._jobs), 3, "slot not reused")
+        self.assertEqual(output._results[0].toDict()["image"], "a.png", "invalid result data")
+        
+        for i in range(1, 5):
+            factory._jobs[i][1].deferred.errback(Exception("refused"))
+        self.assertEqual(stats, [{ "total" : 5, "success" : 1, "failure" : 4, "timeout" : 0 }], "invalid stats")
+        
+    def test_timeout_retry(self):
+        """
+        @summary: job is cancelled on timeout and retried
+        """
+        clock = task.Clock()
+        output = Output()
+        factory = JobFactory()
+        scan = scanner.Scanner(factory, output, concurrency = 1, timeout = 10.0, retries = 1, retryDelay = 1.0, reactor = clock)
+        scan.run([("host", 3389)])
+        
+        clock.advance(10.0)
+        self.assertTrue(factory._jobs[0][1].cancelled, "job must be cancelled")
+        self.assertEqual(output._results, [], "result before last attempt")
+        
+        clock.advance(1.0)
+        self.assertEqual(len(factory._jobs), 2, "job not retried")
+        clock.advance(10.0)
+        self.assertEqual((output._results[0].status, output._results[0].attempts), (scanner.ScanStatus.TIMEOUT, 2), "invalid result")
+        self.assertEqual(scan.getRunning(), 0, "slot not released")
+        
+    def test_json_lines_stdout(self):
+        """
+        @summary: stdout only contains results and stays open
+        """
+        import StringIO, json
+        import rdpy.core.log as log
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout, sys.stderr = StringIO.StringIO(), StringIO.StringIO()
+        try:
+            output = scanner.JSONLinesOutput("-")
+            result = scanner.ScanResult("127.0.0.1", 3389)
+            result.status = scanner.ScanStatus.SUCCESS
+            output.write(result)
+            log.log("message")
+            output.close()
+            lines = sys.stdout.getvalue().splitlines()
+            self.assertEqual(len(lines), 1, "log written on stdout")
+            self.assertEqual(json.loads(lines[0])["host"], "127.0.0.1", "invalid result")
+            self.assertFalse(sys.stdout.closed, "stdout closed")
+            self.assertTrue("message" in sys.stderr.getvalue(), "log not written on stderr")
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+            log._LOG_STREAM = None
@@ -0,0 +1,89 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+unit test for rdpy.core.scheduler module
+"""
+
+import os, sys
+# Change path so we find rdpy
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+import unittest
+from twisted.internet import task
+import rdpy.core.scheduler as scheduler
+
+class SchedulerTest(unittest.TestCase):
+    """
+    @summary: test case for timer wheel
+    """
+    def test_order(self):
+        """
+        @summary: timers fire in order, also after many wheel turns
+        """
+        clock = task.Clock()
+        wheel = scheduler.TimerWheel(0.01, 8, clock)
+        fired = []
+        wheel.schedule(0.5, fired.append, "c")
+        wheel.schedule(0.02, fired.append, "a")
+        wheel.schedule(0.08, fired.append, "b")
+        self.assertEqual(len(clock.getDelayedCalls()), 1, "one reactor call for all timers")
+        clock.pump([0.01] * 10)
+        self.assertEqual(fired, ["a", "b"], "invalid order")
+        clock.pump([0.01] * 40)
+        self.assertEqual(fired, ["a", "b", "c"], "timer after many turns not fired")
+        self.assertEqual(len(clock.getDelayedCalls()), 0, "idle wheel must not tick")
+        
+    def test_cancel_reschedule(self):
+        """
+        @summary: cancelled timer is not called, callback can schedule again
+        """
+        clock = task.Clock()
+        wheel = scheduler.TimerWheel(0.01, 8, clock)
+        fired = []
+        def loop(count):
+            fired.append(count)
+            if count > 0:
+                wheel.schedule(0.01, loop, count - 1)
+        wheel.schedule(0.01, loop, 3)
+        timer = wheel.schedule(0.02, fired.append, "cancelled")
+        timer.cancel()
+        #reactor is late, ticks are caught up
+        clock.advance(0.05)
+        clock.pump([0.01] * 5)
+        self.assertEqual(fired, [3, 2, 1, 0], "invalid callbacks")
+        self.assertEqual(wheel.getCount(), 0, "no more timer")
+        
+    def test_callback_error(self):
+        """
+        @summary: failing callback doesn't stop other timers of wheel
+        """
+        clock = task.Clock()
+        wheel = scheduler.TimerWheel(0.01, 8, clock)
+        fired = []
+        def fail():
+            raise Exception("bad scenario")
+        wheel.schedule(0.02, fail)
+        wheel.schedule(0.02, fired.append, "same tick")
+        wheel.schedule(0.05, fired.append, "later")
+        clock.pump([0.01] * 10)
+        self.assertEqual(fired, ["same tick", "later"], "timers not fired after error")
+        wheel.schedule(0.01, fired.append, "new")
+        clock.pump([0.01] * 2)
+        self.assertEqual(fired[-1], "new", "wheel not restarted after error")
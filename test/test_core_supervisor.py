@@ -0,0 +1,155 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+unit test for rdpy.core.supervisor module
+"""
+
+import os, sys
+# Change path so we find rdpy
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+import unittest, json
+from twisted.internet import task, defer
+from twisted.python import failure
+from twisted.test import proto_helpers
+import rdpy.core.scanner as scanner
+import rdpy.core.supervisor as supervisor
+
+class JobFactory(scanner.ScanJobFactory):
+    """
+    @summary: jobs are finished by test
+    """
+    def __init__(self):
+        self._jobs = []
+    def buildJob(self, host, port):
+        class Job(scanner.ScanJob):
+            def __init__(self):
+                self.deferred = defer.Deferred()
+            def start(self):
+                return self.deferred
+            def cancel(self):
+                pass
+        job = Job()
+        self._jobs.append(job)
+        return job
+    
+class Reactor(object):
+    """
+    @summary: fake reactor, keep spawned process
+    """
+    def __init__(self):
+        self._processes = []
+    def spawnProcess(self, process, executable, args, env, childFDs):
+        transport = proto_helpers.StringTransport()
+        process.makeConnection(transport)
+        self._processes.append((process, transport))
+        
+class Output(scanner.ScanOutput):
+    """
+    @summary: keep results
+    """
+    def __init__(self):
+        self._results = []
+        self._closed = False
+    def write(self, result):
+        self._results.append((result.host, result.status))
+    def close(self):
+        self._closed = True
+
+def resultLine(host, status):
+    """
+    @summary: RESULT message of worker
+    """
+    return "RESULT " + json.dumps({ "host" : host, "port" : 3389, "status" : status, "reason" : None, "attempts" : 1, "duration" : 1.0 }) + "\n"
+
+class SupervisorTest(unittest.TestCase):
+    """
+    @summary: test case for multi process scan
+    """
+    def test_worker(self):
+        """
+        @summary: worker ask targets and report results
+        """
+        factory = JobFactory()
+        worker = supervisor.ScanWorker(factory, 1, 10.0, 0, reactor = task.Clock())
+        transport = proto_helpers.StringTransport()
+        worker.makeConnection(transport)
+        self.assertEqual(transport.value(), "NEED 2\n", "invalid request")
+        
+        transport.clear()
+        worker.dataReceived("10.0.0.1 3389\n10.0.0.2 3389\nEND\n")
+        self.assertEqual(len(factory._jobs), 1, "concurrency not respected")
+        factory._jobs[0].deferred.callback({})
+        self.assertEqual(json.loads(transport.value().split("\n")[0][7:])["host"], "10.0.0.1", "invalid result")
+        self.assertEqual(len(factory._jobs), 2, "next target not started")
+        
+    def test_worker_process(self):
+        """
+        @summary: supervisor side send END when all targets are done
+        """
+        reactor, output = Reactor(), Output()
+        finished = supervisor.Supervisor(["worker"], 1, output, reactor = reactor).run([("10.0.0.1", 3389), ("10.0.0.2", 3389)])
+        process, transport = reactor._processes[0]
+        
+        process.childDataReceived(supervisor.CHANNEL_FD, "NEED 4\nRESULT ")
+        self.assertEqual(transport.value(), "10.0.0.1 3389\n10.0.0.2 3389\nEND\n", "invalid targets")
+        
+        process.childDataReceived(supervisor.CHANNEL_FD, resultLine("10.0.0.1", "success")[7:] + resultLine("10.0.0.2", "timeout"))
+        process.processEnded(failure.Failure(Exception("done")))
+        self.assertEqual(output._results, [("10.0.0.1", "success"), ("10.0.0.2", "timeout")], "invalid results")
+        self.assertTrue(output._closed and finished.called, "scan not finished")
+        
+    def test_worker_crash(self):
+        """
+        @summary: targets of crashed worker are given to live worker
+                    targets not scanned are reported as failure when no worker is left
+        """
+        reactor, output = Reactor(), Output()
+        finished = supervisor.Supervisor(["worker"], 2, output, reactor = reactor).run([("10.0.0.%d"%i, 3389) for i in range(1, 6)])
+        (process1, transport1), (process2, transport2) = reactor._processes
+        
+        process1.childDataReceived(supervisor.CHANNEL_FD, "NEED 2\n")
+        process2.childDataReceived(supervisor.CHANNEL_FD, "NEED 2\n")
+        self.assertEqual(transport1.value(), "10.0.0.1 3389\n10.0.0.2 3389\n", "invalid targets")
+        self.assertEqual(transport2.value(), "10.0.0.3 3389\n10.0.0.4 3389\n", "invalid targets")
+        
+        #worker 2 wait end of worker 1 targets before END
+        transport2.clear()
+        process2.childDataReceived(supervisor.CHANNEL_FD, resultLine("10.0.0.3", "success") + resultLine("10.0.0.4", "success") + "NEED 2\n")
+        self.assertEqual(transport2.value(), "10.0.0.5 3389\n", "invalid targets")
+        
+        transport2.clear()
+        process1.processEnded(failure.Failure(Exception("killed")))
+        self.assertEqual(transport2.value(), "10.0.0.1 3389\n", "lost targets not given to live worker")
+        self.assertFalse(finished.called, "scan finished with live worker")
+        
+        process2.processEnded(failure.Failure(Exception("killed")))
+        self.assertEqual(sorted(output._results), [("10.0.0.1", "failure"), ("10.0.0.2", "failure"), ("10.0.0.3", "success"), ("10.0.0.4", "success"), ("10.0.0.5", "failure")], "invalid results")
+        self.assertTrue(output._closed and finished.called, "scan not finished")
+        
+    def test_unsent_targets(self):
+        """
+        @summary: targets never sent are reported as failure when all workers are ended
+        """
+        reactor, output = Reactor(), Output()
+        finished = supervisor.Supervisor(["worker"], 1, output, reactor = reactor).run([("10.0.0.1", 3389), ("10.0.0.2", 3389)])
+        reactor._processes[0][0].processEnded(failure.Failure(Exception("cannot start")))
+        self.assertEqual(output._results, [("10.0.0.1", "failure"), ("10.0.0.2", "failure")], "targets not reported")
+        self.assertTrue(finished.called, "scan not finished")
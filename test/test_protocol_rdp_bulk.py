@@ -0,0 +1,123 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+unit test for rdpy.protocol.rdp.pdu.bulk module
+"""
+
+import os, sys
+# Change path so we find rdpy
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+import unittest
+import rdpy.protocol.rdp.pdu.bulk as bulk
+from rdpy.protocol.rdp.pdu.data import CompressionOrder, CompressionType
+import rdpy.core.error as error
+
+def bits(s):
+    """
+    @summary: pack a string of 0 and 1 into bytes padded with zero
+    """
+    s += "0" * (-len(s) % 8)
+    return "".join([chr(int(s[i:i + 8], 2)) for i in range(0, len(s), 8)])
+
+class BulkTest(unittest.TestCase):
+    """
+    @summary: test case for MPPC decompression
+    """
+
+    def test_decompress_64k(self):
+        """
+        @summary: literals and overlapping copy with 64K encoding
+        """
+        #a b c, copy offset 3 length 6, literal 0xe9
+        data = bits("01100001" "01100010" "01100011" "11111" "000011" "10" "10" "10" "1101001")
+        d = bulk.MPPCDecompressor()
+        self.assertEqual(d.decompress(data, CompressionOrder.PACKET_COMPRESSED | CompressionOrder.PACKET_FLUSHED | CompressionType.PACKET_COMPR_TYPE_64K), "abcabcabc\xe9", "invalid decompression")
+
+        #history is kept between packets : copy offset 10 length 3
+        data = bits("11111" "001010" "0")
+        self.assertEqual(d.decompress(data, CompressionOrder.PACKET_COMPRESSED | CompressionType.PACKET_COMPR_TYPE_64K), "abc", "history not used")
+
+    def test_decompress_8k(self):
+        """
+        @summary: 8K encoding use shorter copy offset prefix
+        """
+        data = bits("01111000" "01111001" "1111" "000010" "0")
+        d = bulk.MPPCDecompressor()
+        self.assertEqual(d.decompress(data, CompressionOrder.PACKET_COMPRESSED | CompressionType.PACKET_COMPR_TYPE_8K), "xyxyx", "invalid decompression")
+
+    def test_uncompressed(self):
+        """
+        @summary: uncompressed data are forwarded
+        """
+        d = bulk.MPPCDecompressor()
+        self.assertEqual(d.decompress("rdpy", 0), "rdpy", "invalid uncompressed data")
+
+    def test_invalid_offset(self):
+        """
+        @summary: copy before history start
+        """
+        data = bits("01100001" "11111" "000011" "0")
+        d = bulk.MPPCDecompressor()
+        self.assertRaises(error.InvalidExpectedDataException, d.decompress, data, CompressionOrder.PACKET_COMPRESSED | CompressionType.PACKET_COMPR_TYPE_64K)
+
+    def test_compress_roundtrip(self):
+        """
+        @summary: compressed data of successive packets can be decompressed with a shared history
+        """
+        for compressionType in [CompressionType.PACKET_COMPR_TYPE_8K, CompressionType.PACKET_COMPR_TYPE_64K]:
+            c = bulk.MPPCCompressor(compressionType)
+            d = bulk.MPPCDecompressor()
+            for i in range(20):
+                packet = ("rdpy bulk compression %d "%i) * 300 + "".join([chr(j) for j in range(256)])
+                compressed, flags = c.compress(packet)
+                self.assertTrue(flags & CompressionOrder.PACKET_COMPRESSED, "data must be compressed")
+                self.assertTrue(len(compressed) < len(packet), "invalid compression ratio")
+                self.assertEqual(d.decompress(compressed, flags), packet, "invalid roundtrip")
+
+    def test_compress_flush(self):
+        """
+        @summary: not compressible data are sent as is and flush history
+        """
+        c = bulk.MPPCCompressor()
+        compressed, flags = c.compress("\x80\x81\x82")
+        self.assertEqual(compressed, "\x80\x81\x82", "invalid uncompressed data")
+        self.assertEqual(flags, CompressionOrder.PACKET_FLUSHED | CompressionType.PACKET_COMPR_TYPE_64K, "history must be flushed")
+        
+    def test_long_match(self):
+        """
+        @summary: longest matches use 11 (8K) and 14 (64K) prefix bits of length
+        """
+        for compressionType, length in [(CompressionType.PACKET_COMPR_TYPE_8K, 8000), (CompressionType.PACKET_COMPR_TYPE_64K, 60000)]:
+            packet = "r" * (length + 1)
+            compressed, flags = bulk.MPPCCompressor(compressionType).compress(packet)
+            self.assertTrue(len(compressed) < 8, "one copy expected")
+            self.assertEqual(bulk.MPPCDecompressor().decompress(compressed, flags), packet, "invalid long match")
+            
+        #literal r, copy offset 1 length 5000 (11 ones) in 8K encoding
+        data = bits("01110010" + "1111" + "000001" + "1" * 11 + "0" + format(5000 - 4096, "012b"))
+        self.assertEqual(bulk.MPPCDecompressor().decompress(data, CompressionOrder.PACKET_COMPRESSED | CompressionType.PACKET_COMPR_TYPE_8K), "r" * 5001, "invalid 8K long match")
+        #literal r, copy offset 1 length 40000 (14 ones) in 64K encoding
+        data = bits("01110010" + "11111" + "000001" + "1" * 14 + "0" + format(40000 - 32768, "015b"))
+        self.assertEqual(bulk.MPPCDecompressor().decompress(data, CompressionOrder.PACKET_COMPRESSED | CompressionType.PACKET_COMPR_TYPE_64K), "r" * 40001, "invalid 64K long match")
+        #15 ones is longer than 64K history
+        data = bits("01110010" + "11111" + "000001" + "1" * 15 + "0" + "0" * 16)
+        self.assertRaises(error.InvalidExpectedDataException, bulk.MPPCDecompressor().decompress, data, CompressionOrder.PACKET_COMPRESSED | CompressionType.PACKET_COMPR_TYPE_64K)
+
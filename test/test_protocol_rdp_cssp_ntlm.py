@@ -125,4 +125,45 @@ class TestCsspNtlm(unittest.TestCase):
         EncryptedPubKeyDst = interface.GSS_WrapEx(pubKeyHex.decode('base64'))
         
         self.assertTrue(EncryptedPubKeySrc == EncryptedPubKeyDst, "Public key must be equals")
-        
\ No newline at end of file
+                
+    def testDecodeDERTRequest(self):
+        """
+        @summary: hand written decoder match pyasn1 decoder
+        """
+        for data in [peer0_0, peer1_0, peer0_1]:
+            data = data.decode('base64')
+            request = cssp.der_decoder.decode(data, asn1Spec=cssp.TSRequest())[0]
+            negoData = request.getComponentByName("negoTokens")
+            negoTokens = [negoData.getComponentByPosition(i).getComponentByPosition(0).asOctets() for i in range(len(negoData))]
+            
+            fastRequest = cssp.decodeDERTRequest(data)
+            self.assertEqual(fastRequest["version"], 2, "invalid version")
+            self.assertEqual(fastRequest["negoTokens"], negoTokens, "invalid nego tokens")
+            self.assertEqual(cssp.getDERTRequestLength(data), len(data), "invalid TSRequest length")
+            if request.getComponentByName("pubKeyAuth").hasValue():
+                self.assertEqual(fastRequest["pubKeyAuth"], request.getComponentByName("pubKeyAuth").asOctets(), "invalid public key")
+        
+    def testRecvSplitTSRequest(self):
+        """
+        @summary: TSRequest split across many reads is dispatched once complete
+        """
+        messages = []
+        layer = cssp.CSSP(None, None)
+        layer._nextState = messages.append
+        layer.dataReceived = layer.recvTSRequest
+        
+        data = peer1_0.decode('base64')
+        for i in range(0, len(data), 7):
+            layer.dataReceived(data[i:i + 7])
+            self.assertEqual(len(messages), (i + 7 >= len(data)) and 1 or 0, "message must be dispatched when complete")
+        self.assertEqual(messages, [data], "invalid message")
+        
+    def testNTOWFv2(self):
+        """
+        @summary: response key of MS-NLMP example and cache
+        @see: https://msdn.microsoft.com/en-us/library/cc236717.aspx
+        """
+        self.assertEqual(ntlm.MD4(ntlm.UNICODE("Password")).encode('hex'), "a4f49c406510bdcab6824ee7c30fd852", "invalid md4")
+        self.assertEqual(ntlm.NTOWFv2("Password", "User", "Domain").encode('hex'), "0c868a403bfd7a93a3001ef22ef02e3f", "invalid response key")
+        self.assertEqual(ntlm.NTOWFv2("Password", "User", "Domain").encode('hex'), "0c868a403bfd7a93a3001ef22ef02e3f", "invalid cached response key")
+        self.assertNotEqual(ntlm.NTOWFv2("Passwore", "User", "Domain"), ntlm.NTOWFv2("Password", "User", "Domain"), "cache must depend on password")
@@ -126,4 +126,61 @@ class TestLic(unittest.TestCase):
         
         s = type.Stream(SERVERREQUEST.decode("base64"))
         
-        self.assertFalse(l.recv(s) and t._state, "Bad message after license request")
\ No newline at end of file
+        self.assertFalse(l.recv(s) and t._state, "Bad message after license request")
+        
+    def test_license_store(self):
+        """
+        @summary: issued license is stored and presented on next connection
+        """
+        class Transport(object):
+            def __init__(self):
+                self._messages = []
+            def sendFlagged(self, flag, message):
+                s = type.Stream()
+                s.writeType(message)
+                s.pos = 0
+                licPacket = lic.LicPacket()
+                s.readType(licPacket)
+                self._messages.append(licPacket.licensingMessage._value)
+            def getGCCServerSettings(self):
+                class A:
+                    def __init__(self):
+                        self._is_readed = False
+                class B:
+                    def __init__(self):
+                        self.serverCertificate = A()
+                class C:
+                    def __init__(self):
+                        self.SC_SECURITY = B()
+                return C()
+        
+        store = lic.LicenseStore()
+        
+        #first connection ask a new license
+        t = Transport()
+        l = lic.LicenseManager(t)
+        l.setLicenseStore(store, "host")
+        l.recv(type.Stream(SERVERREQUEST.decode("base64")))
+        self.assertTrue(isinstance(t._messages[0], lic.ClientNewLicenseRequest), "new license request expected")
+        
+        #server issue license
+        info = lic.NewLicenseInfo()
+        info.pbLicenseInfo.value = "license"
+        s = type.Stream()
+        s.writeType(info)
+        newLicense = lic.ServerNewLicense()
+        newLicense.encryptedLicenseInfo.blobData.value = lic.rc4.crypt(lic.rc4.RC4Key(l._licenseKey), s.getvalue())
+        newLicense.MACData.value = sec.macData(l._macSalt, s.getvalue())
+        s = type.Stream()
+        s.writeType(lic.LicPacket(newLicense))
+        s.pos = 0
+        self.assertTrue(l.recv(s), "end of license automata expected")
+        self.assertEqual(store.get("host/microsoft.com"), "license", "license not stored")
+        
+        #next connection present license
+        t = Transport()
+        l = lic.LicenseManager(t)
+        l.setLicenseStore(store, "host")
+        l.recv(type.Stream(SERVERREQUEST.decode("base64")))
+        self.assertTrue(isinstance(t._messages[0], lic.ClientLicenseInfo), "license info expected")
+        self.assertEqual(t._messages[0].licenseInfo.blobData.value, "license", "invalid presented license")
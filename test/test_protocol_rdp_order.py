@@ -0,0 +1,75 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+unit test for rdpy.protocol.rdp.pdu.order module
+"""
+
+import os, sys
+# Change path so we find rdpy
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+import unittest
+import rdpy.protocol.rdp.pdu.order as order
+import rdpy.core.type as type
+
+class OrderTest(unittest.TestCase):
+    """
+    @summary: test case for primary drawing order
+    """
+
+    def readOrder(self, state, data):
+        """
+        @summary: decode one order and merge it in state
+        """
+        primaryOrder = order.PrimaryDrawingOrder(lastOrderType = state.getOrderType)
+        type.Stream(data).readType(primaryOrder)
+        return state.update(primaryOrder)
+
+    def test_scrblt_write_read(self):
+        """
+        @summary: server encoded order can be decoded by client
+        """
+        s = type.Stream()
+        s.writeType(order.PrimaryDrawingOrder(order.ScrBltOrder(10, 20, 300, 200, 10, 40)))
+        self.assertEqual(s.getvalue(), "\x09\x02\x7f\x0a\x00\x14\x00\x2c\x01\xc8\x00\xcc\x0a\x00\x28\x00", "invalid scrblt encoding")
+
+        scrBlt, bounds = self.readOrder(order.OrderState(), s.getvalue())
+        self.assertEqual(bounds, None, "no bounds expected")
+        self.assertEqual((scrBlt.nLeftRect.coordinate.value, scrBlt.nTopRect.coordinate.value, scrBlt.nWidth.coordinate.value, scrBlt.nHeight.coordinate.value, scrBlt.nXSrc.coordinate.value, scrBlt.nYSrc.coordinate.value), (10, 20, 300, 200, 10, 40), "invalid scrblt fields")
+
+    def test_scrblt_delta_bounds(self):
+        """
+        @summary: missing fields and delta coordinates are merged with previous order
+        """
+        state = order.OrderState()
+        self.readOrder(state, "\x09\x02\x7f\x0a\x00\x14\x00\x2c\x01\xc8\x00\xcc\x0a\x00\x28\x00")
+        #same order type, delta mode, bounds, only top and source top fields
+        scrBlt, bounds = self.readOrder(state, "\x15\x42\x0f\x00\x00\x10\x00\x20\x03\x58\x02\xfe\xfb")
+        self.assertEqual(bounds, (0, 16, 800, 600), "invalid bounds")
+        self.assertEqual((scrBlt.nLeftRect.coordinate.value, scrBlt.nTopRect.coordinate.value, scrBlt.nWidth.coordinate.value, scrBlt.nHeight.coordinate.value, scrBlt.nXSrc.coordinate.value, scrBlt.nYSrc.coordinate.value), (10, 18, 300, 200, 10, 35), "invalid delta fields")
+
+    def test_unsupported_order(self):
+        """
+        @summary: unknown order type is not decoded
+        """
+        primaryOrder = order.PrimaryDrawingOrder()
+        type.Stream("\x09\x0a\x01\x02\x03").readType(primaryOrder)
+        self.assertEqual(primaryOrder.getOrderType(), order.OrderType.TS_ENC_OPAQUERECT_ORDER, "invalid order type")
+        self.assertTrue(isinstance(primaryOrder.order._value, type.String), "unknown order must be read as raw data")
@@ -0,0 +1,165 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+unit test for rdpy.protocol.rdp.pdu.layer module
+"""
+
+import os, sys
+# Change path so we find rdpy
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+import unittest
+import rdpy.protocol.rdp.pdu.layer as layer
+import rdpy.protocol.rdp.pdu.data as data
+import rdpy.protocol.rdp.tpkt as tpkt
+import rdpy.protocol.rdp.sec as sec
+import rdpy.core.type as type
+
+class PDULayerTest(unittest.TestCase):
+    """
+    @summary: test case for PDU layer
+    """
+    
+    class FastPathSender(tpkt.IFastPathSender):
+        """
+        @summary: keep sent fast path packets
+        """
+        def __init__(self):
+            self._packets = []
+        def sendFastPath(self, secFlag, fastPathS):
+            s = type.Stream()
+            s.writeType(fastPathS)
+            self._packets.append(s.getvalue())
+        def setFastPathListener(self, fastPathListener):
+            pass
+            
+    class Transport(object):
+        """
+        @summary: fake security layer, keep sent PDU
+        """
+        def __init__(self, infoFlag):
+            self._info = sec.RDPInfo(extendedInfoConditional = lambda:False)
+            self._info.flag.value = infoFlag
+            self._packets = []
+        def getUserId(self):
+            return 1002
+        def send(self, message):
+            s = type.Stream()
+            s.writeType(message)
+            self._packets.append(s.getvalue())
+            
+    class Listener(layer.PDUServerListener, layer.PDUClientListener):
+        """
+        @summary: keep received bitmaps
+        """
+        def __init__(self):
+            self._rectangles = []
+        def onConnect(self):
+            pass
+        def onUpdate(self, rectangles):
+            self._rectangles += [r.bitmapDataStream.value for r in rectangles]
+            
+    def test_compressed_bitmap_update(self):
+        """
+        @summary: bitmap updates are compressed by server and decompressed by client, in slow path and fast path
+        """
+        for compressionType in [data.CompressionType.PACKET_COMPR_TYPE_8K, data.CompressionType.PACKET_COMPR_TYPE_64K]:
+            transport = PDULayerTest.Transport(sec.InfoFlag.INFO_COMPRESSION | (compressionType << 9))
+            server = layer.Server(PDULayerTest.Listener())
+            server._transport = transport
+            server.connect()
+            self.assertEqual(server._bulkCompressor._compressionType, compressionType, "invalid compression type from info packet")
+            
+            listener = PDULayerTest.Listener()
+            client = layer.Client(listener)
+            bitmap = "\x10\x20\x30\x40" * 64
+            
+            #slow path
+            transport._packets = []
+            server._clientFastPathSupported = False
+            server.sendBitmapUpdatePDU([data.BitmapData(0, 0, 7, 7, 8, 8, 32, bitmap)])
+            pdu = data.PDU()
+            type.Stream(transport._packets[0]).readType(pdu)
+            header = pdu.pduMessage.shareDataHeader
+            updateDataPDU = data.BitmapUpdateDataPDU()
+            updateDataPDU.rectangles._array = [data.BitmapData(0, 0, 7, 7, 8, 8, 32, bitmap)]
+            self.assertEqual(header.compressedType.value & data.CompressionOrder.CompressionTypeMask, compressionType, "invalid compression type")
+            self.assertTrue(header.compressedType.value & data.CompressionOrder.PACKET_COMPRESSED, "update must be compressed")
+            self.assertEqual(header.uncompressedLength.value, type.sizeof(data.UpdateDataPDU(updateDataPDU)) + 4, "invalid uncompressed length")
+            self.assertEqual(header.compressedLength.value, len(pdu.pduMessage.pduData.value) + 4, "invalid compressed length")
+            self.assertTrue(header.compressedLength.value < header.uncompressedLength.value, "update not compressed")
+            client.recvPDU(type.Stream(transport._packets[0]))
+            
+            #fast path
+            sender = PDULayerTest.FastPathSender()
+            server.setFastPathSender(sender)
+            server._clientFastPathSupported = True
+            server.sendBitmapUpdatePDU([data.BitmapData(0, 0, 7, 7, 8, 8, 32, bitmap)])
+            self.assertEqual(ord(sender._packets[0][0]) >> 6, data.FastPathOutputCompression.FASTPATH_OUTPUT_COMPRESSION_USED, "compression flags not announced")
+            self.assertEqual(ord(sender._packets[0][1]) & data.CompressionOrder.CompressionTypeMask, compressionType, "invalid compression type")
+            self.assertTrue(ord(sender._packets[0][1]) & data.CompressionOrder.PACKET_COMPRESSED, "update must be compressed")
+            client.recvFastPath(0, type.Stream(sender._packets[0]))
+            
+            self.assertEqual(listener._rectangles, [bitmap, bitmap], "invalid decompressed bitmaps")
+            
+    def test_fastpath_input(self):
+        """
+        @summary: slow path input events are sent as fast path input events
+        """
+        client = layer.Client(None)
+        sender = PDULayerTest.FastPathSender()
+        client.setFastPathSender(sender)
+        client._serverFastPathInputSupported = True
+        
+        pointerEvent = data.PointerEvent()
+        pointerEvent.pointerFlags.value = data.PointerFlag.PTRFLAGS_MOVE
+        pointerEvent.xPos.value = 0x102
+        pointerEvent.yPos.value = 0x304
+        keyEvent = data.ScancodeKeyEvent()
+        keyEvent.keyCode.value = 0x1d
+        keyEvent.keyboardFlags.value = data.KeyboardFlag.KBDFLAGS_RELEASE | data.KeyboardFlag.KBDFLAGS_EXTENDED
+        unicodeEvent = data.UnicodeKeyEvent()
+        unicodeEvent.unicode.value = 0x41
+        
+        client.sendInputEvents([pointerEvent, keyEvent, unicodeEvent])
+        self.assertEqual(sender._packets, ["\x03\x20\x00\x08\x02\x01\x04\x03\x03\x1d\x80\x41\x00"], "invalid fast path input encoding")
+        
+        pdu = data.FastPathInputPDU()
+        type.Stream(sender._packets[0]).readType(pdu)
+        self.assertEqual([(x.eventHeader.value >> 5, x.getEventFlags()) for x in pdu.fastPathInputEvents._array], [(data.FastPathInputEventCode.FASTPATH_INPUT_EVENT_MOUSE, 0), (data.FastPathInputEventCode.FASTPATH_INPUT_EVENT_SCANCODE, 3), (data.FastPathInputEventCode.FASTPATH_INPUT_EVENT_UNICODE, 0)], "invalid fast path input decoding")
+        
+    def test_auto_reconnect_cookie(self):
+        """
+        @summary: auto reconnect cookie of extended logon info is kept
+        """
+        logonInfo = data.LogonInfoExtended()
+        logonInfo.fieldsPresent.value = data.LogonExField.LOGON_EX_AUTORECONNECTCOOKIE
+        logonInfo.autoReconnectCookie.logonId.value = 2
+        logonInfo.autoReconnectCookie.arcRandomBits.value = "\x42" * 16
+        s = type.Stream()
+        s.writeType(logonInfo)
+        
+        saveSessionInfo = data.SaveSessionInfoPDU()
+        saveSessionInfo.infoType.value = data.InfoType.INFOTYPE_LOGON_EXTENDED_INFO
+        saveSessionInfo.infoData.value = s.getvalue() + "\x00" * 570
+        
+        client = layer.Client(None)
+        client.readSaveSessionInfoPDU(saveSessionInfo)
+        self.assertEqual(client._autoReconnectCookie, (2, "\x42" * 16), "invalid auto reconnect cookie")
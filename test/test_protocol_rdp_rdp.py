@@ -0,0 +1,74 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+unit test for rdpy.protocol.rdp.rdp module
+"""
+
+import os, sys, tempfile, shutil
+# Change path so we find rdpy
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+import unittest
+import rdpy.protocol.rdp.rdp as rdp
+import rdpy.protocol.rdp.pdu.data as data
+
+class RDPTest(unittest.TestCase):
+    """
+    @summary: test case for RDP controller
+    """
+    
+    def test_input_batching(self):
+        """
+        @summary: consecutive moves are merged and sent with buttons and keys in one PDU
+        """
+        sent = []
+        controller = rdp.RDPClientController()
+        controller._pduLayer.sendInputEvents = lambda events:sent.append(events)
+        controller._isReady = True
+        controller.setInputBatching(10.0)
+        
+        controller.sendPointerEvent(1, 1, 0, False)
+        controller.sendPointerEvent(2, 2, 0, False)
+        controller.sendPointerEvent(2, 2, 1, True)
+        controller.sendPointerEvent(3, 3, 0, False)
+        controller.sendKeyEventScancode(0x1e, True)
+        controller.sendPointerEvent(4, 4, 0, False)
+        controller.sendPointerEvent(5, 5, 0, False)
+        self.assertEqual(sent, [], "events must be delayed")
+        
+        controller.flushInputEvents()
+        self.assertEqual(len(sent), 1, "events must be sent in one PDU")
+        self.assertEqual([e.__class__ for e in sent[0]], [data.PointerEvent, data.PointerEvent, data.PointerEvent, data.ScancodeKeyEvent, data.PointerEvent], "invalid events order")
+        self.assertEqual([(e.xPos.value, e.yPos.value) for e in sent[0] if isinstance(e, data.PointerEvent)], [(2, 2), (2, 2), (3, 3), (5, 5)], "invalid merged moves")
+        self.assertEqual(controller._inputFlushCall, None, "flush must cancel timer")
+        
+    def test_server_factory_keys(self):
+        """
+        @summary: key pool of server factory is configurable and loaded before first connection
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            keyFileName = os.path.join(directory, "keys.pem")
+            factory = rdp.ServerFactory(16, keyPoolSize = 2, keyFileName = keyFileName)
+            factory.loadKeys()
+            self.assertTrue(os.path.exists(keyFileName), "keys not saved")
+            self.assertEqual(len(factory._keyPool._keys), 2, "invalid pool size")
+        finally:
+            shutil.rmtree(directory)
@@ -0,0 +1,90 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+unit test for rdpy.protocol.rdp.sec module
+"""
+
+import os, sys, tempfile, shutil
+# Change path so we find rdpy
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+import unittest
+import rdpy.protocol.rdp.sec as sec
+import rdpy.core.type as type
+
+class SecTest(unittest.TestCase):
+    """
+    @summary: test case for security layer
+    """
+    
+    def test_key_pool(self):
+        """
+        @summary: keys are generated once, saved and shared in round robin
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            keyFileName = os.path.join(directory, "keys.pem")
+            pool = sec.ServerKeyPool(2, keyFileName)
+            key1, key2, key3 = pool.getKey(), pool.getKey(), pool.getKey()
+            self.assertTrue(key1 is key3 and not key1 is key2, "invalid round robin")
+            self.assertTrue(key1[2].certData.verify(), "invalid certificate signature")
+            self.assertEqual(os.stat(keyFileName).st_mode & 0o777, 0o600, "private keys must be readable by owner only")
+            
+            server = sec.Server(None, pool)
+            self.assertEqual(server._rsaPrivateKey, None, "key must be assigned with certificate")
+            self.assertTrue(server.getCertificate() is key2[2], "certificate must be cached")
+            self.assertEqual(server._rsaPrivateKey, key2[1], "invalid private key")
+            
+            loaded = sec.ServerKeyPool(2, keyFileName)
+            self.assertEqual([loaded.getKey()[1], loaded.getKey()[1]], [key1[1], key2[1]], "invalid saved keys")
+        finally:
+            shutil.rmtree(directory)
+            
+    def test_auto_reconnect_cookie(self):
+        """
+        @summary: client info packet carry auto reconnect verifier
+        """
+        class Transport(object):
+            def __init__(self):
+                self._data = None
+            def sendFlagged(self, flag, message):
+                s = type.Stream()
+                s.writeType(message)
+                self._data = s.getvalue()
+        
+        client = sec.Client(None)
+        client._info = sec.RDPInfo(extendedInfoConditional = lambda:True)
+        client._autoReconnectCookie = (7, "\x01" * 16)
+        transport = Transport()
+        client.sendFlagged = transport.sendFlagged
+        client.setNextState = lambda state:None
+        client.sendInfoPkt()
+        
+        info = sec.RDPInfo(extendedInfoConditional = lambda:True)
+        type.Stream(transport._data).readType(info)
+        self.assertEqual(info.extendedInfo.autoReconnectCookie.logonId.value, 7, "invalid logon id")
+        self.assertEqual(info.extendedInfo.autoReconnectCookie.securityVerifier.value.encode("hex"), sec.hmac.new("\x01" * 16, "\x00" * 32, sec.md5).hexdigest(), "invalid security verifier")
+        
+        #info packet without cookie
+        s = type.Stream()
+        s.writeType(sec.RDPInfo(extendedInfoConditional = lambda:True))
+        info = sec.RDPInfo(extendedInfoConditional = lambda:True)
+        type.Stream(s.getvalue()).readType(info)
+        self.assertFalse(info.extendedInfo.autoReconnectCookie._is_readed, "no cookie expected")
@@ -47,6 +47,17 @@ class X224Test(unittest.TestCase):
         """
         pass
     
+    def setUp(self):
+        """
+        @summary: TLS contexts are cached by module, each test start without cache
+        """
+        x224._clientTLSContexts.clear()
+        x224._serverTLSContexts.clear()
+        
+    def tearDown(self):
+        x224._clientTLSContexts.clear()
+        x224._serverTLSContexts.clear()
+    
     def test_x224_layer_recvData(self):
         """
         @summary: unit test for X224Layer.recvData function
@@ -193,7 +204,7 @@ class X224Test(unittest.TestCase):
         connect_event = False
         
         class ServerTLSContext(object):
-            def __init__(self, key, cert):
+            def __init__(self, key, cert, policy = None):
                 pass
             
         x224.ServerTLSContext = ServerTLSContext
@@ -226,4 +237,45 @@ class X224Test(unittest.TestCase):
         layer.recvConnectionRequest(s)
         
         self.assertTrue(tls, "TLS not started")
-        self.assertTrue(connect_event, "connect event not forwarded")
\ No newline at end of file
+        self.assertTrue(connect_event, "connect event not forwarded")
+        
+    def test_x224_tls_policy(self):
+        """
+        @summary: default policy keep TLS 1.0 for old hosts, modern policy only TLS 1.2
+        """
+        from OpenSSL import SSL
+        context = SSL.Context(SSL.SSLv23_METHOD)
+        x224.DEFAULT_TLS_POLICY.apply(context)
+        options = context.set_options(0)
+        self.assertFalse(options & SSL.OP_NO_TLSv1, "TLS 1.0 refused by default policy")
+        self.assertFalse(options & SSL.OP_NO_TLSv1_2, "TLS 1.2 refused by default policy")
+        
+        context = SSL.Context(SSL.SSLv23_METHOD)
+        x224.TLS_POLICIES["modern"].apply(context)
+        options = context.set_options(0)
+        self.assertTrue(options & SSL.OP_NO_TLSv1, "TLS 1.0 accepted by modern policy")
+        self.assertFalse(options & SSL.OP_NO_TLSv1_2, "TLS 1.2 refused by modern policy")
+        
+    def test_x224_client_tls_sessions(self):
+        """
+        @summary: sessions are kept in bounded LRU and forgotten on fatal alert
+        """
+        from OpenSSL import SSL
+        class Connection(object):
+            def __init__(self, peer):
+                self._peer = peer
+            def get_app_data(self):
+                return self._peer
+            def get_session(self):
+                return "session %s"%self._peer
+        
+        context = x224.ClientTLSContext(x224.DEFAULT_TLS_POLICY, 2)
+        for peer in ["a", "b", "c"]:
+            context.infoCallback(Connection(peer), SSL.SSL_CB_HANDSHAKE_DONE, 1)
+        self.assertEqual(context._sessions.keys(), ["b", "c"], "oldest session not evicted")
+        
+        #warning alert (close notify) keep session
+        context.infoCallback(Connection("b"), SSL.SSL_CB_ALERT, (1 << 8) | 0)
+        self.assertTrue("b" in context._sessions, "session forgotten on close notify")
+        context.infoCallback(Connection("b"), SSL.SSL_CB_ALERT, (2 << 8) | 40)
+        self.assertEqual(context._sessions.keys(), ["c"], "session kept after fatal alert")
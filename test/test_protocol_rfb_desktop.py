@@ -0,0 +1,89 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+unit test for rdpy.protocol.rfb.desktop module
+"""
+
+import os, sys
+# Change path so we find rdpy
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+import unittest
+from rdpy.protocol.rfb.desktop import DamageRegion, Desktop
+
+class Listener(object):
+    """
+    @summary: keep damage of desktop
+    """
+    def __init__(self):
+        self._damage = []
+        
+    def onDamage(self, x, y, width, height):
+        self._damage.append((x, y, width, height))
+
+class DesktopTest(unittest.TestCase):
+    """
+    @summary: test case for damage tracking
+    """
+    def test_damage_merge(self):
+        """
+        @summary: overlapping rectangles are merged, distant ones are kept
+        """
+        region = DamageRegion()
+        region.add(0, 0, 10, 10)
+        region.add(5, 0, 10, 10)
+        region.add(100, 100, 5, 5)
+        self.assertEqual(sorted(region.getRectangles()), [(0, 0, 15, 10), (100, 100, 5, 5)], "invalid merge")
+        
+    def test_damage_pop(self):
+        """
+        @summary: damage outside of requested area is kept
+        """
+        region = DamageRegion()
+        region.add(0, 0, 10, 10)
+        self.assertEqual(region.pop(5, 5, 20, 20), [(5, 5, 5, 5)], "invalid damage inside area")
+        self.assertEqual(sorted(region.getRectangles()), [(0, 0, 10, 5), (0, 5, 5, 5)], "invalid damage outside area")
+        self.assertEqual(region.pop(0, 0, 10, 10), [(0, 0, 10, 5), (0, 5, 5, 5)], "invalid remaining damage")
+        self.assertTrue(region.isEmpty(), "region must be empty")
+        
+    def test_damage_limit(self):
+        """
+        @summary: too many rectangles are merged in bounding box
+        """
+        region = DamageRegion()
+        for i in range(DamageRegion.MAX_RECTANGLES + 1):
+            region.add(i * 10, 0, 1, 1)
+        self.assertEqual(region.getRectangles(), [(0, 0, DamageRegion.MAX_RECTANGLES * 10 + 1, 1)], "bounding box expected")
+        
+    def test_desktop_damage(self):
+        """
+        @summary: drawing is clipped and forwarded to listeners, cache is invalidated
+        """
+        desktop = Desktop(20, 10)
+        listener = Listener()
+        desktop.addListener(listener)
+        encode = lambda width, height, pixelFormat, pixels: str(pixels)
+        self.assertEqual(desktop.encode(0, 0, 2, 1, encode, None, None), "\x00" * 8, "invalid encoded data")
+        desktop.drawPixels(-2, 0, 4, 1, bytearray("\x01" * 16))
+        self.assertEqual(listener._damage, [(0, 0, 2, 1)], "damage must be clipped")
+        self.assertEqual(desktop.encode(0, 0, 2, 1, encode, None, None), "\x01" * 8, "cache must be invalidated")
+        desktop.removeListener(listener)
+        desktop.drawPixels(0, 0, 1, 1, bytearray(4))
+        self.assertEqual(len(listener._damage), 1, "listener is removed")
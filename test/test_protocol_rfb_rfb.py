@@ -25,7 +25,169 @@ import os, sys
 # Change path so we find rdpy
 sys.path.insert(1, os.path.join(sys.path[0], '..'))
 
-import unittest
+import unittest, struct, zlib
+import rdpy.protocol.rfb.rfb as rfb
+import rdpy.protocol.rfb.decoder as decoder
+import rdpy.protocol.rfb.encoder as encoder
+import rfbcodec
+from rdpy.protocol.rfb.desktop import Desktop
+from rdpy.ui.framebuffer import FrameBuffer, decodeRFBPixels
+from twisted.internet import task
+from rdpy.core.type import Stream
+
+class Transport(object):
+    """
+    @summary: keep data sent by layer
+    """
+    def __init__(self):
+        self._data = ""
+        
+    def write(self, data):
+        self._data += data
+
+class Listener(rfb.RFBClientListener):
+    """
+    @summary: keep rectangle received from rfb layer
+    """
+    def __init__(self):
+        self._rectangles = []
+        self._copies = []
+        self._updates = 0
+        
+    def recvRectangle(self, rectangle, pixelFormat, data):
+        self._rectangles.append((rectangle.x.value, rectangle.y.value, rectangle.width.value, rectangle.height.value, data))
+        
+    def recvCopyRect(self, rectangle, srcX, srcY):
+        self._copies.append((rectangle.x.value, rectangle.y.value, rectangle.width.value, rectangle.height.value, srcX, srcY))
+        
+    def recvUpdateDone(self):
+        self._updates += 1
+        
+def buildLayer(bitsPerPixel = 8):
+    """
+    @summary: rfb layer waiting for a frame buffer update
+    """
+    listener = Listener()
+    layer = rfb.RFB(listener)
+    layer.transport = Transport()
+    layer._pixelFormat.BitsPerPixel.value = bitsPerPixel
+    layer._serverInit.width.value = 64
+    layer._serverInit.height.value = 64
+    layer.expect(1, layer.recvServerOrder)
+    return layer, listener
+
+def update(encoding, x, y, width, height, body):
+    """
+    @summary: frame buffer update message with one rectangle
+    """
+    return struct.pack(">BBHHHHHi", 0, 0, 1, x, y, width, height, encoding) + body
+
+class Observer(rfb.RFBClientObserver):
+    """
+    @summary: observer without rendering
+    """
+    def onReady(self):
+        pass
+    
+    def onUpdate(self, width, height, x, y, pixelFormat, encoding, data):
+        pass
+    
+def buildController():
+    """
+    @summary: ready controller with fake clock, first full update is pending
+    """
+    clock = task.Clock()
+    controller = rfb.RFBClientController(clock)
+    observer = Observer(controller)
+    layer = controller.getProtocol()
+    layer.transport = Transport()
+    layer._serverInit.width.value = 64
+    layer._serverInit.height.value = 48
+    layer.expect(1, layer.recvServerOrder)
+    controller.onReady()
+    return controller, observer, layer, clock
+
+EMPTY_UPDATE = struct.pack(">BBH", 0, 0, 0)
+
+def updateRequest(x, y, width, height):
+    """
+    @summary: incremental frame buffer update request message
+    """
+    return struct.pack(">BBHHHH", 3, 1, x, y, width, height)
+
+class ScreenObserver(Observer):
+    """
+    @summary: observer drawing updates in a frame buffer
+    """
+    def __init__(self, controller, width, height):
+        Observer.__init__(self, controller)
+        self._frameBuffer = FrameBuffer(width, height)
+        
+    def onUpdate(self, width, height, x, y, pixelFormat, encoding, data):
+        self._frameBuffer.drawRFBPixels(x, y, width, height, pixelFormat, data, self._controller.getColourMap())
+        
+class ServerObserver(rfb.RFBServerObserver):
+    """
+    @summary: keep input events of client
+    """
+    def onReady(self):
+        self._events = []
+        
+    def onKeyEvent(self, isDown, key):
+        self._events.append(("key", isDown, key))
+        
+    def onPointerEvent(self, mask, x, y):
+        self._events.append(("pointer", mask, x, y))
+        
+def buildDesktop():
+    """
+    @summary: desktop with gradient, solid block and two colours area
+    """
+    desktop = Desktop(80, 40, "test")
+    desktop.drawPixels(0, 0, 80, 40, bytearray("".join([struct.pack("BBBB", x * 3, y * 6, (x * y) % 256, 0) for y in range(40) for x in range(80)])))
+    desktop.drawPixels(5, 5, 30, 20, bytearray("\x00\x00\xff\x00" * 600))
+    desktop.drawPixels(40, 20, 20, 10, bytearray(("\xff\xff\xff\x00" + "\x00\x00\x00\x00") * 100))
+    return desktop
+
+def connect(desktop, encodings, bitsPerPixel = 32, trueColor = True, password = None, clientPassword = None):
+    """
+    @summary: client and server controllers connected through memory
+    """
+    clock = task.Clock()
+    server = rfb.RFBServerController(desktop, password, clock)
+    serverObserver = ServerObserver(server)
+    client = rfb.RFBClientController(clock)
+    client.setPixelFormat(bitsPerPixel, trueColor)
+    if not clientPassword is None:
+        client.setPassword(clientPassword)
+    client.getProtocol()._encodings = encodings
+    observer = ScreenObserver(client, desktop.getWidth(), desktop.getHeight())
+    for layer in [server.getProtocol(), client.getProtocol()]:
+        layer.transport = Transport()
+    server.getProtocol().connect()
+    client.getProtocol().connect()
+    pump(client, server, clock)
+    return client, observer, server, serverObserver, clock
+
+def pump(client, server, clock):
+    """
+    @summary: exchange data until both sides are waiting
+    """
+    clientLayer, serverLayer = client.getProtocol(), server.getProtocol()
+    while True:
+        clock.advance(0)
+        if clientLayer.transport._data == "" and serverLayer.transport._data == "":
+            return
+        data, clientLayer.transport._data = clientLayer.transport._data, ""
+        serverLayer.dataReceived(data)
+        data, serverLayer.transport._data = serverLayer.transport._data, ""
+        clientLayer.dataReceived(data)
+        
+def expectedScreen(desktop, pixelFormat, colourMap):
+    """
+    @summary: desktop seen through client pixel format
+    """
+    return decodeRFBPixels(desktop.getWidth(), desktop.getHeight(), pixelFormat, encoder.convertPixels(desktop.getFrameBuffer().getPixels(), pixelFormat), colourMap)
 
 class RfbCase(unittest.TestCase):
     '''
@@ -33,3 +195,348 @@ class RfbCase(unittest.TestCase):
     '''
     def testName(self):
         pass
+    
+    def test_set_encoding(self):
+        """
+        @summary: encodings are advertised in preference order
+        """
+        layer, _ = buildLayer()
+        layer.sendSetEncoding()
+        encodings = [rfb.Encoding.COPY_RECT, rfb.Encoding.TIGHT, rfb.Encoding.ZRLE, rfb.Encoding.HEXTILE, rfb.Encoding.RRE, rfb.Encoding.RAW]
+        if decoder.hasJpegSupport():
+            encodings.append(rfb.Encoding.JPEG_QUALITY_LEVEL_0 + 6)
+        encodings.append(rfb.Encoding.CONTINUOUS_UPDATES)
+        self.assertEqual(layer.transport._data, struct.pack(">BBH", 2, 0, len(encodings)) + "".join([struct.pack(">i", e) for e in encodings]), "invalid set encoding message")
+        
+    def test_copy_rect(self):
+        """
+        @summary: copy rect is forwarded with source position
+        """
+        layer, listener = buildLayer()
+        layer.dataReceived(update(rfb.Encoding.COPY_RECT, 10, 20, 30, 40, struct.pack(">HH", 1, 2)))
+        self.assertEqual(listener._copies, [(10, 20, 30, 40, 1, 2)], "invalid copy rect")
+        #listener is notified of end of update
+        self.assertEqual(listener._updates, 1, "end of update expected")
+        
+    def test_rre(self):
+        """
+        @summary: rre sub rectangles are drawn over background
+        """
+        layer, listener = buildLayer()
+        body = struct.pack(">IB", 2, 1) + struct.pack(">BHHHH", 2, 0, 0, 2, 1) + struct.pack(">BHHHH", 3, 3, 2, 1, 2)
+        #split data to check partial reception
+        data = update(rfb.Encoding.RRE, 0, 0, 4, 4, body)
+        layer.dataReceived(data[:20])
+        layer.dataReceived(data[20:])
+        self.assertEqual(listener._rectangles, [(0, 0, 4, 4, "\x02\x02\x01\x01" "\x01\x01\x01\x01" "\x01\x01\x01\x03" "\x01\x01\x01\x03")], "invalid rre decoding")
+        
+    def test_rre_outside(self):
+        """
+        @summary: sub rectangle must be inside rectangle
+        """
+        d = decoder.RREDecoder(2, 2, 1)
+        d.feed(struct.pack(">IB", 1, 0))
+        self.assertRaises(decoder.InvalidExpectedDataException, d.feed, struct.pack(">BHHHH", 1, 1, 1, 2, 1))
+        
+    def test_hextile(self):
+        """
+        @summary: raw tile, background only tile, sub rectangles with kept foreground
+        """
+        layer, listener = buildLayer()
+        #20x17 rectangle : tiles 16x16, 4x16, 16x1, 4x1
+        body = "\x01" + "\x05" * 256
+        body += "\x0e" + "\x06\x07\x01" + "\x11\x10"
+        body += "\x02\x08"
+        body += "\x18\x01\x09\x20\x00"
+        layer.dataReceived(update(rfb.Encoding.HEXTILE, 0, 0, 20, 17, body))
+        self.assertEqual(len(listener._rectangles), 1, "one rectangle expected")
+        pixels = listener._rectangles[0][4]
+        self.assertEqual(len(pixels), 20 * 17, "invalid decoded size")
+        pixel = lambda x, y: ord(pixels[y * 20 + x])
+        self.assertEqual(pixel(0, 0), 5, "invalid raw tile")
+        self.assertEqual(pixel(15, 15), 5, "invalid raw tile")
+        self.assertEqual((pixel(16, 0), pixel(17, 1), pixel(18, 1), pixel(17, 2), pixel(19, 15)), (6, 7, 7, 6, 6), "invalid sub rectangle")
+        self.assertEqual((pixel(0, 16), pixel(15, 16)), (8, 8), "invalid background tile")
+        self.assertEqual((pixel(16, 16), pixel(18, 16), pixel(19, 16)), (8, 9, 8), "invalid coloured sub rectangle")
+        
+    def test_unsupported_encoding(self):
+        """
+        @summary: encoding not advertised cannot be read
+        """
+        layer, _ = buildLayer()
+        self.assertRaises(rfb.InvalidExpectedDataException, layer.dataReceived, update(6, 0, 0, 1, 1, ""))
+        
+    def test_zrle(self):
+        """
+        @summary: zlib stream is kept between rectangles
+        """
+        layer, listener = buildLayer(32)
+        compressor = zlib.compressobj()
+        #66x2 : solid 64x2 tile, plain rle 2x2 tile
+        tiles = "\x01" "\x01\x02\x03" + "\x80" "\x04\x05\x06\x02" "\x07\x08\x09\x00"
+        data = compressor.compress(tiles) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        layer.dataReceived(update(rfb.Encoding.ZRLE, 0, 0, 66, 2, struct.pack(">I", len(data)) + data))
+        pixels = listener._rectangles[0][4]
+        self.assertEqual(pixels[0:4], "\x01\x02\x03\x00", "invalid solid tile")
+        self.assertEqual(pixels[64 * 4:66 * 4], "\x04\x05\x06\x00" * 2, "invalid rle tile")
+        self.assertEqual(pixels[(66 + 64) * 4:], "\x04\x05\x06\x00" "\x07\x08\x09\x00", "invalid rle run")
+        
+        #packed palette tile with 2 colors
+        data = compressor.compress("\x02" "\x00\x00\x00" "\xff\xff\xff" "\x40" "\x80") + compressor.flush(zlib.Z_SYNC_FLUSH)
+        layer.dataReceived(update(rfb.Encoding.ZRLE, 0, 0, 2, 2, struct.pack(">I", len(data)) + data))
+        self.assertEqual(listener._rectangles[1][4], "\x00\x00\x00\x00" "\xff\xff\xff\x00" "\xff\xff\xff\x00" "\x00\x00\x00\x00", "invalid palette tile")
+        
+    def test_zrle_invalid(self):
+        """
+        @summary: run longer than tile is an error
+        """
+        d = decoder.ZRLEDecoder(1, 1, rfb.PixelFormat(), zlib.decompressobj())
+        data = zlib.compress("\x80" "\x01\x02\x03\x01")
+        d.feed(struct.pack(">I", len(data)))
+        self.assertRaises(decoder.InvalidExpectedDataException, d.feed, data)
+        
+        #run length bytes which wrap 32 bits count to 1
+        data = "\x80" "\x01\x02\x03" + "\xff" * 16843009 + "\x01"
+        self.assertRaises(ValueError, rfbcodec.zrle_decode, data, 1, 1, 3, 4, 0)
+        
+    def test_tight_fill(self):
+        """
+        @summary: tight pixels are RGB
+        """
+        layer, listener = buildLayer(32)
+        layer.dataReceived(update(rfb.Encoding.TIGHT, 0, 0, 2, 1, "\x80" "\x01\x02\x03"))
+        self.assertEqual(listener._rectangles[0][4], "\x03\x02\x01\x00" * 2, "invalid fill")
+        
+    def test_tight_basic(self):
+        """
+        @summary: small copy data are not compressed, palette data use selected stream
+        """
+        layer, listener = buildLayer(32)
+        layer.dataReceived(update(rfb.Encoding.TIGHT, 0, 0, 3, 1, "\x00" "\x01\x02\x03" "\x04\x05\x06" "\x07\x08\x09"))
+        self.assertEqual(listener._rectangles[0][4], "\x03\x02\x01\x00" "\x06\x05\x04\x00" "\x09\x08\x07\x00", "invalid copy filter")
+        
+        #stream 1, palette of 2 colors, 16x2 indexes is 4 bytes then 16x4 is 8 bytes compressed
+        compressor = zlib.compressobj()
+        data = compressor.compress("\xff\x00" * 6) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        layer.dataReceived(update(rfb.Encoding.TIGHT, 0, 0, 16, 6, "\x50" "\x01" "\x01" "\x00\x00\x00" "\xff\x00\x00" + chr(len(data)) + data))
+        pixels = listener._rectangles[1][4]
+        self.assertEqual(pixels[0:4], "\x00\x00\xff\x00", "invalid palette color")
+        self.assertEqual(pixels[8 * 4:9 * 4], "\x00\x00\x00\x00", "invalid palette color")
+        
+        #stream is reset by compression control
+        compressor = zlib.compressobj()
+        data = compressor.compress("\x00" * 12) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        layer.dataReceived(update(rfb.Encoding.TIGHT, 0, 0, 4, 1, "\x12" + chr(len(data)) + data))
+        self.assertEqual(listener._rectangles[2][4], "\x00" * 16, "invalid reset stream")
+        
+    def test_tight_gradient(self):
+        """
+        @summary: gradient filter predict from neighbours
+        """
+        d = decoder.TightDecoder(2, 2, rfb.PixelFormat(), [zlib.decompressobj() for _ in range(4)])
+        d.feed("\x40")
+        d.feed(chr(decoder.TightFilter.GRADIENT))
+        #left pixel 10, predicted from left then up, then left + up - upleft
+        data = zlib.compress("\x0a\x00\x00" "\x01\x00\x00" "\x02\x00\x00" "\x03\x00\x00")
+        d.feed(chr(len(data)))
+        d.feed(data)
+        self.assertEqual(d.getPixels(), "\x00\x00\x0a\x00" "\x00\x00\x0b\x00" "\x00\x00\x0c\x00" "\x00\x00\x10\x00", "invalid gradient")
+        
+    def test_pacing_frame_rate(self):
+        """
+        @summary: next request wait in respect of max frame rate
+        """
+        controller, _, layer, clock = buildController()
+        controller.setMaxFrameRate(10)
+        clock.advance(0.04)
+        layer.dataReceived(EMPTY_UPDATE)
+        self.assertEqual(layer.transport._data, "", "request must be delayed")
+        clock.advance(0.06)
+        self.assertEqual(layer.transport._data, updateRequest(0, 0, 64, 48), "request expected")
+        
+    def test_pacing_region_of_interest(self):
+        """
+        @summary: only region of interest is requested
+        """
+        controller, _, layer, _ = buildController()
+        controller.setRegionOfInterest(8, 4, 16, 10)
+        layer.dataReceived(EMPTY_UPDATE)
+        self.assertEqual(layer.transport._data, updateRequest(8, 4, 16, 10), "invalid request area")
+        
+    def test_pacing_pause(self):
+        """
+        @summary: no request while no observer need updates
+        """
+        _, observer, layer, _ = buildController()
+        observer.setUpdateNeeded(False)
+        layer.dataReceived(EMPTY_UPDATE)
+        self.assertEqual(layer.transport._data, "", "no request expected")
+        observer.setUpdateNeeded(True)
+        self.assertEqual(layer.transport._data, updateRequest(0, 0, 64, 48), "request expected on resume")
+        
+    def test_continuous_updates(self):
+        """
+        @summary: continuous updates replace requests until no observer need updates
+        """
+        controller, observer, layer, _ = buildController()
+        controller.setContinuousUpdates(True)
+        #server advertise extension
+        layer.dataReceived("\x96")
+        self.assertEqual(layer.transport._data, struct.pack(">BBHHHH", 150, 1, 0, 0, 64, 48), "enable continuous updates expected")
+        layer.transport._data = ""
+        layer.dataReceived(EMPTY_UPDATE)
+        self.assertEqual(layer.transport._data, "", "no request in continuous mode")
+        
+        observer.setUpdateNeeded(False)
+        self.assertEqual(layer.transport._data, struct.pack(">BBHHHH", 150, 0, 0, 0, 64, 48), "disable continuous updates expected")
+        layer.transport._data = ""
+        observer.setUpdateNeeded(True)
+        #server confirm end of continuous updates
+        layer.dataReceived("\x96")
+        self.assertEqual(layer.transport._data, struct.pack(">BBHHHH", 150, 1, 0, 0, 64, 48), "continuous updates expected again")
+        
+    def test_pixel_format(self):
+        """
+        @summary: requested pixel format is sent at end of handshake, server format can be kept
+        """
+        controller = rfb.RFBClientController(task.Clock())
+        Observer(controller)
+        controller.setPixelFormat(16)
+        layer = controller.getProtocol()
+        layer.transport = Transport()
+        layer.recvServerName(Stream("server"))
+        self.assertEqual(layer.transport._data[:20], "\x00\x00\x00\x00" "\x10\x10\x00\x01" "\x00\x1f\x00\x3f\x00\x1f" "\x0b\x05\x00" "\x00\x00\x00", "invalid pixel format message")
+        
+        controller = rfb.RFBClientController(task.Clock())
+        Observer(controller)
+        controller.setPixelFormat(None)
+        layer = controller.getProtocol()
+        layer.transport = Transport()
+        layer._serverInit.pixelFormat.BitsPerPixel.value = 8
+        layer.recvServerName(Stream("server"))
+        self.assertEqual(controller.getPixelFormat().BitsPerPixel.value, 8, "server pixel format expected")
+        self.assertRaises(rfb.InvalidValue, rfb.createPixelFormat, 16, False)
+        
+    def test_colour_map(self):
+        """
+        @summary: colour map entries are stored as BGRX
+        """
+        controller, _, layer, _ = buildController()
+        layer.dataReceived(struct.pack(">BBHH", 1, 0, 254, 3) + struct.pack(">HHH", 0x1000, 0x2000, 0x3000) * 3 + EMPTY_UPDATE)
+        self.assertEqual(controller.getColourMap()[254 * 4:], "\x30\x20\x10\xff" * 2, "invalid colour map")
+        #next message is read
+        self.assertEqual(layer.transport._data, updateRequest(0, 0, 64, 48), "update expected after colour map")
+        
+    def test_server_encodings(self):
+        """
+        @summary: client decode server update of each encoding and pixel format
+        """
+        for encoding in [rfb.Encoding.RAW, rfb.Encoding.HEXTILE, rfb.Encoding.ZRLE]:
+            for bitsPerPixel, trueColor in [(32, True), (16, True), (8, True), (8, False)]:
+                desktop = buildDesktop()
+                client, observer, server, _, _ = connect(desktop, [encoding], bitsPerPixel, trueColor)
+                self.assertEqual(server.getEncoding(), encoding, "invalid encoding choice")
+                self.assertEqual(observer._frameBuffer.getPixels(), expectedScreen(desktop, client.getPixelFormat(), client.getColourMap()), "invalid screen %d %d %s"%(encoding, bitsPerPixel, trueColor))
+                
+    def test_server_encoding_choice(self):
+        """
+        @summary: first supported encoding of client, raw by default
+        """
+        _, _, server, _, _ = connect(buildDesktop(), [rfb.Encoding.TIGHT, rfb.Encoding.HEXTILE, rfb.Encoding.ZRLE])
+        self.assertEqual(server.getEncoding(), rfb.Encoding.HEXTILE, "hextile expected")
+        _, _, server, _, _ = connect(buildDesktop(), [rfb.Encoding.TIGHT])
+        self.assertEqual(server.getEncoding(), rfb.Encoding.RAW, "raw expected")
+        
+    def test_server_damage(self):
+        """
+        @summary: incremental request is answered with damaged rectangles only
+        """
+        desktop = buildDesktop()
+        client, observer, server, _, clock = connect(desktop, [rfb.Encoding.RAW])
+        serverLayer = server.getProtocol()
+        #nothing changed, request is pending
+        self.assertEqual(serverLayer.transport._data, "", "no update expected")
+        self.assertFalse(server._request is None, "pending request expected")
+        
+        desktop.drawPixels(10, 12, 3, 2, bytearray("\x01\x02\x03\x00" * 6))
+        desktop.drawPixels(11, 13, 3, 2, bytearray("\x01\x02\x03\x00" * 6))
+        clock.advance(0)
+        self.assertEqual(serverLayer.transport._data[:16], struct.pack(">BBHHHHHi", 0, 0, 1, 10, 12, 4, 3, 0), "bounding box of damage expected")
+        self.assertEqual(len(serverLayer.transport._data), 16 + 4 * 3 * 4, "invalid update size")
+        pump(client, server, clock)
+        self.assertEqual(observer._frameBuffer.getPixels(), desktop.getFrameBuffer().getPixels(), "invalid screen")
+        
+    def test_server_shared(self):
+        """
+        @summary: clients of same desktop share encoded rectangles
+        """
+        desktop = buildDesktop()
+        first = connect(desktop, [rfb.Encoding.HEXTILE])
+        second = connect(desktop, [rfb.Encoding.HEXTILE])
+        encoded = []
+        desktop.encode = lambda *args: encoded.append(args[:4]) or Desktop.encode(desktop, *args)
+        desktop.drawPixels(0, 0, 8, 8, bytearray("\xff" * 256))
+        for client, observer, server, _, clock in [first, second]:
+            clock.advance(0)
+            pump(client, server, clock)
+            self.assertEqual(observer._frameBuffer.getPixels(), desktop.getFrameBuffer().getPixels(), "invalid screen")
+        self.assertEqual(encoded, [(0, 0, 8, 8)] * 2, "damage must be sent to each client")
+        self.assertEqual(len(desktop._cache), 1, "encoded rectangle must be shared")
+        
+    def test_server_authentication(self):
+        """
+        @summary: vnc authentication check client response
+        """
+        client, observer, server, _, _ = connect(buildDesktop(), [rfb.Encoding.RAW], password = "secret", clientPassword = "secret")
+        self.assertEqual(observer._frameBuffer.getPixels(), server.getDesktop().getFrameBuffer().getPixels(), "invalid screen")
+        
+        closed = []
+        rfb.RFBServer.close = lambda self: closed.append(self)
+        try:
+            client, observer, server, _, _ = connect(buildDesktop(), [rfb.Encoding.RAW], password = "secret", clientPassword = "wrong")
+        finally:
+            del rfb.RFBServer.close
+        self.assertEqual(closed, [server.getProtocol()], "connection must be closed")
+        self.assertFalse(server._isReady, "server must not be ready")
+        
+    def test_server_cut_text_limit(self):
+        """
+        @summary: client cut text bigger than limit close connection before it is buffered
+        """
+        _, _, server, _, _ = connect(buildDesktop(), [rfb.Encoding.RAW])
+        layer = server.getProtocol()
+        closed = []
+        rfb.RFBServer.close = lambda self: closed.append(self)
+        try:
+            layer.dataReceived(struct.pack(">B3xI", 6, 10) + "0123456789")
+            self.assertEqual(closed, [], "small cut text must be accepted")
+            layer.dataReceived(struct.pack(">B3xI", 6, 0xffffffff) + "0123")
+        finally:
+            del rfb.RFBServer.close
+        self.assertEqual(closed, [layer], "connection must be closed")
+        self.assertTrue(len(layer._buffer) < 16, "oversized text must not be buffered")
+        
+    def test_server_input(self):
+        """
+        @summary: input events are forwarded to server observers
+        """
+        client, _, server, serverObserver, clock = connect(buildDesktop(), [rfb.Encoding.RAW])
+        client.sendKeyEvent(True, 0x61)
+        client.sendPointerEvent(rfb.Pointer.BUTTON1, 10, 20)
+        pump(client, server, clock)
+        self.assertEqual(serverObserver._events, [("key", True, 0x61), ("pointer", 1, 10, 20)], "invalid input events")
+        
+    def test_raw_streaming(self):
+        """
+        @summary: large raw rectangle is forwarded in bands as data arrive
+        """
+        layer, listener = buildLayer()
+        layer._bandSize = 1000
+        body = "".join([chr(y) * 64 for y in range(64)])
+        data = update(rfb.Encoding.RAW, 0, 0, 64, 64, body)
+        layer.dataReceived(data[:16 + 2000])
+        self.assertEqual([r[:4] for r in listener._rectangles], [(0, 0, 64, 15), (0, 15, 64, 15)], "bands expected before end of rectangle")
+        layer.dataReceived(data[16 + 2000:])
+        self.assertEqual([r[1] for r in listener._rectangles], [0, 15, 30, 45, 60], "invalid band positions")
+        self.assertEqual("".join([r[4] for r in listener._rectangles]), body, "invalid band data")
+        self.assertEqual(listener._updates, 1, "one update expected")
@@ -0,0 +1,48 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+unit test for rdpy.security.des module
+"""
+
+import os, sys
+# Change path so we find rdpy
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+import unittest
+import rdpy.security.des as des
+
+class DESTest(unittest.TestCase):
+    """
+    @summary: test case for DES backend
+    """
+    def test_known_vector(self):
+        """
+        @summary: classic DES test vector
+        """
+        self.assertEqual(des.encrypt("\x13\x34\x57\x79\x9b\xbc\xdf\xf1", "\x01\x23\x45\x67\x89\xab\xcd\xef").encode('hex'), "85e813540f0ab405", "invalid des encryption")
+        
+    def test_backend_match_pydes(self):
+        """
+        @summary: native backend and pyDes must agree
+        """
+        for i in range(16):
+            key = "".join([chr((i * 37 + j * 11) & 0xff) for j in range(8)])
+            data = "".join([chr((i * 7 + j) & 0xff) for j in range(16)])
+            self.assertEqual(des.encrypt(key, data), des.pyEncrypt(key, data), "backend %s mismatch"%des.BACKEND)
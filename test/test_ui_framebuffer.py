@@ -0,0 +1,107 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+unit test for rdpy.ui.framebuffer module
+"""
+
+import os, sys
+# Change path so we find rdpy
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+import unittest, struct, zlib
+import rdpy.ui.framebuffer as framebuffer
+import rdpy.protocol.rfb.rfb as rfb
+
+class FrameBufferTest(unittest.TestCase):
+    """
+    @summary: test case for headless frame buffer
+    """
+    def test_draw_uncompressed(self):
+        """
+        @summary: uncompressed bitmaps are bottom up and clipped
+        """
+        fb = framebuffer.FrameBuffer(4, 4)
+        #2 lines of 16 bits pixels : bottom line is red, top line is blue
+        fb.drawRDPBitmap(3, 0, 4, 1, 2, 2, 16, False, "\x00\xf8\x00\xf8\x1f\x00\x1f\x00")
+        self.assertEqual(fb.getPixel(3, 0), (0, 0, 0xf8), "invalid top line")
+        self.assertEqual(fb.getPixel(3, 1), (0xf8, 0, 0), "invalid bottom line")
+        
+    def test_encode(self):
+        """
+        @summary: encoded bitmap can be decoded in all color depth
+        """
+        pixels = bytearray("\xf8\x00\x00\xff\x00\xfc\x00\xff\x00\x00\xf8\xff\xf8\xf8\xf8\xff")
+        self.assertEqual(framebuffer.encodeRDPBitmap(2, 2, 16, pixels), "\x00\xf8\xdf\xff\x1f\x00\xe0\x07", "invalid 16 bpp bitmap")
+        for bitsPerPixel in [15, 16, 24, 32]:
+            data = framebuffer.encodeRDPBitmap(2, 2, bitsPerPixel, pixels)
+            decoded = framebuffer.decodeRDPBitmap(2, 2, bitsPerPixel, False, data)
+            self.assertEqual(decoded[0::4], pixels[0::4], "invalid blue in %d bpp"%bitsPerPixel)
+            self.assertEqual(decoded[2::4], pixels[2::4], "invalid red in %d bpp"%bitsPerPixel)
+        
+    def test_decode_rfb(self):
+        """
+        @summary: 32, 16 and 8 bits true color, colour map and big endian RFB pixels are converted to BGRX
+        """
+        #red and blue in RGB 565
+        self.assertEqual(framebuffer.decodeRFBPixels(2, 1, rfb.createPixelFormat(16), struct.pack("<HH", 0xf800, 0x001f)), bytearray("\x00\x00\xff\xff" "\xff\x00\x00\xff"), "invalid 16 bits conversion")
+        #green and blue in BGR 233
+        self.assertEqual(framebuffer.decodeRFBPixels(2, 1, rfb.createPixelFormat(8), "\x38\xc0"), bytearray("\x00\xff\x00\xff" "\xff\x00\x00\xff"), "invalid 8 bits conversion")
+        
+        colourMap = bytearray(256 * 4)
+        colourMap[4:8] = "\x01\x02\x03\xff"
+        self.assertEqual(framebuffer.decodeRFBPixels(2, 1, rfb.createPixelFormat(8, False), "\x01\x00", colourMap), bytearray("\x01\x02\x03\xff" "\x00\x00\x00\x00"), "invalid colour map conversion")
+        
+        pixelFormat = rfb.createPixelFormat(32)
+        pixelFormat.BigEndianFlag.value = True
+        self.assertEqual(framebuffer.decodeRFBPixels(1, 1, pixelFormat, "\x00\x01\x02\x03"), bytearray("\x03\x02\x01\xff"), "invalid big endian conversion")
+        pixelFormat = rfb.createPixelFormat(16)
+        pixelFormat.BigEndianFlag.value = True
+        self.assertEqual(framebuffer.decodeRFBPixels(1, 1, pixelFormat, struct.pack(">H", 0x07e0)), bytearray("\x00\xff\x00\xff"), "invalid 16 bits big endian conversion")
+        
+        #red in low byte and 10 bits components
+        pixelFormat = rfb.createPixelFormat(32)
+        pixelFormat.RedShift.value, pixelFormat.BlueShift.value = 0, 16
+        self.assertEqual(framebuffer.decodeRFBPixels(1, 1, pixelFormat, "\x01\x02\x03\x00"), bytearray("\x03\x02\x01\xff"), "invalid RGB conversion")
+        pixelFormat.RedMax.value, pixelFormat.GreenMax.value, pixelFormat.BlueMax.value = 1023, 1023, 1023
+        pixelFormat.RedShift.value, pixelFormat.GreenShift.value, pixelFormat.BlueShift.value = 20, 10, 0
+        self.assertEqual(framebuffer.decodeRFBPixels(1, 1, pixelFormat, struct.pack("<I", (1023 << 20) | 0x200)), bytearray("\x7f\x00\xff\xff"), "invalid 10 bits components conversion")
+        self.assertRaises(ValueError, framebuffer.decodeRFBPixels, 1, 1, rfb.createPixelFormat(8, False), "\x00")
+        self.assertRaises(ValueError, framebuffer.decodeRFBPixels, 2, 1, rfb.createPixelFormat(16), "\x00\x00")
+        
+    def test_screen_blt(self):
+        """
+        @summary: overlapping copy
+        """
+        fb = framebuffer.FrameBuffer(4, 4)
+        fb.drawPixels(0, 0, 1, 2, bytearray("\x01\x02\x03\x00\x04\x05\x06\x00"))
+        fb.screenBlt(0, 1, 1, 2, 0, 0)
+        self.assertEqual([fb.getPixel(0, y) for y in range(3)], [(3, 2, 1), (3, 2, 1), (6, 5, 4)], "invalid screen blt")
+        
+    def test_png(self):
+        """
+        @summary: PNG header and pixels
+        """
+        fb = framebuffer.FrameBuffer(2, 1)
+        fb.drawPixels(0, 0, 2, 1, bytearray("\x01\x02\x03\x00\x04\x05\x06\x00"))
+        png = fb.toPNG()
+        self.assertEqual(png[:8], "\x89PNG\r\n\x1a\n", "invalid signature")
+        self.assertEqual(struct.unpack(">II", png[16:24]), (2, 1), "invalid size")
+        idat = png.index("IDAT")
+        self.assertEqual(zlib.decompress(png[idat + 4:idat + 4 + struct.unpack(">I", png[idat - 4:idat])[0]]), "\x00\x03\x02\x01\x06\x05\x04", "invalid pixels")
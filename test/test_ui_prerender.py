@@ -0,0 +1,97 @@
+#
+# Copyright (c) 2014-2015 Sylvain Peyrefitte
+#
+# This file is part of rdpy.
+#
+# rdpy is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+
+"""
+unit test for rdpy.ui.prerender module
+"""
+
+import os, sys
+# Change path so we find rdpy
+sys.path.insert(1, os.path.join(sys.path[0], '..'))
+
+import unittest, StringIO, tempfile, shutil
+from rdpy.core import rss
+import rdpy.ui.prerender as prerender
+
+def writeScenario(f):
+    """
+    @summary: 4x4 screen in 24 bpp with one red update of 4x4 pixels
+    """
+    recorder = rss.FileRecorder(f)
+    screen = rss.ScreenEvent()
+    screen.width.value, screen.height.value, screen.colorDepth.value = 4, 4, 24
+    recorder.rec(screen, 0)
+    update = rss.UpdateEvent()
+    update.destLeft.value, update.destTop.value, update.destRight.value, update.destBottom.value = 0, 0, 3, 3
+    update.width.value, update.height.value, update.bpp.value = 4, 4, 24
+    update.format.value = rss.UpdateFormat.RAW
+    update.data.value = "\x00\x00\xff" * 16
+    recorder.rec(update, 20)
+    recorder.rec(rss.CloseEvent(), 1000)
+
+class PrerenderTest(unittest.TestCase):
+    """
+    @summary: test case for scenario pre-rendering
+    """
+    def test_render(self):
+        """
+        @summary: update is centered, clipped and converted
+        """
+        source = StringIO.StringIO()
+        writeScenario(source)
+        output = StringIO.StringIO()
+        prerender.renderScenario(rss.FileReader(StringIO.StringIO(source.getvalue())), rss.FileRecorder(output), 6, 2, 16)
+        
+        reader = rss.FileReader(StringIO.StringIO(output.getvalue()))
+        screen = reader.nextEvent()
+        self.assertEqual((screen.event.width.value, screen.event.height.value, screen.event.colorDepth.value), (6, 2, 16), "invalid screen")
+        update = reader.nextEvent()
+        self.assertEqual(update.timestamp.value, 20, "timestamp of screen event must be kept")
+        self.assertEqual((update.event.destLeft.value, update.event.destTop.value, update.event.destRight.value, update.event.destBottom.value), (1, 0, 4, 1), "invalid position")
+        self.assertEqual((update.event.bpp.value, update.event.format.value), (16, rss.UpdateFormat.RAW), "invalid format")
+        self.assertEqual(update.event.data.value, "\x00\xf8" * 8, "invalid pixels")
+        self.assertEqual(reader.nextEvent().type.value, rss.EventType.CLOSE, "close event not kept")
+        
+    def test_cache(self):
+        """
+        @summary: variant with same color depth and closest size is selected
+        """
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "scenario.rss")
+            with open(path, "wb") as f:
+                writeScenario(f)
+            cache = rss.ScenarioCache()
+            self.assertEqual(cache.load(path), (4, 4, 24), "invalid variant")
+            for variant in prerender.renderVariants(path, directory, [(8, 8), (16, 16)], [16, 32]):
+                cache.load(variant)
+            self.assertEqual(len(cache.getVariants()), 5, "invalid number of variants")
+            self.assertEqual(cache.select(10, 10, 32)[0], (8, 8, 32), "invalid selection")
+            self.assertEqual(cache.select(10, 10, 15)[0], (8, 8, 16), "invalid fallback on size")
+            reader = cache.select(16, 16, 16)[1]
+            self.assertEqual(reader.nextEvent().type.value, rss.EventType.SCREEN, "invalid first event")
+            
+            #scenario with same screen is kept and played in turn
+            self.assertEqual(cache.load(path), (4, 4, 24), "invalid variant")
+            self.assertEqual(len(cache.getVariants()), 5, "invalid number of variants")
+            first, second, third = [cache.select(4, 4, 24)[1]._events for _ in range(3)]
+            self.assertFalse(first is second, "scenarios must be played in turn")
+            self.assertTrue(first is third, "scenarios must be played in turn")
+        finally:
+            shutil.rmtree(directory)